@@ -0,0 +1,218 @@
+from datetime import datetime, timedelta, timezone
+
+import storage
+
+# ---------------- ISSUE ANALYTICS ----------------
+#
+# Reports read only the rollup tables of migration 10, which triggers on
+# issue_events keep current:
+#   issue_totals            issues in each status right now
+#   issue_daily             reported / entered / exited per day and status
+#   issue_resolutions_daily completions per day, bucketed by time open
+# all keyed by panchayath first, so a report costs a range scan per
+# panchayath and period however many issues there are. District and state
+# reports are the same queries over every panchayath in the district or
+# state, run on each shard holding one of them and added up.
+
+SCOPES = ("panchayath", "district", "state")
+# Report length in days -> trend granularity
+PERIODS = {30: "day", 90: "week", 365: "month"}
+OPEN_STATUSES = ("Pending", "In Progress")
+RESOLVED_STATUS = "Completed"
+# Upper bounds in days of the issue_resolutions_daily buckets; must match
+# the CASE in migration 10. None is the open-ended last bucket.
+RESOLUTION_BUCKETS = (1, 2, 3, 7, 14, 30, 60, 90, None)
+# Panchayaths listed in district and state reports
+TOP_PANCHAYATHS = 20
+
+# SQL for the trend period a rollup day falls in, per dialect
+_PERIOD_SQL = {
+    "sqlite": {
+        "day": "day",
+        "week": "date(day, '-6 days', 'weekday 1')",
+        "month": "substr(day, 1, 7)",
+    },
+    "postgresql": {
+        "day": "day",
+        "week": "to_char(date_trunc('week', day::date), 'YYYY-MM-DD')",
+        "month": "substr(day, 1, 7)",
+    },
+}
+
+
+def today():
+    # Rollups are dated in UTC, like CURRENT_TIMESTAMP
+    return datetime.now(timezone.utc).date()
+
+
+def _period_key(day, granularity):
+    if granularity == "week":
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if granularity == "month":
+        return day.isoformat()[:7]
+    return day.isoformat()
+
+
+def scope_filter(conn, scope, panchayath_id):
+    """(label, condition on panchayath_id, params) for a report on one
+    panchayath or on its whole district or state."""
+    home = conn.execute(
+        "SELECT name, district, state FROM panchayath WHERE id = ?", (panchayath_id,)
+    ).fetchone()
+    if home is not None:
+        if scope == "district" and home["district"]:
+            same_state = "IS NOT DISTINCT FROM" if storage.dialect(conn) == "postgresql" else "IS"
+            return (home["district"],
+                    f"panchayath_id IN (SELECT id FROM panchayath WHERE state {same_state} ? AND district = ?)",
+                    [home["state"], home["district"]])
+        if scope == "state" and home["state"]:
+            return (home["state"],
+                    "panchayath_id IN (SELECT id FROM panchayath WHERE state = ?)",
+                    [home["state"]])
+    return (home["name"] if home else "Panchayath"), "panchayath_id = ?", [panchayath_id]
+
+
+def _median_label(buckets):
+    total = sum(buckets.values())
+    seen = 0
+    for index, bound in enumerate(RESOLUTION_BUCKETS):
+        seen += buckets.get(index, 0)
+        if seen * 2 >= total:
+            if bound is None:
+                return f"over {RESOLUTION_BUCKETS[-2]} days"
+            return f"within {bound} day{'s' if bound > 1 else ''}"
+    return None
+
+
+def collect(conn, where, params, days=30, by_panchayath=False):
+    """The sums report() and panchayath_breakdown() are built from, read
+    from one database. With sharding there is one per shard holding the
+    scope; every figure is a plain sum, so the parts add up."""
+    granularity = PERIODS.get(days, "day")
+    since = (today() - timedelta(days=days - 1)).isoformat()
+    part = {}
+    part["totals"] = conn.execute(f"""
+        SELECT category, status, SUM(count) FROM issue_totals
+        WHERE {where}
+        GROUP BY category, status
+    """, params).fetchall()
+    part["categories"] = conn.execute(f"""
+        SELECT category, SUM(reported),
+               SUM(CASE WHEN status = ? THEN entered ELSE 0 END)
+        FROM issue_daily
+        WHERE {where} AND day >= ?
+        GROUP BY category
+    """, [RESOLVED_STATUS, *params, since]).fetchall()
+    part["trend"] = conn.execute(f"""
+        SELECT {_PERIOD_SQL[storage.dialect(conn)][granularity]} AS period, SUM(reported),
+               SUM(CASE WHEN status = ? THEN entered ELSE 0 END)
+        FROM issue_daily
+        WHERE {where} AND day >= ?
+        GROUP BY period
+    """, [RESOLVED_STATUS, *params, since]).fetchall()
+    part["buckets"] = conn.execute(f"""
+        SELECT bucket, SUM(resolved), SUM(seconds)
+        FROM issue_resolutions_daily
+        WHERE {where} AND day >= ?
+        GROUP BY bucket
+    """, [*params, since]).fetchall()
+    if by_panchayath:
+        part["open"] = conn.execute(f"""
+            SELECT panchayath_id, SUM(count) FROM issue_totals
+            WHERE {where} AND status IN ({", ".join("?" for _ in OPEN_STATUSES)})
+            GROUP BY panchayath_id
+        """, [*params, *OPEN_STATUSES]).fetchall()
+        part["panchayaths"] = conn.execute(f"""
+            SELECT panchayath_id, SUM(reported),
+                   SUM(CASE WHEN status = ? THEN entered ELSE 0 END)
+            FROM issue_daily
+            WHERE {where} AND day >= ?
+            GROUP BY panchayath_id
+        """, [RESOLVED_STATUS, *params, since]).fetchall()
+    return part
+
+
+def report(parts, days=30):
+    """Counts, trend, resolution rate and time to resolution over the last
+    `days` days (including today), from the collect() parts of a scope."""
+    granularity = PERIODS.get(days, "day")
+    end = today()
+    start = end - timedelta(days=days - 1)
+
+    by_status, categories = {}, {}
+    trend = {}
+    day = start
+    while day <= end:
+        trend.setdefault(_period_key(day, granularity), {"reported": 0, "resolved": 0})
+        day += timedelta(days=1)
+    buckets, resolved_count, resolved_seconds = {}, 0, 0.0
+
+    for part in parts:
+        for category, status, count in part["totals"]:
+            by_status[status] = by_status.get(status, 0) + count
+            entry = categories.setdefault(category, {"open": 0, "reported": 0, "resolved": 0})
+            if status in OPEN_STATUSES:
+                entry["open"] += count
+        for category, reported, resolved in part["categories"]:
+            entry = categories.setdefault(category, {"open": 0, "reported": 0, "resolved": 0})
+            entry["reported"] += reported
+            entry["resolved"] += resolved
+        for period, reported, resolved in part["trend"]:
+            if period in trend:
+                trend[period]["reported"] += reported
+                trend[period]["resolved"] += resolved
+        for bucket, resolved, seconds in part["buckets"]:
+            buckets[bucket] = buckets.get(bucket, 0) + resolved
+            resolved_count += resolved
+            resolved_seconds += seconds
+
+    reported = sum(entry["reported"] for entry in categories.values())
+    resolved = sum(entry["resolved"] for entry in categories.values())
+    return {
+        "days": days,
+        "granularity": granularity,
+        "by_status": by_status,
+        "open": sum(by_status.get(status, 0) for status in OPEN_STATUSES),
+        "total": sum(by_status.values()),
+        "reported": reported,
+        "resolved": resolved,
+        # Completions per new report over the period; above 100% means the
+        # backlog shrank
+        "resolution_rate": round(100 * resolved / reported) if reported else None,
+        "avg_days": resolved_seconds / resolved_count / 86400 if resolved_count else None,
+        "median": _median_label(buckets) if resolved_count else None,
+        "categories": sorted(
+            ({"category": name or "Uncategorised", **entry} for name, entry in categories.items()),
+            key=lambda entry: (-entry["open"], -entry["reported"], entry["category"]),
+        ),
+        "trend": [{"period": period, **counts} for period, counts in trend.items()],
+        "trend_max": max([1] + [max(c["reported"], c["resolved"]) for c in trend.values()]),
+    }
+
+
+def panchayath_breakdown(conn, parts):
+    """The panchayaths with the most open issues in a district or state
+    report, with what each reported and resolved over the period. `parts`
+    come from collect(by_panchayath=True); `conn` supplies the names."""
+    rows = {}
+    for part in parts:
+        for panchayath_id, count in part["open"]:
+            entry = rows.setdefault(panchayath_id, {"id": panchayath_id, "open": 0, "reported": 0, "resolved": 0})
+            entry["open"] += count
+        for panchayath_id, reported, resolved in part["panchayaths"]:
+            entry = rows.setdefault(panchayath_id, {"id": panchayath_id, "open": 0, "reported": 0, "resolved": 0})
+            entry["reported"] += reported
+            entry["resolved"] += resolved
+
+    top = sorted(rows.values(), key=lambda entry: (-entry["open"], -entry["reported"], entry["id"]))
+    top = top[:TOP_PANCHAYATHS]
+    if top:
+        names = dict(conn.execute(
+            f"SELECT id, name FROM panchayath WHERE id IN ({', '.join('?' for _ in top)})",
+            [entry["id"] for entry in top],
+        ).fetchall())
+        for entry in top:
+            entry["name"] = names.get(entry["id"], f"#{entry['id']}")
+            entry["resolution_rate"] = (round(100 * entry["resolved"] / entry["reported"])
+                                        if entry["reported"] else None)
+    return top
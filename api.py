@@ -0,0 +1,274 @@
+import hashlib
+import json
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context, url_for
+from werkzeug.exceptions import HTTPException
+
+import caching
+import pagination
+import shards
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is the fallback
+    orjson = None
+
+# ---------------- READ-ONLY JSON API (v1) ----------------
+#
+# For the mobile app and kiosk displays, which poll. Every listing carries
+# an ETag built from the change_counters row of the panchayath it covers
+# (migration 8) plus the query string, so an unchanged poll is answered
+# with 304 after a single primary-key read, before issues or notices are
+# touched. Pages use the same keyset cursors as the HTML listings.
+
+API_VERSION = "v1"
+# Pages with more items than this are streamed item by item instead of
+# being encoded into one buffer
+STREAM_MIN_ITEMS = 50
+
+ISSUE_FIELDS = {
+    "id": "i.id",
+    "panchayath_id": "i.panchayath_id",
+    "panchayath": "p.name AS panchayath",
+    "category": "i.category",
+    "description": "i.description",
+    "location": "i.location",
+    "status": "i.status",
+    "photo_path": "i.photo_path",
+    "created_at": "i.created_at",
+}
+NOTICE_FIELDS = {
+    "id": "n.id",
+    "panchayath_id": "n.panchayath_id",
+    "panchayath": "p.name AS panchayath",
+    "title": "n.title",
+    "description": "n.description",
+    "banner_path": "n.banner_path",
+    "created_at": "n.created_at",
+}
+
+api = Blueprint("api_v1", __name__, url_prefix=f"/api/{API_VERSION}")
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------------- ENCODING ----------------
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _with_urls(item):
+    # Paths are stored relative to static/; clients want URLs
+    for key in ("photo_path", "banner_path"):
+        if item.get(key):
+            item[key.replace("_path", "_url")] = url_for("static", filename=item.pop(key))
+        elif key in item:
+            item[key.replace("_path", "_url")] = item.pop(key)
+    return item
+
+
+def json_page(items, next_cursor, etag):
+    """Encode a page. Large pages are streamed so the whole body never sits
+    in memory as one string."""
+    if len(items) < STREAM_MIN_ITEMS:
+        response = Response(dumps({"data": items, "next_cursor": next_cursor}),
+                            mimetype="application/json")
+    else:
+        def generate():
+            yield b'{"data":['
+            for n, item in enumerate(items):
+                yield (b"," if n else b"") + dumps(item)
+            yield b'],"next_cursor":' + dumps(next_cursor) + b"}"
+        response = Response(stream_with_context(generate()), mimetype="application/json")
+    return _revalidate(response, etag)
+
+
+def _revalidate(response, etag):
+    response.set_etag(etag)
+    # Clients may keep the body but must ask before reusing it
+    response.cache_control.no_cache = True
+    return response
+
+
+# ---------------- CONDITIONAL GET ----------------
+
+def change_version(resource, panchayath_id=None):
+    """Write counter for `resource` in one panchayath, or overall."""
+    pair = (resource, panchayath_id or 0)
+    return shards.change_versions([pair]).get(pair, 0)
+
+
+def make_etag(*parts):
+    # The query string is part of the key: another filter or page of the
+    # same data is a different representation
+    args = sorted(request.args.items(multi=True))
+    raw = json.dumps([API_VERSION, request.path, args, *parts])
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def not_modified(etag):
+    """A bare 304 if the client's copy is current, else None."""
+    if etag in request.if_none_match:
+        return _revalidate(Response(status=304), etag)
+    return None
+
+
+# ---------------- REQUEST PARSING ----------------
+
+def _fields(allowed):
+    """?fields=id,status -> SELECT list; id and created_at always come along
+    because the cursor needs them."""
+    raw = request.args.get("fields")
+    names = [name.strip() for name in raw.split(",") if name.strip()] if raw else list(allowed)
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise APIError(f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    columns = {name: allowed[name] for name in names}
+    columns.setdefault("id", allowed["id"])
+    columns.setdefault("created_at", allowed["created_at"])
+    return names, ", ".join(columns.values())
+
+
+def _int_arg(name):
+    value = request.args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise APIError(f"'{name}' must be an integer")
+
+
+def _read_db(panchayath_id):
+    try:
+        return shards.read_db(panchayath_id)
+    except HTTPException:
+        raise APIError("Unknown panchayath", 404)
+
+
+def _rows(rows, names):
+    return [_with_urls({name: row[name] for name in names}) for row in rows]
+
+
+# ---------------- ENDPOINTS ----------------
+
+@api.route("/issues")
+def list_issues():
+    panchayath_id = _int_arg("panchayath_id")
+    etag = make_etag(change_version("issues", panchayath_id))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    names, columns = _fields(ISSUE_FIELDS)
+    where, params = [], []
+    if panchayath_id:
+        where.append("i.panchayath_id = ?")
+        params.append(panchayath_id)
+    for name in ("status", "category"):
+        if request.args.get(name):
+            where.append(f"i.{name} = ?")
+            params.append(request.args[name])
+    if request.args.get("since"):
+        where.append("i.created_at >= ?")
+        params.append(request.args["since"])
+
+    select = f"""
+        SELECT {columns}
+        FROM issues i
+        JOIN panchayath p ON p.id = i.panchayath_id
+    """
+    if panchayath_id:
+        page = pagination.fetch_page(_read_db(panchayath_id), select, where, params)
+    else:
+        page = shards.fetch_page(select, where, params)
+    return json_page(_rows(page.items, names), page.next_cursor, etag)
+
+
+@api.route("/issues/<int:issue_id>")
+def get_issue(issue_id):
+    # Which panchayath it belongs to isn't known without reading it, so
+    # single issues revalidate against the overall counter
+    etag = make_etag(change_version("issues"))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    names, columns = _fields(ISSUE_FIELDS)
+    sql = f"""
+        SELECT {columns}
+        FROM issues i
+        JOIN panchayath p ON p.id = i.panchayath_id
+        WHERE i.id = ?
+    """
+    # New issues' ids name their shard; ones moved in by a split don't
+    shard = issue_id >> shards.ID_BITS
+    rows = shards.fan_out(lambda conn: conn.execute(sql, (issue_id,)).fetchone(),
+                          {shard} if shard else None)
+    row = next((row for row in rows if row is not None), None)
+    if row is None:
+        raise APIError("Issue not found", 404)
+    response = Response(dumps({"data": _rows([row], names)[0]}), mimetype="application/json")
+    return _revalidate(response, etag)
+
+
+@api.route("/notices")
+def list_notices():
+    panchayath_id = _int_arg("panchayath_id")
+    etag = make_etag(change_version("notices", panchayath_id))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    names, columns = _fields(NOTICE_FIELDS)
+    where, params = [], []
+    if panchayath_id:
+        where.append("n.panchayath_id = ?")
+        params.append(panchayath_id)
+    if request.args.get("since"):
+        where.append("n.created_at >= ?")
+        params.append(request.args["since"])
+
+    select = f"""
+        SELECT {columns}
+        FROM notices n
+        JOIN panchayath p ON p.id = n.panchayath_id
+    """
+    if panchayath_id:
+        page = pagination.fetch_page(_read_db(panchayath_id), select, where, params, alias="n")
+    else:
+        page = shards.fetch_page(select, where, params, alias="n")
+    return json_page(_rows(page.items, names), page.next_cursor, etag)
+
+
+@api.route("/stats")
+def stats():
+    # The counters table is a handful of rows; its contents are the ETag.
+    # Kept the way the home page keeps them (app.get_stats)
+    data = dict(sorted(caching.remember("stats", ("issues",), 60, shards.stats).items()))
+    etag = make_etag(data)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    return _revalidate(Response(dumps({"data": data}), mimetype="application/json"), etag)
+
+
+@api.errorhandler(APIError)
+def api_error(e):
+    return jsonify(error=str(e)), e.status
+
+
+@api.errorhandler(HTTPException)
+def http_error(e):
+    return jsonify(error=e.description), e.code
+
+
+def init_app(app):
+    app.register_blueprint(api)
@@ -1,90 +1,117 @@
 import os
-import sqlite3
-from urllib import response
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, current_app, request, redirect, url_for, flash, session, make_response, jsonify
+from werkzeug.security import generate_password_hash
 from functools import wraps
-from translations import TRANSLATIONS # Import translations
+import translations
+from translations import render_template # Compiled per language
+from db import get_db, get_read_db
+import db
+import storage
+import queries
+import migrations
+import shards
+import pagination
+from pagination import fetch_page
+import caching
+from caching import ttl_cache, cached
+import images
+import mailer
+import uploads
+import assets
+import fts
+import api
+import live
+import metrics
+import analytics
+import exports
+import archive
+import importer
+import limiter
+import sessions
+from werkzeug.exceptions import RequestEntityTooLarge
 
-import requests
 import random
+import secrets
 import time
 
 
-app = Flask(__name__)
-#---------------- SMS OTP CONFIGURATION ----------------
+# ---------------- ROUTES ----------------
+# Views are collected as they're defined and added to each app
+# create_app() builds. (A Blueprint would prefix the endpoint names the
+# templates pass to url_for.)
 
+_routes = []
+_error_handlers = []
 
+def route(rule, **options):
+    def decorator(f):
+        _routes.append((rule, f, options))
+        return f
+    return decorator
+
+def errorhandler(exception):
+    def decorator(f):
+        _error_handlers.append((exception, f))
+        return f
+    return decorator
 
 #---------------- EMAIL OTP UTILITIES ------------------
-import smtplib
-import random
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+
+# An OTP is good for 2 minutes; the sign-up it belongs to can be resent
+# new ones for half an hour
+OTP_TTL = 120
+REGISTRATION_TTL = 1800
 
 def generate_otp():
     return str(random.randint(100000, 999999))
 
 def send_email_otp(user_email, otp):
-    # Use provided credentials as defaults if env vars are missing
-    sender_email = os.environ.get("MAIL_USERNAME", "panchayatseva1@gmail.com")
-    # REPLACE THE STRING BELOW WITH YOUR 16-CHARACTER GOOGLE APP PASSWORD
-    app_password = os.environ.get("MAIL_PASSWORD", "tkao zyic hwog dxnd")
-    
-    if not sender_email or not app_password:
-        print("Error: Email credentials not found in environment variables.")
-        return False
-
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = user_email
-        msg['Subject'] = "Your Verification OTP"
-
-        body = f"Your OTP is: {otp}\n\nThis OTP is valid for 2 minutes.\nDo not share this with anyone."
-        msg.attach(MIMEText(body, 'plain'))
-
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, app_password)
-        server.sendmail(sender_email, user_email, msg.as_string())
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        # Even if email fails, print to console so user can still test
-        print(f"\n[FALLBACK] Email failed. Enter this OTP: {otp}\n")
-        return True
-
-# ---------------- CONFIGURATION ----------------
-app.secret_key = os.environ.get("SECRET_KEY", "new_secure_random_key_2025")
-
-DB_NAME = "database/panchayath.db"
-
-# ---------------- DATABASE CONNECTION ----------------
-
-def connect_db():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Queued in the outbox; mailer's worker does the SMTP round trips
+    body = f"Your OTP is: {otp}\n\nThis OTP is valid for 2 minutes.\nDo not share this with anyone."
+    mailer.enqueue(get_db(), user_email, "Your Verification OTP", body)
+    return True
+
+def sweep_registrations(limit):
+    # Called by the session reaper (sessions.py)
+    conn = get_db()
+    deleted = queries.delete_expired_registrations(conn, time.time(), limit)
+    conn.commit()
+    return deleted
 
 # ---------------- I18N UTILS ----------------
 
-@app.context_processor
-def inject_get_text():
-    def get_text(key):
-        lang = session.get("lang", "en")
-        return TRANSLATIONS.get(lang, TRANSLATIONS["en"]).get(key, key)
-    return dict(get_text=get_text)
-
-@app.route("/set_language/<lang_code>")
+@route("/set_language/<lang_code>")
 def set_language(lang_code):
-    if lang_code in TRANSLATIONS:
+    if lang_code in translations.LANGUAGES:
         session["lang"] = lang_code
     return redirect(request.referrer or url_for("home"))
 
+# ---------------- LISTING UTILS ----------------
+
+def render_listing(template, fragment, page, **context):
+    """Render a paginated listing. "Load more" requests (?fragment=1) only
+    get the next batch of rows, with the following cursor in a header."""
+    if request.args.get("fragment"):
+        response = make_response(render_template(fragment, page=page, **context))
+        if page.next_cursor:
+            response.headers["X-Next-Cursor"] = page.next_cursor
+        return response
+    return render_template(template, page=page, **context)
+
+@errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    limit_mb = current_app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)
+    flash(f"File is too large. The limit is {limit_mb} MB.", "danger")
+    return redirect(request.url)
+
 # ---------------- SECURITY UTILS ----------------
 
+def verify_password(password_hash, password):
+    # Deliberately slow hashing; the histogram shows what logins cost,
+    # including any wait for a hashing slot
+    with metrics.timed("password_check_duration_seconds"):
+        return limiter.check_password(password_hash, password)
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -106,107 +133,70 @@ def user_login_required(f):
 # ---------------- INITIALIZE DATABASE ----------------
 
 def init_db():
-    conn = connect_db()
-    conn.executescript("""
-    CREATE TABLE IF NOT EXISTS panchayath (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        district TEXT,
-        state TEXT
-    );
-
-    CREATE TABLE IF NOT EXISTS issues (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        panchayath_id INTEGER,
-        category TEXT,
-        description TEXT,
-        location TEXT,
-        photo_path TEXT,
-        status TEXT DEFAULT 'Pending',
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    );
-
-    CREATE TABLE IF NOT EXISTS notices ( 
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        panchayath_id INTEGER,
-        title TEXT,
-        description TEXT,
-        banner_path TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    );
-
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        email TEXT UNIQUE,
-        mobile TEXT,
-        password_hash TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    );
-
-    CREATE TABLE IF NOT EXISTS admin (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT,
-        password_hash TEXT,
-        panchayath_id INTEGER
-    );
-    """)
-    
-    # Add user_id to issues table if it doesn't exist
-    try:
-        conn.execute("SELECT user_id FROM issues LIMIT 1")
-    except sqlite3.OperationalError:
-        conn.execute("ALTER TABLE issues ADD COLUMN user_id INTEGER")
-        conn.commit()
-
-    # Add banner_path to notices table if it doesn't exist
-    try:
-        conn.execute("SELECT banner_path FROM notices LIMIT 1")
-    except sqlite3.OperationalError:
-        conn.execute("ALTER TABLE notices ADD COLUMN banner_path TEXT")
-        conn.commit()
-
-    conn.commit()
-    conn.close()
+    # Schema changes live in migrations.py; in production run
+    # `flask db upgrade` once per deploy instead.
+    conn = get_db()
+    for version, name in migrations.upgrade(conn):
+        print(f"Applied migration {version:04d} {name}")
+    for path in shards.paths():
+        shard = db.open_connection(path)
+        try:
+            for version, name in migrations.upgrade(shard):
+                print(f"Applied migration {version:04d} {name} to {path}")
+        finally:
+            shard.close()
 
 # ---------------- SEED DEFAULT DATA ----------------
 
 def seed_data():
-    conn = connect_db()
-    cur = conn.cursor()
+    conn = get_db()
 
-    cur.execute("SELECT COUNT(*) FROM panchayath")
-    if cur.fetchone()[0] == 0:
-        cur.execute("""
-            INSERT INTO panchayath (name, district, state)
-            VALUES ('Demo Panchayath', 'Demo District', 'Demo State')
-        """)
-
-        cur.execute("""
-            INSERT INTO admin (username, password_hash, panchayath_id)
-            VALUES (?, ?, ?)
-        """, ("admin", generate_password_hash("admin123"), 1))
+    if queries.count_panchayaths(conn) == 0:
+        queries.add_panchayath(conn, "Demo Panchayath", "Demo District", "Demo State")
+        queries.add_admin(conn, "admin", generate_password_hash("admin123"), 1)
 
     conn.commit()
-    conn.close()
+    get_panchayaths.cache_clear()
+
+# ---------------- SHARED LOOKUPS ----------------
+
+ISSUE_STATUSES = ("Pending", "In Progress", "Completed")
+ISSUE_CATEGORIES = ("Garbage Collection", "Water Supply", "Road Maintenance", "Street Lights",
+                    "Drainage/Sewerage", "Others")
+# Most issues one bulk status update may touch
+BULK_UPDATE_LIMIT = 500
+
+@ttl_cache(300)
+def get_panchayaths():
+    # Changes only when a panchayath is onboarded; other workers pick the
+    # change up within the TTL.
+    return queries.all_panchayaths(get_read_db())
+
+def get_stats():
+    # Counters maintained by triggers (migration 4), a single PK range read
+    # per database - every shard's, so the sum is kept until an issue
+    # changes (the citizen count within the TTL), for logged-in renders too
+    return caching.remember("stats", ("issues",), 60, shards.stats)
 
 # ---------------- CITIZEN ROUTES --------------
 
-@app.route("/")
+@route("/")
+# The citizen count has no change counter; the TTL keeps it fresh enough
+@cached("issues", ttl=60)
 def home():
-    conn = connect_db()
-    panchayaths = conn.execute("SELECT * FROM panchayath").fetchall()
+    panchayaths = get_panchayaths()
     
     # Fetch stats
-    total_panchayaths = conn.execute("SELECT COUNT(*) FROM panchayath").fetchone()[0]
-    total_issues = conn.execute("SELECT COUNT(*) FROM issues").fetchone()[0]
-    resolved_issues = conn.execute("SELECT COUNT(*) FROM issues WHERE status = 'Completed'").fetchone()[0]
+    counters = get_stats()
+    total_panchayaths = counters.get("panchayaths", 0)
+    total_issues = counters.get("issues", 0)
+    resolved_issues = counters.get("issues_completed", 0)
     
     resolution_rate = 0
     if total_issues > 0:
         resolution_rate = int((resolved_issues / total_issues) * 100)
     
-    total_citizens = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    total_citizens = counters.get("users", 0)
     
     stats = {
         "panchayaths": total_panchayaths,
@@ -215,10 +205,9 @@ def home():
         "citizens": f"{total_citizens}" if total_citizens > 0 else "0"
     }
     
-    conn.close()
     return render_template("citizen/index.html", panchayaths=panchayaths, stats=stats)
 
-@app.route("/report", methods=["GET", "POST"])
+@route("/report", methods=["GET", "POST"])
 @user_login_required
 def report_issue():
     # Admins can't report issues (already blocked but good to keep logic clear)
@@ -226,15 +215,6 @@ def report_issue():
         flash("Admins cannot report issues. Please use the dashboard.", "warning")
         return redirect(url_for("admin_dashboard"))
 
-    conn = connect_db()
-
-    # Check/Add photo_path column if not exists (already handled in migration above but safe to keep)
-    try:
-        conn.execute("SELECT photo_path FROM issues LIMIT 1")
-    except sqlite3.OperationalError:
-        conn.execute("ALTER TABLE issues ADD COLUMN photo_path TEXT")
-        conn.commit()
-
     if request.method == "POST":
         panchayath_id = request.form["panchayath_id"]
         category = request.form["category"]
@@ -245,96 +225,144 @@ def report_issue():
         image = request.files.get("image")
         image_filename = None
         
+        created = False
+        conn = shards.write_db(panchayath_id)
+        
         if image and image.filename != "":
-            upload_folder = os.path.join("static", "uploads")
-            os.makedirs(upload_folder, exist_ok=True)
-            import time
-            from werkzeug.utils import secure_filename
-            ext = os.path.splitext(image.filename)[1]
-            filename = f"issue_{int(time.time())}{ext}"
-            image.save(os.path.join(upload_folder, filename))
-            image_filename = f"uploads/{filename}"
-
-        conn.execute("""
-            INSERT INTO issues (panchayath_id, category, description, location, photo_path, user_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (panchayath_id, category, description, location, image_filename, user_id))
+            try:
+                image_filename, created = uploads.store(conn, image)
+            except uploads.UploadError as e:
+                conn.rollback()
+                flash(str(e), "danger")
+                return redirect(url_for("report_issue"))
+
+        queries.add_issue(conn, panchayath_id, category, description, location, image_filename, user_id)
 
         conn.commit()
-        conn.close()
+        # Thumbnails and WebP variants happen off the request; a photo
+        # someone already uploaded has them already
+        if created:
+            images.submit(image_filename)
         flash("Issue reported successfully", "success")
         return redirect(url_for("track_issue"))
 
-    panchayaths = conn.execute("SELECT * FROM panchayath").fetchall()
-    conn.close()
-    return render_template("citizen/report_issue.html", panchayaths=panchayaths)
+    return render_template("citizen/report_issue.html", panchayaths=get_panchayaths())
 
-@app.route("/track")
+@route("/track")
 @user_login_required
 def track_issue():
     user_id = session["user_id"]
-    conn = connect_db()
-    issues = conn.execute("""
-        SELECT i.*, p.name AS panchayath_name
-        FROM issues i
-        JOIN panchayath p ON p.id = i.panchayath_id
-        WHERE i.user_id = ?
-        ORDER BY i.created_at DESC
-    """, (user_id,)).fetchall()
-    conn.close()
-    return render_template("citizen/track_issue.html", issues=issues, title="My Reported Issues")
-
-@app.route("/public-track")
+    # A citizen may report in any panchayath, so in any shard; archived
+    # issues only when they ask for their history
+    history = archive.requested()
+    fetch = archive.fetch_page if history else shards.fetch_page
+    page = fetch(queries.ISSUES_WITH_PANCHAYATH_LISTING, ["i.user_id = ?"], [user_id])
+    return render_listing("citizen/track_issue.html", "citizen/_issue_cards.html", page,
+                          issues=page.items, title="My Reported Issues", history=history,
+                          live_after=live.resume_token())
+
+@route("/public-track")
+@cached("issues")
 def public_track():
-    conn = connect_db()
-    issues = conn.execute("""
-        SELECT i.*, p.name AS panchayath_name, u.name AS user_name
-        FROM issues i
-        JOIN panchayath p ON p.id = i.panchayath_id
-        LEFT JOIN users u ON u.id = i.user_id
-        ORDER BY i.created_at DESC
-    """).fetchall()
-    conn.close()
-    return render_template("citizen/track_issue.html", issues=issues, title="Public Issue Tracker", is_public=True)
-
-@app.route("/about")
+    history = archive.requested()
+    fetch = archive.fetch_page if history else shards.fetch_page
+    page = fetch(queries.PUBLIC_ISSUES_LISTING)
+    return render_listing("citizen/track_issue.html", "citizen/_issue_cards.html", page,
+                          issues=page.items, title="Public Issue Tracker", is_public=True,
+                          history=history)
+
+@route("/about")
+@cached()
 def about():
     return render_template("citizen/about.html")
 
-@app.route("/notices")
+@route("/notices")
+@cached("notices")
 def notices():
-    conn = connect_db()
-    notices = conn.execute("""
-        SELECT n.*, p.name AS panchayath_name
-        FROM notices n
-        JOIN panchayath p ON p.id = n.panchayath_id
-        ORDER BY n.created_at DESC
-    """).fetchall()
-    conn.close()
-    return render_template("citizen/notices.html", notices=notices)
+    page = shards.fetch_page(queries.NOTICES_LISTING, alias="n")
+    return render_listing("citizen/notices.html", "citizen/_notice_items.html", page,
+                          notices=page.items)
+
+# ---------------- SEARCH ----------------
+
+def run_search():
+    """Parse the search form and fetch one page of results."""
+    query = {
+        "q": request.args.get("q", "").strip(),
+        "type": "notices" if request.args.get("type") == "notices" else "issues",
+        "panchayath_id": request.args.get("panchayath_id", type=int),
+        "status": request.args.get("status") if request.args.get("status") in ISSUE_STATUSES else None,
+    }
+    cursor = request.args.get("cursor", "")
+    size = pagination.page_size()
+
+    def run(conn):
+        if query["type"] == "notices":
+            return fts.search_notices(conn, query["q"], query["panchayath_id"], cursor, size)
+        return fts.search_issues(conn, query["q"], query["panchayath_id"], query["status"], cursor, size)
+
+    if query["panchayath_id"]:
+        page = run(shards.read_db(query["panchayath_id"]))
+    else:
+        page = fts.merge(shards.fan_out(run), size)
+    return query, page
+
+@route("/search")
+def search():
+    query, page = run_search()
+    return render_listing("citizen/search.html", "citizen/_search_results.html", page,
+                          results=page.items, query=query,
+                          panchayaths=get_panchayaths(), statuses=ISSUE_STATUSES)
+
+@route("/api/search")
+def api_search():
+    query, page = run_search()
+    if query["type"] == "notices":
+        results = [{
+            "id": r["id"],
+            "title": r["title"],
+            "title_html": fts.marked(r["title_hl"]),
+            "snippet_html": fts.marked(r["description_hl"]),
+            "panchayath": r["panchayath_name"],
+            "created_at": r["created_at"],
+        } for r in page.items]
+    else:
+        results = [{
+            "id": r["id"],
+            "category": r["category"],
+            "status": r["status"],
+            "location": r["location"],
+            "snippet_html": fts.marked(r["description_hl"]),
+            "panchayath": r["panchayath_name"],
+            "created_at": r["created_at"],
+        } for r in page.items]
+    return jsonify(query=query, results=results, next_cursor=page.next_cursor)
 
 # ---------------- USER AUTH ROUTES ----------------
 
-@app.route("/register", methods=["GET", "POST"])
+@route("/register", methods=["GET", "POST"])
 def user_register():
     if request.method == "POST":
         name = request.form["name"]
         email = request.form["email"]
         mobile = request.form["mobile"]
         password = request.form["password"]
-
-        # store data temporarily
-        session["temp_user"] = {
-            "name": name,
-            "email": email,
-            "mobile": mobile,
-            "password": generate_password_hash(password)
-        }
-
+        limiter.check("otp", email)
+
+        # Held server-side until the OTP is confirmed; the session only
+        # carries the token
+        conn = get_db()
+        if session.get("registration"):
+            queries.delete_pending_registration(conn, session["registration"])
+        token = secrets.token_urlsafe(16)
         otp = generate_otp()
-        session["otp"] = otp
-        session["otp_time"] = time.time()
-        
+        now = time.time()
+        queries.add_pending_registration(conn, token, name, email, mobile,
+                                         limiter.hash_password(password), otp,
+                                         now, now + REGISTRATION_TTL)
+        conn.commit()
+        session["registration"] = token
+
         # Send OTP via Email
         if send_email_otp(email, otp):
              flash(f"OTP sent to {email}", "info")
@@ -345,41 +373,36 @@ def user_register():
 
     return render_template("citizen/register.html")
 
-@app.route("/verify-otp", methods=["GET", "POST"])
+@route("/verify-otp", methods=["GET", "POST"])
 def verify_otp():
     if request.method == "POST":
         entered_otp = request.form["otp"]
 
-        # OTP expiry: 2 minutes
-        if time.time() - session.get("otp_time", 0) > 120:
+        conn = get_db()
+        now = time.time()
+        token = session.get("registration")
+        pending = queries.pending_registration(conn, token, now) if token else None
+        if pending is None:
+            session.pop("registration", None)
+            flash("Session expired. Please register again.", "warning")
+            return redirect(url_for("user_register"))
+
+        if now - pending["otp_sent_at"] > OTP_TTL:
             flash("OTP expired. Please resend OTP.", "danger")
             return redirect(url_for("verify_otp"))
 
-        if entered_otp == session.get("otp"):
-            user = session.get("temp_user")
-
-            conn = connect_db()
+        if entered_otp == pending["otp"]:
             try:
-                conn.execute("""
-                    INSERT INTO users (name, email, mobile, password_hash)
-                    VALUES (?, ?, ?, ?)
-                """, (
-                    user["name"],
-                    user["email"],
-                    user["mobile"],
-                    user["password"]
-                ))
+                queries.add_user(conn, pending["name"], pending["email"], pending["mobile"],
+                                 pending["password_hash"])
+                queries.delete_pending_registration(conn, token)
                 conn.commit()
-            except sqlite3.IntegrityError:
+            except storage.IntegrityError:
                 flash("Email or Mobile already exists.", "danger")
+                conn.rollback()
                 return redirect(url_for("user_register"))
-            finally:
-                conn.close()
 
-            # Clear session
-            session.pop("otp", None)
-            session.pop("otp_time", None)
-            session.pop("temp_user", None)
+            session.pop("registration", None)
 
             flash("Registration successful. Please login.", "success")
             return redirect(url_for("user_login"))
@@ -388,18 +411,22 @@ def verify_otp():
 
     return render_template("citizen/verify_otp.html")
 
-@app.route("/resend-otp")
+@route("/resend-otp")
 def resend_otp():
-    if "temp_user" not in session:
+    conn = get_db()
+    token = session.get("registration")
+    pending = queries.pending_registration(conn, token, time.time()) if token else None
+    if pending is None:
         flash("Session expired. Please register again.", "warning")
         return redirect(url_for("user_register"))
-    
+
+    email = pending["email"]
+    limiter.check("otp", email)
+
     otp = generate_otp()
-    session["otp"] = otp
-    session["otp_time"] = time.time()
-    
-    email = session["temp_user"]["email"]
-    
+    queries.set_registration_otp(conn, token, otp, time.time())
+    conn.commit()
+
     if send_email_otp(email, otp):
         flash(f"New OTP sent to {email}", "info")
     else:
@@ -407,17 +434,17 @@ def resend_otp():
         
     return redirect(url_for("verify_otp"))
 
-@app.route("/login", methods=["GET", "POST"])
+@route("/login", methods=["GET", "POST"])
 def user_login():
     if request.method == "POST":
         email = request.form["email"]
         password = request.form["password"]
+        limiter.check("login", email)
         
-        conn = connect_db()
-        user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
-        conn.close()
+        user = queries.user_by_email(get_read_db(), email)
         
-        if user and check_password_hash(user["password_hash"], password):
+        if user and verify_password(user["password_hash"], password):
+            sessions.regenerate()
             session["user_id"] = user["id"]
             session["user_name"] = user["name"]
             flash(f"Welcome back, {user['name']}!", "success")
@@ -427,7 +454,7 @@ def user_login():
         
     return render_template("citizen/login.html")
 
-@app.route("/logout")
+@route("/logout")
 def user_logout():
     session.pop("user_id", None)
     session.pop("user_name", None)
@@ -436,19 +463,17 @@ def user_logout():
 
 # ---------------- ADMIN ROUTES ----------------
 
-@app.route("/admin/login", methods=["GET", "POST"])
+@route("/admin/login", methods=["GET", "POST"])
 def admin_login():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
+        limiter.check("admin_login", username)
 
-        conn = connect_db()
-        admin = conn.execute(
-            "SELECT * FROM admin WHERE username = ?", (username,)
-        ).fetchone()
-        conn.close()
+        admin = queries.admin_by_username(get_read_db(), username)
 
-        if admin and check_password_hash(admin["password_hash"], password):
+        if admin and verify_password(admin["password_hash"], password):
+            sessions.regenerate()
             session["admin_id"] = admin["id"]
             session["panchayath_id"] = admin["panchayath_id"]
             flash(f"Welcome back, Admin {admin['username']}!", "success")
@@ -458,32 +483,74 @@ def admin_login():
 
     return render_template("admin/login.html")
 
-@app.route("/admin")
+@route("/admin")
 @login_required
 def admin_dashboard():
     # if "admin_id" not in session: check handled by decorator
     pid = session["panchayath_id"]
-    conn = connect_db()
+    conn = shards.read_db(pid)
 
-    issues = conn.execute("""
-        SELECT i.*, u.name as reporter_name 
-        FROM issues i
-        LEFT JOIN users u ON i.user_id = u.id
-        WHERE i.panchayath_id = ?
-        ORDER BY i.created_at DESC
-    """, (pid,)).fetchall()
+    selected = dashboard_filters(request.args)
+    where, params = queries.issue_filters(pid, selected)
+    history = archive.requested()
+    if history:
+        page = archive.fetch_page(queries.ADMIN_ISSUES_LISTING, where, params, panchayath_id=pid)
+    else:
+        page = fetch_page(conn, queries.ADMIN_ISSUES_LISTING, where, params)
+
+    if request.args.get("fragment"):
+        return render_listing("admin/dashboard.html", "admin/_issue_rows.html", page, issues=page.items)
 
-    conn.close()
-    return render_template("admin/dashboard.html", issues=issues)
+    return render_listing("admin/dashboard.html", "admin/_issue_rows.html", page,
+                          issues=page.items, counts=issue_counts(conn, pid),
+                          statuses=ISSUE_STATUSES, live_after=live.resume_token(),
+                          filters=selected, categories=ISSUE_CATEGORIES, formats=exports.FORMATS,
+                          history=history)
+
+def dashboard_filters(args):
+    try:
+        return exports.filters(args)
+    except ValueError:
+        flash("Dates must be in YYYY-MM-DD format.", "danger")
+        return {}
+
+def issue_counts(conn, pid):
+    # Kept current by the analytics rollup triggers (migration 10)
+    by_status = queries.status_totals(conn, pid)
+    return {
+        "total": sum(by_status.values()),
+        "pending": by_status.get("Pending", 0),
+        "resolved": by_status.get("Completed", 0),
+    }
+
+@route("/admin/analytics")
+@login_required
+def admin_analytics():
+    scope = request.args.get("scope")
+    if scope not in analytics.SCOPES:
+        scope = "panchayath"
+    days = request.args.get("days", type=int)
+    if days not in analytics.PERIODS:
+        days = 30
+
+    conn = get_read_db()
+    label, where, params = analytics.scope_filter(conn, scope, session["panchayath_id"])
+    parts = shards.fan_out(lambda shard: analytics.collect(shard, where, params, days, scope != "panchayath"),
+                           shards.shard_ids(where, params))
+    report = analytics.report(parts, days)
+    breakdown = analytics.panchayath_breakdown(conn, parts) if scope != "panchayath" else None
+    return render_template("admin/analytics.html", report=report, breakdown=breakdown,
+                           scope=scope, scope_label=label, days=days,
+                           scopes=analytics.SCOPES, periods=analytics.PERIODS)
 
 # ---------------- ADMIN NOTICES (FIXED PART) ----------------
 
-@app.route("/admin/notices", methods=["GET", "POST"])
+@route("/admin/notices", methods=["GET", "POST"])
 @login_required
 def admin_notices():
     # if "admin_id" not in session: check handled by decorator
     pid = session["panchayath_id"]
-    conn = connect_db()
+    conn = shards.write_db(pid)
 
     if request.method == "POST":
         title = request.form["title"]
@@ -492,57 +559,49 @@ def admin_notices():
         banner = request.files.get("banner")
         banner_filename = None
         
+        created = False
+        
         if banner and banner.filename != "":
-            upload_folder = os.path.join("static", "uploads")
-            os.makedirs(upload_folder, exist_ok=True)
-            import time
-            ext = os.path.splitext(banner.filename)[1]
-            filename = f"notice_{int(time.time())}{ext}"
-            banner.save(os.path.join(upload_folder, filename))
-            banner_filename = f"uploads/{filename}"
-
-        conn.execute("""
-            INSERT INTO notices (panchayath_id, title, description, banner_path)
-            VALUES (?, ?, ?, ?)
-        """, (pid, title, description, banner_filename))
+            try:
+                banner_filename, created = uploads.store(conn, banner)
+            except uploads.UploadError as e:
+                conn.rollback()
+                flash(str(e), "danger")
+                return redirect(url_for("admin_notices"))
+
+        queries.add_notice(conn, pid, title, description, banner_filename)
         conn.commit()
+        if created:
+            images.submit(banner_filename)
         flash("Notice published successfully", "success")
 
-    notices = conn.execute("""
-        SELECT * FROM notices
-        WHERE panchayath_id = ?
-        ORDER BY created_at DESC
-    """, (pid,)).fetchall()
+    return render_template("admin/notices.html", notices=queries.panchayath_notices(conn, pid))
 
-    conn.close()
-    return render_template("admin/notices.html", notices=notices)
-
-@app.route("/admin/notices/delete/<int:notice_id>")
+@route("/admin/notices/delete/<int:notice_id>")
 @login_required
 def delete_notice(notice_id):
     pid = session["panchayath_id"]
-    conn = connect_db()
+    conn = shards.write_db(pid)
     
     # Ensure the notice belongs to this panchayath
-    notice = conn.execute("SELECT * FROM notices WHERE id = ? AND panchayath_id = ?", (notice_id, pid)).fetchone()
+    notice = queries.panchayath_notice(conn, notice_id, pid)
     
     if notice:
-        conn.execute("DELETE FROM notices WHERE id = ?", (notice_id,))
+        queries.delete_notice(conn, notice_id)
+        released = uploads.release(conn, notice["banner_path"])
         conn.commit()
+        uploads.discard(conn, [released])
         flash("Notice deleted successfully", "success")
     else:
         flash("Notice not found or unauthorized", "danger")
         
-    conn.close()
     return redirect(url_for("admin_notices"))
 
-@app.route("/profile")
+@route("/profile")
 @user_login_required
 def user_profile():
     user_id = session["user_id"]
-    conn = connect_db()
-    user = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
+    user = queries.user_by_id(get_read_db(), user_id)
     
     if not user:
         flash("User not found", "danger")
@@ -550,19 +609,16 @@ def user_profile():
         
     return render_template("citizen/profile.html", user=user)
 
-@app.route("/admin/issue/<int:issue_id>")
+@route("/admin/issue/<int:issue_id>")
 @login_required
 def admin_issue_detail(issue_id):
     # Authorization check handled by decorator
 
-    conn = connect_db()
-    issue = conn.execute("""
-        SELECT i.*, u.name as reporter_name, u.email as reporter_email, u.mobile as reporter_mobile
-        FROM issues i
-        LEFT JOIN users u ON i.user_id = u.id
-        WHERE i.id = ?
-    """, (issue_id,)).fetchone()
-    conn.close()
+    conn = shards.read_db(session["panchayath_id"])
+    issue = queries.issue_with_reporter(conn, issue_id)
+    if not issue:
+        issue = archive.find(lambda archived: queries.issue_with_reporter(archived, issue_id),
+                             session["panchayath_id"])
 
     if not issue:
         flash("Issue not found", "danger")
@@ -570,32 +626,231 @@ def admin_issue_detail(issue_id):
 
     return render_template("admin/issue_detail.html", issue=issue)
 
-@app.route("/admin/update/<int:issue_id>", methods=["POST"])
+@route("/admin/update/<int:issue_id>", methods=["POST"])
 @login_required
 def update_issue(issue_id):
     # Authorization check handled by decorator
 
     status = request.form["status"]
-    conn = connect_db()
-    conn.execute(
-        "UPDATE issues SET status=? WHERE id=?",
-        (status, issue_id)
-    )
+    conn = shards.write_db(session["panchayath_id"])
+    updated = queries.set_issue_status(conn, issue_id, session["panchayath_id"], status)
     conn.commit()
-    conn.close()
 
-    flash("Status updated", "success")
+    if updated:
+        flash("Status updated", "success")
+    else:
+        flash("Issue not found or unauthorized", "danger")
     return redirect(url_for("admin_dashboard"))
 
-@app.route("/admin/logout")
+@route("/admin/issues/bulk-update", methods=["POST"])
+@login_required
+def bulk_update_issues():
+    pid = session["panchayath_id"]
+    status = request.form.get("status")
+    issue_ids = sorted(set(request.form.getlist("issue_ids", type=int)))
+    wants_json = request.accept_mimetypes.best == "application/json"
+
+    error = None
+    if status not in ISSUE_STATUSES:
+        error = "Choose a valid status."
+    elif not issue_ids:
+        error = "Select at least one issue."
+    elif len(issue_ids) > BULK_UPDATE_LIMIT:
+        error = f"At most {BULK_UPDATE_LIMIT} issues can be updated at once."
+    if error:
+        if wants_json:
+            return jsonify(error=error), 400
+        flash(error, "danger")
+        return redirect(url_for("admin_dashboard"))
+
+    conn = shards.write_db(pid)
+    # Only this panchayath's issues that actually change; the write lock is
+    # held (or the rows locked) from here so the set can't shift before the
+    # update
+    storage.begin_write(conn)
+    try:
+        changed = queries.issues_to_update(conn, issue_ids, pid, status)
+        queries.set_statuses(conn, changed, status)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    summary = {"status": status, "updated": len(changed), "skipped": len(issue_ids) - len(changed)}
+    message = f"{summary['updated']} issue(s) marked {status}"
+    if summary["skipped"]:
+        message += f", {summary['skipped']} skipped (already {status}, or not in your panchayath)"
+    if not wants_json:
+        flash(message, "success")
+        return redirect(url_for("admin_dashboard"))
+
+    rows = []
+    if changed:
+        rows = queries.admin_issue_rows(conn, changed)
+    return jsonify(
+        **summary,
+        message=message,
+        ids=changed,
+        rows_html=render_template("admin/_issue_rows.html", issues=rows),
+        counts=issue_counts(conn, pid),
+    )
+
+# ---------------- EXPORTS ----------------
+
+@route("/admin/export")
+@login_required
+def admin_export():
+    # Streamed as it is read, so any number of issues can be downloaded
+    pid = session["panchayath_id"]
+    fmt = request.args.get("format", "csv")
+    try:
+        selected = exports.filters(request.args)
+    except ValueError:
+        flash("Dates must be in YYYY-MM-DD format.", "danger")
+        return redirect(url_for("admin_dashboard"))
+    if fmt not in exports.FORMATS:
+        flash("Unknown export format.", "danger")
+        return redirect(url_for("admin_dashboard"))
+    where, params = queries.issue_filters(pid, selected)
+    return exports.stream(queries.export_issue_rows(shards.read_db(pid), where, params), fmt, pid)
+
+@route("/admin/exports", methods=["GET", "POST"])
+@login_required
+def admin_exports():
+    pid = session["panchayath_id"]
+    if request.method == "POST":
+        fmt = request.form.get("format", "csv")
+        try:
+            selected = exports.filters(request.form)
+        except ValueError:
+            flash("Dates must be in YYYY-MM-DD format.", "danger")
+            return redirect(url_for("admin_exports"))
+        if fmt not in exports.FORMATS:
+            flash("Unknown export format.", "danger")
+            return redirect(url_for("admin_exports"))
+        exports.start_job(get_db(), pid, session["admin_id"], fmt, selected)
+        flash("Export started. It can be downloaded here once it is ready.", "info")
+        return redirect(url_for("admin_exports"))
+
+    jobs = [exports.describe(job) for job in queries.panchayath_export_jobs(get_read_db(), pid)]
+    return render_template("admin/exports.html", jobs=jobs, formats=exports.FORMATS,
+                           statuses=ISSUE_STATUSES, categories=ISSUE_CATEGORIES)
+
+def panchayath_export_job(job_id):
+    job = queries.export_job(get_read_db(), job_id)
+    if job is None or job["panchayath_id"] != session["panchayath_id"]:
+        return None
+    return job
+
+@route("/admin/exports/<int:job_id>")
+@login_required
+def admin_export_progress(job_id):
+    job = panchayath_export_job(job_id)
+    if job is None:
+        return jsonify(error="Export not found"), 404
+    return jsonify(exports.describe(job))
+
+@route("/admin/exports/<int:job_id>/download")
+@login_required
+def admin_export_download(job_id):
+    job = panchayath_export_job(job_id)
+    if job is None or job["status"] != "done":
+        flash("Export not found.", "danger")
+        return redirect(url_for("admin_exports"))
+    return exports.send(job)
+
+@route("/admin/logout")
 def admin_logout():
     session.clear()
     flash("Admin logged out successfully.", "success")
     return redirect(url_for("admin_login"))
 
+# ---------------- LIVE UPDATES ----------------
+
+@route("/track/stream")
+@user_login_required
+def track_stream():
+    user_id = session["user_id"]
+
+    def render(conn, issue_ids):
+        rows = queries.user_issue_cards(conn, issue_ids, user_id)
+        return {row["id"]: render_template("citizen/_issue_cards.html", issues=[row]) for row in rows}
+
+    return live.stream(lambda event: event["user_id"] == user_id, render)
+
+@route("/admin/stream")
+@login_required
+def admin_stream():
+    pid = session["panchayath_id"]
+
+    def render(conn, issue_ids):
+        rows = queries.panchayath_issue_rows(conn, issue_ids, pid)
+        return {row["id"]: render_template("admin/_issue_rows.html", issues=[row]) for row in rows}
+
+    return live.stream(lambda event: event["panchayath_id"] == pid, render)
+
+# ---------------- HEALTH ----------------
+
+@route("/healthz")
+def healthz():
+    # Readiness probe for the load balancer: the database answers and its
+    # schema is current. One read, never cached.
+    try:
+        version = queries.schema_version(get_read_db())
+    except storage.DatabaseError as e:
+        return jsonify(status="unavailable", error=str(e)), 503
+    if version < migrations.latest_version():
+        return jsonify(status="migrating", schema_version=version), 503
+    return jsonify(status="ok", schema_version=version)
+
+# ---------------- APPLICATION FACTORY ----------------
+
+def create_app(config=None):
+    """Build the app. gunicorn builds it once in the master and forks its
+    workers from it (gunicorn.conf.py); `flask` finds it on its own."""
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SECRET_KEY", "new_secure_random_key_2025")
+    if config:
+        app.config.update(config)
+
+    storage.init_app(app)
+    db.init_app(app)
+    metrics.init_app(app)
+    limiter.init_app(app)
+    sessions.init_app(app)
+    sessions.register_sweeper(sweep_registrations)
+    migrations.init_app(app)
+    shards.init_app(app)
+    pagination.init_app(app)
+    images.init_app(app)
+    mailer.init_app(app)
+    uploads.init_app(app)
+    assets.init_app(app)
+    translations.init_app(app)
+    caching.init_app(app)
+    fts.init_app(app)
+    exports.init_app(app)
+    archive.init_app(app)
+    importer.init_app(app)
+    api.init_app(app)
+    live.init_app(app)
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    for exception, handler in _error_handlers:
+        app.register_error_handler(exception, handler)
+    return app
+
+def initialize(app):
+    """Upgrade the schema and seed the demo data. Runs once per start: in
+    gunicorn's master before it forks, or here for the dev server."""
+    with app.app_context():
+        init_db()
+        seed_data()
+
 # ---------------- MAIN ----------------
 
 if __name__ == "__main__":
-    init_db()
-    seed_data()
+    app = create_app()
+    initialize(app)
     app.run(debug=True)
@@ -0,0 +1,360 @@
+import gzip
+import mimetypes
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import abort, current_app, request, send_file, url_for
+from flask.cli import AppGroup
+from werkzeug.security import safe_join
+
+import db
+import pagination
+import shards
+import storage
+import uploads
+
+# ---------------- ARCHIVE ----------------
+#
+# A completed issue never changes again, yet it would stay in the issues
+# table, and its photo in static/uploads, for good: every index, listing,
+# COUNT(*) and backup keeps growing with years of finished work. `flask
+# archive run` (schedule it, e.g. nightly) moves issues completed more than
+# ARCHIVE_AFTER_DAYS ago out of the hot database:
+#
+#   rows    into an archive database beside it, attached while they move:
+#           ARCHIVE_PATH (database/archive.db) for the main database,
+#           <shard>.archive.db for each shard file (shards.py)
+#   photos  into ARCHIVE_UPLOAD_DIR under their upload names, gzipped when
+#           that saves space (most photos are compressed already), and
+#           without their thumbnails; served from /archive/<path>
+#
+# Each batch of ARCHIVE_BATCH issues is copied in one transaction and
+# deleted from the hot database in a second, once the photos are safe.
+# SQLite in WAL mode commits atomically per file only, so in this order a
+# crash at worst leaves an issue in both files, for the next run to finish;
+# never in neither.
+#
+# The home page counters and analytics totals keep counting archived
+# issues (the delete puts back what the triggers take off); search covers
+# the hot database only. Listings read the archives only when the reader
+# asks for history (?history=1, see requested()); archived rows carry an
+# archived_at column, which the templates check.
+#
+# SQLite only. On PostgreSQL, partition the issues table instead.
+
+# Issues moved per pair of transactions
+BATCH = 500
+# A gzipped photo is kept only if it is at least this much smaller
+MIN_SAVING = 0.1
+# Listing indexes of the archive's issues table
+INDEXES = (
+    ("idx_issues_panchayath_created", "panchayath_id, created_at, id"),
+    ("idx_issues_user_created", "user_id, created_at, id"),
+    ("idx_issues_created", "created_at, id"),
+)
+
+
+def archive_path(path):
+    """The archive database of a hot database file."""
+    if os.path.realpath(path) == os.path.realpath(db.database_path()):
+        return current_app.config["ARCHIVE_PATH"]
+    return os.path.splitext(path)[0] + ".archive.db"
+
+
+def hot_databases():
+    """Every database file holding issues: the main one, then the shards."""
+    return [db.database_path(), *shards.paths()]
+
+
+# ---------------- READING ----------------
+
+def requested():
+    """Whether the reader asked for archived issues too."""
+    return request.args.get("history") == "1"
+
+
+def connections(panchayath_id=None):
+    """Request connections to the archives there are: the one beside a
+    panchayath's database, or all of them. Like shard connections, they
+    see the catalog's panchayath and users tables."""
+    if storage.is_postgres():
+        return []
+    hot = hot_databases() if panchayath_id is None else [shards.database_of(panchayath_id)]
+    return [db.get_shard_db(path, readonly=True)
+            for path in map(archive_path, hot) if os.path.exists(path)]
+
+
+def fetch_page(select, where=(), params=(), panchayath_id=None):
+    """One page of a listing over hot and archived issues, newest first:
+    everyone's, or only a panchayath's."""
+    size = pagination.page_size()
+    cursor = request.args.get("cursor", "")
+
+    def page(conn):
+        return pagination.fetch_page(conn, select, where, params, "i", cursor, size)
+
+    if panchayath_id is None:
+        pages = shards.fan_out(page)
+    else:
+        pages = [page(shards.read_db(panchayath_id))]
+    pages += [page(conn) for conn in connections(panchayath_id)]
+    return shards.merge_pages(pages, size, lambda row: (row["created_at"], row["id"]),
+                              pagination.encode_cursor, reverse=True)
+
+
+def find(lookup, panchayath_id):
+    """lookup(conn) on a panchayath's archive, for an issue that is no
+    longer in the hot database; None if it isn't archived either."""
+    for conn in connections(panchayath_id):
+        found = lookup(conn)
+        if found is not None:
+            return found
+    return None
+
+
+# ---------------- PHOTOS ----------------
+
+def _cold_file(path):
+    """Where an archived photo is kept (plus .gz if compressed), or None
+    for a path outside the archive folder."""
+    folder, _, rest = path.partition("/")
+    if folder != "uploads" or not rest:
+        return None
+    return safe_join(current_app.config["ARCHIVE_UPLOAD_DIR"], rest)
+
+
+def freeze_photo(path):
+    """Copy an uploaded photo into the archive folder. Returns whether a
+    copy is there now (False when the original has gone missing)."""
+    target = _cold_file(path)
+    if target is None:
+        return False
+    if os.path.exists(target) or os.path.exists(target + ".gz"):
+        return True
+    source = uploads.file_path(path)
+    if not os.path.exists(source):
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    part = f"{target}.{os.getpid()}.part"
+    with open(source, "rb") as original, gzip.GzipFile(part, "wb", compresslevel=6, mtime=0) as out:
+        shutil.copyfileobj(original, out, uploads.CHUNK_SIZE)
+    if os.path.getsize(part) <= os.path.getsize(source) * (1 - MIN_SAVING):
+        os.replace(part, target + ".gz")
+    else:
+        shutil.copyfile(source, part)
+        os.replace(part, target)
+    return True
+
+
+def upload_url(path, archived=False):
+    """URL of an uploaded original: under static/, or for an archived
+    issue's photo, the archive's."""
+    if archived:
+        return url_for("archived_upload", filename=path)
+    return url_for("static", filename=path)
+
+
+def archived_upload(filename):
+    target = _cold_file(filename)
+    if target is None:
+        abort(404)
+    mimetype = mimetypes.guess_type(target)[0] or "application/octet-stream"
+    if os.path.exists(target + ".gz"):
+        # Stored compressed; sent that way to every client that takes it
+        if "gzip" in request.accept_encodings:
+            response = send_file(target + ".gz", mimetype=mimetype)
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            response = send_file(gzip.open(target + ".gz"), mimetype=mimetype)
+        response.vary.add("Accept-Encoding")
+    elif os.path.exists(target):
+        response = send_file(target, mimetype=mimetype)
+    else:
+        abort(404)
+    if uploads.HASHED_PATH.match(filename):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = uploads.CACHE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+# ---------------- MOVING ----------------
+
+def _ensure_schema(conn):
+    """Create the attached archive's issues table, or add the columns the
+    hot one gained since (migrations only run on hot databases). Returns
+    the hot table's columns."""
+    hot = conn.execute("PRAGMA main.table_info(issues)").fetchall()
+    have = {row["name"] for row in conn.execute("PRAGMA archive.table_info(issues)")}
+    if not have:
+        columns = ", ".join(f"{row['name']} {row['type']}" + (" PRIMARY KEY" if row["name"] == "id" else "")
+                            for row in hot)
+        conn.execute(f"CREATE TABLE archive.issues ({columns}, archived_at DATETIME)")
+    for row in hot:
+        if have and row["name"] not in have:
+            conn.execute(f"ALTER TABLE archive.issues ADD COLUMN {row['name']} {row['type']}")
+    for name, columns in INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS archive.{name} ON issues({columns})")
+    conn.commit()
+    return [row["name"] for row in hot]
+
+
+def _move_batch(conn, columns, cutoff, limit):
+    """Archive up to `limit` issues completed before `cutoff`. Returns
+    (issues picked, issues moved, photos archived); none picked means
+    there are no more."""
+    ids = [row[0] for row in conn.execute("""
+        SELECT id FROM main.issues
+        WHERE completed_at < ? AND status = 'Completed'
+        ORDER BY completed_at
+        LIMIT ?
+    """, (cutoff, limit))]
+    if not ids:
+        return 0, 0, 0
+    marks = ",".join("?" * len(ids))
+    names = ", ".join(columns)
+
+    # Copies left by an interrupted run are replaced
+    conn.execute(f"""
+        INSERT OR REPLACE INTO archive.issues ({names}, archived_at)
+        SELECT {names}, CURRENT_TIMESTAMP FROM main.issues WHERE id IN ({marks})
+    """, ids)
+    conn.commit()
+
+    photos = {row[0] for row in conn.execute(
+        f"SELECT photo_path FROM archive.issues WHERE id IN ({marks}) AND photo_path IS NOT NULL", ids
+    )}
+    frozen = sum(freeze_photo(path) for path in photos)
+
+    storage.begin_write(conn)
+    try:
+        # Only issues nobody reopened (or completed again) since the copy
+        moved = [row[0] for row in conn.execute(f"""
+            SELECT i.id FROM main.issues i
+            JOIN archive.issues a ON a.id = i.id
+            WHERE i.id IN ({marks}) AND i.status = 'Completed' AND a.completed_at IS i.completed_at
+        """, ids)]
+        stale = sorted(set(ids) - set(moved))
+        if stale:
+            conn.execute(f"DELETE FROM archive.issues WHERE id IN ({','.join('?' * len(stale))})", stale)
+        if moved:
+            gone = ",".join("?" * len(moved))
+            totals = conn.execute(f"""
+                SELECT COALESCE(panchayath_id, 0), COALESCE(category, ''), COUNT(*)
+                FROM main.issues WHERE id IN ({gone})
+                GROUP BY 1, 2
+            """, moved).fetchall()
+            released = [row[0] for row in conn.execute(
+                f"SELECT photo_path FROM main.issues WHERE id IN ({gone}) AND photo_path IS NOT NULL", moved
+            )]
+            conn.execute(f"DELETE FROM main.issues WHERE id IN ({gone})", moved)
+            # The delete triggers took them off the counters (migrations 4
+            # and 10); archived issues still count as reported and resolved
+            for panchayath_id, category, count in totals:
+                conn.execute("""
+                    UPDATE issue_totals SET count = count + ?
+                    WHERE panchayath_id = ? AND category = ? AND status = 'Completed'
+                """, (count, panchayath_id, category))
+            conn.execute("UPDATE stats SET value = value + ? WHERE name IN ('issues', 'issues_completed')",
+                         (len(moved),))
+            # The hot copy of a photo goes with its last reference, once
+            # the delete is committed
+            released = [uploads.release(conn, path) for path in released]
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if moved:
+        uploads.discard(conn, released)
+    return len(ids), len(moved), frozen
+
+
+def archive_database(path, cutoff, batch=BATCH):
+    """Move a hot database's issues completed before `cutoff` (UTC,
+    'YYYY-MM-DD HH:MM:SS') to its archive. Returns (issues, photos)."""
+    target = archive_path(path)
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    conn = db.open_connection(path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (target,))
+        conn.execute("PRAGMA archive.journal_mode=WAL")
+        conn.execute("PRAGMA archive.synchronous=NORMAL")
+        columns = _ensure_schema(conn)
+        issues = photos = 0
+        while True:
+            picked, moved, frozen = _move_batch(conn, columns, cutoff, batch)
+            if not picked:
+                return issues, photos
+            issues += moved
+            photos += frozen
+    finally:
+        conn.close()
+
+
+# ---------------- CLI ----------------
+
+archive_cli = AppGroup("archive", help="Long-completed issues, moved out of the hot database.")
+
+
+def _require_sqlite():
+    if storage.is_postgres():
+        raise click.ClickException("Archiving moves rows between SQLite files; "
+                                   "on PostgreSQL, partition the issues table instead.")
+
+
+def _count(path):
+    conn = db.open_connection(path, readonly=True)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM issues").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@archive_cli.command("run")
+@click.option("--older-than", "days", type=int, help="Days since completion (default ARCHIVE_AFTER_DAYS).")
+@click.option("--batch", type=int, help="Issues moved per transaction (default ARCHIVE_BATCH).")
+@click.option("--vacuum", is_flag=True,
+              help="VACUUM each database afterwards to give the space back (writers wait meanwhile).")
+def run_command(days, batch, vacuum):
+    """Move long-completed issues and their photos to the archive.
+
+    Safe to run while the site is up, and again if it was interrupted.
+    """
+    _require_sqlite()
+    config = current_app.config
+    days = config["ARCHIVE_AFTER_DAYS"] if days is None else days
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    for path in hot_databases():
+        issues, photos = archive_database(path, cutoff, batch or config["ARCHIVE_BATCH"])
+        click.echo(f"{path}: {issues} issue(s), {photos} photo(s) archived to {archive_path(path)}")
+        if vacuum and issues:
+            conn = db.open_connection(path)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+
+
+@archive_cli.command("status")
+def status_command():
+    """Show how many issues each database and its archive hold."""
+    _require_sqlite()
+    for path in hot_databases():
+        target = archive_path(path)
+        archived = _count(target) if os.path.exists(target) else 0
+        click.echo(f"{path}: {_count(path)} issue(s), {os.path.getsize(path) / 1e6:.1f} MB; "
+                   f"{target}: {archived} archived")
+
+
+def init_app(app):
+    app.config.setdefault("ARCHIVE_AFTER_DAYS", int(os.environ.get("ARCHIVE_AFTER_DAYS", "365")))
+    app.config.setdefault("ARCHIVE_BATCH", int(os.environ.get("ARCHIVE_BATCH", str(BATCH))))
+    app.config.setdefault("ARCHIVE_PATH", os.environ.get("ARCHIVE_PATH", "database/archive.db"))
+    app.config.setdefault("ARCHIVE_UPLOAD_DIR",
+                          os.environ.get("ARCHIVE_UPLOAD_DIR", "database/archive/uploads"))
+    app.add_url_rule("/archive/<path:filename>", "archived_upload", archived_upload)
+    app.add_template_global(upload_url)
+    app.cli.add_command(archive_cli)
@@ -0,0 +1,182 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip alone still covers every browser
+    brotli = None
+
+# ---------------- FINGERPRINTED STATIC ASSETS ----------------
+#
+# `flask assets build` copies css/, js/ and image/ into static/dist/ under
+# content-hashed names (css/layout.css -> dist/css/layout.3f2a9c1b04de.css),
+# writes .gz/.br siblings for text files and records the mapping in
+# dist/manifest.json.
+#
+# At runtime url_for('static', filename='css/layout.css') is rewritten
+# through the manifest, and dist/ files are served with a one-year immutable
+# Cache-Control, precompressed when the browser accepts it. Without a
+# manifest (fresh checkout, local dev) URLs stay unversioned and everything
+# is served as before.
+
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+SOURCE_DIRS = ("css", "js", "image")
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt")
+MIN_COMPRESS_SIZE = 512
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = {}
+
+
+def _write_atomic(target, data):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, target)
+
+
+def _compressed(data):
+    """(suffix, bytes) for every encoding that actually saves space."""
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data, quality=11)))
+    return [(suffix, body) for suffix, body in variants if len(body) < len(data)]
+
+
+def build(static_folder):
+    """Fingerprint and precompress every source asset. Returns the manifest."""
+    manifest = {}
+    for source_dir in SOURCE_DIRS:
+        for root, dirs, files in os.walk(os.path.join(static_folder, source_dir)):
+            dirs.sort()
+            for name in sorted(files):
+                source = os.path.join(root, name)
+                logical = os.path.relpath(source, static_folder).replace(os.sep, "/")
+                with open(source, "rb") as f:
+                    data = f.read()
+
+                stem, ext = os.path.splitext(logical)
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                hashed = f"{DIST_DIR}/{stem}.{digest}{ext}"
+                target = os.path.join(static_folder, *hashed.split("/"))
+
+                # Same name means same bytes, so earlier builds can be reused
+                if not os.path.exists(target):
+                    _write_atomic(target, data)
+                    if ext.lower() in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+                        for suffix, body in _compressed(data):
+                            _write_atomic(target + suffix, body)
+                manifest[logical] = hashed
+
+    _write_atomic(
+        os.path.join(static_folder, DIST_DIR, MANIFEST),
+        json.dumps(manifest, indent=2, sort_keys=True).encode(),
+    )
+    return manifest
+
+
+def clean(static_folder, manifest):
+    """Delete dist/ files that the manifest no longer points at."""
+    dist = os.path.join(static_folder, DIST_DIR)
+    keep = {os.path.join(static_folder, *path.split("/")) for path in manifest.values()}
+    keep.add(os.path.join(dist, MANIFEST))
+    removed = 0
+    for root, dirs, files in os.walk(dist):
+        for name in files:
+            path = os.path.join(root, name)
+            base = path
+            for _, suffix in ENCODINGS:
+                if base.endswith(suffix):
+                    base = base[:-len(suffix)]
+            if base not in keep:
+                os.unlink(path)
+                removed += 1
+    return removed
+
+
+def load_manifest(static_folder):
+    global _manifest
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST), encoding="utf-8") as f:
+            _manifest = json.load(f)
+    except FileNotFoundError:
+        _manifest = {}
+    return _manifest
+
+
+# ---------------- URL REWRITING & SERVING ----------------
+
+
+def _fingerprint(endpoint, values):
+    # Runs for every url_for(); only static filenames from the manifest
+    # change. The debug server serves live sources so edits show up at once.
+    if endpoint == "static" and not current_app.debug:
+        hashed = _manifest.get(values.get("filename"))
+        if hashed:
+            values["filename"] = hashed
+
+
+def serve_static(filename):
+    """Replacement for Flask's static view: dist/ files are immutable and
+    precompressed, everything else is served unchanged."""
+    if not filename.startswith(DIST_DIR + "/"):
+        return current_app.send_static_file(filename)
+
+    folder = current_app.static_folder
+    response = None
+    for encoding, suffix in ENCODINGS:
+        candidate = safe_join(folder, filename + suffix)
+        if request.accept_encodings[encoding] and candidate and os.path.isfile(candidate):
+            response = send_from_directory(
+                folder, filename + suffix,
+                mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            )
+            response.headers["Content-Encoding"] = encoding
+            break
+    if response is None:
+        response = send_from_directory(folder, filename)
+
+    response.vary.add("Accept-Encoding")
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+# ---------------- CLI ----------------
+
+assets_cli = AppGroup("assets", help="Static asset fingerprinting.")
+
+
+@assets_cli.command("build")
+@click.option("--clean", "prune", is_flag=True, help="Remove outdated files from static/dist.")
+def build_command(prune):
+    """Fingerprint, precompress and write the manifest."""
+    static_folder = current_app.static_folder
+    manifest = build(static_folder)
+    load_manifest(static_folder)
+    click.echo(f"{len(manifest)} asset(s) in {DIST_DIR}/{MANIFEST}"
+               + ("" if brotli else " (brotli not installed, gzip only)"))
+    if prune:
+        click.echo(f"Removed {clean(static_folder, manifest)} outdated file(s)")
+
+
+def init_app(app):
+    load_manifest(app.static_folder)
+    app.url_defaults(_fingerprint)
+    app.view_functions["static"] = serve_static
+    app.cli.add_command(assets_cli)
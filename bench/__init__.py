@@ -0,0 +1,2 @@
+# Benchmark suite: synthetic data (generate), load driver (load) and
+# result reports (report). See "Benchmarks" in README.md.
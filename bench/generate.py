@@ -0,0 +1,264 @@
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+import click
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+import storage  # noqa: E402
+from db import open_connection  # noqa: E402
+
+# ---------------- SYNTHETIC DATA GENERATOR ----------------
+#
+# Fills a fresh database with panchayaths, citizens, admins, issues and
+# notices shaped like production: a few panchayaths get most of the
+# traffic (Zipf), activity grows over time, older issues are mostly
+# resolved, and about half of all issues carry a photo. Rows go through the
+# normal triggers, so counters, search indexes and change logs are exactly
+# what the app would have built itself.
+#
+#   python -m bench.generate --issues 2000000
+#   python -m bench.generate --database postgresql://localhost/bench
+#
+# Every citizen and admin shares BENCH_PASSWORD: citizen<n>@bench.example
+# and admin<panchayath_id>.
+
+BENCH_PASSWORD = "bench-password"
+DEFAULT_DATABASE = os.path.join("bench", "data", "bench.db")
+BATCH = 20000
+
+STATES = {
+    "Karnataka": ["Mysuru", "Mandya", "Hassan", "Tumakuru", "Udupi", "Shivamogga", "Belagavi", "Dharwad"],
+    "Kerala": ["Thrissur", "Palakkad", "Kannur", "Kollam", "Idukki", "Wayanad"],
+    "Tamil Nadu": ["Salem", "Erode", "Vellore", "Madurai", "Tirunelveli"],
+}
+CATEGORIES = [
+    ("Garbage Collection", 30), ("Water Supply", 25), ("Road Maintenance", 20),
+    ("Street Lights", 12), ("Drainage/Sewerage", 9), ("Others", 4),
+]
+PROBLEMS = {
+    "Garbage Collection": ["Garbage not collected for {n} days", "Waste dumped near the {place}",
+                           "Overflowing bins next to the {place}"],
+    "Water Supply": ["No water supply since {n} days", "Pipeline leaking near the {place}",
+                     "Muddy drinking water in our street"],
+    "Road Maintenance": ["Large pothole in front of the {place}", "Road washed out after rain",
+                         "Speed breaker broken near the {place}"],
+    "Street Lights": ["Street light not working near the {place}", "{n} lamps off on the main road",
+                      "Light flickering all night"],
+    "Drainage/Sewerage": ["Drain blocked near the {place}", "Sewage overflowing onto the road",
+                          "Open drain without cover by the {place}"],
+    "Others": ["Stray dogs near the {place}", "Tree fallen on the footpath", "Illegal hoarding at the {place}"],
+}
+PLACES = ["school", "bus stand", "temple", "market", "health centre", "panchayat office",
+          "anganwadi", "ration shop", "post office", "lake", "church", "mosque"]
+NOTICE_TITLES = ["Gram Sabha meeting on {date}", "Water supply interruption on {date}",
+                 "Property tax collection camp", "Vaccination drive at the {place}",
+                 "Road closed for repairs near the {place}", "Ration card update camp"]
+# Share of issues in each status by age of the issue (days)
+STATUS_BY_AGE = [
+    (30, (("Pending", 50), ("In Progress", 30), ("Completed", 20))),
+    (90, (("Pending", 25), ("In Progress", 25), ("Completed", 50))),
+    (None, (("Pending", 15), ("In Progress", 10), ("Completed", 75))),
+]
+
+
+def _weights(pairs):
+    values, weights = zip(*pairs)
+    return list(values), list(accumulate(weights))
+
+
+def _zipf(n, s=0.8):
+    return list(accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def _created_at(rng, now, days):
+    # sqrt skews towards recent dates: usage grows over time
+    age = days * (1 - rng.random() ** 0.5)
+    return now - timedelta(days=age), age
+
+
+def _photos(prefix):
+    folder = os.path.join("static", "uploads")
+    if not os.path.isdir(folder):
+        return []
+    return [f"uploads/{name}" for name in sorted(os.listdir(folder)) if name.startswith(prefix)]
+
+
+def _insert(conn, sql, rows, label, total):
+    done = 0
+    started = time.monotonic()
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            conn.executemany(sql, batch)
+            conn.commit()
+            done += len(batch)
+            batch = []
+            rate = done / (time.monotonic() - started)
+            click.echo(f"\r{label}: {done}/{total} ({rate:.0f}/s)", nl=False)
+    if batch:
+        conn.executemany(sql, batch)
+        conn.commit()
+        done += len(batch)
+    click.echo(f"\r{label}: {done}/{total} in {time.monotonic() - started:.1f}s")
+
+
+def generate(conn, panchayaths, users, issues, notices, days, seed):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+
+    districts = [(state, district) for state, names in STATES.items() for district in names]
+    _insert(conn, "INSERT INTO panchayath (id, name, district, state) VALUES (?, ?, ?, ?)", (
+        (pid, f"{district} Gram Panchayat {pid}", district, state)
+        for pid, (state, district) in ((pid, districts[pid % len(districts)]) for pid in range(1, panchayaths + 1))
+    ), "panchayaths", panchayaths)
+    _insert(conn, "INSERT INTO admin (username, password_hash, panchayath_id) VALUES (?, ?, ?)", (
+        (f"admin{pid}", password_hash, pid) for pid in range(1, panchayaths + 1)
+    ), "admins", panchayaths)
+
+    # Busy panchayaths have more citizens and more issues
+    panchayath_weights = _zipf(panchayaths)
+    panchayath_ids = list(range(1, panchayaths + 1))
+    rng.shuffle(panchayath_ids)
+    user_panchayath = {}
+
+    def user_rows():
+        for uid in range(1, users + 1):
+            user_panchayath[uid] = rng.choices(panchayath_ids, cum_weights=panchayath_weights)[0]
+            yield (uid, f"Citizen {uid}", f"citizen{uid}@bench.example", f"9{uid:09d}", password_hash)
+    _insert(conn, "INSERT INTO users (id, name, email, mobile, password_hash) VALUES (?, ?, ?, ?, ?)",
+            user_rows(), "users", users)
+
+    categories, category_weights = _weights(CATEGORIES)
+    statuses = [(limit, *_weights(pairs)) for limit, pairs in STATUS_BY_AGE]
+    # A handful of citizens report most issues
+    user_weights = _zipf(users, 1.1) if users else None
+    issue_photos = _photos("issue_")
+
+    def issue_rows():
+        for _ in range(issues):
+            created, age = _created_at(rng, now, days)
+            if users and rng.random() < 0.9:
+                user_id = rng.choices(range(1, users + 1), cum_weights=user_weights)[0]
+                panchayath_id = user_panchayath[user_id]
+            else:
+                user_id = None
+                panchayath_id = rng.choices(panchayath_ids, cum_weights=panchayath_weights)[0]
+            category = rng.choices(categories, cum_weights=category_weights)[0]
+            _, names, weights = next(s for s in statuses if s[0] is None or age < s[0])
+            place = rng.choice(PLACES)
+            yield (
+                panchayath_id, category,
+                rng.choice(PROBLEMS[category]).format(n=rng.randint(2, 9), place=place),
+                f"Ward {rng.randint(1, 20)}, near the {place}",
+                rng.choice(issue_photos) if issue_photos and rng.random() < 0.5 else None,
+                rng.choices(names, cum_weights=weights)[0],
+                created.strftime("%Y-%m-%d %H:%M:%S"),
+                user_id,
+            )
+    _insert(conn, """
+        INSERT INTO issues (panchayath_id, category, description, location, photo_path, status, created_at, user_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, issue_rows(), "issues", issues)
+
+    notice_photos = _photos("notice_")
+
+    def notice_rows():
+        for _ in range(notices):
+            created, _ = _created_at(rng, now, days)
+            place = rng.choice(PLACES)
+            title = rng.choice(NOTICE_TITLES).format(
+                date=(created + timedelta(days=rng.randint(3, 20))).strftime("%d %b"), place=place)
+            yield (
+                rng.choices(panchayath_ids, cum_weights=panchayath_weights)[0],
+                title,
+                f"{title}. All residents near the {place} are requested to take note.",
+                rng.choice(notice_photos) if notice_photos and rng.random() < 0.3 else None,
+                created.strftime("%Y-%m-%d %H:%M:%S"),
+            )
+    _insert(conn, """
+        INSERT INTO notices (panchayath_id, title, description, banner_path, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, notice_rows(), "notices", notices)
+
+    if storage.dialect(conn) == "postgresql":
+        # Rows above were given explicit ids; sequences carry on after them
+        for table in ("panchayath", "users"):
+            conn.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                         f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false)")
+        conn.commit()
+
+
+def _generate_postgres(url, force, **options):
+    storage.configure(url)
+    conn = open_connection()
+    try:
+        migrations.upgrade(conn)
+        if conn.execute("SELECT COUNT(*) FROM panchayath").fetchone()[0]:
+            if not force:
+                raise click.ClickException("The database isn't empty, pass --force to empty it")
+            conn.execute("""
+                TRUNCATE panchayath, admin, users, issues, notices, issue_events, issue_daily,
+                         issue_resolutions_daily, issue_totals, change_counters, upload_refs
+                RESTART IDENTITY
+            """)
+            conn.execute("UPDATE stats SET value = 0")
+            conn.commit()
+        # A throwaway database: durability doesn't matter while loading
+        conn.execute("SET synchronous_commit = off")
+        generate(conn, **options)
+        conn.execute("ANALYZE")
+        conn.commit()
+        size = conn.execute("SELECT pg_database_size(current_database())").fetchone()[0]
+    finally:
+        conn.close()
+    click.echo(f"Wrote {url.rsplit('/', 1)[-1]} ({size / 1e6:.0f} MB)")
+
+
+@click.command()
+@click.option("--database", default=DEFAULT_DATABASE, show_default=True,
+              help="SQLite file, or a postgresql:// URL.")
+@click.option("--panchayaths", default=5000, show_default=True)
+@click.option("--users", default=200000, show_default=True)
+@click.option("--issues", default=2000000, show_default=True)
+@click.option("--notices", default=50000, show_default=True)
+@click.option("--days", default=3 * 365, show_default=True, help="History to spread rows over.")
+@click.option("--seed", default=1, show_default=True)
+@click.option("--force", is_flag=True, help="Replace an existing database.")
+def main(database, panchayaths, users, issues, notices, days, seed, force):
+    """Create a benchmark database filled with synthetic data."""
+    if storage.url_dialect(database if "://" in database else None) == "postgresql":
+        return _generate_postgres(database, force, panchayaths=panchayaths, users=users,
+                                  issues=issues, notices=notices, days=days, seed=seed)
+    if "://" in database:
+        database = storage.sqlite_path(database)
+    if os.path.exists(database):
+        if not force:
+            raise click.ClickException(f"{database} exists, pass --force to replace it")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(database + suffix):
+                os.unlink(database + suffix)
+
+    conn = open_connection(database)
+    try:
+        migrations.upgrade(conn)
+        # A throwaway database: durability doesn't matter while loading
+        conn.execute("PRAGMA synchronous=OFF")
+        generate(conn, panchayaths, users, issues, notices, days, seed)
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    click.echo(f"Wrote {database} ({os.path.getsize(database) / 1e6:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
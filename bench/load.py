@@ -0,0 +1,530 @@
+import http.client
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+from bench import report  # noqa: E402
+from bench.generate import BENCH_PASSWORD, CATEGORIES, DEFAULT_DATABASE  # noqa: E402
+
+try:
+    from PIL import Image
+except ImportError:  # Reports are sent without photos
+    Image = None
+
+# ---------------- LOAD DRIVER ----------------
+#
+# Closed-loop virtual users, each repeatedly picking a scenario (anonymous
+# browsing, a citizen session, an admin session) and timing every request
+# by route. Runs against the app in-process through Flask's test client
+# (--server testclient) or against a real gunicorn started for the run
+# (--server gunicorn).
+#
+# Statements per request are counted with a trace callback (SQLite) or
+# storage.statement_observer (PostgreSQL), which need the app in this
+# process: with gunicorn they come from a short test-client pass over the
+# same scenarios after the timed run.
+#
+#   python -m bench.generate
+#   python -m bench.load --server gunicorn --concurrency 16 --duration 60
+#   python -m bench.load --database postgresql://localhost/bench --in-place
+#
+# A SQLite database is copied before the run and photos uploaded during it are
+# deleted afterwards, so runs don't drift the dataset or leave files in
+# static/uploads. Results land in bench/results/ as JSON, see
+# bench/report.py to compare them.
+
+RESULTS_DIR = os.path.join("bench", "results")
+UPLOADS = os.path.join(ROOT, "static", "uploads")
+# Weights of the scenarios a virtual user picks from
+SCENARIO_WEIGHTS = {"anonymous": 50, "citizen": 35, "admin": 15}
+REPORT_RATE = 0.3      # citizen sessions that report an issue
+PHOTO_RATE = 0.2       # reports with a photo attached
+
+_local = threading.local()
+
+
+# ---------------- QUERY COUNTING ----------------
+
+def _trace(sql):
+    # Trigger bodies are reported as "-- TRIGGER name"; connection setup
+    # PRAGMAs aren't part of any request
+    if not sql.startswith(("--", "PRAGMA")):
+        _local.queries = getattr(_local, "queries", 0) + 1
+
+
+def count_queries():
+    """Count statements on every connection the app opens from now on."""
+    import db
+    import storage
+
+    open_connection = db.open_connection
+    observer = storage.statement_observer
+
+    def traced(*args, **kwargs):
+        conn = open_connection(*args, **kwargs)
+        if storage.dialect(conn) == "sqlite":
+            conn.set_trace_callback(_trace)
+        return conn
+    db.open_connection = traced
+
+    def observed(sql, seconds):
+        _trace(sql)
+        if observer is not None:
+            observer(sql, seconds)
+    storage.statement_observer = observed
+
+
+def _queries():
+    return getattr(_local, "queries", 0)
+
+
+# ---------------- SESSIONS ----------------
+
+def _multipart(data, files):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in data.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, mimetype) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f"Content-Type: {mimetype}\r\n\r\n".encode())
+        body.write(content + b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode())
+    return body.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, files=None):
+        form = dict(data or {})
+        for name, (filename, content, mimetype) in (files or {}).items():
+            form[name] = (io.BytesIO(content), filename, mimetype)
+        response = self.client.open(path, method=method, data=form or None)
+        body = response.get_data()
+        response.close()
+        return response.status_code, response.headers, body
+
+
+class HTTPSession:
+    """Keep-alive connection with a cookie jar; redirects aren't followed,
+    so every request is timed on its own."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.conn = None
+        self.cookies = {}
+
+    def request(self, method, path, data=None, files=None):
+        headers = {}
+        body = None
+        if files:
+            body, headers["Content-Type"] = _multipart(data or {}, files)
+        elif data:
+            body = urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                content = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # The server closed the keep-alive connection; retry once
+                self.conn.close()
+                self.conn = None
+                if attempt == 2:
+                    raise
+
+        for header in response.headers.get_all("Set-Cookie") or []:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel.value and morsel["expires"] != "Thu, 01 Jan 1970 00:00:00 GMT":
+                    self.cookies[name] = morsel.value
+                else:
+                    self.cookies.pop(name, None)
+        return response.status, response.headers, content
+
+
+# ---------------- SCENARIOS ----------------
+
+class VirtualUser:
+    def __init__(self, session, stats, dataset, rng):
+        self.session = session
+        self.stats = stats
+        self.dataset = dataset
+        self.rng = rng
+
+    def call(self, route, method, path, **kwargs):
+        queries = _queries()
+        started = time.perf_counter()
+        try:
+            status, headers, body = self.session.request(method, path, **kwargs)
+        except Exception:
+            self.stats.add(route, time.perf_counter() - started, error=True)
+            return None, {}, b""
+        self.stats.add(route, time.perf_counter() - started, error=status >= 400,
+                       queries=_queries() - queries)
+        return status, headers, body
+
+    def anonymous(self):
+        self.call("home", "GET", "/")
+        self.call("public_track", "GET", "/public-track")
+        # What "load more" fetches: the fragment, then the page after it
+        _, headers, _ = self.call("public_track", "GET", "/public-track?fragment=1")
+        if headers.get("X-Next-Cursor"):
+            self.call("public_track", "GET", "/public-track?" + urlencode(
+                {"fragment": 1, "cursor": headers["X-Next-Cursor"]}))
+
+    def citizen(self, report=None):
+        user_id = self.rng.randint(1, self.dataset["users"])
+        self.call("user_login", "POST", "/login", data={
+            "email": f"citizen{user_id}@bench.example", "password": BENCH_PASSWORD})
+        self.call("track_issue", "GET", "/track")
+        if report is None:
+            report = self.rng.random() < REPORT_RATE
+        if report:
+            self.report()
+        self.call("user_logout", "GET", "/logout")
+
+    def report(self):
+        category = self.rng.choice(CATEGORIES)[0]
+        files = None
+        if Image is not None and self.rng.random() < PHOTO_RATE:
+            buffer = io.BytesIO()
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            Image.new("RGB", (320, 240), color).save(buffer, "JPEG", quality=80)
+            files = {"image": ("photo.jpg", buffer.getvalue(), "image/jpeg")}
+        self.call("report_issue", "POST", "/report", data={
+            "panchayath_id": self.rng.randint(1, self.dataset["panchayaths"]),
+            "category": category,
+            "description": f"Benchmark report about {category.lower()}",
+            "location": f"Ward {self.rng.randint(1, 20)}",
+        }, files=files)
+
+    def admin(self):
+        panchayath_id = self.rng.randint(1, self.dataset["panchayaths"])
+        self.call("admin_login", "POST", "/admin/login", data={
+            "username": f"admin{panchayath_id}", "password": BENCH_PASSWORD})
+        self.call("admin_dashboard", "GET", "/admin")
+        self.call("admin_analytics", "GET", "/admin/analytics?scope=" + self.rng.choice(["panchayath", "district", "state"]))
+        self.call("admin_logout", "GET", "/admin/logout")
+
+    def run_once(self):
+        names, weights = zip(*SCENARIO_WEIGHTS.items())
+        getattr(self, self.rng.choices(names, weights)[0])()
+
+
+# ---------------- STATS ----------------
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.recording = False
+        self.latencies = {}
+        self.errors = {}
+        self.queries = {}
+
+    def add(self, route, seconds, error=False, queries=None):
+        if not self.recording:
+            return
+        with self.lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            self.errors[route] = self.errors.get(route, 0) + error
+            if queries is not None:
+                self.queries.setdefault(route, []).append(queries)
+
+
+def _latency(samples):
+    ordered = sorted(samples)
+
+    def pct(p):
+        # Nearest rank
+        return ordered[max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))] * 1000
+
+    return {
+        "p50": round(pct(50), 2),
+        "p95": round(pct(95), 2),
+        "p99": round(pct(99), 2),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+def summarize(stats, duration, queries=None):
+    queries = queries if queries is not None else stats.queries
+    routes = {}
+    for route, samples in sorted(stats.latencies.items()):
+        counts = queries.get(route)
+        routes[route] = {
+            "requests": len(samples),
+            "errors": stats.errors.get(route, 0),
+            "throughput_rps": round(len(samples) / duration, 2),
+            "latency_ms": _latency(samples),
+            "queries_per_request": round(sum(counts) / len(counts), 1) if counts else None,
+        }
+    everything = [s for samples in stats.latencies.values() for s in samples]
+    total = {
+        "requests": len(everything),
+        "errors": sum(stats.errors.values()),
+        "throughput_rps": round(len(everything) / duration, 2),
+        "latency_ms": _latency(everything) if everything else None,
+    }
+    return routes, total
+
+
+def run(make_session, dataset, concurrency, duration, warmup, seed):
+    stats = Stats()
+    deadline = time.monotonic() + warmup + duration
+
+    def worker(n):
+        user = VirtualUser(make_session(), stats, dataset, random.Random(seed * 1000 + n))
+        while time.monotonic() < deadline:
+            user.run_once()
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    stats.recording = True
+    started = time.monotonic()
+    for thread in threads:
+        thread.join()
+    # Scenarios in flight at the deadline finish, so measure the real span
+    return stats, time.monotonic() - started
+
+
+def profile_queries(app, dataset, iterations, seed):
+    """Statement counts per route from `iterations` of every scenario."""
+    stats = Stats()
+    stats.recording = True
+    user = VirtualUser(TestClientSession(app), stats, dataset, random.Random(seed))
+    for _ in range(iterations):
+        user.anonymous()
+        user.citizen(report=True)
+        user.admin()
+    return stats.queries
+
+
+# ---------------- SERVER ----------------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(env, workers, threads):
+    port = _free_port()
+    process = subprocess.Popen([
+        sys.executable, "-m", "gunicorn", "app:create_app()",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers),
+        "--worker-class", "gthread", "--threads", str(threads),
+        "--log-level", "warning",
+    ], cwd=ROOT, env=dict(env, WEB_THREADS=str(threads)))
+    for _ in range(300):
+        if process.poll() is not None:
+            raise click.ClickException("gunicorn exited during startup")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/about")
+            conn.getresponse().read()
+            conn.close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise click.ClickException("gunicorn did not start within 30s")
+
+
+def _snapshot():
+    entries = set()
+    for root, dirs, files in os.walk(UPLOADS):
+        entries.update(os.path.join(root, name) for name in dirs + files)
+    return entries
+
+
+def clean_uploads(before):
+    """Delete photos and variants created since `before`. Image processing
+    may still be writing variants, so wait until nothing new shows up."""
+    quiet = 0
+    while quiet < 3:
+        new = sorted(_snapshot() - before, key=len, reverse=True)
+        for path in new:
+            try:
+                if os.path.isdir(path):
+                    os.rmdir(path)
+                else:
+                    os.unlink(path)
+            except OSError:
+                pass  # a directory that isn't empty yet; next round
+        quiet = 0 if new else quiet + 1
+        time.sleep(0.5)
+
+
+def _shard_paths(conn):
+    try:
+        return [row[0] for row in conn.execute("SELECT path FROM shards")]
+    except storage.OperationalError:
+        return []  # from before migration 11
+
+
+def _dataset(database, url=None):
+    conn = storage.connect(readonly=True) if url else sqlite3.connect(database)
+    try:
+        # Generated ids are dense, so the largest id is also the count
+        dataset = {
+            "panchayaths": conn.execute("SELECT MAX(id) FROM panchayath").fetchone()[0] or 0,
+            "users": conn.execute("SELECT MAX(id) FROM users").fetchone()[0] or 0,
+            "issues": conn.execute("SELECT COUNT(*) FROM issues").fetchone()[0],
+            "notices": conn.execute("SELECT COUNT(*) FROM notices").fetchone()[0],
+        }
+        for path in _shard_paths(conn):
+            shard = sqlite3.connect(path)
+            try:
+                dataset["issues"] += shard.execute("SELECT COUNT(*) FROM issues").fetchone()[0]
+                dataset["notices"] += shard.execute("SELECT COUNT(*) FROM notices").fetchone()[0]
+            finally:
+                shard.close()
+        return dataset
+    finally:
+        conn.close()
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option("--database", default=DEFAULT_DATABASE, show_default=True,
+              help="SQLite file, or a postgresql:// URL.")
+@click.option("--server", type=click.Choice(["testclient", "gunicorn"]), default="testclient", show_default=True)
+@click.option("--concurrency", default=8, show_default=True, help="Virtual users.")
+@click.option("--duration", default=30.0, show_default=True, help="Measured seconds.")
+@click.option("--warmup", default=5.0, show_default=True, help="Unmeasured seconds first.")
+@click.option("--workers", default=2, show_default=True, help="gunicorn workers.")
+@click.option("--threads", default=8, show_default=True, help="gunicorn threads per worker.")
+@click.option("--profile-iterations", default=20, show_default=True,
+              help="Scenario passes for query counts (gunicorn mode).")
+@click.option("--seed", default=1, show_default=True)
+@click.option("--in-place", is_flag=True, help="Run against the database itself instead of a copy.")
+@click.option("--out", default=RESULTS_DIR, show_default=True)
+def main(database, server, concurrency, duration, warmup, workers, threads,
+         profile_iterations, seed, in_place, out):
+    """Drive load against the app and save latency, throughput and query counts."""
+    url = None
+    if "://" in database and storage.url_dialect(database) == "postgresql":
+        url = database
+        storage.configure(url)
+        if not in_place:
+            # Nothing to copy: the run writes to the server's database
+            raise click.ClickException("PostgreSQL databases can't be copied; pass --in-place")
+    else:
+        database = os.path.abspath(storage.sqlite_path(database) if "://" in database else database)
+    out = os.path.abspath(out)
+    # The app resolves static/ and database/ against the working directory
+    os.chdir(ROOT)
+    if not url and not os.path.exists(database):
+        raise click.ClickException(f"{database} not found, run `python -m bench.generate` first")
+    dataset = _dataset(database, url)
+
+    workdir = None
+    if not in_place and os.environ.get("SHARDING", "none") != "none":
+        # The copy would still write to the original shard files
+        raise click.ClickException("Sharded databases can't be copied; pass --in-place")
+    if not in_place:
+        workdir = tempfile.mkdtemp(prefix="bench-")
+        copy = os.path.join(workdir, os.path.basename(database))
+        shutil.copyfile(database, copy)
+        database = copy
+
+    # Mail stays queued instead of going out over SMTP. Every virtual user
+    # comes from 127.0.0.1, so per-IP rate limits would refuse most logins
+    env = dict(os.environ, MAIL_WORKER="external", RATELIMIT_ENABLED="0")
+    if url:
+        env["DATABASE_URL"] = url
+    else:
+        env["DATABASE_PATH"] = os.path.abspath(database)
+    os.environ.update(env)
+    from app import create_app
+    app = create_app(None if url else {"DATABASE": env["DATABASE_PATH"]})
+    count_queries()
+
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    uploads_before = _snapshot()
+    try:
+        if server == "testclient":
+            stats, elapsed = run(lambda: TestClientSession(app), dataset, concurrency, duration, warmup, seed)
+            routes, total = summarize(stats, elapsed)
+        else:
+            process, port = start_gunicorn(env, workers, threads)
+            try:
+                stats, elapsed = run(lambda: HTTPSession("127.0.0.1", port), dataset,
+                                     concurrency, duration, warmup, seed)
+            finally:
+                process.terminate()
+                process.wait()
+            routes, total = summarize(stats, elapsed, profile_queries(app, dataset, profile_iterations, seed))
+    finally:
+        clean_uploads(uploads_before)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    result = {
+        "meta": {
+            "commit": commit,
+            "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "started_at": started_at,
+            "server": server,
+            "workers": workers if server == "gunicorn" else None,
+            "threads": threads if server == "gunicorn" else None,
+            "concurrency": concurrency,
+            "duration_s": round(elapsed, 2),
+            "warmup_s": warmup,
+            "seed": seed,
+            "python": sys.version.split()[0],
+            "dataset": dataset,
+        },
+        "routes": routes,
+        "total": total,
+    }
+    os.makedirs(out, exist_ok=True)
+    path = os.path.join(out, f"{started_at[:19].replace(':', '').replace('-', '')}-{commit or 'nogit'}-{server}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    click.echo(report.format_result(result))
+    click.echo(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
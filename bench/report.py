@@ -0,0 +1,121 @@
+import json
+
+import click
+
+# ---------------- RESULT REPORTS ----------------
+#
+#   python -m bench.report show bench/results/<run>.json
+#   python -m bench.report compare <baseline>.json <candidate>.json
+#
+# compare lines the two runs up by route; a negative latency change or a
+# positive throughput change is an improvement.
+
+COLUMNS = ("requests", "errors", "rps", "p50", "p95", "p99", "queries")
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _row(stats):
+    latency = stats.get("latency_ms") or {}
+    return {
+        "requests": stats["requests"],
+        "errors": stats["errors"],
+        "rps": stats["throughput_rps"],
+        "p50": latency.get("p50"),
+        "p95": latency.get("p95"),
+        "p99": latency.get("p99"),
+        "queries": stats.get("queries_per_request"),
+    }
+
+
+def _rows(result):
+    rows = {route: _row(stats) for route, stats in result["routes"].items()}
+    rows["TOTAL"] = _row(result["total"])
+    return rows
+
+
+def _cell(value):
+    if value is None:
+        return "-"
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def _table(header, rows):
+    widths = [max(len(str(line[i])) for line in [header, *rows]) for i in range(len(header))]
+    lines = ["  ".join(str(cell).rjust(width) if i else str(cell).ljust(width)
+                       for i, (cell, width) in enumerate(zip(line, widths)))
+             for line in [header, *rows]]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def _describe(meta):
+    server = meta["server"]
+    if meta.get("workers"):
+        server += f" {meta['workers']}x{meta['threads']}"
+    dataset = ", ".join(f"{n} {name}" for name, n in meta["dataset"].items())
+    return (f"{meta['commit'] or '?'}{' (dirty)' if meta.get('dirty') else ''} {meta['started_at']} "
+            f"| {server}, {meta['concurrency']} users, {meta['duration_s']}s | {dataset}")
+
+
+def format_result(result):
+    """Per-route table of one run; latencies in ms."""
+    rows = [[route, *(_cell(values[c]) for c in COLUMNS)] for route, values in _rows(result).items()]
+    return _describe(result["meta"]) + "\n" + _table(["route", *COLUMNS], rows)
+
+
+def _change(base, new, lower_is_better=True):
+    if base is None or new is None:
+        return "-"
+    if not base:
+        return _cell(new)
+    delta = (new - base) / base * 100
+    better = delta < 0 if lower_is_better else delta > 0
+    return f"{_cell(new)} ({delta:+.0f}%{' ✓' if better and abs(delta) >= 5 else ''})"
+
+
+def format_comparison(base, new):
+    """Candidate's numbers per route with the change against the baseline."""
+    base_rows, new_rows = _rows(base), _rows(new)
+    rows = []
+    for route in [r for r in new_rows if r in base_rows] + [r for r in new_rows if r not in base_rows]:
+        b, n = base_rows.get(route, {}), new_rows[route]
+        rows.append([
+            route,
+            _cell(n["requests"]),
+            _change(b.get("errors"), n["errors"]),
+            _change(b.get("rps"), n["rps"], lower_is_better=False),
+            _change(b.get("p50"), n["p50"]),
+            _change(b.get("p95"), n["p95"]),
+            _change(b.get("p99"), n["p99"]),
+            _change(b.get("queries"), n["queries"]),
+        ])
+    return ("base " + _describe(base["meta"]) + "\nnew  " + _describe(new["meta"]) + "\n"
+            + _table(["route", *COLUMNS], rows))
+
+
+@click.group()
+def cli():
+    """Inspect and compare benchmark results."""
+
+
+@cli.command()
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+def show(paths):
+    """Print one or more result files."""
+    click.echo("\n\n".join(format_result(load(path)) for path in paths))
+
+
+@cli.command()
+@click.argument("baseline", type=click.Path(exists=True))
+@click.argument("candidate", type=click.Path(exists=True))
+def compare(baseline, candidate):
+    """Compare a candidate run against a baseline, route by route."""
+    click.echo(format_comparison(load(baseline), load(candidate)))
+
+
+if __name__ == "__main__":
+    cli()
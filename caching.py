@@ -0,0 +1,367 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import click
+from flask import current_app, request, session
+from flask.cli import AppGroup
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+import db
+import shards
+import translations
+
+# ---------------- IN-PROCESS TTL CACHE ----------------
+
+
+def ttl_cache(seconds):
+    """Memoize a function's result per argument tuple for `seconds`.
+
+    Each gunicorn worker keeps its own copy, so writers in another process
+    are only seen after the TTL expires; call .cache_clear() after a local
+    write to drop it immediately.
+    """
+    def decorator(f):
+        entries = {}
+        lock = threading.Lock()
+
+        @wraps(f)
+        def wrapper(*args):
+            now = time.monotonic()
+            hit = entries.get(args)
+            if hit is not None and hit[0] > now:
+                return hit[1]
+            value = f(*args)
+            with lock:
+                entries[args] = (now + seconds, value)
+            return value
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+
+# ---------------- RESPONSE & FRAGMENT CACHE ----------------
+#
+# Whole anonymous pages (@cached) and template fragments ({% cache %}) are
+# stored rendered, other computed values (remember()) pickled. Every entry is tagged with resources from change_counters
+# (migration 8) and remembers their versions at render time; the triggers
+# bump those versions in the same transaction as any write to issues or
+# notices, so an entry is dead the moment a write commits, in every worker,
+# whichever process made the write. A lookup costs one primary-key read of
+# the counters.
+#
+# Sharded, a tag covering every panchayath sums the counters of every shard
+# file, so those versions are snapshotted per process for VERSIONS_TTL
+# seconds instead of read on each lookup. A write request in this process
+# drops the snapshot at once; other workers' writes show within the TTL.
+# Tags for one panchayath still read only its shard, every time.
+#
+# Tags are "issues" / "notices" (any panchayath) or "issues:3" (one
+# panchayath). Pages with session-specific content (a logged-in user, a
+# pending flash message) are never cached or served from the cache.
+#
+# Backends: "memory" is a per-process LRU; "sqlite" is a separate database
+# file shared by all workers on the host; "none" disables caching.
+
+SESSION_KEYS = ("user_id", "admin_id", "_flashes")
+# Never replayed from the cache
+SKIP_HEADERS = ("Set-Cookie", "Content-Length")
+VERSIONS_TTL = 1
+
+
+class MemoryBackend:
+    """LRU bounded to `max_entries`, private to this process."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            hit = self.entries.get(key)
+            if hit is None:
+                return None
+            if hit[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return hit[1]
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteBackend:
+    """Entries in their own database file, shared by every worker.
+
+    Kept apart from the main database so cache writes never queue behind
+    (or hold up) the application's write lock. Losing it is harmless, so
+    it is written without fsyncs and a busy cache write is just skipped.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.writes = 0
+
+    def _conn(self):
+        pid = os.getpid()
+        if getattr(self.local, "pid", None) != pid:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA busy_timeout=100")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            self.local.pid, self.local.conn = pid, conn
+        return self.local.conn
+
+    def get(self, key):
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        conn = self._conn()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl),
+            )
+            self.writes += 1
+            if self.writes % self.PRUNE_EVERY == 0:
+                self.prune()
+        except sqlite3.OperationalError:
+            pass
+
+    def prune(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        # Over the bound: drop the entries closest to expiring
+        conn.execute("""
+            DELETE FROM cache WHERE key IN (
+                SELECT key FROM cache ORDER BY expires
+                LIMIT max(0, (SELECT COUNT(*) FROM cache) - ?)
+            )
+        """, (self.max_entries,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache")
+
+
+def _backend():
+    return current_app.extensions["response_cache"]
+
+
+def _enabled():
+    return _backend() is not None and not current_app.debug
+
+
+def _key(*parts):
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+@ttl_cache(VERSIONS_TTL)
+def _all_shard_versions(database, pairs):
+    # `database` keys the snapshot to one catalog
+    return shards.change_versions(list(pairs))
+
+
+def tag_versions(tags):
+    """Current change_counters version of every tag, in order."""
+    if not tags:
+        return ()
+    pairs = []
+    for tag in tags:
+        resource, _, panchayath_id = str(tag).partition(":")
+        pairs.append((resource, int(panchayath_id or 0)))
+    if shards.enabled() and not all(panchayath_id for _, panchayath_id in pairs):
+        found = _all_shard_versions(db.database_path(), tuple(pairs))
+    else:
+        found = shards.change_versions(pairs)
+    return tuple(found.get(pair, 0) for pair in pairs)
+
+
+def _forget_versions(response):
+    # This worker must see its own writes at once, e.g. on the page a form
+    # redirects to
+    if request.method not in ("GET", "HEAD"):
+        _all_shard_versions.cache_clear()
+    return response
+
+
+def _lookup(key, versions):
+    entry = _backend().get(key)
+    if entry is not None and entry[0] == versions:
+        return entry[1]
+    return None
+
+
+def cached(*tags, ttl=None):
+    """Cache a view's response for anonymous visitors.
+
+    Keyed by path, query string and language. Versions are read before the
+    view runs, so a write that lands while it renders leaves the entry
+    already stale.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if (not _enabled() or request.method not in ("GET", "HEAD")
+                    or any(name in session for name in SESSION_KEYS)):
+                return f(*args, **kwargs)
+
+            key = _key("view", request.path, sorted(request.args.items(multi=True)),
+                       translations.current_language())
+            versions = tag_versions(tags)
+            hit = _lookup(key, versions)
+            if hit is not None:
+                status, headers, body = hit
+                response = current_app.response_class(body, status=status, headers=headers)
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed and not session.modified:
+                headers = [(name, value) for name, value in response.headers
+                           if name not in SKIP_HEADERS]
+                _backend().set(key, (versions, (200, headers, response.get_data())),
+                               ttl or current_app.config["CACHE_DEFAULT_TTL"])
+                response.headers["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
+
+
+def remember(key, tags, ttl, compute):
+    """compute()'s result, cached under `key` until a tag changes. It must
+    pickle (the sqlite backend) and not be None."""
+    if not _enabled():
+        return compute()
+    full_key = _key("value", key)
+    versions = tag_versions(tags)
+    hit = _lookup(full_key, versions)
+    if hit is not None:
+        return hit
+    value = compute()
+    _backend().set(full_key, (versions, value), ttl or current_app.config["CACHE_DEFAULT_TTL"])
+    return value
+
+
+def fragment(key, tags, ttl, render, lang=None):
+    """Rendered output of `render()`, cached under `key` until a tag changes."""
+    if not _enabled():
+        return render()
+    full_key = _key("fragment", key, lang)
+    versions = tag_versions(tags)
+    hit = _lookup(full_key, versions)
+    if hit is not None:
+        return Markup(hit)
+    html = render()
+    _backend().set(full_key, (versions, str(html)), ttl or current_app.config["CACHE_DEFAULT_TTL"])
+    return html
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache "name", vary..., tags=["notices"], ttl=300 %}...{% endcache %}
+
+    The body is rendered once per name, vary values and language, and
+    served from the cache until one of its tags changes. Fragments don't
+    depend on who is logged in, so unlike @cached they are also reused on
+    personalised pages.
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        options = {"tags": nodes.List([]), "ttl": nodes.Const(None)}
+        while parser.stream.skip_if("comma"):
+            if parser.stream.current.type == "name" and parser.stream.look().type == "assign":
+                name = next(parser.stream).value
+                next(parser.stream)
+                if name not in options:
+                    parser.fail(f"unknown cache option '{name}'", lineno)
+                options[name] = parser.parse_expression()
+            else:
+                key.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_render", [nodes.List(key), options["tags"], options["ttl"]])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, key, tags, ttl, caller):
+        # Overlays from translations carry their language; output differs per language
+        return fragment(key, tags, ttl, caller, getattr(self.environment, "language", None))
+
+
+# ---------------- CLI ----------------
+
+cache_cli = AppGroup("cache", help="Response and fragment cache.")
+
+
+@cache_cli.command("clear")
+def clear_command():
+    """Drop every cached page and fragment."""
+    backend = _backend()
+    if backend is None:
+        click.echo("Caching is disabled (CACHE_BACKEND=none)")
+        return
+    backend.clear()
+    click.echo("Cache cleared")
+
+
+def init_app(app):
+    app.config.setdefault("CACHE_BACKEND", os.environ.get("CACHE_BACKEND", "memory"))
+    app.config.setdefault("CACHE_PATH", os.environ.get("CACHE_PATH", "database/cache.db"))
+    app.config.setdefault("CACHE_MAX_ENTRIES", int(os.environ.get("CACHE_MAX_ENTRIES", "500")))
+    app.config.setdefault("CACHE_DEFAULT_TTL", 300)
+
+    kind = app.config["CACHE_BACKEND"]
+    if kind == "memory":
+        backend = MemoryBackend(app.config["CACHE_MAX_ENTRIES"])
+    elif kind == "sqlite":
+        backend = SQLiteBackend(app.config["CACHE_PATH"], app.config["CACHE_MAX_ENTRIES"])
+    elif kind == "none":
+        backend = None
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND {kind!r} (memory, sqlite or none)")
+    app.extensions["response_cache"] = backend
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.after_request(_forget_versions)
+    app.cli.add_command(cache_cli)
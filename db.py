@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from flask import current_app, g
+
+import storage
+
+DB_NAME = (storage.sqlite_path(os.environ.get("DATABASE_URL"))
+           or os.environ.get("DATABASE_PATH", "database/panchayath.db"))
+# Class of every connection we open; metrics.py swaps in one that times
+# each statement
+connection_class = sqlite3.Connection
+
+# ---------------- CONNECTION TUNING ----------------
+
+# Applied to every connection we open. journal_mode=WAL is persistent in the
+# database file, so it is only (re)asserted on writer connections.
+PRAGMAS = (
+    ("busy_timeout", 5000),        # wait up to 5s for the write lock instead of failing
+    ("synchronous", "NORMAL"),     # safe with WAL, avoids an fsync per commit
+    ("cache_size", -16000),        # ~16 MB page cache per connection
+    ("mmap_size", 134217728),      # 128 MB memory-mapped reads
+    ("temp_store", "MEMORY"),
+)
+
+# One writer and one read-only connection per worker thread, reused across
+# requests. Connections never cross threads, and are reopened after a fork
+# so gunicorn workers don't share the master's file handles.
+_local = threading.local()
+# Per thread; only threads touching many shard files come near it
+MAX_THREAD_CONNECTIONS = 64
+# Live in the catalog database and are visible through shard connections
+CATALOG_TABLES = ("panchayath", "users", "admin")
+
+
+def database_path():
+    try:
+        return current_app.config.get("DATABASE", DB_NAME)
+    except RuntimeError:
+        # Outside an application context (scripts, CLI helpers)
+        return DB_NAME
+
+
+def open_connection(path=None, readonly=False, catalog=None):
+    """Open a new tuned connection. Callers own it and must close it.
+
+    With `catalog`, the connection is to a shard file (shards.py) and the
+    catalog database is attached read-only, its panchayath, users and admin
+    tables shadowing the shard's empty ones so queries can join them as if
+    everything lived in one file.
+
+    With a PostgreSQL DATABASE_URL there is no file: the connection is to
+    the server, outside the request pool (storage.connect).
+    """
+    if catalog is None and storage.is_postgres():
+        return storage.connect(readonly)
+    path = path or database_path()
+    if readonly:
+        uri = "file:{}?mode=ro".format(os.path.abspath(path))
+        conn = sqlite3.connect(uri, uri=True, factory=connection_class)
+    else:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if catalog:
+            # A URI connection, so the ATTACH below can ask for read-only
+            conn = sqlite3.connect("file:{}".format(os.path.abspath(path)), uri=True,
+                                   factory=connection_class)
+        else:
+            conn = sqlite3.connect(path, factory=connection_class)
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name}={value}")
+    if catalog:
+        conn.execute("ATTACH DATABASE ? AS catalog", ("file:{}?mode=ro".format(os.path.abspath(catalog)),))
+        for table in CATALOG_TABLES:
+            # TEMP objects are found before the main schema's
+            conn.execute(f"CREATE TEMP VIEW {table} AS SELECT * FROM catalog.{table}")
+    return conn
+
+
+def _thread_connection(path, readonly, catalog=None):
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        # New thread, or we are in a freshly forked worker: never reuse
+        # connections inherited from the parent process.
+        _local.pid = pid
+        _local.connections = OrderedDict()
+
+    key = (path, readonly, catalog)
+    conn = _local.connections.get(key)
+    if conn is None:
+        if readonly and catalog is None and (path, False, None) not in _local.connections:
+            # Make sure the file exists and is in WAL mode before the first
+            # read-only connection attaches to it. Shard files are created
+            # that way by shards.py.
+            _thread_connection(path, False)
+        conn = open_connection(path, readonly=readonly, catalog=catalog)
+        _local.connections[key] = conn
+        # Threads that fan out over many shards keep only the recently
+        # used, never one that is mid-transaction
+        idle = [k for k, c in _local.connections.items() if k != key and not c.in_transaction]
+        for stale in idle[:max(0, len(_local.connections) - MAX_THREAD_CONNECTIONS)]:
+            _local.connections.pop(stale).close()
+    else:
+        _local.connections.move_to_end(key)
+    return conn
+
+
+def get_db():
+    """Read/write connection for the current request."""
+    if "db" not in g:
+        if storage.is_postgres():
+            g.db = storage.borrow()
+        else:
+            g.db = _thread_connection(database_path(), False)
+    return g.db
+
+
+def get_read_db():
+    """Read-only connection for the current request. Under WAL, readers see
+    the last committed snapshot and never wait on a writer. On PostgreSQL
+    readers don't block writers either, so it is the request's one pooled
+    connection."""
+    if storage.is_postgres():
+        return get_db()
+    if "read_db" not in g:
+        g.read_db = _thread_connection(database_path(), True)
+    return g.read_db
+
+
+def get_shard_db(path, readonly=False):
+    """Connection to a shard file for the current request, with the
+    catalog attached (see open_connection)."""
+    connections = g.setdefault("shard_dbs", {})
+    key = (path, readonly)
+    if key not in connections:
+        connections[key] = _thread_connection(path, readonly, catalog=database_path())
+    return connections[key]
+
+
+def thread_connection(path, readonly=True, catalog=None):
+    """This thread's reusable connection to `path`, for threads that serve
+    no request (shards.fan_out). Never commit on a shared read connection."""
+    return _thread_connection(path, readonly, catalog)
+
+
+def release_db(exception=None):
+    # Connections stay open for the next request on this thread; only make
+    # sure nothing is left half-done.
+    conns = [g.pop(name, None) for name in ("db", "read_db")]
+    conns.extend(g.pop("shard_dbs", {}).values())
+    for conn in conns:
+        if conn is None:
+            continue
+        if storage.dialect(conn) == "postgresql":
+            # Back to the pool, rolled back if left mid-transaction
+            storage.release(conn)
+        elif conn.in_transaction:
+            conn.rollback()
+
+
+def close_thread_connections():
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = OrderedDict()
+
+
+def init_app(app):
+    app.config.setdefault("DATABASE", DB_NAME)
+    app.teardown_appcontext(release_db)
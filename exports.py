@@ -0,0 +1,335 @@
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from flask import Response, current_app, send_file, stream_with_context
+
+import api
+import db
+import queries
+import sessions
+import shards
+
+# ---------------- ISSUE EXPORTS ----------------
+#
+# Panchayath admins send the district monthly issue reports as CSV, NDJSON
+# or XLSX. Exports read through queries.export_issue_rows (a server-side
+# cursor on PostgreSQL, a stepping cursor on SQLite) and are encoded a
+# chunk of rows at a time, so memory stays flat however many rows match:
+#
+#   stream()     straight into the response, for exports a browser waits on
+#   start_job()  in a background thread, into a compressed file under
+#                EXPORT_DIR the admin downloads later; progress is kept in
+#                export_jobs (migration 13) so any worker can report it
+#
+# Finished files are kept EXPORT_RETENTION seconds, then swept by the
+# session reaper along with their rows.
+
+COLUMNS = ("id", "created_at", "category", "status", "location", "description",
+           "reporter_name", "photo_path")
+# name: (mimetype, file extension, stored gzipped)
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv", True),
+    "ndjson": ("application/x-ndjson", "ndjson", True),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx", False),
+}
+FILTERS = ("status", "category", "since", "until")
+# Rows encoded per chunk yielded
+CHUNK_ROWS = 500
+# CSV cells starting with these are prefixed with ' so spreadsheets read
+# them as text (CSV injection); XLSX cells are inline strings already
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+# Rows between progress updates of a background job
+PROGRESS_EVERY = 5000
+# A queued or running job whose row hasn't moved in this long lost its
+# worker (a restart)
+STALE_AFTER = 300
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def filters(args):
+    """The dashboard filters present in `args`. Raises ValueError for a
+    date that isn't YYYY-MM-DD."""
+    found = {name: args[name].strip() for name in FILTERS if args.get(name, "").strip()}
+    for name in ("since", "until"):
+        if name in found:
+            datetime.strptime(found[name], "%Y-%m-%d")
+    return found
+
+
+def filename(panchayath_id, fmt):
+    return f"issues-{panchayath_id}-{datetime.now():%Y%m%d-%H%M%S}.{FORMATS[fmt][1]}"
+
+
+# ---------------- ENCODERS ----------------
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def _csv_cell(value):
+    # Citizens type descriptions and locations; one starting like a formula
+    # would run as one when the admin opens the file in Excel
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # The BOM tells Excel the file is UTF-8 (Malayalam, Kannada ...)
+    buffer.write("\ufeff")
+    writer.writerow(COLUMNS)
+    for n, row in enumerate(rows, 1):
+        writer.writerow([_csv_cell(row[name]) for name in COLUMNS])
+        if n % CHUNK_ROWS == 0:
+            yield _drain(buffer).encode()
+    yield _drain(buffer).encode()
+
+
+def _ndjson(rows):
+    lines = []
+    for row in rows:
+        lines.append(api.dumps({name: row[name] for name in COLUMNS}))
+        if len(lines) == CHUNK_ROWS:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+# The smallest workbook spreadsheet applications accept: one sheet of
+# inline strings, no shared strings table or styles to build up in memory
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Issues" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+# Characters XML 1.0 can't carry at all
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _cell(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    if value is None:
+        return "<c/>"
+    text = escape(_XML_INVALID.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable file collecting what zipfile writes, drained
+    chunk by chunk. zipfile falls back to data descriptors for it, so the
+    archive streams."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _xlsx(rows):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in _XLSX_PARTS.items():
+            archive.writestr(name, xml)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData><row>' + "".join(map(_cell, COLUMNS)).encode() + b'</row>'
+            )
+            for n, row in enumerate(rows, 1):
+                sheet.write(("<row>" + "".join(_cell(row[name]) for name in COLUMNS) + "</row>").encode())
+                if n % CHUNK_ROWS == 0:
+                    yield sink.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
+
+
+_ENCODERS = {"csv": _csv, "ndjson": _ndjson, "xlsx": _xlsx}
+
+
+def encode(rows, fmt):
+    """Chunks of bytes of `rows` in `fmt`."""
+    return _ENCODERS[fmt](rows)
+
+
+def stream(rows, fmt, panchayath_id):
+    """Download response encoding `rows` as they are read."""
+    response = Response(stream_with_context(encode(rows, fmt)), mimetype=FORMATS[fmt][0])
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename(panchayath_id, fmt)}"'
+    response.cache_control.no_store = True
+    return response
+
+
+def send(job):
+    """Download response for a finished job's file."""
+    fmt = job["format"]
+    return send_file(os.path.abspath(job["path"]), as_attachment=True,
+                     download_name=describe(job)["filename"],
+                     mimetype="application/gzip" if FORMATS[fmt][2] else FORMATS[fmt][0])
+
+
+# ---------------- BACKGROUND JOBS ----------------
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        # Pools don't survive fork(); each gunicorn worker builds its own
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=current_app.config["EXPORT_THREADS"],
+                                           thread_name_prefix="exports")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def start_job(conn, panchayath_id, admin_id, fmt, found_filters):
+    """Queue an export and return its id; commits."""
+    job_id = queries.add_export_job(conn, panchayath_id, admin_id, fmt,
+                                    json.dumps(found_filters), time.time())
+    conn.commit()
+    _get_executor().submit(_run, current_app._get_current_object(), job_id)
+    return job_id
+
+
+def _progress(rows, conn, job_id):
+    for n, row in enumerate(rows, 1):
+        if n % PROGRESS_EVERY == 0:
+            queries.update_export_job(conn, job_id, time.time(), rows_done=n)
+            conn.commit()
+        yield row
+
+
+def _run(app, job_id):
+    with app.app_context():
+        # Progress goes through a connection of its own: committing on the
+        # one being read would end a PostgreSQL server-side cursor
+        conn = db.open_connection()
+        try:
+            _export(app, conn, job_id)
+        finally:
+            conn.close()
+
+
+def _export(app, conn, job_id):
+    job = queries.export_job(conn, job_id)
+    fmt, panchayath_id = job["format"], job["panchayath_id"]
+    name = filename(panchayath_id, fmt) + (".gz" if FORMATS[fmt][2] else "")
+    path = os.path.join(app.config["EXPORT_DIR"], f"{job_id}-{name}")
+    try:
+        source = shards.read_db(panchayath_id)
+        where, params = queries.issue_filters(panchayath_id, json.loads(job["filters"]))
+        total = queries.count_issues(source, where, params)
+        queries.update_export_job(conn, job_id, time.time(), status="running", rows_total=total)
+        conn.commit()
+
+        os.makedirs(app.config["EXPORT_DIR"], exist_ok=True)
+        rows = _progress(queries.export_issue_rows(source, where, params), conn, job_id)
+        opener = gzip.open if FORMATS[fmt][2] else open
+        with opener(path + ".part", "wb") as out:
+            for chunk in encode(rows, fmt):
+                out.write(chunk)
+        os.replace(path + ".part", path)
+        queries.update_export_job(conn, job_id, time.time(), status="done", rows_done=total, path=path)
+        conn.commit()
+    except Exception as e:
+        print(f"Export {job_id} failed: {e}")
+        conn.rollback()
+        if os.path.exists(path + ".part"):
+            os.remove(path + ".part")
+        queries.update_export_job(conn, job_id, time.time(), status="failed", error=str(e)[:500])
+        conn.commit()
+
+
+def describe(job):
+    """A job as the exports page and its progress polling show it."""
+    status = job["status"]
+    if status in ("queued", "running") and time.time() - job["updated_at"] > STALE_AFTER:
+        status = "interrupted"
+    total = job["rows_total"]
+    return {
+        "id": job["id"],
+        "format": job["format"],
+        "filters": json.loads(job["filters"]),
+        "status": status,
+        "rows_done": job["rows_done"],
+        "rows_total": total,
+        "percent": 100 if status == "done" else int(100 * job["rows_done"] / total) if total else 0,
+        "error": job["error"],
+        "created_at": datetime.fromtimestamp(job["created_at"]).strftime("%Y-%m-%d %H:%M"),
+        "filename": os.path.basename(job["path"]).split("-", 1)[1] if job["path"] else None,
+    }
+
+
+def sweep(limit):
+    """Delete up to `limit` jobs older than EXPORT_RETENTION, files first.
+    Called by the session reaper."""
+    conn = db.get_db()
+    before = time.time() - current_app.config["EXPORT_RETENTION"]
+    jobs = queries.expired_export_jobs(conn, before, limit)
+    for job in jobs:
+        if job["path"] and os.path.exists(job["path"]):
+            os.remove(job["path"])
+    if jobs:
+        queries.delete_export_jobs(conn, [job["id"] for job in jobs])
+        conn.commit()
+    return len(jobs)
+
+
+def init_app(app):
+    app.config.setdefault("EXPORT_DIR", os.environ.get("EXPORT_DIR", "database/exports"))
+    app.config.setdefault("EXPORT_THREADS", int(os.environ.get("EXPORT_THREADS", "2")))
+    app.config.setdefault("EXPORT_RETENTION", int(os.environ.get("EXPORT_RETENTION", str(7 * 86400))))
+    sessions.register_sweeper(sweep)
@@ -0,0 +1,298 @@
+import base64
+import json
+
+import click
+from flask import request
+from flask.cli import AppGroup
+from markupsafe import Markup, escape
+
+import shards
+import storage
+from db import database_path, open_connection
+from pagination import Page, page_size
+
+# ---------------- FULL-TEXT SEARCH ----------------
+#
+# issues_fts and notices_fts (migration 7) are external-content FTS5 indexes
+# over issues and notices, kept in sync by triggers. Results are ordered by
+# bm25 with the column weights stored in each index's 'rank' setting. Like
+# pagination.py, a page continues strictly after the last row it showed,
+# here the (rank, rowid) pair instead of (created_at, id).
+#
+# Ranking has to score every match, which gets slow once a query matches a
+# large part of a million-row table ("road", a two-letter prefix). Only the
+# newest SEARCH_WINDOW matches are ranked: finding that window is a short
+# walk down the index in rowid order, and the rowid floor it yields is
+# pushed into the ranked query. The window counts only matches that pass
+# the panchayath and status filters, as on PostgreSQL, so a filter never
+# hides older results behind newer ones it excludes.
+#
+# With sharding each shard has its own indexes; results from several are
+# merged on rank. bm25 weighs terms by how rare they are in each index, so
+# ranks from different shards are close to, not exactly, comparable.
+#
+# On PostgreSQL the same searches run against GIN indexes over weighted
+# tsvectors (issue_document / notice_document, see migrations.py), ranked
+# by ts_rank, negated so that lower is better here too.
+
+MAX_TERMS = 8
+SNIPPET_TOKENS = 32
+SEARCH_WINDOW = 10000
+# Highlight markers: control characters that don't occur in real text and
+# pass through escape() untouched, swapped for <mark> afterwards
+_OPEN, _CLOSE = "\x02", "\x03"
+
+# The FTS table is always the outer loop (CROSS JOIN), so filters on
+# panchayath or status only ever look at rows that already matched.
+ISSUE_SEARCH = """
+    SELECT i.id, i.category, i.status, i.location, i.photo_path, i.created_at,
+           i.panchayath_id, p.name AS panchayath_name,
+           snippet(issues_fts, 0, ?, ?, '…', ?) AS description_hl,
+           highlight(issues_fts, 1, ?, ?) AS location_hl,
+           highlight(issues_fts, 2, ?, ?) AS category_hl,
+           issues_fts.rank AS rank
+    FROM issues_fts
+    CROSS JOIN issues i ON i.id = issues_fts.rowid
+    JOIN panchayath p ON p.id = i.panchayath_id
+"""
+# What the filters of a search need joined to find its window
+ISSUE_JOIN = "CROSS JOIN issues i ON i.id = issues_fts.rowid"
+
+NOTICE_SEARCH = """
+    SELECT n.id, n.title, n.banner_path, n.created_at,
+           n.panchayath_id, p.name AS panchayath_name,
+           highlight(notices_fts, 0, ?, ?) AS title_hl,
+           snippet(notices_fts, 1, ?, ?, '…', ?) AS description_hl,
+           notices_fts.rank AS rank
+    FROM notices_fts
+    CROSS JOIN notices n ON n.id = notices_fts.rowid
+    JOIN panchayath p ON p.id = n.panchayath_id
+"""
+NOTICE_JOIN = "CROSS JOIN notices n ON n.id = notices_fts.rowid"
+
+
+# Ranks the newest SEARCH_WINDOW matches, then fetches and highlights only
+# the page. {filters} and {after} are extra AND-ed conditions.
+POSTGRES_ISSUE_SEARCH = """
+    WITH hits AS (
+        SELECT i.id, -ts_rank(issue_document(i.description, i.location, i.category), q) AS rank
+        FROM issues i
+        CROSS JOIN to_tsquery('simple', ?) q
+        WHERE issue_document(i.description, i.location, i.category) @@ q{filters}
+        ORDER BY i.id DESC
+        LIMIT {window}
+    )
+    SELECT i.id, i.category, i.status, i.location, i.photo_path, i.created_at,
+           i.panchayath_id, p.name AS panchayath_name,
+           ts_headline('simple', coalesce(i.description, ''), q, ?) AS description_hl,
+           ts_headline('simple', coalesce(i.location, ''), q, ?) AS location_hl,
+           ts_headline('simple', coalesce(i.category, ''), q, ?) AS category_hl,
+           hits.rank
+    FROM hits
+    JOIN issues i ON i.id = hits.id
+    JOIN panchayath p ON p.id = i.panchayath_id
+    CROSS JOIN to_tsquery('simple', ?) q
+    WHERE 1 = 1{after}
+    ORDER BY hits.rank, hits.id
+    LIMIT ?
+"""
+
+POSTGRES_NOTICE_SEARCH = """
+    WITH hits AS (
+        SELECT n.id, -ts_rank(notice_document(n.title, n.description), q) AS rank
+        FROM notices n
+        CROSS JOIN to_tsquery('simple', ?) q
+        WHERE notice_document(n.title, n.description) @@ q{filters}
+        ORDER BY n.id DESC
+        LIMIT {window}
+    )
+    SELECT n.id, n.title, n.banner_path, n.created_at,
+           n.panchayath_id, p.name AS panchayath_name,
+           ts_headline('simple', coalesce(n.title, ''), q, ?) AS title_hl,
+           ts_headline('simple', coalesce(n.description, ''), q, ?) AS description_hl,
+           hits.rank
+    FROM hits
+    JOIN notices n ON n.id = hits.id
+    JOIN panchayath p ON p.id = n.panchayath_id
+    CROSS JOIN to_tsquery('simple', ?) q
+    WHERE 1 = 1{after}
+    ORDER BY hits.rank, hits.id
+    LIMIT ?
+"""
+# ts_headline options: whole field highlighted, or a snippet around the hits
+_HIGHLIGHT = f"StartSel={_OPEN}, StopSel={_CLOSE}, HighlightAll=true"
+_SNIPPET = f"StartSel={_OPEN}, StopSel={_CLOSE}, MaxWords={SNIPPET_TOKENS}, MinWords={SNIPPET_TOKENS // 2}"
+
+
+def fts_query(text):
+    """Turn what a citizen typed into an FTS5 query.
+
+    Every word is quoted, so punctuation and FTS operators are plain text
+    and can't raise a syntax error; all words must match and the last one
+    is a prefix, so results appear while a word is still being typed.
+    Single letters aren't expanded, they would match most of the index.
+    """
+    terms = (text or "").split()[:MAX_TERMS]
+    if not terms:
+        return None
+    query = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    return query + "*" if len(terms[-1]) > 1 else query
+
+
+def tsquery(text):
+    """fts_query() for PostgreSQL: the same rules, as a tsquery."""
+    terms = (text or "").split()[:MAX_TERMS]
+    if not terms:
+        return None
+    quoted = ["'" + term.replace("\\", "\\\\").replace("'", "''") + "'" for term in terms]
+    if len(terms[-1]) > 1:
+        quoted[-1] += ":*"
+    return " & ".join(quoted)
+
+
+def marked(text):
+    """Escape highlighted FTS output and turn the markers into <mark>."""
+    if not text:
+        return Markup("")
+    return Markup(str(escape(text)).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>"))
+
+
+def _encode(row):
+    raw = json.dumps([row["rank"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        rank, row_id = json.loads(raw)
+        return float(rank), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _run(conn, select, table, join, markers, query, where, params, cursor, size):
+    if cursor is None:
+        cursor = request.args.get("cursor")
+    clauses = [f"{table} MATCH ?"] + list(where)
+    args = [query] + list(params)
+
+    window = f"SELECT {table}.rowid FROM {table}"
+    if where:
+        window += " " + join
+    window += " WHERE " + " AND ".join(clauses)
+    floor = conn.execute(
+        window + f" ORDER BY {table}.rowid DESC LIMIT 1 OFFSET ?", args + [SEARCH_WINDOW - 1],
+    ).fetchone()
+    if floor:
+        clauses.append(f"{table}.rowid >= ?")
+        args.append(floor[0])
+
+    after = _decode(cursor)
+    if after:
+        clauses.append(f"({table}.rank, {table}.rowid) > (?, ?)")
+        args.extend(after)
+
+    sql = select + " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {table}.rank, {table}.rowid LIMIT ?"
+    # One extra row tells us whether there is a next page
+    rows = conn.execute(sql, list(markers) + args + [size + 1]).fetchall()
+    next_cursor = _encode(rows[size - 1]) if len(rows) > size else None
+    return Page(rows[:size], next_cursor)
+
+
+def _run_postgres(conn, template, headlines, query, where, params, cursor, size):
+    if cursor is None:
+        cursor = request.args.get("cursor")
+    after, after_args = "", []
+    decoded = _decode(cursor)
+    if decoded:
+        after, after_args = " AND (hits.rank, hits.id) > (?, ?)", list(decoded)
+    sql = template.format(filters="".join(f" AND {clause}" for clause in where),
+                          window=SEARCH_WINDOW, after=after)
+    args = [query, *params, *headlines, query, *after_args, size + 1]
+    rows = conn.execute(sql, args).fetchall()
+    next_cursor = _encode(rows[size - 1]) if len(rows) > size else None
+    return Page(rows[:size], next_cursor)
+
+
+def search_issues(conn, text, panchayath_id=None, status=None, cursor=None, size=None):
+    """One page of issues matching `text`, best first."""
+    postgres = storage.dialect(conn) == "postgresql"
+    query = tsquery(text) if postgres else fts_query(text)
+    if query is None:
+        return Page([], None)
+    where, params = [], []
+    if panchayath_id:
+        where.append("i.panchayath_id = ?")
+        params.append(panchayath_id)
+    if status:
+        where.append("i.status = ?")
+        params.append(status)
+    if postgres:
+        return _run_postgres(conn, POSTGRES_ISSUE_SEARCH, (_SNIPPET, _HIGHLIGHT, _HIGHLIGHT),
+                             query, where, params, cursor, size or page_size())
+    markers = (_OPEN, _CLOSE, SNIPPET_TOKENS, _OPEN, _CLOSE, _OPEN, _CLOSE)
+    return _run(conn, ISSUE_SEARCH, "issues_fts", ISSUE_JOIN, markers, query, where, params,
+                cursor, size or page_size())
+
+
+def search_notices(conn, text, panchayath_id=None, cursor=None, size=None):
+    """One page of notices matching `text`, best first."""
+    postgres = storage.dialect(conn) == "postgresql"
+    query = tsquery(text) if postgres else fts_query(text)
+    if query is None:
+        return Page([], None)
+    where, params = [], []
+    if panchayath_id:
+        where.append("n.panchayath_id = ?")
+        params.append(panchayath_id)
+    if postgres:
+        return _run_postgres(conn, POSTGRES_NOTICE_SEARCH, (_HIGHLIGHT, _SNIPPET),
+                             query, where, params, cursor, size or page_size())
+    markers = (_OPEN, _CLOSE, _OPEN, _CLOSE, SNIPPET_TOKENS)
+    return _run(conn, NOTICE_SEARCH, "notices_fts", NOTICE_JOIN, markers, query, where, params,
+                cursor, size or page_size())
+
+
+def merge(pages, size):
+    """One page from the same search run on several shards, best first."""
+    return shards.merge_pages(pages, size, lambda row: (row["rank"], row["id"]), _encode)
+
+
+# ---------------- CLI ----------------
+
+search_cli = AppGroup("search", help="Full-text search index.")
+
+
+@search_cli.command("rebuild")
+def rebuild_command():
+    """Rebuild and optimize both indexes from the base tables."""
+    if storage.is_postgres():
+        conn = open_connection()
+        try:
+            for index in ("idx_issues_search", "idx_notices_search"):
+                conn.execute(f"REINDEX INDEX {index}")
+                conn.commit()
+                click.echo(f"{index}: rebuilt")
+        finally:
+            conn.close()
+        return
+    for path in [database_path(), *shards.paths()]:
+        conn = open_connection(path)
+        try:
+            for table in ("issues_fts", "notices_fts"):
+                conn.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+                conn.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+                conn.commit()
+                count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                click.echo(f"{path}: {table}: {count} row(s) indexed")
+        finally:
+            conn.close()
+
+
+def init_app(app):
+    app.add_template_filter(marked)
+    app.cli.add_command(search_cli)
@@ -0,0 +1,57 @@
+import gc
+import multiprocessing
+import os
+
+# ---------------- GUNICORN ----------------
+#
+# Production server profile, picked up by `gunicorn "app:create_app()"`
+# (see Procfile).
+#
+# The app is built once, in the master, before the workers are forked
+# (preload_app): modules, compiled templates and translations are shared
+# copy-on-write instead of every worker loading its own, and the schema
+# upgrade, demo seeding and static asset build (assets.py) run exactly
+# once, before any worker takes a request (when_ready). Pools, threads and connections are all created per
+# process after the fork (they check os.getpid()), so nothing the master
+# opened leaks into a worker.
+#
+# WEB_WORKER_CLASS=gthread (the default) serves each worker's requests from
+# a pool of WEB_THREADS threads. gevent (pip install gevent) runs them as
+# greenlets, WEB_CONNECTIONS per worker, for deployments that spend their
+# time waiting on uploads, SMTP and the live update streams.
+
+worker_class = os.environ.get("WEB_WORKER_CLASS", "gthread")
+if worker_class == "gevent":
+    # Patch before the app is imported into the master, or the workers
+    # inherit unpatched sockets and locks
+    from gevent import monkey
+    monkey.patch_all()
+
+# Requests are mostly I/O; concurrency comes from threads or greenlets, so
+# one process per core is enough to use every CPU
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("WEB_THREADS", "16"))
+worker_connections = int(os.environ.get("WEB_CONNECTIONS", "1000"))
+
+preload_app = True
+timeout = int(os.environ.get("WEB_TIMEOUT", "30"))
+# Live update streams never finish on their own; don't wait long for them
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", "10"))
+keepalive = 5
+
+
+def when_ready(server):
+    # The master has loaded the app (preload_app) and is about to fork
+    import app
+    import assets
+    application = server.app.wsgi()
+    app.initialize(application)
+    # Built here, on the machine that serves them, and loaded before the
+    # fork so every worker has the manifest: files written by a Heroku
+    # release phase never reach the web dynos. Unchanged assets keep their
+    # names, so this is quick after the first start.
+    assets.build(application.static_folder)
+    assets.load_manifest(application.static_folder)
+    # Keep the collector from touching (and so copying) the objects every
+    # worker shares with the master
+    gc.freeze()
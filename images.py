@@ -0,0 +1,334 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import url_for
+from flask.cli import AppGroup
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it uploads are served as-is
+    Image = None
+
+# ---------------- IMAGE PIPELINE ----------------
+#
+# sanitize() strips EXIF (GPS, device data), XMP, IPTC and comments from an
+# upload by dropping those segments of the JPEG / chunks of the PNG or WebP
+# file; the pixels are copied as they are, never decoded, so it is cheap
+# enough for the upload request. A JPEG keeps only its orientation tag.
+# uploads.store() runs it before the file is hashed and named, since a
+# content-addressed file is cached forever and must never change
+# afterwards. Images over MAX_PIXELS are refused from their header before
+# anything decodes them.
+#
+# The thumb / medium variants are written next to it as WebP and JPEG off
+# the request thread.
+#
+# Listings use the variants; only the image modal loads the original. Until
+# a variant exists the helpers below fall back to the original, so pages
+# never break while the worker is still busy.
+
+VARIANT_DIR = "variants"
+# Largest image accepted, in pixels; decoding one holds width x height x 4
+# bytes in memory
+MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", "50000000"))
+ORIENTATION = 0x0112
+
+# name -> longest edge in pixels
+VARIANTS = {
+    "thumb": 480,
+    "medium": 1280,
+}
+FORMATS = (
+    ("webp", "WEBP", {"quality": 80, "method": 4}),
+    ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+)
+WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_ready = set()  # variant files known to exist, saves a stat() per render
+
+
+def variant_path(path, size, ext):
+    """'uploads/issue_1.png' -> 'uploads/variants/issue_1.thumb.webp'"""
+    folder, name = os.path.split(path)
+    stem = os.path.splitext(name)[0]
+    return f"{folder}/{VARIANT_DIR}/{stem}.{size}.{ext}"
+
+
+def _fs(path, folder=None):
+    import uploads  # uploads imports this module
+    return uploads.file_path(path, folder)
+
+
+def _variant_ready(path):
+    filename = _fs(path)
+    if filename in _ready:
+        return True
+    if os.path.exists(filename):
+        _ready.add(filename)
+        return True
+    return False
+
+
+def _save_atomic(image, target, fmt, options):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    image.save(tmp, fmt, **options)
+    os.replace(tmp, target)
+
+
+def _flatten(image):
+    """RGB copy for JPEG/WebP variants; transparency goes onto white."""
+    if image.mode in ("RGB", "L"):
+        return image
+    if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+class ImageRejected(ValueError):
+    """An upload no image of ours may be; the message is safe to show."""
+
+
+def _open(source):
+    """(format, upright loaded image), or None if Pillow can't read it."""
+    try:
+        with Image.open(source) as opened:
+            fmt = opened.format
+            if opened.width * opened.height > MAX_PIXELS:
+                raise ValueError(f"{opened.width}x{opened.height} is over {MAX_PIXELS} pixels")
+            image = ImageOps.exif_transpose(opened)
+            image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"Image pipeline: skipping {source}: {e}")
+        return None
+    return fmt, image
+
+
+def _header(source):
+    """(width, height, orientation) read from the file's header without
+    decoding it, or None if Pillow is missing or can't read it."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(source) as opened:
+            orientation = opened.getexif().get(ORIENTATION, 1) if opened.format in ("JPEG", "MPO") else 1
+            return opened.width, opened.height, orientation
+    except Image.DecompressionBombError:
+        raise ImageRejected("The image is too large.")
+    except (OSError, ValueError):
+        return None
+
+
+def _orientation_exif(orientation):
+    """APP1 segment holding nothing but the orientation tag."""
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    payload = b"Exif\x00\x00" + exif.tobytes()
+    return b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload
+
+
+def _strip_jpeg(data, orientation):
+    # Markers up to the first scan; APP0 (JFIF), APP2 colour profiles and
+    # APP14 (Adobe colour transform) are needed to show the image right,
+    # the other APPn and COM segments are metadata
+    out, pos = [data[:2]], 2
+    keep_exif = orientation not in (None, 1)
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker == 0xDA:  # start of scan: the compressed image follows
+            break
+        end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], "big")
+        segment = data[pos:end]
+        metadata = marker == 0xFE or (0xE1 <= marker <= 0xEF and marker != 0xEE)
+        if marker == 0xE2 and segment[4:16] == b"ICC_PROFILE\x00":
+            metadata = False
+        if keep_exif and marker != 0xE0:
+            out.append(_orientation_exif(orientation))
+            keep_exif = False
+        if not metadata:
+            out.append(segment)
+        pos = end
+    if keep_exif:
+        out.append(_orientation_exif(orientation))
+    # Up to the end of the primary image: multi-picture files (MPO) append
+    # more images, each with EXIF of its own
+    eoi = data.find(b"\xff\xd9", pos)
+    out.append(data[pos:] if eoi < 0 else data[pos:eoi + 2])
+    return b"".join(out)
+
+
+def _strip_png(data):
+    out, pos = [data[:8]], 8
+    while pos + 8 <= len(data):
+        kind = data[pos + 4:pos + 8]
+        end = pos + 12 + int.from_bytes(data[pos:pos + 4], "big")
+        if kind not in (b"eXIf", b"tEXt", b"zTXt", b"iTXt", b"tIME"):
+            out.append(data[pos:end])
+        pos = end
+        if kind == b"IEND":
+            break
+    return b"".join(out)
+
+
+def _strip_webp(data):
+    chunks, pos = [], 12
+    while pos + 8 <= len(data):
+        kind = data[pos:pos + 4]
+        size = int.from_bytes(data[pos + 4:pos + 8], "little")
+        chunk = data[pos:pos + 8 + size + (size & 1)]
+        if kind == b"VP8X":
+            # Clear the EXIF and XMP flags along with the chunks
+            chunk = chunk[:8] + bytes([chunk[8] & ~0x0C]) + chunk[9:]
+        if kind not in (b"EXIF", b"XMP "):
+            chunks.append(chunk)
+        pos += 8 + size + (size & 1)
+    body = b"WEBP" + b"".join(chunks)
+    return b"RIFF" + len(body).to_bytes(4, "little") + body
+
+
+def sanitize(source):
+    """Strip metadata from the JPEG, PNG or WebP file at `source` (a
+    filesystem path) in place; GIFs carry none worth removing. Returns
+    whether the file changed. Raises ImageRejected for an image over
+    MAX_PIXELS."""
+    header = _header(source)
+    if header is not None and header[0] * header[1] > MAX_PIXELS:
+        raise ImageRejected(f"The image is too large ({header[0]}×{header[1]} pixels).")
+    with open(source, "rb") as f:
+        data = f.read()
+    if data.startswith(b"\xff\xd8"):
+        stripped = _strip_jpeg(data, header[2] if header and Image is not None else None)
+    elif data.startswith(b"\x89PNG\r\n\x1a\n"):
+        stripped = _strip_png(data)
+    elif data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        stripped = _strip_webp(data)
+    else:
+        return False
+    if stripped == data:
+        return False
+    tmp = f"{source}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(stripped)
+    os.replace(tmp, source)
+    return True
+
+
+def process_image(path, folder=None):
+    """Write every variant of an upload. `path` is as stored in
+    issues.photo_path / notices.banner_path; `folder` is the upload folder
+    it lives in, the app's UPLOAD_FOLDER by default."""
+    if Image is None:
+        return False
+    opened = _open(_fs(path, folder))
+    if opened is None:
+        return False
+    fmt, image = opened
+
+    flat = _flatten(image)
+    for size, edge in VARIANTS.items():
+        resized = flat.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        for ext, variant_fmt, options in FORMATS:
+            _save_atomic(resized, _fs(variant_path(path, size, ext), folder), variant_fmt, options)
+    return True
+
+
+def _run(path, folder):
+    try:
+        process_image(path, folder)
+    except Exception as e:
+        # Never let one bad upload kill the worker thread
+        print(f"Image pipeline: failed on {path}: {e}")
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        # Pools don't survive fork(); each gunicorn worker builds its own
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="images")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def submit(path):
+    """Queue an uploaded image for processing and return immediately."""
+    if not path or Image is None:
+        return None
+    import uploads  # uploads imports this module
+    # The worker has no app context to look the folder up in
+    return _get_executor().submit(_run, path, uploads.upload_folder())
+
+
+# ---------------- TEMPLATE HELPERS ----------------
+
+
+def image_url(path, size="thumb"):
+    """JPEG variant URL if it has been generated, otherwise the original."""
+    variant = variant_path(path, size, "jpg")
+    if _variant_ready(variant):
+        return url_for("static", filename=variant)
+    return url_for("static", filename=path)
+
+
+def image_srcset(path, ext="webp"):
+    """srcset covering every generated variant, or '' if none exist yet."""
+    candidates = []
+    for size, edge in VARIANTS.items():
+        variant = variant_path(path, size, ext)
+        if _variant_ready(variant):
+            candidates.append(f"{url_for('static', filename=variant)} {edge}w")
+    return ", ".join(candidates)
+
+
+# ---------------- CLI ----------------
+
+images_cli = AppGroup("images", help="Uploaded image processing.")
+
+
+@images_cli.command("backfill")
+@click.option("--force", is_flag=True, help="Reprocess images that already have variants.")
+def backfill_command(force):
+    """Generate variants for existing uploads."""
+    if Image is None:
+        raise click.ClickException("Pillow is not installed.")
+    import uploads as store  # uploads imports this module
+    folder = store.upload_folder()
+    done = 0
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if d != VARIANT_DIR]
+        for name in sorted(files):
+            if name.endswith(".tmp"):
+                continue
+            path = "uploads/" + os.path.relpath(os.path.join(root, name), folder).replace(os.sep, "/")
+            if not force and os.path.exists(_fs(variant_path(path, "thumb", "webp"), folder)):
+                continue
+            # Hashed uploads were sanitized before they were named; older
+            # ones can still be rewritten in place
+            if not store.HASHED_PATH.match(path):
+                try:
+                    sanitize(_fs(path, folder))
+                except ImageRejected as e:
+                    click.echo(f"Skipped {path}: {e}")
+                    continue
+            if process_image(path, folder):
+                done += 1
+                click.echo(f"Processed {path}")
+    click.echo(f"{done} image(s) processed")
+
+
+def init_app(app):
+    app.add_template_global(image_url)
+    app.add_template_global(image_srcset)
+    app.cli.add_command(images_cli)
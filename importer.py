@@ -0,0 +1,780 @@
+import csv
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+import db
+import limiter
+import migrations
+import shards
+import storage
+
+# ---------------- BULK IMPORT ----------------
+#
+# Onboarding a state: thousands of panchayaths and their admins, and the
+# grievances already filed in the old system, loaded from CSV (with a
+# header row) or JSON (an array of objects, or one object per line),
+# optionally gzipped:
+#
+#   flask import panchayaths panchayaths.csv
+#   flask import admins admins.csv
+#   flask import issues legacy-issues.ndjson.gz
+#
+# Files are read as they go, never whole. Every record is checked first;
+# those that fail go to <file>.rejects.ndjson with the reason, so they
+# can be fixed there and that file imported in turn, and those already in
+# the database (same panchayath id or name, same admin username) are
+# skipped. Valid rows are written BATCH at a time with executemany, one
+# transaction per batch, and the batch commits together with a checkpoint
+# (import_checkpoints, migration 15): run the same command again after a
+# crash or Ctrl-C and it carries on after the last committed batch. With
+# SHARDING on, issues go to their panchayath's shard file, which keeps a
+# checkpoint of its own.
+#
+# On SQLite, the target table's indexes and triggers are dropped for the
+# length of the import and recreated at the end, with what the triggers
+# maintain (home page counters, search index, change counters, analytics
+# rollups) brought up to date for the new rows in one pass each, instead
+# of row by row. Stop the site first: writes it made meanwhile would miss
+# their triggers. Pass --live to keep everything in place and import
+# while it runs, more slowly. If an import stops half way and won't be
+# resumed, `flask import finish` puts the indexes and triggers back.
+#
+# Admin passwords are hashed IMPORT_HASH_WORKERS at a time in a process
+# pool (limiter.hash_passwords). Legacy issues are loaded without creating
+# issue events, so live update streams don't replay years of history.
+
+# Records per transaction (and checkpoint), unless the kind says otherwise
+BATCH = 20000
+# How much of a file its fingerprint covers, besides its size
+FINGERPRINT_BYTES = 1 << 20
+# JSON array reads, and the longest single record accepted from one
+READ_SIZE = 1 << 16
+MAX_RECORD_SIZE = 1 << 24
+# Emails looked up per query when matching issues to citizens
+LOOKUP_CHUNK = 500
+COUNTS = ("inserted", "skipped", "rejected")
+STATUSES = ("Pending", "In Progress", "Completed")
+
+# What the dropped triggers would have done for the rows loaded without
+# them, per table; :after is the highest id the table had beforehand
+REBUILD = {
+    "panchayath": (
+        """
+        UPDATE stats SET value = value + (SELECT COUNT(*) FROM panchayath WHERE id > :after)
+        WHERE name = 'panchayaths'
+        """,
+    ),
+    "issues": (
+        """
+        UPDATE stats SET value = value + (
+            SELECT COUNT(*) FROM issues
+            WHERE id > :after AND (stats.name = 'issues' OR status = 'Completed')
+        )
+        WHERE name IN ('issues', 'issues_completed')
+        """,
+        """
+        INSERT INTO issues_fts (rowid, description, location, category)
+        SELECT id, description, location, category FROM issues WHERE id > :after
+        """,
+        """
+        INSERT INTO change_counters (resource, panchayath_id, version)
+        SELECT 'issues', panchayath_id, 1 FROM issues
+        WHERE id > :after AND panchayath_id IS NOT NULL GROUP BY panchayath_id
+        UNION ALL
+        SELECT 'issues', 0, 1 WHERE true
+        ON CONFLICT (resource, panchayath_id) DO UPDATE SET version = version + 1
+        """,
+        """
+        INSERT INTO issue_daily (panchayath_id, day, category, status, reported, entered)
+        SELECT COALESCE(panchayath_id, 0), COALESCE(date(created_at), date('now')), COALESCE(category, ''),
+               COALESCE(status, 'Pending'), COUNT(*), COUNT(*)
+        FROM issues WHERE id > :after
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (panchayath_id, day, category, status)
+        DO UPDATE SET reported = reported + excluded.reported, entered = entered + excluded.entered
+        """,
+        """
+        INSERT INTO issue_totals (panchayath_id, category, status, count)
+        SELECT COALESCE(panchayath_id, 0), COALESCE(category, ''), COALESCE(status, 'Pending'), COUNT(*)
+        FROM issues WHERE id > :after
+        GROUP BY 1, 2, 3
+        ON CONFLICT (panchayath_id, category, status) DO UPDATE SET count = count + excluded.count
+        """,
+    ),
+}
+
+
+class Invalid(ValueError):
+    """A record that can't be imported; the message says why."""
+
+
+# ---------------- READING ----------------
+
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, encoding="utf-8-sig", newline="")
+
+
+def file_format(path):
+    """csv or json, from the file name."""
+    name = path[:-3] if path.endswith(".gz") else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".json", ".jsonl", ".ndjson"):
+        return "json"
+    raise click.ClickException(f"Can't tell the format of {path}; pass --format csv or json")
+
+
+def _json_records(f):
+    """Values of a top-level JSON array one at a time, or of JSON lines.
+    A line that doesn't parse is passed on as text, to be rejected."""
+    first = f.read(1)
+    while first.isspace():
+        first = f.read(1)
+    if first != "[":
+        for line in itertools.chain([first + f.readline()], f):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield line.rstrip("\r\n")
+        return
+
+    decoder = json.JSONDecoder()
+    buffer, pos = "", 0
+    while True:
+        # Past whitespace and the comma before the next value
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ","):
+                pos += 1
+            if pos < len(buffer):
+                break
+            buffer, pos = f.read(READ_SIZE), 0
+            if not buffer:
+                raise ValueError("the JSON array is never closed")
+        if buffer[pos] == "]":
+            return
+        while True:
+            try:
+                value, pos = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                # Most likely a record cut off at the end of the buffer
+                more = f.read(READ_SIZE)
+                if not more or len(buffer) - pos > MAX_RECORD_SIZE:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+        yield value
+
+
+def read_records(path, fmt):
+    """(record number, record) for each record in the file, from 1."""
+    number = 0
+    try:
+        with _open(path) as f:
+            records = csv.DictReader(f) if fmt == "csv" else _json_records(f)
+            for number, record in enumerate(records, 1):
+                yield number, record
+    except (ValueError, csv.Error) as e:
+        raise click.ClickException(f"{path}, after record {number}: {e}")
+
+
+def fingerprint(path, kind):
+    """Checkpoint key of an input file: the same file imported again
+    resumes, a different one (or the same one as another kind) doesn't."""
+    digest = hashlib.sha256(f"{kind}:{os.path.getsize(path)}:".encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+    return f"{kind}:{digest.hexdigest()[:32]}"
+
+
+def rejects_path(path):
+    return path + ".rejects.ndjson"
+
+
+def _rejected(number, record, reason):
+    if isinstance(record, dict):
+        # DictReader files surplus CSV cells under None
+        entry = {key: value for key, value in record.items() if key is not None}
+    else:
+        entry = {"_line": record}
+    entry.update(_record=number, _error=reason)
+    return entry
+
+
+# ---------------- VALIDATION ----------------
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _text(record, field, required=False, limit=200):
+    value = record.get(field)
+    if _blank(value):
+        if required:
+            raise Invalid(f"{field} is missing")
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise Invalid(f"{field} must be text")
+    value = str(value).strip()
+    if len(value) > limit:
+        raise Invalid(f"{field} is longer than {limit} characters")
+    return value
+
+
+def _integer(record, field, required=False):
+    value = record.get(field)
+    if _blank(value):
+        if required:
+            raise Invalid(f"{field} is missing")
+        return None
+    try:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError
+        number = int(value)
+    except (TypeError, ValueError):
+        raise Invalid(f"{field} must be a whole number")
+    if number <= 0:
+        raise Invalid(f"{field} must be positive")
+    return number
+
+
+def _timestamp(record, field):
+    """'YYYY-MM-DD HH:MM:SS' UTC, from an ISO 8601 date or time (UTC
+    unless it has an offset)."""
+    value = _text(record, field, limit=40)
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    except ValueError:
+        raise Invalid(f"{field} must be a date or time like 2024-01-31 or 2024-01-31 14:05:00")
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if parsed > datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(days=1):
+        raise Invalid(f"{field} is in the future")
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _panchayath_ids(conn):
+    return {row[0] for row in conn.execute("SELECT id FROM panchayath")}
+
+
+def _written(conn, cursor, rows):
+    # psycopg2's execute_batch leaves the rowcount of its last page only
+    if storage.dialect(conn) == "postgresql":
+        return len(rows)
+    return cursor.rowcount
+
+
+# ---------------- KINDS ----------------
+
+class Loader:
+    """One kind of record: how to check it and where it goes."""
+
+    kind = None
+    table = None
+    batch = BATCH
+
+    def prepare(self, conn):
+        """Load what validation looks up, from the main database."""
+
+    def validate(self, record):
+        """The row to insert, or None if the record is in the database
+        already. Raises Invalid."""
+        raise NotImplementedError
+
+    def complete(self, conn, rows):
+        """Finish a batch of validated (record number, row) pairs before
+        they are written."""
+        return rows
+
+    def target(self, row):
+        """Database file the row goes to; None for the main database."""
+        return None
+
+    def insert(self, conn, rows):
+        """Write the rows, returning how many were inserted."""
+        raise NotImplementedError
+
+    def finish(self, conn):
+        """After the last batch, in the main database."""
+
+
+class Panchayaths(Loader):
+    """id (optional, to keep legacy ids other files refer to), name,
+    district, state."""
+
+    kind = "panchayaths"
+    table = "panchayath"
+
+    def prepare(self, conn):
+        self.ids = _panchayath_ids(conn)
+        self.names = {self._key(*row) for row in conn.execute("SELECT name, district, state FROM panchayath")}
+        self.with_ids = None
+
+    @staticmethod
+    def _key(name, district, state):
+        return tuple((value or "").casefold() for value in (name, district, state))
+
+    def validate(self, record):
+        if not isinstance(record, dict):
+            raise Invalid("not a record")
+        panchayath_id = _integer(record, "id")
+        name = _text(record, "name", required=True)
+        district = _text(record, "district", limit=100)
+        state = _text(record, "state", limit=100)
+        # Numbered rows and rows the database numbers could collide
+        if self.with_ids is None:
+            self.with_ids = panchayath_id is not None
+        elif self.with_ids != (panchayath_id is not None):
+            raise Invalid("id must be given for every record of the file or for none")
+        key = self._key(name, district, state)
+        if panchayath_id in self.ids or key in self.names:
+            return None
+        if panchayath_id is not None:
+            self.ids.add(panchayath_id)
+        self.names.add(key)
+        return (panchayath_id, name, district, state)
+
+    def insert(self, conn, rows):
+        if self.with_ids:
+            return _written(conn, conn.executemany("""
+                INSERT INTO panchayath (id, name, district, state) VALUES (?, ?, ?, ?)
+                ON CONFLICT (id) DO NOTHING
+            """, rows), rows)
+        return _written(conn, conn.executemany(
+            "INSERT INTO panchayath (name, district, state) VALUES (?, ?, ?)", [row[1:] for row in rows]
+        ), rows)
+
+    def finish(self, conn):
+        if storage.dialect(conn) == "postgresql":
+            # Explicit ids; the sequence carries on after them
+            conn.execute("SELECT setval(pg_get_serial_sequence('panchayath', 'id'), "
+                         "(SELECT COALESCE(MAX(id), 0) + 1 FROM panchayath), false)")
+            conn.commit()
+
+
+class Admins(Loader):
+    """username, panchayath_id, and password (hashed here) or password_hash
+    (werkzeug's format, as the old system may already have it)."""
+
+    kind = "admins"
+    table = "admin"
+    # Hashing takes most of the time; checkpoint more often
+    batch = 1000
+
+    def __init__(self, workers):
+        self.workers = workers
+
+    def prepare(self, conn):
+        self.panchayaths = _panchayath_ids(conn)
+        self.existing = {row[0] for row in conn.execute("SELECT username FROM admin")}
+        self.seen = set()
+
+    def validate(self, record):
+        if not isinstance(record, dict):
+            raise Invalid("not a record")
+        username = _text(record, "username", required=True, limit=150)
+        panchayath_id = _integer(record, "panchayath_id", required=True)
+        if panchayath_id not in self.panchayaths:
+            raise Invalid(f"no panchayath {panchayath_id}")
+        password_hash = _text(record, "password_hash", limit=500)
+        password = None if password_hash else record.get("password")
+        if password_hash:
+            if password_hash.split(":", 1)[0] not in ("pbkdf2", "scrypt") or password_hash.count("$") != 2:
+                raise Invalid("password_hash isn't a werkzeug pbkdf2 or scrypt hash")
+        elif _blank(password) or not isinstance(password, str):
+            raise Invalid("password or password_hash is missing")
+        if username in self.existing:
+            return None
+        if username in self.seen:
+            raise Invalid("username appears twice in the file")
+        self.seen.add(username)
+        return (username, password_hash, panchayath_id, password)
+
+    def complete(self, conn, rows):
+        plain = [i for i, (_, row) in enumerate(rows) if row[1] is None]
+        hashes = limiter.hash_passwords([rows[i][1][3] for i in plain], self.workers) if plain else []
+        rows = [(number, row[:3]) for number, row in rows]
+        for i, password_hash in zip(plain, hashes):
+            number, row = rows[i]
+            rows[i] = (number, (row[0], password_hash, row[2]))
+        return rows
+
+    def insert(self, conn, rows):
+        return _written(conn, conn.executemany(
+            "INSERT INTO admin (username, password_hash, panchayath_id) VALUES (?, ?, ?)", rows
+        ), rows)
+
+
+class Issues(Loader):
+    """panchayath_id, category, description, location, status,
+    created_at, completed_at, and email to match the citizen who
+    reported it (issues of unknown emails are kept without one)."""
+
+    kind = "issues"
+    table = "issues"
+
+    def prepare(self, conn):
+        self.panchayaths = _panchayath_ids(conn)
+        self.now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    def validate(self, record):
+        if not isinstance(record, dict):
+            raise Invalid("not a record")
+        panchayath_id = _integer(record, "panchayath_id", required=True)
+        if panchayath_id not in self.panchayaths:
+            raise Invalid(f"no panchayath {panchayath_id}")
+        category = _text(record, "category", required=True, limit=100)
+        description = _text(record, "description", required=True, limit=5000)
+        location = _text(record, "location", limit=500)
+        status = _text(record, "status", limit=20) or "Pending"
+        if status not in STATUSES:
+            raise Invalid(f"status must be one of {', '.join(STATUSES)}")
+        created_at = _timestamp(record, "created_at") or self.now
+        completed_at = None
+        if status == "Completed":
+            # What the issues_completed_insert trigger would set
+            completed_at = _timestamp(record, "completed_at") or created_at
+            if completed_at < created_at:
+                raise Invalid("completed_at is before created_at")
+        email = _text(record, "email", limit=254)
+        return (panchayath_id, email, category, description, location, status, created_at, completed_at)
+
+    def complete(self, conn, rows):
+        emails = list({row[1] for _, row in rows if row[1]})
+        users = {}
+        for start in range(0, len(emails), LOOKUP_CHUNK):
+            chunk = emails[start:start + LOOKUP_CHUNK]
+            users.update(conn.execute(
+                f"SELECT email, id FROM users WHERE email IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        conn.commit()
+        return [(number, (row[0], users.get(row[1])) + row[2:]) for number, row in rows]
+
+    def target(self, row):
+        return shards.database_of(row[0]) if shards.enabled() else None
+
+    def insert(self, conn, rows):
+        return _written(conn, conn.executemany("""
+            INSERT INTO issues (panchayath_id, user_id, category, description, location, status,
+                                created_at, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows), rows)
+
+
+# ---------------- DEFERRED INDEXES & TRIGGERS ----------------
+
+def defer(conn, table):
+    """Drop a table's indexes and triggers, keeping their definitions in
+    import_deferred. Those of a run that stopped half way stay dropped, at
+    the id they were first dropped at."""
+    storage.begin_write(conn)
+    try:
+        earlier = conn.execute(
+            "SELECT after_id FROM import_deferred WHERE tbl_name = ? LIMIT 1", (table,)
+        ).fetchone()
+        after_id = earlier[0] if earlier else conn.execute(
+            f"SELECT COALESCE(MAX(id), 0) FROM {table}"
+        ).fetchone()[0]
+        objects = conn.execute("""
+            SELECT type, name, sql FROM sqlite_master
+            WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+        """, (table,)).fetchall()
+        for kind, name, sql in objects:
+            conn.execute("INSERT INTO import_deferred (name, tbl_name, sql, after_id) VALUES (?, ?, ?, ?)",
+                         (name, table, sql, after_id))
+            conn.execute(f'DROP {kind.upper()} "{name}"')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def restore(conn):
+    """Bring what the dropped triggers maintain up to date and recreate
+    the indexes and triggers. Returns how many were recreated."""
+    deferred = conn.execute("SELECT name, tbl_name, sql, after_id FROM import_deferred").fetchall()
+    if not deferred:
+        return 0
+    storage.begin_write(conn)
+    try:
+        for table, after_id in {(row["tbl_name"], row["after_id"]) for row in deferred}:
+            for sql in REBUILD.get(table, ()):
+                conn.execute(sql, {"after": after_id})
+        for row in deferred:
+            conn.execute(row["sql"])
+        conn.execute("DELETE FROM import_deferred")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.execute("PRAGMA optimize")
+    return len(deferred)
+
+
+def _databases():
+    return [db.database_path()] + shards.paths()
+
+
+def restore_all():
+    for path in _databases():
+        conn = _connect(path)
+        try:
+            restored = restore(conn)
+        finally:
+            conn.close()
+        if restored:
+            click.echo(f"{path}: {restored} index(es) and trigger(s) recreated")
+
+
+# ---------------- LOADING ----------------
+
+def _connect(path=None):
+    conn = db.open_connection(path)
+    if storage.dialect(conn) != "postgresql":
+        # Room for index builds and the rebuild queries
+        conn.execute("PRAGMA cache_size=-262144")
+    return conn
+
+
+def _require_schema(conn):
+    if migrations.current_version(conn) < migrations.latest_version():
+        raise click.ClickException("The database schema is out of date; run `flask db upgrade` first")
+
+
+def _save(conn, source, kind, path, position, counts=None):
+    counts = counts or dict.fromkeys(COUNTS, 0)
+    conn.execute("""
+        INSERT INTO import_checkpoints (source, kind, path, position, inserted, skipped, rejected, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (source) DO UPDATE SET
+            path = excluded.path, position = excluded.position, inserted = excluded.inserted,
+            skipped = excluded.skipped, rejected = excluded.rejected, updated_at = excluded.updated_at
+    """, (source, kind, path, position, counts["inserted"], counts["skipped"], counts["rejected"], time.time()))
+
+
+def load(loader, path, fmt, batch, live, max_errors):
+    """Import one file, or carry on with it from its checkpoint."""
+    deferring = not live and not storage.is_postgres()
+    source = fingerprint(path, loader.kind)
+    main = _connect()
+    # path (None: the main database) -> [connection, checkpoint position]
+    targets = {}
+    try:
+        _require_schema(main)
+        checkpoint = main.execute("SELECT * FROM import_checkpoints WHERE source = ?", (source,)).fetchone()
+        main.commit()
+        if checkpoint and checkpoint["finished_at"]:
+            click.echo(f"{path} was imported already: {checkpoint['inserted']} inserted, "
+                       f"{checkpoint['skipped']} skipped, {checkpoint['rejected']} rejected")
+            return
+        counts = {name: checkpoint[name] if checkpoint else 0 for name in COUNTS}
+        start = checkpoint["position"] if checkpoint else 0
+        if start:
+            click.echo(f"Resuming {path} after record {start}")
+        loader.prepare(main)
+        main.commit()
+
+        def target(key):
+            if key not in targets:
+                conn = main if key is None else _connect(key)
+                if key is not None:
+                    _require_schema(conn)
+                row = conn.execute("SELECT position FROM import_checkpoints WHERE source = ?",
+                                   (source,)).fetchone()
+                conn.commit()
+                targets[key] = [conn, row[0] if row and key is not None else 0]
+                if deferring:
+                    defer(conn, loader.table)
+            return targets[key]
+
+        started = time.monotonic()
+        records = itertools.islice(read_records(path, fmt), start, None)
+        with open(rejects_path(path), "a", encoding="utf-8") as rejects:
+            while True:
+                chunk = list(itertools.islice(records, batch or loader.batch))
+                if not chunk:
+                    break
+                rows = []
+                for number, record in chunk:
+                    try:
+                        row = loader.validate(record)
+                    except Invalid as e:
+                        rejects.write(json.dumps(_rejected(number, record, str(e)), ensure_ascii=False) + "\n")
+                        counts["rejected"] += 1
+                        continue
+                    if row is None:
+                        counts["skipped"] += 1
+                    else:
+                        rows.append((number, row))
+                grouped = {}
+                for number, row in loader.complete(main, rows):
+                    grouped.setdefault(loader.target(row), []).append((number, row))
+                position = chunk[-1][0]
+
+                # Shard files first, each committing its rows with its own
+                # checkpoint; rows one already has (it committed, then the
+                # run stopped before the main database did) aren't written
+                # twice. The main database last: a resumed run starts from
+                # its checkpoint.
+                for key, group in grouped.items():
+                    if key is None:
+                        continue
+                    conn, done = target(key)
+                    fresh = [row for number, row in group if number > done]
+                    counts["inserted"] += len(group) - len(fresh)
+                    storage.begin_write(conn)
+                    inserted = loader.insert(conn, fresh) if fresh else 0
+                    _save(conn, source, loader.kind, path, position)
+                    conn.commit()
+                    counts["inserted"] += inserted
+                    counts["skipped"] += len(fresh) - inserted
+                    targets[key][1] = position
+                if None in grouped:
+                    target(None)
+                rejects.flush()
+                storage.begin_write(main)
+                if None in grouped:
+                    inserted = loader.insert(main, [row for _, row in grouped[None]])
+                    counts["inserted"] += inserted
+                    counts["skipped"] += len(grouped[None]) - inserted
+                _save(main, source, loader.kind, path, position, counts)
+                main.commit()
+
+                rate = (position - start) / (time.monotonic() - started)
+                click.echo(f"\r{loader.kind}: {position} read, {counts['inserted']} inserted, "
+                           f"{counts['skipped']} skipped, {counts['rejected']} rejected ({rate:.0f}/s)", nl=False)
+                if counts["rejected"] > max_errors:
+                    click.echo()
+                    raise click.ClickException(
+                        f"More than {max_errors} records rejected, stopping; see {rejects_path(path)}. "
+                        "Run the same command again to carry on.")
+        click.echo()
+
+        for conn, _ in targets.values():
+            if conn is not main:
+                conn.close()
+        targets = {}
+        if deferring:
+            click.echo("Rebuilding indexes and triggers...")
+            restore_all()
+        loader.finish(main)
+        storage.begin_write(main)
+        main.execute("UPDATE import_checkpoints SET finished_at = ? WHERE source = ?", (time.time(), source))
+        main.commit()
+        click.echo(f"{path}: {counts['inserted']} inserted, {counts['skipped']} skipped, "
+                   f"{counts['rejected']} rejected in {time.monotonic() - started:.1f}s")
+        if counts["rejected"]:
+            click.echo(f"Rejected records are in {rejects_path(path)}")
+    except BaseException:
+        if deferring and targets:
+            click.echo(f"\nIndexes and triggers of {loader.table} are still dropped: run this again to "
+                       "carry on, or `flask import finish`, before starting the site.", err=True)
+        raise
+    finally:
+        for conn, _ in targets.values():
+            if conn is not main:
+                conn.close()
+        main.close()
+
+
+# ---------------- CLI ----------------
+
+import_cli = AppGroup("import", help="Bulk loading of panchayaths, admins and legacy issues.")
+
+
+def _load_options(command):
+    for option in reversed((
+        click.argument("path", type=click.Path(exists=True, dir_okay=False)),
+        click.option("--format", "fmt", type=click.Choice(("csv", "json")),
+                     help="Input format (default: from the file name)."),
+        click.option("--batch", type=int, help="Records per transaction and checkpoint."),
+        click.option("--live", is_flag=True,
+                     help="Keep indexes and triggers in place, to import while the site runs (slower)."),
+        click.option("--max-errors", type=int,
+                     help="Stop once more records than this are rejected (default IMPORT_MAX_ERRORS)."),
+    )):
+        command = option(command)
+    return command
+
+
+def _run(loader, path, fmt, batch, live, max_errors):
+    if max_errors is None:
+        max_errors = current_app.config["IMPORT_MAX_ERRORS"]
+    load(loader, path, fmt or file_format(path), batch, live, max_errors)
+
+
+@import_cli.command("panchayaths")
+@_load_options
+def panchayaths_command(path, fmt, batch, live, max_errors):
+    """Import panchayaths: id (optional), name, district, state."""
+    _run(Panchayaths(), path, fmt, batch, live, max_errors)
+
+
+@import_cli.command("admins")
+@_load_options
+@click.option("--workers", type=int, help="Password hashing processes (default IMPORT_HASH_WORKERS).")
+def admins_command(path, fmt, batch, live, max_errors, workers):
+    """Import admins: username, panchayath_id, password or password_hash."""
+    _run(Admins(workers or current_app.config["IMPORT_HASH_WORKERS"]), path, fmt, batch, live, max_errors)
+
+
+@import_cli.command("issues")
+@_load_options
+def issues_command(path, fmt, batch, live, max_errors):
+    """Import legacy issues: panchayath_id, category, description,
+    location, status, created_at, completed_at, email."""
+    _run(Issues(), path, fmt, batch, live, max_errors)
+
+
+@import_cli.command("status")
+def status_command():
+    """Show imports, finished or to be resumed."""
+    conn = db.open_connection()
+    try:
+        rows = conn.execute("SELECT * FROM import_checkpoints ORDER BY updated_at").fetchall()
+    finally:
+        conn.close()
+    for row in rows:
+        state = "done" if row["finished_at"] else f"stopped after record {row['position']}"
+        click.echo(f"{row['kind']} {row['path']}: {state}; {row['inserted']} inserted, "
+                   f"{row['skipped']} skipped, {row['rejected']} rejected")
+    if not rows:
+        click.echo("No imports yet")
+    if not storage.is_postgres():
+        for path in _databases():
+            conn = db.open_connection(path, readonly=True)
+            try:
+                left = conn.execute("SELECT COUNT(*) FROM import_deferred").fetchone()[0]
+            finally:
+                conn.close()
+            if left:
+                click.echo(f"{path}: {left} index(es) and trigger(s) dropped by an unfinished import")
+
+
+@import_cli.command("finish")
+def finish_command():
+    """Recreate indexes and triggers an interrupted import dropped."""
+    if storage.is_postgres():
+        click.echo("Nothing to do: imports keep PostgreSQL's indexes and triggers")
+        return
+    restore_all()
+
+
+def init_app(app):
+    app.config.setdefault("IMPORT_MAX_ERRORS", int(os.environ.get("IMPORT_MAX_ERRORS", "1000")))
+    app.config.setdefault("IMPORT_HASH_WORKERS", int(os.environ.get("IMPORT_HASH_WORKERS", str(os.cpu_count() or 1))))
+    app.cli.add_command(import_cli)
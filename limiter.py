@@ -0,0 +1,257 @@
+import math
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import metrics
+
+# ---------------- RATE LIMITING & AUTH ADMISSION ----------------
+#
+# Logging in hashes a password (tens of milliseconds of CPU on purpose),
+# and registering or resending an OTP hashes one and queues an email. Two
+# defences keep a burst of those from starving the rest of the site:
+#
+# * Token buckets per client IP and per account (email or username) for
+#   each rule below. A refused request costs a dict or primary-key lookup
+#   and gets a 429 with Retry-After before any hashing or mail happens.
+# * A cap on concurrent password hashing per process, sized as a share of
+#   the worker's threads (AUTH_CAPACITY_SHARE of WEB_THREADS). A request
+#   that can't get a slot within AUTH_QUEUE_SECONDS is refused with 429
+#   instead of queueing, so auth traffic never holds more threads than
+#   that. With AUTH_HASH_POOL=N the hashing itself runs in N helper
+#   processes instead of the request thread.
+#
+# Buckets live in memory per process (RATELIMIT_BACKEND=memory, least
+# recently used keys evicted beyond RATELIMIT_MAX_KEYS) or in a SQLite
+# file shared by every worker on the host (sqlite). A limiter that can't
+# reach its state lets the request through rather than locking everyone
+# out.
+
+# rule -> (per-IP limit, per-account limit) as "count/seconds": a bucket
+# of `count` attempts that refills completely over `seconds`
+DEFAULT_LIMITS = {
+    "login": ("20/300", "10/300"),
+    "admin_login": ("10/300", "5/300"),
+    "otp": ("5/600", "3/600"),
+}
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class RateLimited(TooManyRequests):
+    def __init__(self, retry_after, description="Too many attempts. Please wait a little and try again."):
+        super().__init__(description, retry_after=max(1, math.ceil(retry_after)))
+
+
+def parse_limit(value):
+    """"10/300" -> (capacity, seconds to refill completely)."""
+    count, _, seconds = str(value).partition("/")
+    return int(count), float(seconds or 60)
+
+
+class MemoryBuckets:
+    """Buckets private to this process, bounded to `max_keys`."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, seconds):
+        """Spend one token. Returns 0 if allowed, else seconds until one is
+        available."""
+        rate = capacity / seconds
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            self.buckets[key] = (tokens - 1 if not wait else tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class SQLiteBuckets:
+    """Buckets in their own database file, shared by every worker.
+
+    Like the SQLite response cache, kept out of the main database so limiter
+    writes never wait on the application's write lock, and written without
+    fsyncs: losing it only forgets who was throttled.
+    """
+
+    PRUNE_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.writes = 0
+
+    def _conn(self):
+        pid = os.getpid()
+        if getattr(self.local, "pid", None) != pid:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA busy_timeout=100")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    full_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            self.local.pid, self.local.conn = pid, conn
+        return self.local.conn
+
+    def take(self, key, capacity, seconds):
+        rate = capacity / seconds
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + (capacity - tokens) / rate),
+            )
+            conn.execute("COMMIT")
+        except sqlite3.OperationalError:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return 0
+        self.writes += 1
+        if self.writes % self.PRUNE_EVERY == 0:
+            self.prune()
+        return wait
+
+    def prune(self):
+        # A full bucket is the same as no bucket
+        try:
+            self._conn().execute("DELETE FROM buckets WHERE full_at <= ?", (time.time(),))
+        except sqlite3.OperationalError:
+            pass
+
+    def clear(self):
+        self._conn().execute("DELETE FROM buckets")
+
+
+def client_ip():
+    # Behind a reverse proxy, wrap the app in werkzeug's ProxyFix so this
+    # is the client rather than the proxy
+    return request.remote_addr or "unknown"
+
+
+def check(rule, account=None):
+    """Charge this request to `rule`'s per-IP bucket and, if given, the
+    account's. Raises RateLimited when either is empty."""
+    if not current_app.config["RATELIMIT_ENABLED"]:
+        return
+    buckets = current_app.extensions["rate_limits"]
+    ip_limit, account_limit = current_app.config["RATELIMITS"][rule]
+    charges = []
+    if ip_limit:
+        charges.append(("ip", f"{rule}:ip:{client_ip()}", ip_limit))
+    if account_limit and account:
+        charges.append(("account", f"{rule}:account:{account.strip().lower()}", account_limit))
+    for scope, key, limit in charges:
+        wait = buckets.take(key, *parse_limit(limit))
+        if wait:
+            metrics.inc("ratelimit_rejections_total", rule=rule, scope=scope)
+            raise RateLimited(wait)
+
+
+# ---------------- PASSWORD HASHING ----------------
+
+def _get_pool(workers):
+    global _pool, _pool_pid
+    with _pool_lock:
+        # Pools don't survive fork(); each gunicorn worker builds its own.
+        # forkserver children start clean instead of copying a threaded
+        # process.
+        if _pool is None or _pool_pid != os.getpid():
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+@contextmanager
+def hashing_slot():
+    slots = current_app.extensions["auth_slots"]
+    if not slots.acquire(timeout=current_app.config["AUTH_QUEUE_SECONDS"]):
+        metrics.inc("ratelimit_rejections_total", rule="hashing", scope="busy")
+        raise RateLimited(1, "The server is busy. Please try again in a moment.")
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+def _hash(fn, *args):
+    with hashing_slot():
+        workers = current_app.config["AUTH_HASH_POOL"]
+        if not workers:
+            return fn(*args)
+        return _get_pool(workers).submit(fn, *args).result()
+
+
+def check_password(password_hash, password):
+    return _hash(check_password_hash, password_hash, password)
+
+
+def hash_password(password):
+    return _hash(generate_password_hash, password)
+
+
+def hash_passwords(passwords, workers):
+    """Hash many passwords across `workers` processes, for bulk loads
+    outside a request (importer.py): no slots, no rate limits."""
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(_get_pool(workers).map(generate_password_hash, passwords, chunksize=chunksize))
+
+
+def init_app(app):
+    app.config.setdefault("RATELIMIT_ENABLED", os.environ.get("RATELIMIT_ENABLED", "1") != "0")
+    app.config.setdefault("RATELIMIT_BACKEND", os.environ.get("RATELIMIT_BACKEND", "memory"))
+    app.config.setdefault("RATELIMIT_PATH", os.environ.get("RATELIMIT_PATH", "database/ratelimit.db"))
+    app.config.setdefault("RATELIMIT_MAX_KEYS", int(os.environ.get("RATELIMIT_MAX_KEYS", "10000")))
+    app.config.setdefault("RATELIMITS", dict(DEFAULT_LIMITS))
+    app.config.setdefault("WEB_THREADS", int(os.environ.get("WEB_THREADS", "16")))
+    app.config.setdefault("AUTH_CAPACITY_SHARE", float(os.environ.get("AUTH_CAPACITY_SHARE", "0.25")))
+    app.config.setdefault("AUTH_QUEUE_SECONDS", float(os.environ.get("AUTH_QUEUE_SECONDS", "0.2")))
+    app.config.setdefault("AUTH_HASH_POOL", int(os.environ.get("AUTH_HASH_POOL", "0")))
+
+    kind = app.config["RATELIMIT_BACKEND"]
+    if kind == "memory":
+        buckets = MemoryBuckets(app.config["RATELIMIT_MAX_KEYS"])
+    elif kind == "sqlite":
+        buckets = SQLiteBuckets(app.config["RATELIMIT_PATH"])
+    else:
+        raise ValueError(f"Unknown RATELIMIT_BACKEND {kind!r} (memory or sqlite)")
+    app.extensions["rate_limits"] = buckets
+
+    slots = max(1, int(app.config["WEB_THREADS"] * app.config["AUTH_CAPACITY_SHARE"]))
+    app.extensions["auth_slots"] = threading.BoundedSemaphore(slots)
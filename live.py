@@ -0,0 +1,293 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from flask import Response, current_app, request, stream_with_context
+
+import shards
+import storage
+from db import open_connection
+
+# ---------------- LIVE ISSUE UPDATES (SSE) ----------------
+#
+# New issues and status changes are written to issue_events by triggers
+# (migration 9), whichever process made the write, and the newest 10000 of
+# them are mirrored into live_events (migration 16), the bounded feed read
+# here. Each web process runs one poller thread that reads new events with
+# a rowid range scan and hands them to the Server-Sent Events streams open
+# in that process, each of which filters them (one citizen's issues, one
+# panchayath) and pushes the re-rendered card or row.
+#
+# A stream holds a server thread for as long as it is open, so streams are
+# capped per process (SSE_MAX_STREAMS, below the gunicorn thread count) and
+# recycled every MAX_STREAM_SECONDS; the browser reconnects on its own and
+# resumes from the last event id, so nothing is lost across either.
+# Heartbeats keep proxies from timing out idle streams and surface dead
+# clients. A client that can't keep up overflows its bounded queue and is
+# disconnected instead of slowing the poller down; it replays the gap from
+# the feed when it reconnects.
+#
+# With sharding every shard has its own live_events, and the poller reads
+# them all. Event ids then only order events within a shard (whose id they
+# encode, see shards.py), so the id sent to clients is the last event id
+# seen from each shard, dot-separated. Unsharded it is a single number.
+#
+# PostgreSQL hands out ids as rows are inserted, not as they commit, so a
+# higher id can become visible before a lower one. There every read stops
+# at events written by transactions older than all those still running
+# (the xid column), which are final, so ids still arrive in order.
+
+POLL_INTERVAL = 1.0
+HEARTBEAT = 15
+QUEUE_SIZE = 100
+MAX_STREAM_SECONDS = 300
+RETRY_MS = 3000
+# Told to clients that arrive while every slot is taken
+BUSY_RETRY_MS = 30000
+
+_subscribers = set()
+_lock = threading.Lock()
+_poller = None
+_poller_pid = None
+
+
+class Subscriber:
+    def __init__(self, predicate):
+        self.predicate = predicate
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+
+def _visible(conn):
+    if storage.dialect(conn) == "postgresql":
+        return "xid < pg_snapshot_xmin(pg_current_snapshot())"
+    return "1 = 1"
+
+
+def latest_event_id(conn):
+    """Last event id a database has handed out."""
+    if storage.dialect(conn) == "postgresql":
+        return conn.execute(f"""
+            SELECT COALESCE(MAX(id) FILTER (WHERE {_visible(conn)}), MIN(id) - 1, 0)
+            FROM live_events
+        """).fetchone()[0]
+    return conn.execute("""
+        SELECT COALESCE(MAX(id), (SELECT seq FROM sqlite_sequence WHERE name = 'issue_events'), 0)
+        FROM live_events
+    """).fetchone()[0]
+
+
+def _events_after(conn, after, limit=None):
+    sql = f"SELECT * FROM live_events WHERE id > ? AND {_visible(conn)} ORDER BY id"
+    if limit:
+        return conn.execute(sql + " LIMIT ?", (after, limit)).fetchall()
+    return conn.execute(sql, (after,)).fetchall()
+
+
+def _end_read(conn):
+    # Otherwise a PostgreSQL connection sits idle in the transaction its
+    # SELECTs opened for as long as the stream is open
+    if storage.dialect(conn) == "postgresql" and conn.in_transaction:
+        conn.rollback()
+
+
+def _shard(event_id):
+    return event_id >> shards.ID_BITS
+
+
+def resume_token():
+    """Id to resume from for a page rendered now."""
+    return _encode({_shard(last): last for last in shards.fan_out(latest_event_id)})
+
+
+def _encode(seen):
+    # Shards as "shard:offset from its first id", leaving out any with no
+    # events yet; unsharded, just the id
+    parts = []
+    for shard in sorted(seen):
+        base = shard << shards.ID_BITS
+        if not shard:
+            parts.append(str(seen[shard]))
+        elif seen[shard] > base:
+            parts.append(f"{shard}:{seen[shard] - base}")
+    return ".".join(parts)
+
+
+def _poll(sources):
+    conns, last = {}, {}
+    started = False
+    while True:
+        if started:
+            time.sleep(POLL_INTERVAL)
+        events = []
+        try:
+            targets = sources()
+        except storage.DatabaseError as e:
+            print(f"Live update poll error: {e}")
+            continue
+        for _, path in targets:
+            try:
+                if path not in conns:
+                    conns[path] = open_connection(path, readonly=True)
+                    # A shard appearing later is new: all of it is news
+                    last[path] = latest_event_id(conns[path]) if not started else 0
+                rows = _events_after(conns[path], last[path], 1000)
+            except storage.DatabaseError as e:
+                print(f"Live update poll error in {path}: {e}")
+                continue
+            if rows:
+                last[path] = rows[-1]["id"]
+                events.extend(dict(row, source=path) for row in rows)
+        started = True
+        if not events:
+            continue
+        with _lock:
+            subscribers = list(_subscribers)
+        for subscriber in subscribers:
+            for event in events:
+                if subscriber.predicate(event):
+                    subscriber.offer(event)
+
+
+def ensure_poller(sources):
+    """Start this process's poller thread if it isn't running yet.
+    `sources()` lists the (shard, path) databases to poll."""
+    global _poller, _poller_pid
+    with _lock:
+        if _poller is not None and _poller_pid == os.getpid() and _poller.is_alive():
+            return
+        _poller = threading.Thread(target=_poll, args=(sources,), name="live-poller", daemon=True)
+        _poller_pid = os.getpid()
+        _poller.start()
+
+
+def _resume_ids():
+    # Last-Event-ID is sent by the browser on reconnects; ?after= is the
+    # token the page was rendered at
+    raw = request.headers.get("Last-Event-ID") or request.args.get("after")
+    if raw is None:
+        return None
+    seen = {}
+    try:
+        for part in filter(None, raw.split(".")):
+            shard, sep, offset = part.partition(":")
+            if sep:
+                seen[int(shard)] = (int(shard) << shards.ID_BITS) + int(offset)
+            else:
+                seen[_shard(int(part))] = int(part)
+    except ValueError:
+        return None
+    return seen
+
+
+def _format(events, render, seen):
+    """SSE chunks for a batch of events, advancing `seen` past them."""
+    # Several changes to one issue in a batch: only its final state matters
+    latest = {}
+    for event in events:
+        latest[event["issue_id"]] = event
+    by_source = {}
+    for event in latest.values():
+        by_source.setdefault(event["source"], []).append(event["issue_id"])
+    html = {}
+    for source, issue_ids in by_source.items():
+        conn = shards.connect(source)
+        html.update(render(conn, issue_ids))
+        _end_read(conn)
+    chunks = []
+    for event in sorted(latest.values(), key=lambda e: (_shard(e["id"]), e["id"])):
+        seen[_shard(event["id"])] = event["id"]
+        data = {
+            "issue_id": event["issue_id"],
+            "kind": event["kind"],
+            "status": event["status"],
+            "html": html.get(event["issue_id"]),
+        }
+        chunks.append(f"id: {_encode(seen)}\nevent: issue\ndata: {json.dumps(data)}\n\n")
+    return "".join(chunks)
+
+
+def stream(predicate, render):
+    """SSE response of the issue events `predicate` accepts.
+
+    `render(conn, issue_ids)` returns {issue_id: html} with the current
+    markup of each issue the client is allowed to see, read from `conn`.
+    """
+    slots = current_app.extensions["live_streams"]
+    sources = shards.shard_map().sources
+
+    def is_new(event, seen):
+        shard = _shard(event["id"])
+        return event["id"] > seen.get(shard, shard << shards.ID_BITS)
+
+    def generate():
+        if not slots.acquire(blocking=False):
+            yield f"retry: {BUSY_RETRY_MS}\n\n"
+            return
+        subscriber = Subscriber(predicate)
+        try:
+            ensure_poller(sources)
+            # Subscribe before reading the backlog so nothing falls between
+            # the two; duplicates are skipped by id below
+            with _lock:
+                _subscribers.add(subscriber)
+            yield f"retry: {RETRY_MS}\n\n"
+
+            seen = {}
+            resumed = _resume_ids()
+            if resumed is not None:
+                backlog = []
+                for shard, path in sources():
+                    conn = shards.connect(path)
+                    # A shard missing from the token is younger than the page
+                    after = resumed.get(shard, shard << shards.ID_BITS)
+                    oldest = conn.execute("SELECT MIN(id) FROM live_events").fetchone()[0]
+                    if shard in resumed and oldest is not None and after < oldest - 1:
+                        # Missed events have been trimmed already
+                        yield "event: reload\ndata: {}\n\n"
+                        return
+                    seen[shard] = after
+                    backlog.extend(dict(row, source=path) for row in _events_after(conn, after))
+                    _end_read(conn)
+                backlog = [event for event in backlog if predicate(event)]
+                if backlog:
+                    yield _format(backlog, render, seen)
+
+            deadline = time.monotonic() + MAX_STREAM_SECONDS
+            while time.monotonic() < deadline and not subscriber.overflowed:
+                try:
+                    batch = [subscriber.queue.get(timeout=HEARTBEAT)]
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                while True:
+                    try:
+                        batch.append(subscriber.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                batch = [event for event in batch if is_new(event, seen)]
+                if batch:
+                    yield _format(batch, render, seen)
+        finally:
+            with _lock:
+                _subscribers.discard(subscriber)
+            slots.release()
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    # Don't let nginx hold events back in its buffer
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def init_app(app):
+    app.config.setdefault("SSE_MAX_STREAMS", int(os.environ.get("SSE_MAX_STREAMS", "8")))
+    app.extensions["live_streams"] = threading.BoundedSemaphore(app.config["SSE_MAX_STREAMS"])
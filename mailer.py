@@ -0,0 +1,304 @@
+import os
+import random
+import smtplib
+import threading
+import time
+
+import click
+from flask.cli import AppGroup
+
+import metrics
+import storage
+from db import get_read_db, open_connection, database_path
+
+# ---------------- EMAIL OUTBOX ----------------
+#
+# Requests never talk to SMTP. enqueue() inserts a row into email_outbox
+# and returns; a sender worker claims due rows in batches, pushes them
+# through one long-lived authenticated SMTP session and retries failures
+# with exponential backoff.
+#
+# The worker runs as a thread inside each web process (MAIL_WORKER=thread,
+# the default) or as a dedicated process via `flask mail worker`
+# (MAIL_WORKER=external). Claims are made under the SQLite write lock, so
+# any number of workers can run without sending a message twice.
+#
+# /metrics reports the queue (pending, sending, failed messages) as the
+# mail_outbox_messages gauge, counted when it is scraped.
+
+MAIL_SERVER = os.environ.get("MAIL_SERVER", "smtp.gmail.com")
+MAIL_PORT = int(os.environ.get("MAIL_PORT", "587"))
+MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS", "1") == "1"
+# Credentials only ever come from the environment; without MAIL_PASSWORD
+# the server is used unauthenticated
+MAIL_USERNAME = os.environ.get("MAIL_USERNAME", "")
+MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD", "")
+MAIL_SENDER = os.environ.get("MAIL_SENDER", MAIL_USERNAME or "noreply@localhost")
+MAIL_WORKER = os.environ.get("MAIL_WORKER", "thread")
+
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 5          # seconds; 5, 10, 20, 40, 80 ...
+BACKOFF_MAX = 600
+CLAIM_TIMEOUT = 120       # a claimed row is retried if its worker died
+IDLE_POLL = 1.0
+SENT_RETENTION = 86400    # sent rows are kept a day for latency stats
+SMTP_IDLE_CLOSE = 60      # providers drop idle sessions; close ours first
+# Reported by the mail_outbox_messages gauge
+QUEUE_STATUSES = ("pending", "sending", "failed")
+
+# Per-process counters, exported by `flask mail status` and the metrics
+# endpoint.
+STATS = {
+    "sent_total": 0,
+    "failed_total": 0,
+    "retries_total": 0,
+    "send_seconds_total": 0.0,      # time inside SMTP per message
+    "delivery_seconds_total": 0.0,  # enqueue -> accepted by SMTP
+}
+
+_wakeup = threading.Event()
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def enqueue(conn, recipient, subject, body):
+    """Queue a plain-text email. Commits on `conn` and returns immediately."""
+    now = time.time()
+    conn.execute("""
+        INSERT INTO email_outbox (recipient, subject, body, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (recipient, subject, body, now, now))
+    conn.commit()
+    if MAIL_WORKER == "thread":
+        ensure_worker(database_path())
+        _wakeup.set()
+
+
+def queue_depth(conn):
+    """Messages waiting to go out (pending, sending) and given up on
+    (failed), by status."""
+    counts = dict.fromkeys(QUEUE_STATUSES, 0)
+    rows = conn.execute("""
+        SELECT status, COUNT(*) FROM email_outbox
+        WHERE status IN ('pending', 'sending', 'failed')
+        GROUP BY status
+    """).fetchall()
+    for status, count in rows:
+        counts[status] = count
+    return counts
+
+
+def _queue_gauge():
+    return [({"status": status}, count) for status, count in queue_depth(get_read_db()).items()]
+
+
+# ---------------- SMTP SESSION ----------------
+
+class SMTPSession:
+    """One authenticated connection, reopened on demand and closed when idle."""
+
+    def __init__(self):
+        self.server = None
+        self.last_used = 0.0
+
+    def _open(self):
+        server = smtplib.SMTP(MAIL_SERVER, MAIL_PORT, timeout=30)
+        server.ehlo()
+        if MAIL_USE_TLS:
+            server.starttls()
+            server.ehlo()
+        # Local stand-ins (aiosmtpd, python -m smtpd) don't offer AUTH
+        if MAIL_PASSWORD and server.has_extn("auth"):
+            server.login(MAIL_USERNAME, MAIL_PASSWORD)
+        self.server = server
+
+    def send(self, recipient, message):
+        if self.server is None:
+            self._open()
+        try:
+            self.server.sendmail(MAIL_SENDER, [recipient], message)
+        except smtplib.SMTPServerDisconnected:
+            # Stale session: reconnect once and retry
+            self.close()
+            self._open()
+            self.server.sendmail(MAIL_SENDER, [recipient], message)
+        self.last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self.server is not None and time.monotonic() - self.last_used > SMTP_IDLE_CLOSE:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+
+# ---------------- WORKER ----------------
+
+def _claim(conn, limit):
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # PostgreSQL locks rows rather than the database: concurrent
+        # workers skip the ones already being claimed
+        rows = conn.execute(f"""
+            SELECT id, recipient, subject, body, attempts, created_at
+            FROM email_outbox
+            WHERE (status = 'pending' AND next_attempt_at <= ?)
+               OR (status = 'sending' AND locked_until < ?)
+            ORDER BY next_attempt_at
+            LIMIT ?{storage.for_update(conn, skip_locked=True)}
+        """, (now, now, limit)).fetchall()
+        conn.executemany(
+            "UPDATE email_outbox SET status = 'sending', locked_until = ? WHERE id = ?",
+            [(now + CLAIM_TIMEOUT, row["id"]) for row in rows],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def _backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _format(row):
+    # Loaded by the process that sends, not by every web worker at import
+    from email.mime.text import MIMEText
+
+    msg = MIMEText(row["body"], "plain")
+    msg["From"] = MAIL_SENDER
+    msg["To"] = row["recipient"]
+    msg["Subject"] = row["subject"]
+    return msg.as_string()
+
+
+def process_batch(conn, session, limit=BATCH_SIZE):
+    """Send one batch of due messages. Returns how many were claimed."""
+    rows = _claim(conn, limit)
+    for row in rows:
+        started = time.time()
+        try:
+            session.send(row["recipient"], _format(row))
+        except Exception as e:
+            # Anything else (a message that won't format) is a failed
+            # attempt too, or the row would stay claimed for good
+            if isinstance(e, (smtplib.SMTPException, OSError)):
+                session.close()
+            attempts = row["attempts"] + 1
+            if row["attempts"] == 0:
+                print(f"Error sending email: {e}")
+                # Even if email fails, print to console so user can still test
+                print(f"\n[FALLBACK] Email to {row['recipient']} failed:\n{row['body']}\n")
+            if attempts >= MAX_ATTEMPTS:
+                status, next_attempt = "failed", started
+                STATS["failed_total"] += 1
+            else:
+                status, next_attempt = "pending", started + _backoff(attempts)
+                STATS["retries_total"] += 1
+            conn.execute("""
+                UPDATE email_outbox
+                SET status = ?, attempts = ?, next_attempt_at = ?, locked_until = NULL, last_error = ?
+                WHERE id = ?
+            """, (status, attempts, next_attempt, str(e)[:500], row["id"]))
+        else:
+            finished = time.time()
+            STATS["sent_total"] += 1
+            STATS["send_seconds_total"] += finished - started
+            STATS["delivery_seconds_total"] += finished - row["created_at"]
+            metrics.observe("mail_send_duration_seconds", finished - started)
+            conn.execute("""
+                UPDATE email_outbox
+                SET status = 'sent', attempts = attempts + 1, sent_at = ?, locked_until = NULL, last_error = NULL
+                WHERE id = ?
+            """, (finished, row["id"]))
+        conn.commit()
+    return len(rows)
+
+
+def run_worker(path, stop=None, once=False):
+    conn = open_connection(path)
+    # Claims use explicit BEGIN IMMEDIATE
+    conn.isolation_level = None
+    session = SMTPSession()
+    next_prune = 0.0
+    try:
+        while stop is None or not stop.is_set():
+            if time.monotonic() > next_prune:
+                conn.execute(
+                    "DELETE FROM email_outbox WHERE status = 'sent' AND sent_at < ?",
+                    (time.time() - SENT_RETENTION,),
+                )
+                next_prune = time.monotonic() + 3600
+            try:
+                claimed = process_batch(conn, session)
+            except Exception as e:
+                # Keep the worker alive across transient DB errors
+                print(f"Mail worker error: {e}")
+                claimed = 0
+            if once and not claimed:
+                break
+            if not claimed:
+                session.close_if_idle()
+                _wakeup.wait(IDLE_POLL)
+                _wakeup.clear()
+    finally:
+        session.close()
+        conn.close()
+
+
+def ensure_worker(path):
+    """Start this process's sender thread if it isn't running yet."""
+    global _worker, _worker_pid
+    with _worker_lock:
+        if _worker is not None and _worker_pid == os.getpid() and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=run_worker, args=(path,), name="mail-worker", daemon=True)
+        _worker_pid = os.getpid()
+        _worker.start()
+
+
+# ---------------- CLI ----------------
+
+mail_cli = AppGroup("mail", help="Outgoing email queue.")
+
+
+@mail_cli.command("worker")
+@click.option("--once", is_flag=True, help="Drain due messages and exit.")
+def worker_command(once):
+    """Run a dedicated sender process."""
+    click.echo(f"Mail worker sending via {MAIL_SERVER}:{MAIL_PORT}")
+    run_worker(database_path(), once=once)
+
+
+@mail_cli.command("status")
+def status_command():
+    """Show queue depth and delivery latency."""
+    conn = open_connection(database_path(), readonly=True)
+    try:
+        for row in conn.execute("SELECT status, COUNT(*) AS n FROM email_outbox GROUP BY status"):
+            click.echo(f"{row['status']:>8}: {row['n']}")
+        latency = conn.execute("""
+            SELECT AVG(sent_at - created_at), MAX(sent_at - created_at)
+            FROM email_outbox WHERE status = 'sent' AND sent_at > ?
+        """, (time.time() - 3600,)).fetchone()
+        if latency[0] is not None:
+            click.echo(f"last hour delivery latency: avg {latency[0]:.2f}s, max {latency[1]:.2f}s")
+    finally:
+        conn.close()
+
+
+def init_app(app):
+    metrics.export_counters("mail", STATS)
+    metrics.register_gauge("mail_outbox_messages", "Outbox messages by status (pending, sending, failed).",
+                           _queue_gauge)
+    app.cli.add_command(mail_cli)
@@ -0,0 +1,462 @@
+import atexit
+import bisect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, abort, g, request
+from flask.signals import before_render_template, template_rendered
+
+import db
+import storage
+
+try:
+    import fcntl
+except ImportError:  # Windows: dead workers' files are summed but never folded
+    fcntl = None
+
+# ---------------- METRICS ----------------
+#
+# Counters and histograms live in memory per process; recording one is a
+# dict update under a lock. Every FLUSH_INTERVAL seconds each process
+# writes its totals to METRICS_DIR/worker-<pid>.json. /metrics answers
+# from whichever worker gunicorn hands it to: its own live numbers plus
+# every other worker's last file, in Prometheus text format, so other
+# workers' numbers can be up to FLUSH_INTERVAL old.
+#
+# Totals from workers that have exited are folded into archive.json, so
+# counters never go backwards when gunicorn recycles a worker. Gauges
+# (requests in flight) only count live workers.
+#
+# Sources: every HTTP request (route latency, status, in-flight,
+# exceptions), every SQLite statement (count per route, duration, slow
+# query log), every template render, password checks, upload storage and
+# the mail worker. Gauges of shared state (the mail outbox) are read from
+# the database when /metrics is scraped instead; see register_gauge.
+
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join("database", "metrics"))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+FLUSH_INTERVAL = 5
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "http_requests_total": ("counter", "HTTP requests by route, method and status.", None),
+    "http_request_duration_seconds": ("histogram", "Time to produce a response, by route.", HTTP_BUCKETS),
+    "http_requests_in_flight": ("gauge", "Requests being handled right now.", None),
+    "http_request_exceptions_total": ("counter", "Unhandled exceptions by route and type.", None),
+    "db_queries_total": ("counter", "SQLite statements by route (background for worker threads).", None),
+    "db_query_duration_seconds": ("histogram", "SQLite statement time, execute() to first fetch.", FAST_BUCKETS),
+    "db_slow_queries_total": ("counter", f"Statements over {SLOW_QUERY_MS:g} ms, by route.", None),
+    "template_render_duration_seconds": ("histogram", "Jinja render time by template.", FAST_BUCKETS),
+    "password_check_duration_seconds": ("histogram", "Password hash verification time.", HTTP_BUCKETS),
+    "ratelimit_rejections_total": ("counter", "Requests refused with 429, by rule and scope (ip, account, busy).", None),
+    "upload_store_duration_seconds": ("histogram", "Moving an upload into the store.", FAST_BUCKETS),
+    "uploads_total": ("counter", "Stored uploads by result (new or duplicate content).", None),
+    "upload_bytes_total": ("counter", "Bytes of uploaded files stored.", None),
+    "mail_send_duration_seconds": ("histogram", "SMTP time per message.", HTTP_BUCKETS),
+}
+
+_local = threading.local()
+_registry = None
+_registry_lock = threading.Lock()
+# name -> dict of counters owned by another module, exported as-is
+_external = {}
+# name -> callable returning [(labels, value)], read at scrape time
+_gauges = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.values = {}      # (name, labels) -> number (counters, gauges)
+        self.histograms = {}  # (name, labels) -> [per-bucket counts..., +Inf count, sum]
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = _key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            hist[bisect.bisect_left(buckets, value)] += 1
+            hist[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            values = [[name, list(labels), value] for (name, labels), value in self.values.items()]
+            histograms = [[name, list(labels), list(hist)] for (name, labels), hist in self.histograms.items()]
+        for prefix, counters in _external.items():
+            values.extend([f"{prefix}_{name}", [], value] for name, value in counters.items())
+        return {"pid": self.pid, "time": time.time(), "values": values, "histograms": histograms}
+
+
+def registry():
+    """This process's registry; a forked worker starts from zero."""
+    global _registry
+    current = _registry
+    if current is not None and current.pid == os.getpid():
+        return current
+    with _registry_lock:
+        if _registry is None or _registry.pid != os.getpid():
+            _registry = Registry()
+            threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+        return _registry
+
+
+def inc(name, value=1, **labels):
+    registry().inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    registry().observe(name, value, **labels)
+
+
+@contextmanager
+def timed(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def current_route():
+    return getattr(_local, "route", None)
+
+
+@contextmanager
+def route(name):
+    """Count queries run on this thread against `name`, for helper threads
+    doing part of a request's work (shards.fan_out)."""
+    previous = current_route()
+    _local.route = name
+    try:
+        yield
+    finally:
+        _local.route = previous
+
+
+def export_counters(prefix, counters):
+    """Export a module's own dict of running totals (e.g. mailer.STATS)."""
+    _external[prefix] = counters
+
+
+def register_gauge(name, help_text, read):
+    """Export a gauge read when /metrics is scraped: `read()` returns
+    [(labels dict, value), ...]. It describes state every worker shares,
+    such as a table, so it is reported once rather than summed."""
+    METRICS[name] = ("gauge", help_text, None)
+    _gauges[name] = read
+
+
+# ---------------- SHARING ACROSS WORKERS ----------------
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(os.path.join(METRICS_DIR, f"worker-{os.getpid()}.json"), registry().snapshot())
+    except OSError as e:
+        print(f"Metrics: can't write to {METRICS_DIR}: {e}")
+
+
+def _flush_loop():
+    pid = os.getpid()
+    while os.getpid() == pid:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _alive(pid):
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(into, snapshot, gauges=True):
+    values, histograms = into
+    for name, labels, value in snapshot["values"]:
+        if not gauges and METRICS.get(name, ("counter",))[0] == "gauge":
+            continue
+        key = (name, tuple((k, str(v)) for k, v in labels))
+        values[key] = values.get(key, 0) + value
+    for name, labels, hist in snapshot["histograms"]:
+        key = (name, tuple((k, str(v)) for k, v in labels))
+        current = histograms.get(key)
+        histograms[key] = hist if current is None else [a + b for a, b in zip(current, hist)]
+
+
+def _unpack(totals):
+    values, histograms = totals
+    return {
+        "values": [[name, list(labels), value] for (name, labels), value in values.items()],
+        "histograms": [[name, list(labels), hist] for (name, labels), hist in histograms.items()],
+    }
+
+
+def _fold_dead(paths):
+    """Add exited workers' counters to archive.json and delete their files."""
+    lock_path = os.path.join(METRICS_DIR, "archive.lock")
+    archive_path = os.path.join(METRICS_DIR, "archive.json")
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            totals = ({}, {})
+            archive = _read_json(archive_path)
+            if archive:
+                _merge(totals, archive)
+            for path in paths:
+                snapshot = _read_json(path)
+                if snapshot is None:
+                    continue  # folded by another worker meanwhile
+                _merge(totals, snapshot, gauges=False)
+                _write_json(archive_path, _unpack(totals))
+                os.unlink(path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def collect():
+    """Totals across all workers: ({(name, labels): value}, {(name, labels): histogram})."""
+    own = registry()
+    totals = ({}, {})
+    _merge(totals, own.snapshot())
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        names = []
+
+    dead = []
+    for name in names:
+        match = re.fullmatch(r"worker-(\d+)\.json", name)
+        if not match or int(match.group(1)) == own.pid:
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        if fcntl is not None and not _alive(int(match.group(1))):
+            dead.append(path)
+            continue
+        snapshot = _read_json(path)
+        if snapshot:
+            _merge(totals, snapshot)
+
+    if dead:
+        _fold_dead(dead)
+    archive = _read_json(os.path.join(METRICS_DIR, "archive.json"))
+    if archive:
+        _merge(totals, archive)
+
+    for name, read in _gauges.items():
+        try:
+            samples = read()
+        except storage.DatabaseError as e:
+            print(f"Metrics: can't read {name}: {e}")
+            continue
+        for labels, value in samples:
+            totals[0][_key(name, labels)] = value
+    return totals
+
+
+# ---------------- EXPOSITION ----------------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_text(totals):
+    values, histograms = totals
+    by_name = {}
+    for (name, labels), value in values.items():
+        by_name.setdefault(name, []).append(("value", labels, value))
+    for (name, labels), hist in histograms.items():
+        by_name.setdefault(name, []).append(("histogram", labels, hist))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text, buckets = METRICS.get(name, ("counter", name.replace("_", " ").capitalize() + ".", None))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_kind, labels, data in sorted(by_name[name], key=lambda s: s[1]):
+            if sample_kind == "value":
+                lines.append(f"{name}{_labels(labels)} {_number(data)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ["+Inf"], data[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else f"{bound:g}"
+                lines.append(f"{name}_bucket{_labels(labels, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(data[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        abort(401)
+    return Response(render_text(collect()), mimetype="text/plain; version=0.0.4")
+
+
+# ---------------- HOOKS ----------------
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Times each statement from execute() to the end of the first fetch.
+    Iterating a cursor counts up to the first row, which execute() reads."""
+
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        if self.description is None:
+            _statement(sql, time.perf_counter() - started)
+        else:
+            self._pending = (sql, started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        _statement(sql, time.perf_counter() - started)
+        return self
+
+    def _fetched(self):
+        if self._pending is not None:
+            sql, started = self._pending
+            self._pending = None
+            _statement(sql, time.perf_counter() - started)
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._fetched()
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().fetchmany(*args, **kwargs)
+        self._fetched()
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._fetched()
+        return rows
+
+    def __iter__(self):
+        self._fetched()
+        return super().__iter__()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _statement(sql, seconds):
+    route = getattr(_local, "route", None) or "background"
+    reg = registry()
+    reg.inc("db_queries_total", route=route)
+    reg.observe("db_query_duration_seconds", seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        reg.inc("db_slow_queries_total", route=route)
+        print(f"Slow query: {seconds * 1000:.0f} ms in {route}: {' '.join(sql.split())}")
+
+
+def _request_started():
+    _local.route = request.endpoint or "unmatched"
+    g.metrics_started = time.perf_counter()
+    inc("http_requests_in_flight")
+
+
+def _request_finished(response):
+    route = request.endpoint or "unmatched"
+    reg = registry()
+    reg.inc("http_requests_total", route=route, method=request.method, status=response.status_code)
+    reg.observe("http_request_duration_seconds", time.perf_counter() - g.metrics_started, route=route)
+    return response
+
+
+def _request_teardown(exc):
+    if "metrics_started" not in g:
+        return
+    if exc is not None:
+        inc("http_request_exceptions_total", route=request.endpoint or "unmatched",
+            exception=type(exc).__name__)
+    inc("http_requests_in_flight", -1)
+    _local.route = None
+
+
+def _template_started(sender, template, context, **extra):
+    _local.templates = getattr(_local, "templates", [])
+    _local.templates.append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    stack = getattr(_local, "templates", None)
+    if stack:
+        observe("template_render_duration_seconds", time.perf_counter() - stack.pop(),
+                template=template.name or "<string>")
+
+
+def init_app(app):
+    db.connection_class = InstrumentedConnection
+    storage.statement_observer = _statement
+    app.before_request(_request_started)
+    app.after_request(_request_finished)
+    app.teardown_request(_request_teardown)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+    atexit.register(flush)
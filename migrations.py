@@ -0,0 +1,1151 @@
+import sqlite3
+
+import click
+from flask.cli import AppGroup
+
+import storage
+from db import open_connection
+
+# ---------------- MIGRATIONS ----------------
+#
+# Numbered, append-only. Each entry is (version, name, step) where step is
+# either an SQL script or a callable taking the connection. Every migration
+# runs in its own transaction together with its schema_version row, so a
+# failed step leaves the database at the previous version.
+#
+# Never edit a migration that has shipped; add a new one instead.
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def run_script(conn, script):
+    """Execute a multi-statement script inside the caller's transaction.
+    executescript() can't be used here, it commits before running."""
+    if storage.dialect(conn) == "postgresql":
+        # The server takes several statements at once, and plpgsql bodies
+        # don't split on semicolons
+        conn.execute(script)
+        return
+    for statement in _split_sql(script):
+        conn.execute(statement)
+
+
+def _split_sql(script):
+    statements, buffer = [], ""
+    for line in script.splitlines(keepends=True):
+        if line.strip().startswith("--"):
+            continue
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    if buffer.strip():
+        statements.append(buffer.strip())
+    return statements
+
+
+def _baseline(conn):
+    run_script(conn, """
+    CREATE TABLE IF NOT EXISTS panchayath (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        district TEXT,
+        state TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS issues (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        panchayath_id INTEGER,
+        category TEXT,
+        description TEXT,
+        location TEXT,
+        photo_path TEXT,
+        status TEXT DEFAULT 'Pending',
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        user_id INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS notices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        panchayath_id INTEGER,
+        title TEXT,
+        description TEXT,
+        banner_path TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        email TEXT UNIQUE,
+        mobile TEXT,
+        password_hash TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS admin (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        password_hash TEXT,
+        panchayath_id INTEGER
+    );
+    """)
+
+    # Databases created before these columns existed were patched by the old
+    # init_db() probes; bring any that missed them up to the same shape.
+    if "user_id" not in _columns(conn, "issues"):
+        conn.execute("ALTER TABLE issues ADD COLUMN user_id INTEGER")
+    if "photo_path" not in _columns(conn, "issues"):
+        conn.execute("ALTER TABLE issues ADD COLUMN photo_path TEXT")
+    if "banner_path" not in _columns(conn, "notices"):
+        conn.execute("ALTER TABLE notices ADD COLUMN banner_path TEXT")
+
+
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "hot path indexes", """
+    -- admin_dashboard(): WHERE panchayath_id = ? ORDER BY created_at DESC
+    CREATE INDEX IF NOT EXISTS idx_issues_panchayath_created ON issues(panchayath_id, created_at);
+    -- track_issue(): WHERE user_id = ? ORDER BY created_at DESC
+    CREATE INDEX IF NOT EXISTS idx_issues_user_created ON issues(user_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_issues_status ON issues(status);
+    -- admin_notices(): WHERE panchayath_id = ? ORDER BY created_at DESC
+    CREATE INDEX IF NOT EXISTS idx_notices_panchayath_created ON notices(panchayath_id, created_at);
+    """),
+    (3, "keyset pagination indexes", """
+    -- public_track() and notices(): unfiltered, newest first. The rowid is
+    -- the implicit last index column, so these also order by (created_at, id).
+    CREATE INDEX IF NOT EXISTS idx_issues_created ON issues(created_at);
+    CREATE INDEX IF NOT EXISTS idx_notices_created ON notices(created_at);
+    -- admin_dashboard() status counts as a covering index scan
+    CREATE INDEX IF NOT EXISTS idx_issues_panchayath_status ON issues(panchayath_id, status);
+    """),
+    (4, "home page counters", """
+    CREATE TABLE IF NOT EXISTS stats (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    );
+
+    INSERT OR REPLACE INTO stats (name, value) VALUES
+        ('panchayaths', (SELECT COUNT(*) FROM panchayath)),
+        ('users', (SELECT COUNT(*) FROM users)),
+        ('issues', (SELECT COUNT(*) FROM issues)),
+        ('issues_completed', (SELECT COUNT(*) FROM issues WHERE status = 'Completed'));
+
+    CREATE TRIGGER IF NOT EXISTS stats_panchayath_insert AFTER INSERT ON panchayath BEGIN
+        UPDATE stats SET value = value + 1 WHERE name = 'panchayaths';
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_panchayath_delete AFTER DELETE ON panchayath BEGIN
+        UPDATE stats SET value = value - 1 WHERE name = 'panchayaths';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_users_insert AFTER INSERT ON users BEGIN
+        UPDATE stats SET value = value + 1 WHERE name = 'users';
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_users_delete AFTER DELETE ON users BEGIN
+        UPDATE stats SET value = value - 1 WHERE name = 'users';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_issues_insert AFTER INSERT ON issues BEGIN
+        UPDATE stats SET value = value + 1 WHERE name = 'issues';
+        UPDATE stats SET value = value + 1 WHERE name = 'issues_completed' AND NEW.status = 'Completed';
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_issues_delete AFTER DELETE ON issues BEGIN
+        UPDATE stats SET value = value - 1 WHERE name = 'issues';
+        UPDATE stats SET value = value - 1 WHERE name = 'issues_completed' AND OLD.status = 'Completed';
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_issues_status AFTER UPDATE OF status ON issues
+    WHEN (OLD.status = 'Completed') IS NOT (NEW.status = 'Completed') BEGIN
+        UPDATE stats
+        SET value = value + CASE WHEN NEW.status = 'Completed' THEN 1 ELSE -1 END
+        WHERE name = 'issues_completed';
+    END;
+    """),
+    (5, "email outbox", """
+    CREATE TABLE IF NOT EXISTS email_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        recipient TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',  -- pending | sending | sent | failed
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,           -- unix time
+        locked_until REAL,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        sent_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_outbox_due ON email_outbox(status, next_attempt_at);
+    """),
+    (6, "upload references", """
+    -- uploads.py: one row per content-addressed file, refcount = rows using it
+    CREATE TABLE IF NOT EXISTS upload_refs (
+        path TEXT PRIMARY KEY,
+        refcount INTEGER NOT NULL,
+        size INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    -- Existing hashed uploads, in case the table is rebuilt
+    INSERT OR IGNORE INTO upload_refs (path, refcount)
+    SELECT path, COUNT(*) FROM (
+        SELECT photo_path AS path FROM issues WHERE photo_path GLOB 'uploads/??/??/*'
+        UNION ALL
+        SELECT banner_path FROM notices WHERE banner_path GLOB 'uploads/??/??/*'
+    ) GROUP BY path;
+    """),
+    (7, "full-text search", """
+    -- fts.py: external-content indexes, the text itself stays in issues/notices.
+    -- 'M*' keeps Kannada vowel signs inside words instead of splitting on them;
+    -- prefix='2 3' indexes short prefixes so search-as-you-type stays cheap.
+    CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts USING fts5(
+        description, location, category,
+        content='issues', content_rowid='id', prefix='2 3',
+        tokenize="unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS notices_fts USING fts5(
+        title, description,
+        content='notices', content_rowid='id', prefix='2 3',
+        tokenize="unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+    );
+
+    CREATE TRIGGER IF NOT EXISTS issues_fts_insert AFTER INSERT ON issues BEGIN
+        INSERT INTO issues_fts (rowid, description, location, category)
+        VALUES (new.id, new.description, new.location, new.category);
+    END;
+    CREATE TRIGGER IF NOT EXISTS issues_fts_delete AFTER DELETE ON issues BEGIN
+        INSERT INTO issues_fts (issues_fts, rowid, description, location, category)
+        VALUES ('delete', old.id, old.description, old.location, old.category);
+    END;
+    CREATE TRIGGER IF NOT EXISTS issues_fts_update AFTER UPDATE OF description, location, category ON issues BEGIN
+        INSERT INTO issues_fts (issues_fts, rowid, description, location, category)
+        VALUES ('delete', old.id, old.description, old.location, old.category);
+        INSERT INTO issues_fts (rowid, description, location, category)
+        VALUES (new.id, new.description, new.location, new.category);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS notices_fts_insert AFTER INSERT ON notices BEGIN
+        INSERT INTO notices_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notices_fts_delete AFTER DELETE ON notices BEGIN
+        INSERT INTO notices_fts (notices_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notices_fts_update AFTER UPDATE OF title, description ON notices BEGIN
+        INSERT INTO notices_fts (notices_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO notices_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END;
+
+    INSERT INTO issues_fts (issues_fts) VALUES ('rebuild');
+    INSERT INTO notices_fts (notices_fts) VALUES ('rebuild');
+
+    -- Column weights for ORDER BY rank: a hit in the short location/category
+    -- or the notice title counts more than one somewhere in a long description
+    INSERT INTO issues_fts (issues_fts, rank) VALUES ('rank', 'bm25(1.0, 2.0, 2.0)');
+    INSERT INTO notices_fts (notices_fts, rank) VALUES ('rank', 'bm25(3.0, 1.0)');
+    """),
+    (8, "change counters", """
+    -- Bumped on every write to issues/notices, per panchayath and overall
+    -- (panchayath_id 0). api.py derives ETags from them, so a poll can be
+    -- answered with 304 without reading the tables themselves.
+    CREATE TABLE IF NOT EXISTS change_counters (
+        resource TEXT NOT NULL,
+        panchayath_id INTEGER NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (resource, panchayath_id)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS changes_issues_insert AFTER INSERT ON issues BEGIN
+        INSERT INTO change_counters (resource, panchayath_id, version)
+        VALUES ('issues', NEW.panchayath_id, 1), ('issues', 0, 1)
+        ON CONFLICT (resource, panchayath_id) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS changes_issues_update AFTER UPDATE ON issues BEGIN
+        INSERT INTO change_counters (resource, panchayath_id, version)
+        VALUES ('issues', OLD.panchayath_id, 1), ('issues', NEW.panchayath_id, 1), ('issues', 0, 1)
+        ON CONFLICT (resource, panchayath_id) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS changes_issues_delete AFTER DELETE ON issues BEGIN
+        INSERT INTO change_counters (resource, panchayath_id, version)
+        VALUES ('issues', OLD.panchayath_id, 1), ('issues', 0, 1)
+        ON CONFLICT (resource, panchayath_id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS changes_notices_insert AFTER INSERT ON notices BEGIN
+        INSERT INTO change_counters (resource, panchayath_id, version)
+        VALUES ('notices', NEW.panchayath_id, 1), ('notices', 0, 1)
+        ON CONFLICT (resource, panchayath_id) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS changes_notices_update AFTER UPDATE ON notices BEGIN
+        INSERT INTO change_counters (resource, panchayath_id, version)
+        VALUES ('notices', OLD.panchayath_id, 1), ('notices', NEW.panchayath_id, 1), ('notices', 0, 1)
+        ON CONFLICT (resource, panchayath_id) DO UPDATE SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS changes_notices_delete AFTER DELETE ON notices BEGIN
+        INSERT INTO change_counters (resource, panchayath_id, version)
+        VALUES ('notices', OLD.panchayath_id, 1), ('notices', 0, 1)
+        ON CONFLICT (resource, panchayath_id) DO UPDATE SET version = version + 1;
+    END;
+
+    -- Listings embed the panchayath name
+    CREATE TRIGGER IF NOT EXISTS changes_panchayath_update AFTER UPDATE OF name ON panchayath BEGIN
+        INSERT INTO change_counters (resource, panchayath_id, version)
+        VALUES ('issues', NEW.id, 1), ('issues', 0, 1), ('notices', NEW.id, 1), ('notices', 0, 1)
+        ON CONFLICT (resource, panchayath_id) DO UPDATE SET version = version + 1;
+    END;
+    """),
+    (9, "issue events", """
+    -- Change log for live updates (live.py): one row per new issue and per
+    -- status change, read by every web process with a rowid range scan.
+    -- AUTOINCREMENT so an id is never reused; SSE clients resume from it.
+    CREATE TABLE IF NOT EXISTS issue_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        issue_id INTEGER NOT NULL,
+        panchayath_id INTEGER,
+        user_id INTEGER,
+        kind TEXT NOT NULL,
+        status TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TRIGGER IF NOT EXISTS issue_events_insert AFTER INSERT ON issues BEGIN
+        INSERT INTO issue_events (issue_id, panchayath_id, user_id, kind, status)
+        VALUES (NEW.id, NEW.panchayath_id, NEW.user_id, 'created', NEW.status);
+    END;
+    CREATE TRIGGER IF NOT EXISTS issue_events_status AFTER UPDATE OF status ON issues
+    WHEN NEW.status IS NOT OLD.status BEGIN
+        INSERT INTO issue_events (issue_id, panchayath_id, user_id, kind, status)
+        VALUES (NEW.id, NEW.panchayath_id, NEW.user_id, 'status', NEW.status);
+    END;
+
+    -- Only the newest 10000 events are kept; older ones fall off as new
+    -- ones arrive, so the table never needs a cleanup job
+    CREATE TRIGGER IF NOT EXISTS issue_events_trim AFTER INSERT ON issue_events BEGIN
+        DELETE FROM issue_events WHERE id <= NEW.id - 10000;
+    END;
+    """),
+    (10, "issue analytics rollups", """
+    -- Daily rollups for the analytics pages (analytics.py). Triggers on
+    -- issue_events keep them current in the same transaction as the write,
+    -- so the events themselves can keep being trimmed and no report ever
+    -- scans issues.
+    ALTER TABLE issue_events ADD COLUMN category TEXT;
+    ALTER TABLE issue_events ADD COLUMN from_status TEXT;
+
+    -- A new issue's event is dated when the issue was, so imported rows
+    -- land on the right day
+    DROP TRIGGER IF EXISTS issue_events_insert;
+    CREATE TRIGGER issue_events_insert AFTER INSERT ON issues BEGIN
+        INSERT INTO issue_events (issue_id, panchayath_id, user_id, kind, status, category, created_at)
+        VALUES (NEW.id, NEW.panchayath_id, NEW.user_id, 'created', NEW.status, NEW.category,
+                COALESCE(NEW.created_at, CURRENT_TIMESTAMP));
+    END;
+    DROP TRIGGER IF EXISTS issue_events_status;
+    CREATE TRIGGER issue_events_status AFTER UPDATE OF status ON issues
+    WHEN NEW.status IS NOT OLD.status BEGIN
+        INSERT INTO issue_events (issue_id, panchayath_id, user_id, kind, status, from_status, category)
+        VALUES (NEW.id, NEW.panchayath_id, NEW.user_id, 'status', NEW.status, OLD.status, NEW.category);
+    END;
+
+    -- Per panchayath, day (UTC), category and status: issues reported, and
+    -- issues moving into and out of the status. A new issue counts as
+    -- reported and entered under its first status.
+    CREATE TABLE IF NOT EXISTS issue_daily (
+        panchayath_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        category TEXT NOT NULL,
+        status TEXT NOT NULL,
+        reported INTEGER NOT NULL DEFAULT 0,
+        entered INTEGER NOT NULL DEFAULT 0,
+        exited INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (panchayath_id, day, category, status)
+    ) WITHOUT ROWID;
+
+    -- Completions by how long the issue had been open; bucket indexes
+    -- analytics.RESOLUTION_BUCKETS
+    CREATE TABLE IF NOT EXISTS issue_resolutions_daily (
+        panchayath_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        category TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        resolved INTEGER NOT NULL DEFAULT 0,
+        seconds REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (panchayath_id, day, category, bucket)
+    ) WITHOUT ROWID;
+
+    -- Issues in each status right now
+    CREATE TABLE IF NOT EXISTS issue_totals (
+        panchayath_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (panchayath_id, category, status)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS rollup_issue_created AFTER INSERT ON issue_events
+    WHEN NEW.kind = 'created' BEGIN
+        INSERT INTO issue_daily (panchayath_id, day, category, status, reported, entered)
+        VALUES (COALESCE(NEW.panchayath_id, 0), date(NEW.created_at), COALESCE(NEW.category, ''),
+                COALESCE(NEW.status, 'Pending'), 1, 1)
+        ON CONFLICT (panchayath_id, day, category, status)
+        DO UPDATE SET reported = reported + 1, entered = entered + 1;
+        INSERT INTO issue_totals (panchayath_id, category, status, count)
+        VALUES (COALESCE(NEW.panchayath_id, 0), COALESCE(NEW.category, ''), COALESCE(NEW.status, 'Pending'), 1)
+        ON CONFLICT (panchayath_id, category, status) DO UPDATE SET count = count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS rollup_issue_status AFTER INSERT ON issue_events
+    WHEN NEW.kind = 'status' BEGIN
+        INSERT INTO issue_daily (panchayath_id, day, category, status, exited)
+        VALUES (COALESCE(NEW.panchayath_id, 0), date(NEW.created_at), COALESCE(NEW.category, ''),
+                COALESCE(NEW.from_status, 'Pending'), 1)
+        ON CONFLICT (panchayath_id, day, category, status) DO UPDATE SET exited = exited + 1;
+        INSERT INTO issue_daily (panchayath_id, day, category, status, entered)
+        VALUES (COALESCE(NEW.panchayath_id, 0), date(NEW.created_at), COALESCE(NEW.category, ''),
+                COALESCE(NEW.status, 'Pending'), 1)
+        ON CONFLICT (panchayath_id, day, category, status) DO UPDATE SET entered = entered + 1;
+
+        UPDATE issue_totals SET count = count - 1
+        WHERE panchayath_id = COALESCE(NEW.panchayath_id, 0) AND category = COALESCE(NEW.category, '')
+          AND status = COALESCE(NEW.from_status, 'Pending');
+        INSERT INTO issue_totals (panchayath_id, category, status, count)
+        VALUES (COALESCE(NEW.panchayath_id, 0), COALESCE(NEW.category, ''), COALESCE(NEW.status, 'Pending'), 1)
+        ON CONFLICT (panchayath_id, category, status) DO UPDATE SET count = count + 1;
+
+        INSERT INTO issue_resolutions_daily (panchayath_id, day, category, bucket, resolved, seconds)
+        SELECT COALESCE(NEW.panchayath_id, 0), date(NEW.created_at), COALESCE(NEW.category, ''),
+               CASE
+                   WHEN open_seconds <= 1 * 86400 THEN 0
+                   WHEN open_seconds <= 2 * 86400 THEN 1
+                   WHEN open_seconds <= 3 * 86400 THEN 2
+                   WHEN open_seconds <= 7 * 86400 THEN 3
+                   WHEN open_seconds <= 14 * 86400 THEN 4
+                   WHEN open_seconds <= 30 * 86400 THEN 5
+                   WHEN open_seconds <= 60 * 86400 THEN 6
+                   WHEN open_seconds <= 90 * 86400 THEN 7
+                   ELSE 8
+               END,
+               1, open_seconds
+        FROM (
+            SELECT MAX(0, (julianday(NEW.created_at) - julianday(created_at)) * 86400) AS open_seconds
+            FROM issues WHERE id = NEW.issue_id
+        )
+        WHERE NEW.status = 'Completed'
+        ON CONFLICT (panchayath_id, day, category, bucket)
+        DO UPDATE SET resolved = resolved + 1, seconds = seconds + excluded.seconds;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS rollup_issue_delete AFTER DELETE ON issues BEGIN
+        UPDATE issue_totals SET count = count - 1
+        WHERE panchayath_id = COALESCE(OLD.panchayath_id, 0) AND category = COALESCE(OLD.category, '')
+          AND status = COALESCE(OLD.status, 'Pending');
+    END;
+
+    -- Existing issues: only their creation date and current status are
+    -- known, so history before this migration has no status changes
+    INSERT INTO issue_daily (panchayath_id, day, category, status, reported, entered)
+    SELECT COALESCE(panchayath_id, 0), COALESCE(date(created_at), date('now')), COALESCE(category, ''),
+           COALESCE(status, 'Pending'), COUNT(*), COUNT(*)
+    FROM issues
+    GROUP BY 1, 2, 3, 4;
+    INSERT INTO issue_totals (panchayath_id, category, status, count)
+    SELECT COALESCE(panchayath_id, 0), COALESCE(category, ''), COALESCE(status, 'Pending'), COUNT(*)
+    FROM issues
+    GROUP BY 1, 2, 3;
+
+    -- District and state reports
+    CREATE INDEX IF NOT EXISTS idx_panchayath_state_district ON panchayath(state, district);
+    """),
+    (11, "shard catalog", """
+    -- Which shard file holds each panchayath's issues and notices
+    -- (shards.py). Only used in the catalog database, and only when
+    -- SHARDING is on; shard files get the tables too but leave them empty.
+    CREATE TABLE IF NOT EXISTS shards (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT UNIQUE NOT NULL,
+        path TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS panchayath_shards (
+        panchayath_id INTEGER PRIMARY KEY,
+        shard_id INTEGER NOT NULL REFERENCES shards(id)
+    );
+    """),
+    (12, "pending registrations", """
+    -- Sign-ups waiting for their email OTP, keyed by a random token kept
+    -- in the session; rows past expires_at are swept by the session
+    -- reaper (sessions.py)
+    CREATE TABLE IF NOT EXISTS pending_registrations (
+        token TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        mobile TEXT NOT NULL,
+        password_hash TEXT NOT NULL,
+        otp TEXT NOT NULL,
+        otp_sent_at REAL NOT NULL,           -- unix time
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_pending_registrations_expires ON pending_registrations(expires_at);
+    """),
+    (13, "export jobs", """
+    -- Background issue exports (exports.py); always in the main database
+    CREATE TABLE IF NOT EXISTS export_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        panchayath_id INTEGER NOT NULL,
+        admin_id INTEGER NOT NULL,
+        format TEXT NOT NULL,
+        filters TEXT NOT NULL,                   -- JSON
+        status TEXT NOT NULL DEFAULT 'queued',   -- queued | running | done | failed
+        rows_total INTEGER,
+        rows_done INTEGER NOT NULL DEFAULT 0,
+        path TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,                -- unix time
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_export_jobs_panchayath ON export_jobs(panchayath_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_export_jobs_created ON export_jobs(created_at);
+    """),
+    (14, "issue completion time", """
+    -- When an issue was last marked Completed (NULL while it is open), so
+    -- `flask archive run` (archive.py) can pick the ones long finished.
+    -- Issues already completed get the time their status event recorded,
+    -- or failing that (events are trimmed) when they were reported.
+    ALTER TABLE issues ADD COLUMN completed_at DATETIME;
+    UPDATE issues SET completed_at = COALESCE(
+        (SELECT MAX(e.created_at) FROM issue_events e
+         WHERE e.issue_id = issues.id AND e.kind = 'status' AND e.status = 'Completed'),
+        created_at)
+    WHERE status = 'Completed';
+
+    CREATE TRIGGER IF NOT EXISTS issues_completed_insert AFTER INSERT ON issues
+    WHEN NEW.status = 'Completed' AND NEW.completed_at IS NULL BEGIN
+        UPDATE issues SET completed_at = COALESCE(NEW.created_at, CURRENT_TIMESTAMP) WHERE id = NEW.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS issues_completed_status AFTER UPDATE OF status ON issues
+    WHEN (OLD.status = 'Completed') IS NOT (NEW.status = 'Completed') BEGIN
+        UPDATE issues SET completed_at = CASE WHEN NEW.status = 'Completed' THEN CURRENT_TIMESTAMP END
+        WHERE id = NEW.id;
+    END;
+    CREATE INDEX IF NOT EXISTS idx_issues_completed ON issues(completed_at) WHERE completed_at IS NOT NULL;
+    """),
+    (15, "bulk imports", """
+    -- `flask import` (importer.py): how far each input file has got into
+    -- this database. A batch of rows and its checkpoint commit together,
+    -- so a resumed import neither skips nor repeats a record. The main
+    -- database also keeps the running totals; shard files only the
+    -- position.
+    CREATE TABLE IF NOT EXISTS import_checkpoints (
+        source TEXT PRIMARY KEY,              -- kind and fingerprint of the file
+        kind TEXT NOT NULL,
+        path TEXT NOT NULL,
+        position INTEGER NOT NULL DEFAULT 0,  -- input records dealt with
+        inserted INTEGER NOT NULL DEFAULT 0,
+        skipped INTEGER NOT NULL DEFAULT 0,   -- already in the database
+        rejected INTEGER NOT NULL DEFAULT 0,
+        finished_at REAL,                     -- unix time
+        updated_at REAL NOT NULL
+    );
+
+    -- Indexes and triggers dropped for the length of an import, to be
+    -- recreated (and what the triggers maintain brought up to date for
+    -- the rows above after_id) when it finishes
+    CREATE TABLE IF NOT EXISTS import_deferred (
+        name TEXT PRIMARY KEY,
+        tbl_name TEXT NOT NULL,
+        sql TEXT NOT NULL,
+        after_id INTEGER NOT NULL
+    );
+    """),
+    (16, "live event feed", """
+    -- issue_events becomes the append-only history of every issue, which
+    -- the analytics rollups are built from. Live updates (live.py) read
+    -- their own copy of the newest 10000 events instead, under the same
+    -- ids, and only that copy is trimmed as new events arrive.
+    DROP TRIGGER IF EXISTS issue_events_trim;
+
+    CREATE TABLE IF NOT EXISTS live_events (
+        id INTEGER PRIMARY KEY,
+        issue_id INTEGER NOT NULL,
+        panchayath_id INTEGER,
+        user_id INTEGER,
+        kind TEXT NOT NULL,
+        status TEXT
+    );
+    INSERT OR IGNORE INTO live_events (id, issue_id, panchayath_id, user_id, kind, status)
+    SELECT id, issue_id, panchayath_id, user_id, kind, status FROM issue_events
+    WHERE id > (SELECT MAX(id) FROM issue_events) - 10000;
+
+    CREATE TRIGGER IF NOT EXISTS live_events_feed AFTER INSERT ON issue_events BEGIN
+        INSERT INTO live_events (id, issue_id, panchayath_id, user_id, kind, status)
+        VALUES (NEW.id, NEW.issue_id, NEW.panchayath_id, NEW.user_id, NEW.kind, NEW.status);
+        DELETE FROM live_events WHERE id <= NEW.id - 10000;
+    END;
+    """),
+]
+
+# ---------------- POSTGRESQL ----------------
+#
+# A PostgreSQL database (DATABASE_URL=postgresql://..., see storage.py) is
+# created at the current version in one step instead of replaying the
+# SQLite history; later migrations add their PostgreSQL form here under
+# the same version number. The triggers are plpgsql ports of the SQLite
+# ones above. Timestamps are kept as 'YYYY-MM-DD HH:MM:SS' UTC text, the
+# form SQLite's CURRENT_TIMESTAMP gives, so pagination cursors, templates
+# and rollup days work the same on both.
+
+POSTGRES_BASELINE = """
+CREATE OR REPLACE FUNCTION utc_now_text() RETURNS TEXT AS $$
+    SELECT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')
+$$ LANGUAGE SQL STABLE;
+
+CREATE TABLE IF NOT EXISTS panchayath (
+    id SERIAL PRIMARY KEY,
+    name TEXT,
+    district TEXT,
+    state TEXT
+);
+
+CREATE TABLE IF NOT EXISTS admin (
+    id SERIAL PRIMARY KEY,
+    username TEXT,
+    password_hash TEXT,
+    panchayath_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    name TEXT,
+    email TEXT UNIQUE,
+    mobile TEXT,
+    password_hash TEXT,
+    created_at TEXT DEFAULT utc_now_text()
+);
+
+CREATE TABLE IF NOT EXISTS issues (
+    id BIGSERIAL PRIMARY KEY,
+    panchayath_id INTEGER,
+    category TEXT,
+    description TEXT,
+    location TEXT,
+    photo_path TEXT,
+    status TEXT DEFAULT 'Pending',
+    created_at TEXT DEFAULT utc_now_text(),
+    user_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS notices (
+    id BIGSERIAL PRIMARY KEY,
+    panchayath_id INTEGER,
+    title TEXT,
+    description TEXT,
+    banner_path TEXT,
+    created_at TEXT DEFAULT utc_now_text()
+);
+
+-- Keyset pagination orders by (created_at, id); PostgreSQL indexes don't
+-- end in the row id by themselves
+CREATE INDEX IF NOT EXISTS idx_issues_panchayath_created ON issues(panchayath_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_issues_user_created ON issues(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_issues_created ON issues(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_issues_status ON issues(status);
+CREATE INDEX IF NOT EXISTS idx_issues_panchayath_status ON issues(panchayath_id, status);
+CREATE INDEX IF NOT EXISTS idx_notices_panchayath_created ON notices(panchayath_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_notices_created ON notices(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_panchayath_state_district ON panchayath(state, district);
+
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO stats (name, value) VALUES
+    ('panchayaths', (SELECT COUNT(*) FROM panchayath)),
+    ('users', (SELECT COUNT(*) FROM users)),
+    ('issues', (SELECT COUNT(*) FROM issues)),
+    ('issues_completed', (SELECT COUNT(*) FROM issues WHERE status = 'Completed'))
+ON CONFLICT (name) DO UPDATE SET value = excluded.value;
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DOUBLE PRECISION NOT NULL,
+    locked_until DOUBLE PRECISION,
+    last_error TEXT,
+    created_at DOUBLE PRECISION NOT NULL,
+    sent_at DOUBLE PRECISION
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON email_outbox(status, next_attempt_at);
+
+CREATE TABLE IF NOT EXISTS upload_refs (
+    path TEXT PRIMARY KEY,
+    refcount INTEGER NOT NULL,
+    size BIGINT,
+    created_at TEXT DEFAULT utc_now_text()
+);
+
+CREATE TABLE IF NOT EXISTS change_counters (
+    resource TEXT NOT NULL,
+    panchayath_id INTEGER NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (resource, panchayath_id)
+);
+
+CREATE TABLE IF NOT EXISTS issue_events (
+    id BIGSERIAL PRIMARY KEY,
+    issue_id BIGINT NOT NULL,
+    panchayath_id INTEGER,
+    user_id INTEGER,
+    kind TEXT NOT NULL,
+    status TEXT,
+    created_at TEXT DEFAULT utc_now_text(),
+    category TEXT,
+    from_status TEXT,
+    -- Writing transaction, so live.py reads only committed, final events
+    xid xid8 NOT NULL DEFAULT pg_current_xact_id()
+);
+
+CREATE TABLE IF NOT EXISTS issue_daily (
+    panchayath_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL,
+    reported BIGINT NOT NULL DEFAULT 0,
+    entered BIGINT NOT NULL DEFAULT 0,
+    exited BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (panchayath_id, day, category, status)
+);
+
+CREATE TABLE IF NOT EXISTS issue_resolutions_daily (
+    panchayath_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    resolved BIGINT NOT NULL DEFAULT 0,
+    seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (panchayath_id, day, category, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS issue_totals (
+    panchayath_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (panchayath_id, category, status)
+);
+
+-- Only used with SQLite sharding; kept for the same shape
+CREATE TABLE IF NOT EXISTS shards (
+    id SERIAL PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS panchayath_shards (
+    panchayath_id INTEGER PRIMARY KEY,
+    shard_id INTEGER NOT NULL REFERENCES shards(id)
+);
+
+-- Full-text search (fts.py): GIN indexes over weighted documents, the
+-- weights matching the bm25 column weights of the SQLite indexes. 'simple'
+-- splits words without stemming, as unicode61 does.
+CREATE OR REPLACE FUNCTION issue_document(description TEXT, location TEXT, category TEXT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(location, '') || ' ' || coalesce(category, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+$$ LANGUAGE SQL IMMUTABLE;
+CREATE OR REPLACE FUNCTION notice_document(title TEXT, description TEXT) RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+$$ LANGUAGE SQL IMMUTABLE;
+CREATE INDEX IF NOT EXISTS idx_issues_search ON issues USING GIN (issue_document(description, location, category));
+CREATE INDEX IF NOT EXISTS idx_notices_search ON notices USING GIN (notice_document(title, description));
+
+-- Home page counters (migration 4)
+CREATE OR REPLACE FUNCTION bump_stat(stat TEXT, delta INTEGER) RETURNS VOID AS $$
+    UPDATE stats SET value = value + delta WHERE name = stat
+$$ LANGUAGE SQL;
+
+CREATE OR REPLACE FUNCTION stats_panchayath() RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_stat('panchayaths', CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END);
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+CREATE OR REPLACE TRIGGER stats_panchayath AFTER INSERT OR DELETE ON panchayath
+FOR EACH ROW EXECUTE FUNCTION stats_panchayath();
+
+CREATE OR REPLACE FUNCTION stats_users() RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_stat('users', CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END);
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+CREATE OR REPLACE TRIGGER stats_users AFTER INSERT OR DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION stats_users();
+
+CREATE OR REPLACE FUNCTION stats_issues() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_stat('issues', 1);
+        IF NEW.status = 'Completed' THEN PERFORM bump_stat('issues_completed', 1); END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM bump_stat('issues', -1);
+        IF OLD.status = 'Completed' THEN PERFORM bump_stat('issues_completed', -1); END IF;
+    ELSIF (OLD.status = 'Completed') IS DISTINCT FROM (NEW.status = 'Completed') THEN
+        PERFORM bump_stat('issues_completed', CASE WHEN NEW.status = 'Completed' THEN 1 ELSE -1 END);
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+CREATE OR REPLACE TRIGGER stats_issues AFTER INSERT OR DELETE OR UPDATE OF status ON issues
+FOR EACH ROW EXECUTE FUNCTION stats_issues();
+
+-- Change counters for API ETags (migration 8)
+CREATE OR REPLACE FUNCTION bump_change(changed TEXT, pid INTEGER) RETURNS VOID AS $$
+    INSERT INTO change_counters (resource, panchayath_id, version)
+    VALUES (changed, pid, 1)
+    ON CONFLICT (resource, panchayath_id) DO UPDATE SET version = change_counters.version + 1
+$$ LANGUAGE SQL;
+
+CREATE OR REPLACE FUNCTION changes_rows() RETURNS trigger AS $$
+BEGIN
+    -- TG_ARGV[0] is the resource: 'issues' or 'notices'
+    IF TG_OP <> 'INSERT' THEN PERFORM bump_change(TG_ARGV[0], OLD.panchayath_id); END IF;
+    IF TG_OP <> 'DELETE' THEN PERFORM bump_change(TG_ARGV[0], NEW.panchayath_id); END IF;
+    PERFORM bump_change(TG_ARGV[0], 0);
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+CREATE OR REPLACE TRIGGER changes_issues AFTER INSERT OR UPDATE OR DELETE ON issues
+FOR EACH ROW EXECUTE FUNCTION changes_rows('issues');
+CREATE OR REPLACE TRIGGER changes_notices AFTER INSERT OR UPDATE OR DELETE ON notices
+FOR EACH ROW EXECUTE FUNCTION changes_rows('notices');
+
+CREATE OR REPLACE FUNCTION changes_panchayath() RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_change('issues', NEW.id), bump_change('issues', 0),
+            bump_change('notices', NEW.id), bump_change('notices', 0);
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+CREATE OR REPLACE TRIGGER changes_panchayath AFTER UPDATE OF name ON panchayath
+FOR EACH ROW EXECUTE FUNCTION changes_panchayath();
+
+-- Live update change log (migrations 9 and 10)
+CREATE OR REPLACE FUNCTION issue_events_log() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO issue_events (issue_id, panchayath_id, user_id, kind, status, category, created_at)
+        VALUES (NEW.id, NEW.panchayath_id, NEW.user_id, 'created', NEW.status, NEW.category,
+                COALESCE(NEW.created_at, utc_now_text()));
+    ELSIF NEW.status IS DISTINCT FROM OLD.status THEN
+        INSERT INTO issue_events (issue_id, panchayath_id, user_id, kind, status, from_status, category)
+        VALUES (NEW.id, NEW.panchayath_id, NEW.user_id, 'status', NEW.status, OLD.status, NEW.category);
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+CREATE OR REPLACE TRIGGER issue_events_log AFTER INSERT OR UPDATE OF status ON issues
+FOR EACH ROW EXECUTE FUNCTION issue_events_log();
+
+CREATE OR REPLACE FUNCTION issue_events_trim() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM issue_events WHERE id <= NEW.id - 10000;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+CREATE OR REPLACE TRIGGER issue_events_trim AFTER INSERT ON issue_events
+FOR EACH ROW EXECUTE FUNCTION issue_events_trim();
+
+-- Analytics rollups (migration 10)
+CREATE OR REPLACE FUNCTION rollup_issue_event() RETURNS trigger AS $$
+DECLARE
+    pid INTEGER := COALESCE(NEW.panchayath_id, 0);
+    cat TEXT := COALESCE(NEW.category, '');
+    entered_status TEXT := COALESCE(NEW.status, 'Pending');
+    event_day TEXT := left(NEW.created_at, 10);
+    open_seconds DOUBLE PRECISION;
+BEGIN
+    IF NEW.kind = 'created' THEN
+        INSERT INTO issue_daily AS d (panchayath_id, day, category, status, reported, entered)
+        VALUES (pid, event_day, cat, entered_status, 1, 1)
+        ON CONFLICT (panchayath_id, day, category, status)
+        DO UPDATE SET reported = d.reported + 1, entered = d.entered + 1;
+    ELSIF NEW.kind = 'status' THEN
+        INSERT INTO issue_daily AS d (panchayath_id, day, category, status, exited)
+        VALUES (pid, event_day, cat, COALESCE(NEW.from_status, 'Pending'), 1)
+        ON CONFLICT (panchayath_id, day, category, status) DO UPDATE SET exited = d.exited + 1;
+        INSERT INTO issue_daily AS d (panchayath_id, day, category, status, entered)
+        VALUES (pid, event_day, cat, entered_status, 1)
+        ON CONFLICT (panchayath_id, day, category, status) DO UPDATE SET entered = d.entered + 1;
+        UPDATE issue_totals SET count = count - 1
+        WHERE panchayath_id = pid AND category = cat AND status = COALESCE(NEW.from_status, 'Pending');
+
+        IF NEW.status = 'Completed' THEN
+            SELECT GREATEST(0, EXTRACT(EPOCH FROM NEW.created_at::timestamp - created_at::timestamp))
+            INTO open_seconds FROM issues WHERE id = NEW.issue_id;
+            IF FOUND THEN
+                INSERT INTO issue_resolutions_daily AS r (panchayath_id, day, category, bucket, resolved, seconds)
+                VALUES (pid, event_day, cat,
+                        CASE
+                            WHEN open_seconds <= 1 * 86400 THEN 0
+                            WHEN open_seconds <= 2 * 86400 THEN 1
+                            WHEN open_seconds <= 3 * 86400 THEN 2
+                            WHEN open_seconds <= 7 * 86400 THEN 3
+                            WHEN open_seconds <= 14 * 86400 THEN 4
+                            WHEN open_seconds <= 30 * 86400 THEN 5
+                            WHEN open_seconds <= 60 * 86400 THEN 6
+                            WHEN open_seconds <= 90 * 86400 THEN 7
+                            ELSE 8
+                        END,
+                        1, open_seconds)
+                ON CONFLICT (panchayath_id, day, category, bucket)
+                DO UPDATE SET resolved = r.resolved + 1, seconds = r.seconds + excluded.seconds;
+            END IF;
+        END IF;
+    ELSE
+        RETURN NULL;
+    END IF;
+    INSERT INTO issue_totals AS t (panchayath_id, category, status, count)
+    VALUES (pid, cat, entered_status, 1)
+    ON CONFLICT (panchayath_id, category, status) DO UPDATE SET count = t.count + 1;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+CREATE OR REPLACE TRIGGER rollup_issue_event AFTER INSERT ON issue_events
+FOR EACH ROW EXECUTE FUNCTION rollup_issue_event();
+
+CREATE OR REPLACE FUNCTION rollup_issue_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE issue_totals SET count = count - 1
+    WHERE panchayath_id = COALESCE(OLD.panchayath_id, 0) AND category = COALESCE(OLD.category, '')
+      AND status = COALESCE(OLD.status, 'Pending');
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+CREATE OR REPLACE TRIGGER rollup_issue_delete AFTER DELETE ON issues
+FOR EACH ROW EXECUTE FUNCTION rollup_issue_delete();
+"""
+
+POSTGRES_MIGRATIONS = [
+    (11, "baseline schema (PostgreSQL)", POSTGRES_BASELINE),
+    (12, "pending registrations", """
+    CREATE TABLE IF NOT EXISTS pending_registrations (
+        token TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        mobile TEXT NOT NULL,
+        password_hash TEXT NOT NULL,
+        otp TEXT NOT NULL,
+        otp_sent_at DOUBLE PRECISION NOT NULL,
+        expires_at DOUBLE PRECISION NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_pending_registrations_expires ON pending_registrations(expires_at);
+    """),
+    (13, "export jobs", """
+    CREATE TABLE IF NOT EXISTS export_jobs (
+        id BIGSERIAL PRIMARY KEY,
+        panchayath_id INTEGER NOT NULL,
+        admin_id INTEGER NOT NULL,
+        format TEXT NOT NULL,
+        filters TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        rows_total INTEGER,
+        rows_done INTEGER NOT NULL DEFAULT 0,
+        path TEXT,
+        error TEXT,
+        created_at DOUBLE PRECISION NOT NULL,
+        updated_at DOUBLE PRECISION NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_export_jobs_panchayath ON export_jobs(panchayath_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_export_jobs_created ON export_jobs(created_at);
+    """),
+    (14, "issue completion time", """
+    ALTER TABLE issues ADD COLUMN IF NOT EXISTS completed_at TEXT;
+    UPDATE issues SET completed_at = COALESCE(
+        (SELECT MAX(e.created_at) FROM issue_events e
+         WHERE e.issue_id = issues.id AND e.kind = 'status' AND e.status = 'Completed'),
+        created_at)
+    WHERE status = 'Completed';
+
+    CREATE OR REPLACE FUNCTION issues_completed_at() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            IF NEW.status = 'Completed' AND NEW.completed_at IS NULL THEN
+                NEW.completed_at := COALESCE(NEW.created_at, utc_now_text());
+            END IF;
+        ELSIF (OLD.status = 'Completed') IS DISTINCT FROM (NEW.status = 'Completed') THEN
+            NEW.completed_at := CASE WHEN NEW.status = 'Completed' THEN utc_now_text() END;
+        END IF;
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql;
+    CREATE OR REPLACE TRIGGER issues_completed_at BEFORE INSERT OR UPDATE OF status ON issues
+    FOR EACH ROW EXECUTE FUNCTION issues_completed_at();
+    CREATE INDEX IF NOT EXISTS idx_issues_completed ON issues(completed_at) WHERE completed_at IS NOT NULL;
+    """),
+    (15, "bulk imports", """
+    -- Indexes and triggers stay in place during imports here (no
+    -- import_deferred): PostgreSQL maintains them well enough in bulk
+    CREATE TABLE IF NOT EXISTS import_checkpoints (
+        source TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        path TEXT NOT NULL,
+        position BIGINT NOT NULL DEFAULT 0,
+        inserted BIGINT NOT NULL DEFAULT 0,
+        skipped BIGINT NOT NULL DEFAULT 0,
+        rejected BIGINT NOT NULL DEFAULT 0,
+        finished_at DOUBLE PRECISION,
+        updated_at DOUBLE PRECISION NOT NULL
+    );
+    """),
+    (16, "live event feed", """
+    DROP TRIGGER IF EXISTS issue_events_trim ON issue_events;
+    DROP FUNCTION IF EXISTS issue_events_trim();
+
+    CREATE TABLE IF NOT EXISTS live_events (
+        id BIGINT PRIMARY KEY,
+        issue_id BIGINT NOT NULL,
+        panchayath_id INTEGER,
+        user_id INTEGER,
+        kind TEXT NOT NULL,
+        status TEXT,
+        xid xid8 NOT NULL
+    );
+    INSERT INTO live_events (id, issue_id, panchayath_id, user_id, kind, status, xid)
+    SELECT id, issue_id, panchayath_id, user_id, kind, status, xid FROM issue_events
+    WHERE id > (SELECT MAX(id) FROM issue_events) - 10000
+    ON CONFLICT (id) DO NOTHING;
+
+    CREATE OR REPLACE FUNCTION live_events_feed() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO live_events (id, issue_id, panchayath_id, user_id, kind, status, xid)
+        VALUES (NEW.id, NEW.issue_id, NEW.panchayath_id, NEW.user_id, NEW.kind, NEW.status, NEW.xid);
+        DELETE FROM live_events WHERE id <= NEW.id - 10000;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+    CREATE OR REPLACE TRIGGER live_events_feed AFTER INSERT ON issue_events
+    FOR EACH ROW EXECUTE FUNCTION live_events_feed();
+    """),
+]
+
+# Extra database files `flask db upgrade` should bring up to date too:
+# a callable returning their paths, registered by shards.py
+_databases = None
+
+
+def register_databases(provider):
+    global _databases
+    _databases = provider
+
+
+def _with_extra_databases():
+    yield None
+    if _databases:
+        yield from _databases()
+
+# ---------------- ENGINE ----------------
+
+
+def _ensure_version_table(conn):
+    applied_at = "TIMESTAMP" if storage.dialect(conn) == "postgresql" else "DATETIME"
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at {applied_at} DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+
+def _migrations(conn):
+    return POSTGRES_MIGRATIONS if storage.dialect(conn) == "postgresql" else MIGRATIONS
+
+
+def current_version(conn):
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def _apply(conn, version, name, step):
+    previous = conn.isolation_level
+    conn.isolation_level = None  # we manage the transaction ourselves
+    try:
+        # IMMEDIATE takes the write lock up front, so two processes running
+        # an upgrade at once serialize here and the loser sees the new version.
+        conn.execute("BEGIN IMMEDIATE")
+        if storage.dialect(conn) == "postgresql":
+            conn.execute("LOCK TABLE schema_version IN EXCLUSIVE MODE")
+        done = conn.execute(
+            "SELECT 1 FROM schema_version WHERE version = ?", (version,)
+        ).fetchone()
+        if done:
+            conn.execute("ROLLBACK")
+            return False
+        if callable(step):
+            step(conn)
+        else:
+            run_script(conn, step)
+        conn.execute(
+            "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+            (version, name),
+        )
+        conn.execute("COMMIT")
+        return True
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.isolation_level = previous
+
+
+def upgrade(conn, target=None):
+    """Apply pending migrations up to target (default: latest). Returns the
+    list of (version, name) that were applied."""
+    _ensure_version_table(conn)
+    done = {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+    applied = []
+    for version, name, step in _migrations(conn):
+        if target is not None and version > target:
+            break
+        if version not in done and _apply(conn, version, name, step):
+            applied.append((version, name))
+    return applied
+
+
+# ---------------- CLI ----------------
+
+db_cli = AppGroup("db", help="Database schema management.")
+
+
+@db_cli.command("upgrade")
+@click.option("--target", type=int, default=None, help="Stop at this version.")
+def upgrade_command(target):
+    """Apply pending schema migrations."""
+    # The catalog first: it says which other files there are
+    for path in _with_extra_databases():
+        conn = open_connection(path)
+        try:
+            applied = upgrade(conn, target)
+            label = f"{path}: " if path else ""
+            for version, name in applied:
+                click.echo(f"{label}Applied {version:04d} {name}")
+            click.echo(f"{label}Database at version {current_version(conn)}")
+        finally:
+            conn.close()
+
+
+@db_cli.command("current")
+def current_command():
+    """Show the schema version of the database."""
+    conn = open_connection()
+    try:
+        version = current_version(conn)
+        click.echo(f"Database at version {version} (latest {latest_version()})")
+    finally:
+        conn.close()
+
+
+def init_app(app):
+    app.cli.add_command(db_cli)
@@ -0,0 +1,79 @@
+import base64
+import json
+from collections import namedtuple
+
+from flask import current_app, request, url_for
+
+# ---------------- KEYSET PAGINATION ----------------
+#
+# Listings are ordered newest first on (created_at, id). Instead of OFFSET,
+# each page remembers the last row it showed and the next page starts
+# strictly after it, so every page is one index range scan of PAGE_SIZE rows
+# no matter how deep the reader goes or how large the table is.
+
+Page = namedtuple("Page", ["items", "next_cursor"])
+
+
+def page_size():
+    default = current_app.config["PAGE_SIZE"]
+    try:
+        size = int(request.args.get("limit", default))
+    except ValueError:
+        size = default
+    return max(1, min(size, current_app.config["MAX_PAGE_SIZE"]))
+
+
+def encode_cursor(row):
+    raw = json.dumps([row["created_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        created_at, row_id = json.loads(raw)
+        return str(created_at), int(row_id)
+    except (ValueError, TypeError):
+        # A mangled cursor just starts from the first page
+        return None
+
+
+def fetch_page(conn, select, where=(), params=(), alias="i", cursor=None, size=None):
+    """Run `select` (a SELECT ... FROM ... without WHERE/ORDER BY/LIMIT) for
+    one page. `where` is a list of AND-ed conditions matching `params`;
+    `alias` is the table whose created_at/id the listing is ordered by."""
+    size = size or page_size()
+    if cursor is None:
+        cursor = request.args.get("cursor")
+    clauses, args = list(where), list(params)
+
+    after = decode_cursor(cursor)
+    if after:
+        clauses.append(f"({alias}.created_at, {alias}.id) < (?, ?)")
+        args.extend(after)
+
+    sql = select
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {alias}.created_at DESC, {alias}.id DESC LIMIT ?"
+    # One extra row tells us whether there is a next page
+    rows = conn.execute(sql, args + [size + 1]).fetchall()
+
+    next_cursor = encode_cursor(rows[size - 1]) if len(rows) > size else None
+    return Page(rows[:size], next_cursor)
+
+
+def next_page_url(cursor):
+    """Current URL with the cursor advanced, keeping any other filters."""
+    args = request.args.to_dict()
+    args.pop("fragment", None)
+    args["cursor"] = cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def init_app(app):
+    app.config.setdefault("PAGE_SIZE", 20)
+    app.config.setdefault("MAX_PAGE_SIZE", 100)
+    app.add_template_global(next_page_url)
@@ -0,0 +1,313 @@
+import storage
+
+# ---------------- NAMED QUERIES ----------------
+#
+# Every statement the views in app.py run, by name. Each takes the
+# connection to run on (db.get_db / shards.read_db and friends, SQLite or
+# PostgreSQL alike, see storage.py) and sticks to SQL both understand, with
+# the odd difference asked of storage. Callers commit.
+#
+# Listings paged with pagination.fetch_page are given as SELECT ... FROM
+# fragments (the *_LISTING constants); fetch_page adds the filters, cursor
+# and ORDER BY.
+
+ISSUES_WITH_PANCHAYATH_LISTING = """
+    SELECT i.*, p.name AS panchayath_name
+    FROM issues i
+    JOIN panchayath p ON p.id = i.panchayath_id
+"""
+
+PUBLIC_ISSUES_LISTING = """
+    SELECT i.*, p.name AS panchayath_name, u.name AS user_name
+    FROM issues i
+    JOIN panchayath p ON p.id = i.panchayath_id
+    LEFT JOIN users u ON u.id = i.user_id
+"""
+
+NOTICES_LISTING = """
+    SELECT n.*, p.name AS panchayath_name
+    FROM notices n
+    JOIN panchayath p ON p.id = n.panchayath_id
+"""
+
+ADMIN_ISSUES_LISTING = """
+    SELECT i.*, u.name as reporter_name
+    FROM issues i
+    LEFT JOIN users u ON i.user_id = u.id
+"""
+
+
+def _placeholders(values):
+    return ",".join("?" * len(values))
+
+
+def schema_version(conn):
+    """Newest migration applied (raises if there's no schema yet)."""
+    return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+
+
+# ---------------- PANCHAYATHS & ACCOUNTS ----------------
+
+def count_panchayaths(conn):
+    return conn.execute("SELECT COUNT(*) FROM panchayath").fetchone()[0]
+
+
+def add_panchayath(conn, name, district, state):
+    conn.execute("""
+        INSERT INTO panchayath (name, district, state)
+        VALUES (?, ?, ?)
+    """, (name, district, state))
+
+
+def all_panchayaths(conn):
+    return conn.execute("SELECT * FROM panchayath ORDER BY id").fetchall()
+
+
+def add_admin(conn, username, password_hash, panchayath_id):
+    conn.execute("""
+        INSERT INTO admin (username, password_hash, panchayath_id)
+        VALUES (?, ?, ?)
+    """, (username, password_hash, panchayath_id))
+
+
+def admin_by_username(conn, username):
+    return conn.execute("SELECT * FROM admin WHERE username = ?", (username,)).fetchone()
+
+
+def add_user(conn, name, email, mobile, password_hash):
+    """Raises one of storage.IntegrityError if the email is taken."""
+    conn.execute("""
+        INSERT INTO users (name, email, mobile, password_hash)
+        VALUES (?, ?, ?, ?)
+    """, (name, email, mobile, password_hash))
+
+
+def user_by_email(conn, email):
+    return conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+
+
+def user_by_id(conn, user_id):
+    return conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+
+
+# ---------------- PENDING REGISTRATIONS ----------------
+
+def add_pending_registration(conn, token, name, email, mobile, password_hash, otp, sent_at, expires_at):
+    conn.execute("""
+        INSERT INTO pending_registrations
+            (token, name, email, mobile, password_hash, otp, otp_sent_at, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (token, name, email, mobile, password_hash, otp, sent_at, expires_at))
+
+
+def pending_registration(conn, token, now):
+    return conn.execute(
+        "SELECT * FROM pending_registrations WHERE token = ? AND expires_at > ?", (token, now)
+    ).fetchone()
+
+
+def set_registration_otp(conn, token, otp, sent_at):
+    conn.execute(
+        "UPDATE pending_registrations SET otp = ?, otp_sent_at = ? WHERE token = ?",
+        (otp, sent_at, token)
+    )
+
+
+def delete_pending_registration(conn, token):
+    conn.execute("DELETE FROM pending_registrations WHERE token = ?", (token,))
+
+
+def delete_expired_registrations(conn, now, limit):
+    """Returns how many were deleted (at most `limit`)."""
+    return conn.execute("""
+        DELETE FROM pending_registrations WHERE token IN (
+            SELECT token FROM pending_registrations WHERE expires_at <= ? LIMIT ?
+        )
+    """, (now, limit)).rowcount
+
+
+# ---------------- ISSUES ----------------
+
+def add_issue(conn, panchayath_id, category, description, location, photo_path, user_id):
+    conn.execute("""
+        INSERT INTO issues (panchayath_id, category, description, location, photo_path, user_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (panchayath_id, category, description, location, photo_path, user_id))
+
+
+def issue_with_reporter(conn, issue_id):
+    return conn.execute("""
+        SELECT i.*, u.name as reporter_name, u.email as reporter_email, u.mobile as reporter_mobile
+        FROM issues i
+        LEFT JOIN users u ON i.user_id = u.id
+        WHERE i.id = ?
+    """, (issue_id,)).fetchone()
+
+
+def status_totals(conn, panchayath_id):
+    """{status: issues} for a panchayath, from the analytics rollups
+    (migration 10)."""
+    return dict(conn.execute("""
+        SELECT status, SUM(count) FROM issue_totals
+        WHERE panchayath_id = ?
+        GROUP BY status
+    """, (panchayath_id,)).fetchall())
+
+
+def set_issue_status(conn, issue_id, panchayath_id, status):
+    """Returns how many issues changed (0 if it isn't this panchayath's)."""
+    return conn.execute(
+        "UPDATE issues SET status=? WHERE id=? AND panchayath_id=?",
+        (status, issue_id, panchayath_id)
+    ).rowcount
+
+
+def issues_to_update(conn, issue_ids, panchayath_id, status):
+    """Which of `issue_ids` are this panchayath's and not yet in `status`.
+    Run after storage.begin_write(); the rows stay locked until commit."""
+    return [row[0] for row in conn.execute(f"""
+        SELECT id FROM issues
+        WHERE id IN ({_placeholders(issue_ids)})
+          AND panchayath_id = ? AND status != ?
+        ORDER BY id{storage.for_update(conn)}
+    """, (*issue_ids, panchayath_id, status)).fetchall()]
+
+
+def set_statuses(conn, issue_ids, status):
+    conn.executemany(
+        "UPDATE issues SET status = ? WHERE id = ?",
+        [(status, issue_id) for issue_id in issue_ids],
+    )
+
+
+def issue_filters(panchayath_id, filters):
+    """WHERE conditions and params for a panchayath's issues narrowed by
+    the dashboard filters (status, category, since/until as YYYY-MM-DD)."""
+    where, params = ["i.panchayath_id = ?"], [panchayath_id]
+    for name in ("status", "category"):
+        if filters.get(name):
+            where.append(f"i.{name} = ?")
+            params.append(filters[name])
+    if filters.get("since"):
+        where.append("i.created_at >= ?")
+        params.append(filters["since"])
+    if filters.get("until"):
+        where.append("i.created_at <= ?")
+        params.append(filters["until"] + " 23:59:59")
+    return where, params
+
+
+def count_issues(conn, where, params):
+    return conn.execute(
+        f"SELECT COUNT(*) FROM issues i WHERE {' AND '.join(where)}", params
+    ).fetchone()[0]
+
+
+def export_issue_rows(conn, where, params):
+    """Issues for an export, newest first, read as they are iterated (a
+    server-side cursor on PostgreSQL)."""
+    return storage.iterate(conn, f"""
+        {ADMIN_ISSUES_LISTING}
+        WHERE {' AND '.join(where)}
+        ORDER BY i.created_at DESC, i.id DESC
+    """, params)
+
+
+def admin_issue_rows(conn, issue_ids):
+    return conn.execute(f"""
+        SELECT i.*, u.name as reporter_name
+        FROM issues i
+        LEFT JOIN users u ON i.user_id = u.id
+        WHERE i.id IN ({_placeholders(issue_ids)})
+        ORDER BY i.created_at DESC, i.id DESC
+    """, issue_ids).fetchall()
+
+
+def user_issue_cards(conn, issue_ids, user_id):
+    """The citizen's own issues among `issue_ids` (live updates)."""
+    return conn.execute(f"""
+        SELECT i.*, p.name AS panchayath_name
+        FROM issues i
+        JOIN panchayath p ON p.id = i.panchayath_id
+        WHERE i.id IN ({_placeholders(issue_ids)}) AND i.user_id = ?
+    """, (*issue_ids, user_id)).fetchall()
+
+
+def panchayath_issue_rows(conn, issue_ids, panchayath_id):
+    """The panchayath's issues among `issue_ids` (live updates)."""
+    return conn.execute(f"""
+        SELECT i.*, u.name as reporter_name
+        FROM issues i
+        LEFT JOIN users u ON i.user_id = u.id
+        WHERE i.id IN ({_placeholders(issue_ids)}) AND i.panchayath_id = ?
+    """, (*issue_ids, panchayath_id)).fetchall()
+
+
+# ---------------- EXPORT JOBS ----------------
+
+def add_export_job(conn, panchayath_id, admin_id, fmt, filters, now):
+    """Returns the new job's id."""
+    return conn.execute("""
+        INSERT INTO export_jobs (panchayath_id, admin_id, format, filters, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        RETURNING id
+    """, (panchayath_id, admin_id, fmt, filters, now, now)).fetchone()[0]
+
+
+def export_job(conn, job_id):
+    return conn.execute("SELECT * FROM export_jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def panchayath_export_jobs(conn, panchayath_id, limit=20):
+    return conn.execute("""
+        SELECT * FROM export_jobs
+        WHERE panchayath_id = ?
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    """, (panchayath_id, limit)).fetchall()
+
+
+def update_export_job(conn, job_id, now, **columns):
+    assignments = ", ".join(f"{name} = ?" for name in columns)
+    conn.execute(f"UPDATE export_jobs SET {assignments}, updated_at = ? WHERE id = ?",
+                 (*columns.values(), now, job_id))
+
+
+def expired_export_jobs(conn, before, limit):
+    return conn.execute(
+        "SELECT id, path FROM export_jobs WHERE created_at < ? ORDER BY created_at LIMIT ?",
+        (before, limit)
+    ).fetchall()
+
+
+def delete_export_jobs(conn, job_ids):
+    conn.execute(f"DELETE FROM export_jobs WHERE id IN ({_placeholders(job_ids)})", job_ids)
+
+
+# ---------------- NOTICES ----------------
+
+def add_notice(conn, panchayath_id, title, description, banner_path):
+    conn.execute("""
+        INSERT INTO notices (panchayath_id, title, description, banner_path)
+        VALUES (?, ?, ?, ?)
+    """, (panchayath_id, title, description, banner_path))
+
+
+def panchayath_notices(conn, panchayath_id):
+    """Every notice of a panchayath, newest first, read as it is iterated
+    (a server-side cursor on PostgreSQL)."""
+    return storage.iterate(conn, """
+        SELECT * FROM notices
+        WHERE panchayath_id = ?
+        ORDER BY created_at DESC
+    """, (panchayath_id,))
+
+
+def panchayath_notice(conn, notice_id, panchayath_id):
+    return conn.execute(
+        "SELECT * FROM notices WHERE id = ? AND panchayath_id = ?", (notice_id, panchayath_id)
+    ).fetchone()
+
+
+def delete_notice(conn, notice_id):
+    conn.execute("DELETE FROM notices WHERE id = ?", (notice_id,))
@@ -1,4 +1,5 @@
--- schema.sql (Updated to match current production structure)
+-- schema.sql (Reference snapshot of the current production structure)
+-- migrations.py is the source of truth; apply changes with `flask db upgrade`.
 
 CREATE TABLE IF NOT EXISTS panchayath (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -34,6 +35,7 @@ CREATE TABLE IF NOT EXISTS issues (
     photo_path TEXT,
     status TEXT DEFAULT 'Pending',
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    completed_at DATETIME,  -- set by triggers when the status becomes Completed
     FOREIGN KEY (panchayath_id) REFERENCES panchayath(id) ON DELETE CASCADE,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
 );
@@ -43,10 +45,148 @@ CREATE TABLE IF NOT EXISTS notices (
     panchayath_id INTEGER,
     title TEXT,
     description TEXT,
+    banner_path TEXT,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (panchayath_id) REFERENCES panchayath(id) ON DELETE CASCADE
 );
 
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT,
+    applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_issues_panchayath_created ON issues(panchayath_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_issues_user_created ON issues(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_issues_status ON issues(status);
+CREATE INDEX IF NOT EXISTS idx_notices_panchayath_created ON notices(panchayath_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_issues_created ON issues(created_at);
+CREATE INDEX IF NOT EXISTS idx_notices_created ON notices(created_at);
+CREATE INDEX IF NOT EXISTS idx_issues_panchayath_status ON issues(panchayath_id, status);
+CREATE INDEX IF NOT EXISTS idx_issues_completed ON issues(completed_at) WHERE completed_at IS NOT NULL;
+
+-- Home page counters, kept exact by the stats_* triggers (see migrations.py)
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+
+-- Outgoing email queue drained by mailer.py
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    locked_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON email_outbox(status, next_attempt_at);
+
+-- Reference counts for content-addressed uploads (uploads.py)
+CREATE TABLE IF NOT EXISTS upload_refs (
+    path TEXT PRIMARY KEY,
+    refcount INTEGER NOT NULL,
+    size INTEGER,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Full-text indexes over issues and notices, kept in sync by the *_fts_*
+-- triggers (see migrations.py)
+CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts USING fts5(
+    description, location, category,
+    content='issues', content_rowid='id', prefix='2 3',
+    tokenize="unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notices_fts USING fts5(
+    title, description,
+    content='notices', content_rowid='id', prefix='2 3',
+    tokenize="unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+);
+
+-- Per-panchayath write counters for API ETags, bumped by the changes_*
+-- triggers (see migrations.py)
+CREATE TABLE IF NOT EXISTS change_counters (
+    resource TEXT NOT NULL,
+    panchayath_id INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (resource, panchayath_id)
+) WITHOUT ROWID;
+
+-- Append-only history of new issues and status changes, filled by the
+-- issue_events_* triggers (see migrations.py)
+CREATE TABLE IF NOT EXISTS issue_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    issue_id INTEGER NOT NULL,
+    panchayath_id INTEGER,
+    user_id INTEGER,
+    kind TEXT NOT NULL,
+    status TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    category TEXT,
+    from_status TEXT
+);
+
+-- Live update feed: the newest 10000 issue_events, copied and trimmed by
+-- the live_events_feed trigger (see migrations.py)
+CREATE TABLE IF NOT EXISTS live_events (
+    id INTEGER PRIMARY KEY,
+    issue_id INTEGER NOT NULL,
+    panchayath_id INTEGER,
+    user_id INTEGER,
+    kind TEXT NOT NULL,
+    status TEXT
+);
+
+-- Analytics rollups, kept current by the rollup_* triggers (see
+-- migrations.py)
+CREATE TABLE IF NOT EXISTS issue_daily (
+    panchayath_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL,
+    reported INTEGER NOT NULL DEFAULT 0,
+    entered INTEGER NOT NULL DEFAULT 0,
+    exited INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (panchayath_id, day, category, status)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS issue_resolutions_daily (
+    panchayath_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    resolved INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (panchayath_id, day, category, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS issue_totals (
+    panchayath_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (panchayath_id, category, status)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_panchayath_state_district ON panchayath(state, district);
+
+-- Shard catalog (SHARDING=district or panchayath, see shards.py)
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE NOT NULL,
+    path TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS panchayath_shards (
+    panchayath_id INTEGER PRIMARY KEY,
+    shard_id INTEGER NOT NULL REFERENCES shards(id)
+);
+
 -- Seed Initial Data
 -- INSERT INTO panchayath (name, district, state) VALUES ('Demo Panchayath', 'Demo District', 'Demo State');
 -- INSERT INTO admin (username, password_hash, panchayath_id) VALUES ('admin', 'pbkdf2:sha256:260000$...', 1);
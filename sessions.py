@@ -0,0 +1,297 @@
+import os
+import pickle
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import click
+from flask import current_app, session
+from flask.cli import AppGroup
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# ---------------- SERVER-SIDE SESSIONS ----------------
+#
+# Flask's default session is the data itself, signed, in a cookie: it grows
+# with everything put in it, is re-sent and re-verified on every request,
+# and the client can read it. Here the cookie carries only a random session
+# id and the data stays on the server:
+#
+#   SESSION_BACKEND=sqlite   a database file of its own (SESSION_PATH) that
+#                            every worker on the host shares (the default)
+#   SESSION_BACKEND=memory   an LRU inside the process; one worker only
+#   SESSION_BACKEND=cookie   Flask's signed cookie, as before
+#
+# Sessions live PERMANENT_SESSION_LIFETIME past their last write; reading
+# one in the second half of that extends it. Static files never load the
+# session. A reaper thread in each process deletes expired sessions, and
+# whatever else is registered with register_sweeper(), in batches.
+
+# Rows (or entries) a sweep deletes per transaction
+REAP_BATCH = 500
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.modified = False
+        self.regenerate = False
+
+
+# ---------------- STORES ----------------
+
+class MemoryStore:
+    """LRU bounded to `max_entries`, private to this process."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, sid):
+        with self.lock:
+            hit = self.entries.get(sid)
+            if hit is None or hit[0] <= time.time():
+                return None
+            self.entries.move_to_end(sid)
+            return pickle.loads(hit[1]), hit[0]
+
+    def set(self, sid, data, expires):
+        with self.lock:
+            self.entries[sid] = (expires, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+            self.entries.move_to_end(sid)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def touch(self, sid, expires):
+        with self.lock:
+            hit = self.entries.get(sid)
+            if hit is not None:
+                self.entries[sid] = (expires, hit[1])
+
+    def delete(self, sid):
+        with self.lock:
+            self.entries.pop(sid, None)
+
+    def prune(self, limit):
+        now = time.time()
+        with self.lock:
+            expired = [sid for sid, (expires, _) in self.entries.items() if expires <= now][:limit]
+            for sid in expired:
+                del self.entries[sid]
+        return len(expired)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteStore:
+    """Sessions in their own database file, shared by every worker.
+
+    Kept apart from the main database so session writes (a login, every
+    flash message) never queue behind the application's write lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def _conn(self):
+        pid = os.getpid()
+        if getattr(self.local, "pid", None) != pid:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    expires REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires)")
+            self.local.pid, self.local.conn = pid, conn
+        return self.local.conn
+
+    def get(self, sid):
+        row = self._conn().execute(
+            "SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())
+        ).fetchone()
+        return (pickle.loads(row[0]), row[1]) if row else None
+
+    def set(self, sid, data, expires):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+            (sid, pickle.dumps(data, pickle.HIGHEST_PROTOCOL), expires),
+        )
+
+    def touch(self, sid, expires):
+        self._conn().execute("UPDATE sessions SET expires = ? WHERE sid = ?", (expires, sid))
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def prune(self, limit):
+        return self._conn().execute("""
+            DELETE FROM sessions WHERE sid IN (
+                SELECT sid FROM sessions WHERE expires <= ? LIMIT ?
+            )
+        """, (time.time(), limit)).rowcount
+
+    def clear(self):
+        self._conn().execute("DELETE FROM sessions")
+
+
+# ---------------- SESSION INTERFACE ----------------
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        if app.static_url_path and request.path.startswith(app.static_url_path + "/"):
+            return self.make_null_session(app)
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            found = self.store.get(sid)
+            if found is not None:
+                return ServerSession(found[0], sid, found[1])
+        # Unknown or expired ids are never adopted; a new one is issued
+        # when there is something to store
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+
+        if session.sid is not None and (session.regenerate or (session.modified and not session)):
+            self.store.delete(session.sid)
+            if not session:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+                return
+            session.sid = None
+        if not session:
+            return
+
+        new = session.sid is None
+        if new or session.modified:
+            session.sid = session.sid or secrets.token_urlsafe(32)
+            self.store.set(session.sid, dict(session), now + lifetime)
+        elif session.expires - now < lifetime / 2:
+            self.store.touch(session.sid, now + lifetime)
+        else:
+            response.vary.add("Cookie")
+            return
+
+        response.vary.add("Cookie")
+        # A browser-session cookie only needs sending once; a permanent
+        # one whenever its expiry moves
+        if new or session.permanent:
+            response.set_cookie(name, session.sid,
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app),
+                                domain=domain, path=path,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+
+def regenerate():
+    """Move the current session to a new id, e.g. on login, so an id
+    planted before it can't ride along. A no-op with cookie sessions."""
+    if isinstance(session._get_current_object(), ServerSession):
+        session.regenerate = True
+        session.modified = True
+
+
+# ---------------- REAPER ----------------
+
+_sweepers = []
+_reaper_pid = None
+_reaper_lock = threading.Lock()
+
+
+def register_sweeper(sweep):
+    """Have the reaper call sweep(limit) in an app context: it deletes up to
+    `limit` expired rows and returns how many it deleted."""
+    if sweep not in _sweepers:
+        _sweepers.append(sweep)
+
+
+def _reap(app, interval):
+    pid = os.getpid()
+    while os.getpid() == pid:
+        time.sleep(interval)
+        store = app.extensions["session_store"]
+        for sweep in ([store.prune] if store is not None else []) + _sweepers:
+            try:
+                with app.app_context():
+                    while sweep(REAP_BATCH) >= REAP_BATCH:
+                        pass
+            except Exception as e:
+                # Keep reaping after transient errors (a locked database)
+                print(f"Session reaper error: {e}")
+
+
+def ensure_reaper(app):
+    """Start this process's reaper thread if it isn't running yet."""
+    global _reaper_pid
+    if _reaper_pid == os.getpid():
+        return
+    with _reaper_lock:
+        if _reaper_pid != os.getpid():
+            threading.Thread(target=_reap, args=(app, app.config["SESSION_REAP_INTERVAL"]),
+                             name="session-reaper", daemon=True).start()
+            _reaper_pid = os.getpid()
+
+
+# ---------------- CLI ----------------
+
+session_cli = AppGroup("sessions", help="Server-side session store.")
+
+
+@session_cli.command("clear")
+def clear_command():
+    """Log everyone out."""
+    store = current_app.extensions["session_store"]
+    if store is None:
+        raise click.ClickException("SESSION_BACKEND=cookie keeps sessions in the browser")
+    store.clear()
+    click.echo("Sessions cleared")
+
+
+def init_app(app):
+    app.config.setdefault("SESSION_BACKEND", os.environ.get("SESSION_BACKEND", "sqlite"))
+    app.config.setdefault("SESSION_PATH", os.environ.get("SESSION_PATH", "database/sessions.db"))
+    app.config.setdefault("SESSION_MAX_ENTRIES", int(os.environ.get("SESSION_MAX_ENTRIES", "10000")))
+    app.config.setdefault("SESSION_REAP_INTERVAL", float(os.environ.get("SESSION_REAP_INTERVAL", "60")))
+
+    backend = app.config["SESSION_BACKEND"]
+    if backend == "sqlite":
+        store = SQLiteStore(app.config["SESSION_PATH"])
+    elif backend == "memory":
+        store = MemoryStore(app.config["SESSION_MAX_ENTRIES"])
+    elif backend == "cookie":
+        store = None
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND {backend!r}")
+    app.extensions["session_store"] = store
+    if store is not None:
+        app.session_interface = ServerSessionInterface(store)
+
+    app.before_request(lambda: ensure_reaper(app))
+    app.cli.add_command(session_cli)
@@ -0,0 +1,516 @@
+import heapq
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, request
+from flask.cli import AppGroup
+from werkzeug.exceptions import BadRequest
+
+import db
+import metrics
+import migrations
+import pagination
+import storage
+import uploads
+from pagination import Page
+
+# ---------------- SHARDING ----------------
+#
+# With SHARDING=district (or panchayath), issues and notices live in one
+# SQLite file per district (or per panchayath) under SHARD_DIR, each with
+# its own write lock, so reports and status changes in one district never
+# queue behind another's. The main database becomes the catalog: the
+# panchayath, users and admin tables, the mail outbox, and the shards /
+# panchayath_shards tables (migration 11) saying which file holds whose
+# issues. Shard connections attach the catalog read-only
+# (db.open_connection), so queries joining issues to panchayath or users
+# run unchanged.
+#
+# Anything scoped to one panchayath - every admin page, reporting an issue -
+# talks to that panchayath's shard only. Listings across panchayaths (the
+# public tracker, notices, search, a citizen's own issues) ask every shard
+# in parallel for its first page after the cursor and merge them.
+#
+# New shard files start their AUTOINCREMENT counters at shard_id << ID_BITS,
+# so ids stay unique across shards and an event id says which shard it came
+# from. Rows moved over by `flask shards split` keep their original ids.
+#
+# SHARDING=none (the default) keeps everything in the one file.
+
+MODES = ("none", "district", "panchayath")
+ID_BITS = 40
+# Tables whose ids must not collide across shards
+SEQUENCED = ("issues", "notices", "issue_events")
+# How stale this process's copy of the shard list may get; shards created
+# by another worker show up in fan-outs within this many seconds
+REFRESH_SECONDS = 10
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _slug(key):
+    return re.sub(r"[^a-z0-9]+", "-", key.lower()).strip("-")[:40] or "shard"
+
+
+def prepare(path, shard_id):
+    """Create a shard file, or bring an existing one up to date."""
+    conn = db.open_connection(path)
+    try:
+        migrations.upgrade(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        base = shard_id << ID_BITS
+        for table in SEQUENCED:
+            updated = conn.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (base, table)
+            ).rowcount
+            if not updated:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, base))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class ShardMap:
+    """Which shard file holds each panchayath, cached per process.
+
+    A panchayath is placed the first time anything asks for it and never
+    moves afterwards, so cached placements are always right; only the list
+    of shards is refreshed periodically for fan-outs.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.by_panchayath = {}
+        self.paths = {}
+        self.loaded_at = None
+
+    @property
+    def catalog(self):
+        return self.config["DATABASE"]
+
+    @property
+    def mode(self):
+        return self.config["SHARDING"]
+
+    def refresh(self):
+        conn = db.thread_connection(self.catalog)
+        paths = {row["id"]: row["path"] for row in conn.execute("SELECT id, path FROM shards ORDER BY id")}
+        placed = dict(conn.execute("SELECT panchayath_id, shard_id FROM panchayath_shards").fetchall())
+        with self.lock:
+            self.paths, self.by_panchayath = paths, placed
+            self.loaded_at = time.monotonic()
+
+    def current(self):
+        """{shard id: path}, at most REFRESH_SECONDS old."""
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > REFRESH_SECONDS:
+            self.refresh()
+        return self.paths
+
+    def shard_of(self, panchayath_id, create=True):
+        """Shard id of a panchayath, placing it if it has none yet. None
+        for a panchayath that doesn't exist."""
+        shard = self.by_panchayath.get(panchayath_id)
+        if shard is None:
+            self.refresh()
+            shard = self.by_panchayath.get(panchayath_id)
+        if shard is None and create:
+            shard = self._place(panchayath_id)
+        return shard
+
+    def path(self, shard_id):
+        if shard_id not in self.paths:
+            self.refresh()
+        return self.paths[shard_id]
+
+    def _key(self, home):
+        if self.mode == "district":
+            return f"{home['state'] or ''}/{home['district'] or ''}"
+        return f"p{home['id']}"
+
+    def _place(self, panchayath_id):
+        conn = db.open_connection(self.catalog)
+        try:
+            home = conn.execute(
+                "SELECT id, district, state FROM panchayath WHERE id = ?", (panchayath_id,)
+            ).fetchone()
+            if home is None:
+                return None
+            # The catalog's write lock makes placement atomic across workers
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT shard_id FROM panchayath_shards WHERE panchayath_id = ?", (panchayath_id,)
+            ).fetchone()
+            if row is not None:
+                shard = row[0]
+            else:
+                key = self._key(home)
+                found = conn.execute("SELECT id FROM shards WHERE key = ?", (key,)).fetchone()
+                if found is not None:
+                    shard = found[0]
+                else:
+                    shard = conn.execute("INSERT INTO shards (key, path) VALUES (?, '')", (key,)).lastrowid
+                    path = os.path.join(self.config["SHARD_DIR"], f"{shard:04d}-{_slug(key)}.db")
+                    prepare(path, shard)
+                    conn.execute("UPDATE shards SET path = ? WHERE id = ?", (path, shard))
+                    print(f"Created shard {shard} for {key} at {path}")
+                conn.execute(
+                    "INSERT INTO panchayath_shards (panchayath_id, shard_id) VALUES (?, ?)",
+                    (panchayath_id, shard),
+                )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self.refresh()
+        return shard
+
+    def sources(self):
+        """(shard id, path) of every database that records issue events.
+        Shard 0 is the main database when sharding is off."""
+        if self.mode == "none":
+            return [(0, self.catalog)]
+        return sorted(self.current().items())
+
+    def database_paths(self):
+        """Every shard file, for `flask db upgrade` and search rebuilds."""
+        conn = db.open_connection(self.catalog, readonly=True)
+        try:
+            return [row[0] for row in conn.execute("SELECT path FROM shards ORDER BY id")]
+        finally:
+            conn.close()
+
+    def referenced_elsewhere(self, conn, upload_path):
+        """Whether a database other than `conn`'s still references an
+        upload; each shard's upload_refs only counts its own rows."""
+        main = next(row for row in conn.execute("PRAGMA database_list") if row["name"] == "main")
+        own = os.path.realpath(main["file"])
+        for path in [self.catalog, *self.current().values()]:
+            if os.path.realpath(path) == own:
+                continue
+            other = db.thread_connection(path)
+            if other.execute("SELECT 1 FROM upload_refs WHERE path = ?", (upload_path,)).fetchone():
+                return True
+        return False
+
+
+def shard_map():
+    return current_app.extensions["shards"]
+
+
+def enabled():
+    return shard_map().mode != "none"
+
+
+def paths():
+    """Every shard file, in shard order (none when sharding is off)."""
+    if not enabled():
+        return []
+    return list(shard_map().current().values())
+
+
+def _shard_path(panchayath_id):
+    try:
+        panchayath_id = int(panchayath_id)
+    except (TypeError, ValueError):
+        raise BadRequest("Unknown panchayath.")
+    shards = shard_map()
+    shard = shards.shard_of(panchayath_id)
+    if shard is None:
+        raise BadRequest("Unknown panchayath.")
+    return shards.path(shard)
+
+
+def database_of(panchayath_id):
+    """File holding a panchayath's issues and notices."""
+    if not enabled():
+        return db.database_path()
+    return _shard_path(panchayath_id)
+
+
+def read_db(panchayath_id):
+    """Read-only connection to the database holding a panchayath's issues
+    and notices."""
+    if not enabled():
+        return db.get_read_db()
+    return db.get_shard_db(_shard_path(panchayath_id), readonly=True)
+
+
+def write_db(panchayath_id):
+    """Read/write connection to the database holding a panchayath's issues
+    and notices."""
+    if not enabled():
+        return db.get_db()
+    return db.get_shard_db(_shard_path(panchayath_id))
+
+
+def connect(path, readonly=True):
+    """Request connection to one of the databases from ShardMap.sources()."""
+    if path == db.database_path():
+        return db.get_read_db() if readonly else db.get_db()
+    return db.get_shard_db(path, readonly)
+
+
+def shard_ids(condition, params):
+    """Shards holding the panchayaths matched by a condition on
+    panchayath_id (as built by analytics.scope_filter); None for all."""
+    if not enabled():
+        return None
+    rows = db.get_read_db().execute(
+        f"SELECT DISTINCT shard_id FROM panchayath_shards WHERE {condition}", params
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+# ---------------- FAN-OUT ----------------
+
+def _get_executor(workers):
+    global _executor, _executor_pid
+    with _executor_lock:
+        # Pools don't survive fork(); each gunicorn worker builds its own
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shards")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def fan_out(fn, shard_ids=None, catalog=False):
+    """[fn(conn), ...] for each database holding issues and notices: the
+    main database when sharding is off, else every shard (or those in
+    `shard_ids`), queried in parallel. With catalog=True the main
+    database's result comes first in either case.
+
+    `fn` runs on helper threads: it gets a read-only connection and must
+    not touch request or g, so read request arguments before calling.
+    """
+    if not enabled():
+        return [fn(db.get_read_db())]
+    results = [fn(db.get_read_db())] if catalog else []
+    targets = [path for shard, path in shard_map().current().items()
+               if shard_ids is None or shard in shard_ids]
+    if len(targets) == 1:
+        return results + [fn(db.get_shard_db(targets[0], readonly=True))]
+
+    main = db.database_path()
+    route = metrics.current_route()
+
+    def run(path):
+        with metrics.route(route):
+            return fn(db.thread_connection(path, catalog=main))
+
+    executor = _get_executor(current_app.config["SHARD_FANOUT_THREADS"])
+    return results + list(executor.map(run, targets))
+
+
+def merge_pages(pages, size, key, encode, reverse=False):
+    """Combine first pages of the same listing from several shards, each
+    ordered by `key`, into one page; `encode` makes the next cursor."""
+    if len(pages) == 1:
+        return pages[0]
+    rows = list(heapq.merge(*(page.items for page in pages), key=key, reverse=reverse))
+    # A shard that filled its page may have more than the merged page shows
+    more = len(rows) > size or any(page.next_cursor for page in pages)
+    return Page(rows[:size], encode(rows[size - 1]) if more else None)
+
+
+def fetch_page(select, where=(), params=(), alias="i"):
+    """pagination.fetch_page over every shard, newest first."""
+    size = pagination.page_size()
+    cursor = request.args.get("cursor", "")
+    pages = fan_out(lambda conn: pagination.fetch_page(conn, select, where, params, alias, cursor, size))
+    return merge_pages(pages, size, lambda row: (row["created_at"], row["id"]),
+                       pagination.encode_cursor, reverse=True)
+
+
+def stats():
+    """Home page counters (migration 4), summed over every database."""
+    totals = {}
+    for rows in fan_out(lambda conn: conn.execute("SELECT name, value FROM stats").fetchall(), catalog=True):
+        for name, value in rows:
+            totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def change_versions(pairs):
+    """{(resource, panchayath_id): version} from change_counters (migration
+    8), summed over the main database and the shards involved. Each part
+    only ever grows, so the sum changes whenever any of them does."""
+    if not pairs:
+        return {}
+    sql = ("SELECT resource, panchayath_id, version FROM change_counters WHERE "
+           + " OR ".join(["(resource = ? AND panchayath_id = ?)"] * len(pairs)))
+    args = [value for pair in pairs for value in pair]
+    targets = None
+    if enabled() and all(panchayath_id for _, panchayath_id in pairs):
+        targets = {shard_map().shard_of(panchayath_id, create=False) for _, panchayath_id in pairs}
+    found = {}
+    for rows in fan_out(lambda conn: conn.execute(sql, args).fetchall(), targets, catalog=True):
+        for resource, panchayath_id, version in rows:
+            found[(resource, panchayath_id)] = found.get((resource, panchayath_id), 0) + version
+    return found
+
+
+# ---------------- SPLITTING ----------------
+
+def _copy_into(shard, path, catalog):
+    """Copy the shard's panchayaths' issues and notices from the catalog.
+    One transaction per shard; rows already copied are skipped."""
+    conn = db.open_connection(path, catalog=catalog)
+    mine = "SELECT panchayath_id FROM catalog.panchayath_shards WHERE shard_id = ?"
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        last_event = conn.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'issue_events'"
+        ).fetchone()[0]
+        moved = {}
+        for table in ("issues", "notices"):
+            ours = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+            theirs = {row[1] for row in conn.execute(f"PRAGMA catalog.table_info({table})")}
+            columns = ", ".join(name for name in ours if name in theirs)
+            moved[table] = conn.execute(f"""
+                INSERT OR IGNORE INTO main.{table} ({columns})
+                SELECT {columns} FROM catalog.{table} WHERE panchayath_id IN ({mine})
+            """, (shard,)).rowcount
+
+        if moved["issues"] or moved["notices"]:
+            # The insert triggers logged every copy as a new issue. Replace
+            # those with the copied issues' real history, which live clients
+            # must not see either; the rollups the triggers built only know
+            # each issue's current status, so take the real ones too
+            logged = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'issue_events'"
+            ).fetchone()[0]
+            conn.execute("""
+                INSERT INTO main.issue_events
+                    (issue_id, panchayath_id, user_id, kind, status, created_at, category, from_status)
+                SELECT issue_id, panchayath_id, user_id, kind, status, created_at, category, from_status
+                FROM catalog.issue_events
+                WHERE issue_id IN (SELECT issue_id FROM main.issue_events WHERE id > ? AND id <= ?)
+                ORDER BY id
+            """, (last_event, logged))
+            conn.execute("DELETE FROM issue_events WHERE id > ? AND id <= ?", (last_event, logged))
+            conn.execute("DELETE FROM live_events WHERE id > ?", (last_event,))
+            for table in ("issue_daily", "issue_resolutions_daily", "issue_totals"):
+                conn.execute(f"DELETE FROM main.{table} WHERE panchayath_id IN ({mine})", (shard,))
+                conn.execute(f"""
+                    INSERT INTO main.{table}
+                    SELECT * FROM catalog.{table} WHERE panchayath_id IN ({mine})
+                """, (shard,))
+            conn.execute("""
+                INSERT INTO upload_refs (path, refcount, size)
+                SELECT used.path, COUNT(*), refs.size
+                FROM (SELECT photo_path AS path FROM main.issues WHERE photo_path IS NOT NULL
+                      UNION ALL
+                      SELECT banner_path FROM main.notices WHERE banner_path IS NOT NULL) AS used
+                JOIN catalog.upload_refs refs ON refs.path = used.path
+                GROUP BY used.path
+                ON CONFLICT (path) DO UPDATE SET refcount = excluded.refcount
+            """)
+        conn.commit()
+        return moved
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _clear_catalog(conn):
+    """Drop what the shards now hold from the catalog. Returns how many
+    issues are left (those of no known panchayath)."""
+    placed = "SELECT panchayath_id FROM panchayath_shards"
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # The shards have their own copy of the issue_events history now
+        for table in ("issues", "notices", "issue_events", "live_events",
+                      "issue_daily", "issue_resolutions_daily", "issue_totals"):
+            conn.execute(f"DELETE FROM {table} WHERE panchayath_id IN ({placed})")
+        # References now counted by the shards; the files stay
+        conn.execute("""
+            DELETE FROM upload_refs WHERE path NOT IN (
+                SELECT photo_path FROM issues WHERE photo_path IS NOT NULL
+                UNION
+                SELECT banner_path FROM notices WHERE banner_path IS NOT NULL
+            )
+        """)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return conn.execute("SELECT COUNT(*) FROM issues").fetchone()[0]
+
+
+# ---------------- CLI ----------------
+
+shards_cli = AppGroup("shards", help="Per-district or per-panchayath database shards.")
+
+
+@shards_cli.command("list")
+def list_command():
+    """Show the shards and how many panchayaths each holds."""
+    conn = db.open_connection(readonly=True)
+    try:
+        rows = conn.execute("""
+            SELECT s.id, s.key, s.path, COUNT(ps.panchayath_id) AS panchayaths
+            FROM shards s
+            LEFT JOIN panchayath_shards ps ON ps.shard_id = s.id
+            GROUP BY s.id
+            ORDER BY s.id
+        """).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        click.echo("No shards yet")
+    for row in rows:
+        click.echo(f"{row['id']:>4}  {row['path']}  {row['key']}  {row['panchayaths']} panchayath(s)")
+
+
+@shards_cli.command("split")
+def split_command():
+    """Move issues and notices from the main database into shards.
+
+    Stop the web and worker processes first. Safe to run again if it was
+    interrupted.
+    """
+    shards = shard_map()
+    if shards.mode == "none":
+        raise click.ClickException("Set SHARDING=district or SHARDING=panchayath first.")
+    conn = db.open_connection()
+    try:
+        for (panchayath_id,) in conn.execute("SELECT id FROM panchayath ORDER BY id").fetchall():
+            shards.shard_of(panchayath_id)
+        shards.refresh()
+        for shard, path in sorted(shards.paths.items()):
+            moved = _copy_into(shard, path, shards.catalog)
+            click.echo(f"{path}: {moved['issues']} issue(s), {moved['notices']} notice(s) copied")
+        left = _clear_catalog(conn)
+    finally:
+        conn.close()
+    if left:
+        click.echo(f"{left} issue(s) of unknown panchayaths stay in the main database")
+    click.echo("Done. VACUUM the main database to give the space back.")
+
+
+def init_app(app):
+    app.config.setdefault("SHARDING", os.environ.get("SHARDING", "none"))
+    app.config.setdefault("SHARD_DIR", os.environ.get("SHARD_DIR", "database/shards"))
+    app.config.setdefault("SHARD_FANOUT_THREADS", int(os.environ.get("SHARD_FANOUT_THREADS", "8")))
+    if app.config["SHARDING"] not in MODES:
+        raise ValueError(f"Unknown SHARDING {app.config['SHARDING']!r} (none, district or panchayath)")
+    if app.config["SHARDING"] != "none" and storage.is_postgres():
+        raise ValueError("SHARDING splits SQLite files; it can't be used with a PostgreSQL DATABASE_URL")
+
+    shards = ShardMap(app.config)
+    app.extensions["shards"] = shards
+    migrations.register_databases(shards.database_paths)
+    if app.config["SHARDING"] != "none":
+        uploads.referenced_elsewhere = shards.referenced_elsewhere
+    app.cli.add_command(shards_cli)
@@ -0,0 +1,331 @@
+// Shared behaviour for every page rendered from base.html.
+// Served fingerprinted and precompressed (see assets.py), so keep page data
+// out of this file: flash messages arrive via the #flashMessages JSON block.
+
+// ---------------- NAVIGATION MENU ----------------
+
+document.addEventListener('DOMContentLoaded', function () {
+    const burgerBtn = document.getElementById('burgerBtn');
+    const closeBtn = document.getElementById('closeBtn');
+    const navContent = document.getElementById('navContent');
+    const navOverlay = document.getElementById('navOverlay');
+
+    function toggleMenu() {
+        navContent.classList.toggle('active');
+        navOverlay.classList.toggle('active');
+        document.body.classList.toggle('no-scroll');
+
+        // Hide language selector when menu is open to prevent overlap
+        const langWidget = document.querySelector('.language-selector-widget');
+        if (langWidget) {
+            if (navContent.classList.contains('active')) {
+                langWidget.style.display = 'none';
+            } else {
+                langWidget.style.display = 'block';
+            }
+        }
+    }
+
+    if (burgerBtn) burgerBtn.addEventListener('click', toggleMenu);
+    if (closeBtn) closeBtn.addEventListener('click', toggleMenu);
+    if (navOverlay) navOverlay.addEventListener('click', toggleMenu);
+
+    // Close menu when clicking a link
+    const navLinks = document.querySelectorAll('.nav-links a');
+    navLinks.forEach(link => {
+        link.addEventListener('click', () => {
+            if (navContent.classList.contains('active')) {
+                toggleMenu();
+            }
+        });
+    });
+});
+
+// ---------------- LANGUAGE SELECTOR ----------------
+
+document.addEventListener('DOMContentLoaded', function () {
+    const langToggleBtn = document.getElementById('langToggleBtn');
+    const langDropdown = document.getElementById('langDropdown');
+    if (!langToggleBtn || !langDropdown) return;
+
+    langToggleBtn.addEventListener('click', function (e) {
+        e.stopPropagation();
+        langDropdown.classList.toggle('show');
+    });
+
+    // Close dropdown when clicking outside
+    document.addEventListener('click', function () {
+        langDropdown.classList.remove('show');
+    });
+
+    // Prevent dropdown from closing when clicking inside it
+    langDropdown.addEventListener('click', function (e) {
+        e.stopPropagation();
+    });
+});
+
+// ---------------- BANNER SLIDER ----------------
+
+document.addEventListener('DOMContentLoaded', function () {
+    const slides = document.querySelectorAll('.banner-img');
+    if (slides.length > 1) {
+        let currentIndex = 0;
+        setInterval(() => {
+            slides[currentIndex].classList.remove('active');
+            currentIndex = (currentIndex + 1) % slides.length;
+            slides[currentIndex].classList.add('active');
+        }, 1000);
+    }
+});
+
+// ---------------- FLASH POPUPS ----------------
+
+document.addEventListener('DOMContentLoaded', function () {
+    // Get messages from Flask
+    const source = document.getElementById('flashMessages');
+    const messages = source ? JSON.parse(source.textContent) : [];
+
+    messages.forEach(([category, message]) => {
+        createPopup(message, category);
+    });
+});
+
+function createPopup(message, type = 'info') {
+    const container = document.getElementById('popup-overlay');
+
+    // Map flask categories to design
+    let title = 'Info';
+    let iconPath = '';
+    let colorClass = '';
+
+    if (type === 'success') {
+        title = 'Success';
+        colorClass = 'popup-success';
+        // Checkmark
+        iconPath = '<path d="M20 6L9 17l-5-5" stroke-linecap="round" stroke-linejoin="round"></path>';
+    } else if (type === 'danger' || type === 'error') {
+        title = 'Error';
+        colorClass = 'popup-error';
+        // X Icon
+        iconPath = '<path d="M18 6L6 18M6 6l12 12" stroke-linecap="round" stroke-linejoin="round"></path>';
+    } else if (type === 'warning') {
+        title = 'Warning';
+        colorClass = 'popup-warning';
+        // Exclamation
+        iconPath = '<path d="M12 9v2m0 4h.01m-6.938 4h13.856c1.54 0 2.502-1.667 1.732-3L13.732 4c-.77-1.333-2.694-1.333-3.464 0L3.34 16c-.77 1.333.192 3 1.732 3z" stroke-linecap="round" stroke-linejoin="round"></path>';
+    } else {
+        title = 'Notice';
+        colorClass = 'popup-info';
+        // Info
+        iconPath = '<path d="M13 16h-1v-4h-1m1-4h.01M21 12a9 9 0 11-18 0 9 9 0 0118 0z" stroke-linecap="round" stroke-linejoin="round"></path>';
+    }
+
+    const popup = document.createElement('div');
+    popup.className = 'popup-card';
+
+    popup.innerHTML = `
+        <div class="popup-icon-wrapper ${colorClass}">
+            <svg width="40" height="40" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="3">
+                ${iconPath}
+            </svg>
+        </div>
+        <h3 class="popup-title">${title}</h3>
+        <p class="popup-message">${message}</p>
+        <button class="popup-btn ${colorClass}" onclick="closePopup(this)">OK</button>
+    `;
+
+    container.appendChild(popup);
+    container.classList.add('active'); // Show overlay
+}
+
+function closePopup(btn) {
+    const popup = btn.closest('.popup-card');
+    popup.classList.add('closing');
+
+    // Remove after animation
+    setTimeout(() => {
+        popup.remove();
+
+        // If no more popups, hide overlay
+        const container = document.getElementById('popup-overlay');
+        if (container.children.length === 0) {
+            container.classList.remove('active');
+        }
+    }, 300);
+}
+
+// ---------------- IMAGE MODAL ----------------
+
+function openImageModal(imageSrc) {
+    const modal = document.getElementById('imageModal');
+    const modalImg = document.getElementById('modalImage');
+    modalImg.src = imageSrc;
+    modal.style.display = 'flex';
+    document.body.style.overflow = 'hidden';
+}
+
+function closeImageModal() {
+    const modal = document.getElementById('imageModal');
+    modal.style.display = 'none';
+    document.body.style.overflow = 'auto';
+}
+
+// Close modal on click or ESC key
+document.addEventListener('DOMContentLoaded', function () {
+    const modal = document.getElementById('imageModal');
+    if (modal) {
+        modal.addEventListener('click', closeImageModal);
+        document.addEventListener('keydown', function (e) {
+            if (e.key === 'Escape') closeImageModal();
+        });
+    }
+});
+
+// ---------------- LOAD MORE ----------------
+
+document.addEventListener('DOMContentLoaded', function () {
+    // Fetch the next page as a bare fragment and append it in place.
+    // Without JS the link still works as a plain "next page".
+    const btn = document.getElementById('loadMoreBtn');
+    if (!btn) return;
+
+    btn.addEventListener('click', function (e) {
+        e.preventDefault();
+        if (btn.dataset.loading) return;
+        btn.dataset.loading = '1';
+
+        const url = new URL(btn.href, window.location.href);
+        url.searchParams.set('fragment', '1');
+
+        fetch(url, { credentials: 'same-origin' })
+            .then(function (response) {
+                if (!response.ok) throw new Error(response.status);
+                return response.text().then(function (html) {
+                    return { html: html, cursor: response.headers.get('X-Next-Cursor') };
+                });
+            })
+            .then(function (result) {
+                document.querySelector(btn.dataset.target).insertAdjacentHTML('beforeend', result.html);
+                if (result.cursor) {
+                    const next = new URL(btn.href, window.location.href);
+                    next.searchParams.set('cursor', result.cursor);
+                    btn.href = next.toString();
+                    delete btn.dataset.loading;
+                } else {
+                    btn.parentNode.remove();
+                }
+            })
+            .catch(function () {
+                window.location = btn.href;
+            });
+    });
+});
+
+// ---------------- BULK STATUS UPDATE ----------------
+
+document.addEventListener('DOMContentLoaded', function () {
+    // Admin dashboard: post the selected issues in one request and swap in
+    // only the rows that changed. Without JS the form posts normally.
+    const form = document.getElementById('bulkForm');
+    if (!form) return;
+
+    const selectAll = document.getElementById('bulkSelectAll');
+    const count = document.getElementById('bulkCount');
+    const apply = form.querySelector('.bulk-apply');
+    const result = document.getElementById('bulkResult');
+
+    function selected() {
+        return form.querySelectorAll('input[name="issue_ids"]:checked');
+    }
+
+    function refresh() {
+        const n = selected().length;
+        count.textContent = n;
+        apply.disabled = n === 0;
+    }
+
+    // Rows added by "load more" are covered too
+    form.addEventListener('change', function (e) {
+        if (e.target === selectAll) {
+            form.querySelectorAll('input[name="issue_ids"]').forEach(function (box) {
+                box.checked = selectAll.checked;
+            });
+        }
+        refresh();
+    });
+
+    form.addEventListener('submit', function (e) {
+        e.preventDefault();
+        apply.disabled = true;
+        result.classList.remove('error');
+
+        fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            credentials: 'same-origin',
+            headers: { 'Accept': 'application/json' }
+        })
+            .then(function (response) {
+                return response.json().then(function (data) {
+                    if (!response.ok) throw new Error(data.error || response.status);
+                    return data;
+                });
+            })
+            .then(function (data) {
+                const rows = document.createElement('tbody');
+                rows.innerHTML = data.rows_html;
+                rows.querySelectorAll('tr[id^="issue-"]').forEach(function (row) {
+                    const current = document.getElementById(row.id);
+                    if (current) current.replaceWith(row);
+                });
+                Object.keys(data.counts).forEach(function (key) {
+                    const el = document.querySelector('[data-count="' + key + '"]');
+                    if (el) el.textContent = data.counts[key];
+                });
+                selected().forEach(function (box) { box.checked = false; });
+                selectAll.checked = false;
+                result.textContent = data.message;
+                refresh();
+            })
+            .catch(function (err) {
+                result.classList.add('error');
+                result.textContent = err.message;
+                refresh();
+            });
+    });
+});
+
+// ---------------- LIVE UPDATES ----------------
+
+document.addEventListener('DOMContentLoaded', function () {
+    // Lists with data-live subscribe to a Server-Sent Events stream of
+    // issue changes and swap the pushed card/row in place. EventSource
+    // reconnects on its own and resumes from the last event id.
+    if (!window.EventSource) return;
+
+    document.querySelectorAll('[data-live]').forEach(function (list) {
+        const source = new EventSource(list.dataset.live);
+
+        source.addEventListener('issue', function (e) {
+            const data = JSON.parse(e.data);
+            if (!data.html) return;
+            const holder = document.createElement(list.tagName);
+            holder.innerHTML = data.html;
+            const item = holder.firstElementChild;
+            if (!item) return;
+
+            const current = document.getElementById(item.id);
+            if (current) {
+                current.replaceWith(item);
+            } else {
+                list.prepend(item);
+            }
+        });
+
+        // Too far behind to replay what was missed
+        source.addEventListener('reload', function () {
+            source.close();
+            window.location.reload();
+        });
+    });
+});
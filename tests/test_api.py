@@ -0,0 +1,68 @@
+from conftest import add_issues
+
+
+def _walk(client, url):
+    items, cursor = [], None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        body = response.get_json()
+        items.extend(body["data"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def test_issue_listing_pages(app, conn):
+    ids = add_issues(conn, 45)
+    items = _walk(app.test_client(), "/api/v1/issues?panchayath_id=1&limit=20")
+    assert [item["id"] for item in items] == list(reversed(ids))
+    assert items[0]["panchayath"] == "Demo Panchayath"
+
+
+def test_issue_listing_filters_and_fields(app, conn):
+    add_issues(conn, 2)
+    add_issues(conn, 3, status="Completed")
+    response = app.test_client().get("/api/v1/issues?status=Completed&fields=id,status")
+    data = response.get_json()["data"]
+    assert len(data) == 3
+    assert {tuple(sorted(item)) for item in data} == {("id", "status")}
+    assert app.test_client().get("/api/v1/issues?fields=password").status_code == 400
+
+
+def test_etag_revalidation(app, admin, conn):
+    (issue_id,) = add_issues(conn, 1)
+    client = app.test_client()
+    url = "/api/v1/issues?panchayath_id=1"
+
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert "no-cache" in first.headers["Cache-Control"]
+
+    again = client.get(url, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+
+    admin.post(f"/admin/update/{issue_id}", data={"status": "In Progress"})
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_json()["data"][0]["status"] == "In Progress"
+
+
+def test_etag_differs_per_query(app, conn):
+    add_issues(conn, 1)
+    client = app.test_client()
+    first = client.get("/api/v1/issues?limit=5").headers["ETag"]
+    second = client.get("/api/v1/issues?limit=6").headers["ETag"]
+    assert first != second
+
+
+def test_single_issue(app, conn):
+    (issue_id,) = add_issues(conn, 1)
+    client = app.test_client()
+    response = client.get(f"/api/v1/issues/{issue_id}")
+    assert response.status_code == 200
+    assert response.get_json()["data"]["id"] == issue_id
+    assert client.get(f"/api/v1/issues/{issue_id + 1000}").status_code == 404
@@ -0,0 +1,81 @@
+import pytest
+
+import caching
+from conftest import add_issues, add_panchayath
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def app_config(request, tmp_path):
+    return {"CACHE_BACKEND": request.param, "CACHE_PATH": str(tmp_path / "cache.db")}
+
+
+def _cache(client, url):
+    return client.get(url).headers.get("X-Cache")
+
+
+def test_anonymous_pages_are_cached_until_a_write(app, admin, conn):
+    visitor = app.test_client()
+    assert _cache(visitor, "/public-track") == "MISS"
+    assert _cache(visitor, "/public-track") == "HIT"
+    assert _cache(visitor, "/notices") == "MISS"
+
+    (issue_id,) = add_issues(conn, 1, description="Drain overflowing")
+    page = visitor.get("/public-track")
+    assert page.headers["X-Cache"] == "MISS"
+    assert "Drain overflowing" in page.get_data(as_text=True)
+    # Tagged with notices only: an issue write leaves it alone
+    assert _cache(visitor, "/notices") == "HIT"
+
+    admin.post(f"/admin/update/{issue_id}", data={"status": "Completed"})
+    assert _cache(visitor, "/public-track") == "MISS"
+
+
+def test_query_strings_are_cached_apart(app, conn):
+    add_issues(conn, 3)
+    visitor = app.test_client()
+    assert _cache(visitor, "/public-track?limit=1") == "MISS"
+    assert _cache(visitor, "/public-track?limit=2") == "MISS"
+    assert _cache(visitor, "/public-track?limit=1") == "HIT"
+
+
+def test_logged_in_pages_are_never_cached(app, citizen):
+    app.test_client().get("/about")
+    response = citizen.get("/about")
+    assert response.status_code == 200
+    assert "X-Cache" not in response.headers
+
+
+def test_cached_pages_dont_replay_cookies(app):
+    visitor = app.test_client()
+    visitor.get("/about")
+    hit = app.test_client().get("/about")
+    assert hit.headers["X-Cache"] == "HIT"
+    assert "Set-Cookie" not in hit.headers
+
+
+def test_remembered_values_follow_their_tags(app, conn):
+    other = add_panchayath(conn, "Second Panchayath")
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return len(computed)
+
+    def remember():
+        with app.test_request_context():
+            return caching.remember("count", ("issues:1",), 60, compute)
+
+    assert remember() == 1
+    assert remember() == 1
+    add_issues(conn, 1, panchayath_id=other)
+    assert remember() == 1
+    add_issues(conn, 1)
+    assert remember() == 2
+
+
+def test_cache_clear_command(app):
+    visitor = app.test_client()
+    visitor.get("/about")
+    result = app.test_cli_runner().invoke(args=["cache", "clear"])
+    assert "Cache cleared" in result.output
+    assert _cache(visitor, "/about") == "MISS"
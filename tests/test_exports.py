@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+import time
+import zipfile
+
+from conftest import add_issues
+
+
+def test_csv_export(admin, conn):
+    add_issues(conn, 3)
+    add_issues(conn, 1, description="=HYPERLINK(\"http://example.com\")")
+    response = admin.get("/admin/export?format=csv")
+    assert response.status_code == 200
+    assert "attachment" in response.headers["Content-Disposition"]
+    rows = list(csv.reader(io.StringIO(response.get_data().decode("utf-8-sig"))))
+    assert rows[0][0] == "id"
+    assert len(rows) == 5
+    descriptions = [row[rows[0].index("description")] for row in rows[1:]]
+    assert "'=HYPERLINK(\"http://example.com\")" in descriptions
+
+
+def test_ndjson_export_applies_filters(admin, conn):
+    add_issues(conn, 2)
+    add_issues(conn, 3, status="Completed")
+    response = admin.get("/admin/export?format=ndjson&status=Completed")
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(records) == 3
+    assert {record["status"] for record in records} == {"Completed"}
+
+
+def test_xlsx_export(admin, conn):
+    add_issues(conn, 2)
+    response = admin.get("/admin/export?format=xlsx")
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as book:
+        sheet = book.read("xl/worksheets/sheet1.xml").decode()
+    assert "Issue 1" in sheet
+
+
+def test_export_rejects_bad_dates(admin):
+    response = admin.get("/admin/export?format=csv&since=yesterday")
+    assert response.status_code == 302
+
+
+def test_background_export(admin, conn):
+    add_issues(conn, 4)
+    admin.post("/admin/exports", data={"format": "csv"})
+    job_id = conn.execute("SELECT MAX(id) FROM export_jobs").fetchone()[0]
+    deadline = time.time() + 10
+    while True:
+        job = admin.get(f"/admin/exports/{job_id}").get_json()
+        if job["status"] not in ("queued", "running") or time.time() > deadline:
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    assert job["rows_done"] == 4
+    download = admin.get(f"/admin/exports/{job_id}/download")
+    assert download.status_code == 200
+    assert len(download.get_data()) > 0
@@ -0,0 +1,107 @@
+from conftest import add_issues, add_panchayath
+
+
+def _status(conn, issue_id):
+    conn.rollback()
+    return conn.execute("SELECT status FROM issues WHERE id = ?", (issue_id,)).fetchone()[0]
+
+
+# ---------------- REPORTING ----------------
+
+def test_report_issue(citizen, conn):
+    response = citizen.post("/report", data={
+        "panchayath_id": "1",
+        "category": "Street Lights",
+        "description": "Lamp out near the school",
+        "location": "Ward 3",
+    })
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith("/track")
+
+    row = conn.execute("SELECT * FROM issues WHERE user_id = ?", (citizen.user_id,)).fetchone()
+    assert row["description"] == "Lamp out near the school"
+    assert row["status"] == "Pending"
+    assert dict(conn.execute("SELECT name, value FROM stats").fetchall())["issues"] == 1
+
+    page = citizen.get("/track")
+    assert page.status_code == 200
+    assert "Lamp out near the school" in page.get_data(as_text=True)
+
+
+def test_report_requires_login(app):
+    response = app.test_client().post("/report", data={"panchayath_id": "1"})
+    assert response.status_code == 302
+    assert "/login" in response.headers["Location"]
+
+
+# ---------------- STATUS UPDATES ----------------
+
+def test_update_issue(admin, conn):
+    (issue_id,) = add_issues(conn, 1)
+    response = admin.post(f"/admin/update/{issue_id}", data={"status": "Completed"})
+    assert response.status_code == 302
+    assert _status(conn, issue_id) == "Completed"
+    assert dict(conn.execute("SELECT name, value FROM stats").fetchall())["issues_completed"] == 1
+
+
+def test_update_issue_of_another_panchayath_is_refused(admin, conn):
+    other = add_panchayath(conn, "Second Panchayath")
+    (issue_id,) = add_issues(conn, 1, panchayath_id=other)
+    admin.post(f"/admin/update/{issue_id}", data={"status": "Completed"})
+    assert _status(conn, issue_id) == "Pending"
+
+
+def test_bulk_update(admin, conn):
+    mine = add_issues(conn, 3)
+    (done,) = add_issues(conn, 1, status="Completed")
+    (theirs,) = add_issues(conn, 1, panchayath_id=add_panchayath(conn, "Second Panchayath"))
+
+    response = admin.post("/admin/issues/bulk-update",
+                          data={"status": "Completed", "issue_ids": mine + [done, theirs]},
+                          headers={"Accept": "application/json"})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["updated"] == 3
+    assert body["skipped"] == 2
+    assert sorted(body["ids"]) == sorted(mine)
+    assert all(f'id="issue-{issue_id}"' in body["rows_html"] for issue_id in mine)
+    assert [_status(conn, issue_id) for issue_id in mine] == ["Completed"] * 3
+    assert _status(conn, theirs) == "Pending"
+
+
+def test_bulk_update_rejects_bad_input(admin, conn):
+    (issue_id,) = add_issues(conn, 1)
+    response = admin.post("/admin/issues/bulk-update", data={"status": "Closed", "issue_ids": [issue_id]},
+                          headers={"Accept": "application/json"})
+    assert response.status_code == 400
+    response = admin.post("/admin/issues/bulk-update", data={"status": "Completed"},
+                          headers={"Accept": "application/json"})
+    assert response.status_code == 400
+    assert _status(conn, issue_id) == "Pending"
+
+
+# ---------------- KEYSET LISTINGS ----------------
+
+def test_dashboard_pages_follow_the_cursor(admin, conn):
+    # All at the same second: the id breaks the tie, so nothing is skipped
+    # or repeated across pages
+    ids = add_issues(conn, 45, created_at="2025-01-01 10:00:00")
+    seen, cursor = [], None
+    while True:
+        url = "/admin?fragment=1&limit=20" + (f"&cursor={cursor}" if cursor else "")
+        response = admin.get(url)
+        assert response.status_code == 200
+        html = response.get_data(as_text=True)
+        seen.extend(issue_id for issue_id in reversed(ids) if f'id="issue-{issue_id}"' in html)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == list(reversed(ids))
+
+
+def test_public_listing_is_newest_first(app, conn):
+    ids = add_issues(conn, 3)
+    html = app.test_client().get("/public-track").get_data(as_text=True)
+    positions = [html.index(f"Issue {n}") for n in (2, 1, 0)]
+    assert positions == sorted(positions)
+    assert len(ids) == 3
@@ -0,0 +1,73 @@
+import json
+import re
+
+import pytest
+
+import live
+from conftest import add_issues, add_panchayath
+
+
+@pytest.fixture(autouse=True)
+def _backlog_only(monkeypatch):
+    # Streams end once the backlog is sent instead of waiting for news
+    monkeypatch.setattr(live, "MAX_STREAM_SECONDS", 0)
+
+
+def _events(response):
+    """The SSE messages of a finished stream, as dicts of their fields."""
+    messages = []
+    for chunk in response.get_data(as_text=True).split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in chunk.splitlines() if not line.startswith(":"))
+        if "data" in fields:
+            fields["data"] = json.loads(fields["data"])
+        if fields:
+            messages.append(fields)
+    return messages
+
+
+def _token(page):
+    return re.search(r'data-live="[^"]*after=([^"&]*)', page.get_data(as_text=True)).group(1)
+
+
+def test_stream_resumes_from_the_page(citizen, admin, conn):
+    (mine,) = add_issues(conn, 1, user_id=citizen.user_id, description="Pothole on my street")
+    (theirs,) = add_issues(conn, 1)
+    after = _token(citizen.get("/track"))
+    admin.post(f"/admin/update/{mine}", data={"status": "Completed"})
+    admin.post(f"/admin/update/{theirs}", data={"status": "Completed"})
+
+    response = citizen.get(f"/track/stream?after={after}")
+    assert response.mimetype == "text/event-stream"
+    retry, event = _events(response)
+    assert retry == {"retry": str(live.RETRY_MS)}
+    assert event["event"] == "issue"
+    assert event["data"]["issue_id"] == mine
+    assert event["data"]["status"] == "Completed"
+    assert "Pothole on my street" in event["data"]["html"]
+
+    # A reconnect carries the last id seen; nothing is sent twice
+    response = citizen.get("/track/stream", headers={"Last-Event-ID": event["id"]})
+    assert [message.get("event") for message in _events(response)] == [None]
+
+
+def test_stream_without_a_token_has_no_backlog(citizen, conn):
+    add_issues(conn, 2, user_id=citizen.user_id)
+    assert _events(citizen.get("/track/stream")) == [{"retry": str(live.RETRY_MS)}]
+
+
+def test_admin_stream_keeps_to_its_panchayath(admin, conn):
+    after = _token(admin.get("/admin"))
+    (ours,) = add_issues(conn, 1)
+    add_issues(conn, 1, panchayath_id=add_panchayath(conn, "Second Panchayath"))
+    messages = _events(admin.get(f"/admin/stream?after={after}"))
+    assert [message["data"]["issue_id"] for message in messages if "data" in message] == [ours]
+
+
+def test_a_trimmed_gap_asks_for_a_reload(citizen, conn):
+    after = _token(citizen.get("/track"))
+    add_issues(conn, 3, user_id=citizen.user_id)
+    # The feed has moved on past what this client saw
+    conn.execute("DELETE FROM live_events WHERE id <= (SELECT MIN(id) + 1 FROM live_events)")
+    conn.commit()
+    messages = _events(citizen.get(f"/track/stream?after={after}"))
+    assert messages[-1] == {"event": "reload", "data": {}}
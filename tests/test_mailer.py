@@ -0,0 +1,166 @@
+import socket
+import time
+
+import pytest
+
+import db
+import mailer
+
+aiosmtpd = pytest.importorskip("aiosmtpd.controller")
+
+
+class Recorder:
+    """aiosmtpd handler keeping what it was sent; refuses every recipient
+    with a temporary error while `refuse` is set."""
+
+    def __init__(self):
+        self.refuse = False
+        self.received = []
+        self.peers = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if self.refuse:
+            return "451 4.3.0 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.peers.add(session.peer)
+        self.received.extend(envelope.rcpt_tos)
+        return "250 Message accepted for delivery"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    handler = Recorder()
+    controller = aiosmtpd.Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    monkeypatch.setattr(mailer, "MAIL_SERVER", controller.hostname)
+    monkeypatch.setattr(mailer, "MAIL_PORT", controller.port)
+    monkeypatch.setattr(mailer, "MAIL_USE_TLS", False)
+    monkeypatch.setattr(mailer, "MAIL_PASSWORD", "")
+    yield handler
+    controller.stop()
+
+
+@pytest.fixture
+def worker_conn(app):
+    conn = db.open_connection(app.config["DATABASE"])
+    # As run_worker: claims open their own transactions
+    conn.isolation_level = None
+    yield conn
+    conn.close()
+
+
+def _outbox(conn):
+    conn.rollback()
+    return conn.execute("SELECT * FROM email_outbox ORDER BY id").fetchall()
+
+
+def test_batches_share_one_smtp_session(smtp, conn, worker_conn):
+    for n in range(mailer.BATCH_SIZE + 5):
+        mailer.enqueue(conn, f"citizen{n}@example.com", "Your OTP", f"Code {n}")
+
+    session = mailer.SMTPSession()
+    try:
+        claimed = [mailer.process_batch(worker_conn, session) for _ in range(3)]
+    finally:
+        session.close()
+
+    assert claimed == [mailer.BATCH_SIZE, 5, 0]
+    assert sorted(smtp.received) == sorted(f"citizen{n}@example.com" for n in range(mailer.BATCH_SIZE + 5))
+    assert len(smtp.peers) == 1
+    assert {row["status"] for row in _outbox(conn)} == {"sent"}
+
+
+def test_worker_drains_the_queue(app, smtp, conn):
+    for n in range(3):
+        mailer.enqueue(conn, f"citizen{n}@example.com", "Your OTP", f"Code {n}")
+    mailer.run_worker(app.config["DATABASE"], once=True)
+    assert len(smtp.received) == 3
+    assert [row["attempts"] for row in _outbox(conn)] == [1, 1, 1]
+
+
+def test_failures_back_off_then_give_up(smtp, conn, worker_conn):
+    smtp.refuse = True
+    mailer.enqueue(conn, "citizen@example.com", "Your OTP", "Code")
+    session = mailer.SMTPSession()
+    try:
+        for attempt in range(1, mailer.MAX_ATTEMPTS):
+            before = time.time()
+            assert mailer.process_batch(worker_conn, session) == 1
+            (row,) = _outbox(conn)
+            delay = mailer.BACKOFF_BASE * 2 ** (attempt - 1)
+            assert row["status"] == "pending"
+            assert row["attempts"] == attempt
+            assert "451" in row["last_error"]
+            assert before + delay * 0.8 - 1 <= row["next_attempt_at"] <= time.time() + delay * 1.2
+            # Not due yet: nothing to claim
+            assert mailer.process_batch(worker_conn, session) == 0
+            conn.execute("UPDATE email_outbox SET next_attempt_at = 0")
+            conn.commit()
+
+        assert mailer.process_batch(worker_conn, session) == 1
+        (row,) = _outbox(conn)
+        assert row["status"] == "failed"
+        assert row["attempts"] == mailer.MAX_ATTEMPTS
+
+        # Given up on for good, even once the server accepts mail again
+        smtp.refuse = False
+        conn.execute("UPDATE email_outbox SET next_attempt_at = 0")
+        conn.commit()
+        assert mailer.process_batch(worker_conn, session) == 0
+    finally:
+        session.close()
+    assert smtp.received == []
+
+
+def test_a_message_that_wont_format_is_a_failed_attempt(smtp, conn, worker_conn, monkeypatch):
+    format_message = mailer._format
+
+    def broken(row):
+        if row["recipient"] == "broken@example.com":
+            raise UnicodeEncodeError("ascii", "\u0d2a", 0, 1, "ordinal not in range")
+        return format_message(row)
+
+    monkeypatch.setattr(mailer, "_format", broken)
+    mailer.enqueue(conn, "broken@example.com", "Your OTP", "Code")
+    mailer.enqueue(conn, "citizen@example.com", "Your OTP", "Code")
+    session = mailer.SMTPSession()
+    try:
+        assert mailer.process_batch(worker_conn, session) == 2
+        broken_row, sent_row = _outbox(conn)
+        assert broken_row["status"] == "pending"
+        assert broken_row["attempts"] == 1
+        assert "ordinal not in range" in broken_row["last_error"]
+        assert sent_row["status"] == "sent"
+
+        for _ in range(mailer.MAX_ATTEMPTS - 1):
+            conn.execute("UPDATE email_outbox SET next_attempt_at = 0")
+            conn.commit()
+            mailer.process_batch(worker_conn, session)
+    finally:
+        session.close()
+    broken_row, _ = _outbox(conn)
+    assert broken_row["status"] == "failed"
+    assert broken_row["attempts"] == mailer.MAX_ATTEMPTS
+    assert smtp.received == ["citizen@example.com"]
+
+
+def test_queue_depth_gauge(app, conn):
+    for n in range(3):
+        mailer.enqueue(conn, f"citizen{n}@example.com", "Your OTP", f"Code {n}")
+    conn.execute("UPDATE email_outbox SET status = 'failed' WHERE id = (SELECT MIN(id) FROM email_outbox)")
+    conn.commit()
+
+    text = app.test_client().get("/metrics").get_data(as_text=True)
+    assert "# TYPE mail_outbox_messages gauge" in text
+    assert 'mail_outbox_messages{status="pending"} 2' in text
+    assert 'mail_outbox_messages{status="sending"} 0' in text
+    assert 'mail_outbox_messages{status="failed"} 1' in text
@@ -0,0 +1,52 @@
+import migrations
+import storage
+
+from conftest import add_issues
+
+
+def _expected(conn):
+    steps = migrations.POSTGRES_MIGRATIONS if storage.dialect(conn) == "postgresql" else migrations.MIGRATIONS
+    return steps[-1][0]
+
+
+def test_schema_is_at_latest_version(conn):
+    assert migrations.current_version(conn) == _expected(conn)
+
+
+def test_upgrade_is_idempotent(conn):
+    assert migrations.upgrade(conn) == []
+    assert migrations.current_version(conn) == _expected(conn)
+
+
+def test_triggers_keep_counters_and_history(conn):
+    (issue_id,) = add_issues(conn, 1)
+    conn.execute("UPDATE issues SET status = 'Completed' WHERE id = ?", (issue_id,))
+    conn.commit()
+
+    stats = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+    assert stats["issues"] == 1
+    assert stats["issues_completed"] == 1
+    assert conn.execute("SELECT completed_at FROM issues WHERE id = ?", (issue_id,)).fetchone()[0]
+
+    events = conn.execute(
+        "SELECT kind, status, from_status FROM issue_events WHERE issue_id = ? ORDER BY id", (issue_id,)
+    ).fetchall()
+    assert [tuple(event) for event in events] == [("created", "Pending", None),
+                                                  ("status", "Completed", "Pending")]
+    assert conn.execute("SELECT COUNT(*) FROM live_events WHERE issue_id = ?", (issue_id,)).fetchone()[0] == 2
+
+    totals = dict(conn.execute(
+        "SELECT status, count FROM issue_totals WHERE panchayath_id = 1"
+    ).fetchall())
+    assert totals.get("Pending", 0) == 0
+    assert totals["Completed"] == 1
+
+
+def test_deleting_an_issue_updates_counters(conn):
+    (issue_id,) = add_issues(conn, 1)
+    conn.execute("DELETE FROM issues WHERE id = ?", (issue_id,))
+    conn.commit()
+    stats = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+    assert stats["issues"] == 0
+    # The history of a deleted issue stays
+    assert conn.execute("SELECT COUNT(*) FROM issue_events WHERE issue_id = ?", (issue_id,)).fetchone()[0] == 1
@@ -0,0 +1,74 @@
+import pytest
+
+import limiter
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def app_config(request, tmp_path):
+    return {
+        "RATELIMIT_ENABLED": True,
+        "RATELIMIT_BACKEND": request.param,
+        "RATELIMIT_PATH": str(tmp_path / "ratelimit.db"),
+        "RATELIMITS": {
+            "login": ("4/300", "2/300"),
+            "admin_login": ("4/300", "2/300"),
+            "otp": ("4/600", "2/600"),
+        },
+    }
+
+
+def _login(client, email, ip="10.0.0.1"):
+    return client.post("/login", data={"email": email, "password": "wrong"},
+                       environ_base={"REMOTE_ADDR": ip})
+
+
+def test_an_account_is_limited_from_every_address(app):
+    client = app.test_client()
+    assert _login(client, "asha@example.com", "10.0.0.1").status_code == 200
+    assert _login(client, "Asha@Example.com ", "10.0.0.2").status_code == 200
+    refused = _login(client, "asha@example.com", "10.0.0.3")
+    assert refused.status_code == 429
+    assert int(refused.headers["Retry-After"]) >= 1
+    # Another account is still let in
+    assert _login(client, "ravi@example.com", "10.0.0.3").status_code == 200
+
+
+def test_an_address_is_limited_across_accounts(app):
+    client = app.test_client()
+    for n in range(4):
+        assert _login(client, f"user{n}@example.com").status_code == 200
+    assert _login(client, "user9@example.com").status_code == 429
+    assert _login(client, "user9@example.com", "10.0.0.2").status_code == 200
+
+
+def test_rules_are_counted_apart(app):
+    client = app.test_client()
+    for _ in range(2):
+        _login(client, "admin")
+    response = client.post("/admin/login", data={"username": "admin", "password": "wrong"},
+                           environ_base={"REMOTE_ADDR": "10.0.0.1"})
+    assert response.status_code == 200
+
+
+def test_busy_hashing_is_refused_not_queued(app):
+    app.config["AUTH_QUEUE_SECONDS"] = 0
+    slots = app.extensions["auth_slots"]
+    taken = 0
+    while slots.acquire(blocking=False):
+        taken += 1
+    try:
+        with app.test_request_context():
+            with pytest.raises(limiter.RateLimited):
+                limiter.check_password("pbkdf2:sha256:1$salt$hash", "secret")
+    finally:
+        for _ in range(taken):
+            slots.release()
+    with app.test_request_context():
+        assert limiter.check_password(limiter.generate_password_hash("secret"), "secret")
+
+
+def test_buckets_refill(app):
+    buckets = app.extensions["rate_limits"]
+    assert buckets.take("k", 1, 60) == 0
+    wait = buckets.take("k", 1, 60)
+    assert 0 < wait <= 60
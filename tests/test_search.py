@@ -0,0 +1,84 @@
+import fts
+
+from conftest import add_issues, add_panchayath
+
+
+def _search(client, **args):
+    response = client.get("/api/search", query_string=args)
+    assert response.status_code == 200
+    return response.get_json()["results"]
+
+
+def test_filtered_search_looks_past_the_window(app, conn, monkeypatch):
+    # Only the newest SEARCH_WINDOW matches are ranked; the window must be
+    # counted among matches the filters accept, or the older issue in the
+    # second panchayath disappears behind the first one's newer ones
+    monkeypatch.setattr(fts, "SEARCH_WINDOW", 5)
+    other = add_panchayath(conn, "Second Panchayath")
+    (old,) = add_issues(conn, 1, panchayath_id=other, description="road washed away",
+                        created_at="2024-01-01 00:00:00")
+    add_issues(conn, 10, description="road full of potholes")
+    client = app.test_client()
+
+    results = _search(client, q="road", panchayath_id=other)
+    assert [result["id"] for result in results] == [old]
+    results = _search(client, q="road", status="Pending", panchayath_id=other)
+    assert [result["id"] for result in results] == [old]
+    # Unfiltered, the window still applies
+    assert len(_search(client, q="road", limit=50)) == 5
+
+
+def test_every_word_must_match_and_the_last_is_a_prefix(app, conn):
+    pothole, culvert = add_issues(conn, 2, description="pothole near the school")
+    conn.execute("UPDATE issues SET description = 'culvert blocked near the market' WHERE id = ?", (culvert,))
+    conn.commit()
+    client = app.test_client()
+
+    assert sorted(r["id"] for r in _search(client, q="near")) == [pothole, culvert]
+    assert [r["id"] for r in _search(client, q="near scho")] == [pothole]
+    assert _search(client, q="near school market") == []
+    # FTS syntax is plain text, never an error
+    assert _search(client, q='culvert" OR (') == []
+
+
+def test_results_are_highlighted_and_escaped(app, conn):
+    add_issues(conn, 1, description="Leaking <b>pipe</b> on the main road")
+    (result,) = _search(app.test_client(), q="pipe")
+    assert "<mark>pipe</mark>" in result["snippet_html"]
+    assert "&lt;b&gt;" in result["snippet_html"]
+
+
+def test_index_follows_updates_and_deletes(app, conn):
+    issue_id, other = add_issues(conn, 2, description="garbage not collected")
+    client = app.test_client()
+    conn.execute("UPDATE issues SET description = 'streetlight broken' WHERE id = ?", (issue_id,))
+    conn.execute("DELETE FROM issues WHERE id = ?", (other,))
+    conn.commit()
+
+    assert _search(client, q="garbage") == []
+    assert [r["id"] for r in _search(client, q="streetlight")] == [issue_id]
+
+
+def test_pages_follow_the_cursor(app, conn):
+    ids = add_issues(conn, 7, description="water supply cut")
+    client = app.test_client()
+    seen, cursor = [], ""
+    while True:
+        response = client.get("/api/search", query_string={"q": "water", "limit": 3, "cursor": cursor})
+        body = response.get_json()
+        seen += [r["id"] for r in body["results"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(ids)
+
+
+def test_notice_search(app, conn):
+    conn.execute("INSERT INTO notices (panchayath_id, title, description) VALUES (1, ?, ?)",
+                 ("Gram Sabha meeting", "Ward meeting on the new budget"))
+    conn.execute("INSERT INTO notices (panchayath_id, title, description) VALUES (1, ?, ?)",
+                 ("Water cut", "No supply on Sunday"))
+    conn.commit()
+    (result,) = _search(app.test_client(), q="budget", type="notices")
+    assert result["title"] == "Gram Sabha meeting"
+    assert "<mark>budget</mark>" in result["snippet_html"]
@@ -0,0 +1,95 @@
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import queries
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def app_config(request, tmp_path):
+    return {"SESSION_BACKEND": request.param, "SESSION_PATH": str(tmp_path / "sessions.db")}
+
+
+@pytest.fixture
+def store(app):
+    return app.extensions["session_store"]
+
+
+@pytest.fixture
+def user_id(conn):
+    queries.add_user(conn, "Asha", "asha@example.com", "9800000000", generate_password_hash("secret"))
+    conn.commit()
+    return conn.execute("SELECT id FROM users WHERE email = 'asha@example.com'").fetchone()[0]
+
+
+def _sid(client):
+    cookie = client.get_cookie("session")
+    return cookie.value if cookie else None
+
+
+def _login(client, password="secret"):
+    return client.post("/login", data={"email": "asha@example.com", "password": password})
+
+
+def test_cookie_carries_only_an_id(app, store, user_id):
+    client = app.test_client()
+    assert _login(client).status_code == 302
+    sid = _sid(client)
+    assert "Asha" not in sid and len(sid) >= 32
+    data, _ = store.get(sid)
+    assert data["user_id"] == user_id
+    assert client.get("/track").status_code == 200
+
+
+def test_login_moves_the_session_to_a_new_id(app, store, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["lang"] = "ml"
+    before = _sid(client)
+    assert store.get(before)[0] == {"lang": "ml"}
+
+    _login(client)
+    after = _sid(client)
+    assert after != before
+    assert store.get(before) is None
+    assert store.get(after)[0]["user_id"] == user_id
+    # What was in the session comes along
+    assert store.get(after)[0]["lang"] == "ml"
+
+
+def test_unknown_ids_are_not_adopted(app, store, user_id):
+    client = app.test_client()
+    client.set_cookie("session", "planted-by-someone-else")
+    _login(client)
+    assert _sid(client) != "planted-by-someone-else"
+    assert store.get("planted-by-someone-else") is None
+
+
+def test_expired_sessions_are_anonymous_and_reaped(app, store, user_id):
+    store.set("stale", {"user_id": user_id}, time.time() - 1)
+    client = app.test_client()
+    client.set_cookie("session", "stale")
+    response = client.get("/track")
+    assert response.status_code == 302
+    assert "/login" in response.headers["Location"]
+    assert store.prune(10) == 1
+
+
+def test_reads_dont_rewrite_the_session(app, store, user_id):
+    client = app.test_client()
+    _login(client)
+    client.get("/")  # consumes the welcome flash
+    sid = _sid(client)
+    written = store.get(sid)[1]
+    response = client.get("/track")
+    assert "Set-Cookie" not in response.headers
+    assert store.get(sid)[1] == written
+
+
+def test_logging_out_forgets_the_user(app, store, user_id):
+    client = app.test_client()
+    _login(client)
+    client.get("/logout")
+    assert client.get("/track").status_code == 302
+    assert "user_id" not in (store.get(_sid(client)) or ({},))[0]
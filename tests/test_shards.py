@@ -0,0 +1,208 @@
+import pytest
+
+import db
+import live
+import shards
+from conftest import add_issues, add_panchayath
+
+
+@pytest.fixture
+def app_config(database_url):
+    if not database_url.startswith("sqlite"):
+        pytest.skip("sharding splits SQLite files")
+    return {"SHARDING": "panchayath"}
+
+
+def _shard_conns(app):
+    """{shard id: connection} for every shard file, catalog attached."""
+    with app.app_context():
+        paths = shards.shard_map().current()
+    return {shard: db.open_connection(path, catalog=app.config["DATABASE"]) for shard, path in paths.items()}
+
+
+def _history(conn, issue_id):
+    return [tuple(row) for row in conn.execute(
+        "SELECT kind, status, from_status FROM issue_events WHERE issue_id = ? ORDER BY id", (issue_id,))]
+
+
+def _report(client, panchayath_id, description, location="Ward 1"):
+    response = client.post("/report", data={
+        "panchayath_id": str(panchayath_id),
+        "category": "Roads",
+        "description": description,
+        "location": location,
+    })
+    assert response.status_code == 302
+
+
+# ---------------- CACHE VERSIONS ----------------
+
+def test_cache_hits_dont_query_every_shard(app, citizen, conn, monkeypatch):
+    add_panchayath(conn, "Erattupetta")
+    _report(citizen, 1, "Pothole near the bus stand")
+    _report(citizen, 2, "Broken culvert")
+    with app.app_context():
+        assert len(shards.paths()) == 2
+
+    reads = []
+    change_versions = shards.change_versions
+    monkeypatch.setattr(shards, "change_versions", lambda pairs: reads.append(pairs) or change_versions(pairs))
+    visitor = app.test_client()
+    assert visitor.get("/public-track").headers["X-Cache"] == "MISS"
+    assert visitor.get("/public-track").headers["X-Cache"] == "HIT"
+    assert visitor.get("/public-track").headers["X-Cache"] == "HIT"
+    assert len(reads) == 1
+
+    # A write in this process is seen at once
+    _report(citizen, 2, "Drain overflowing")
+    page = visitor.get("/public-track")
+    assert page.headers["X-Cache"] == "MISS"
+    assert "Drain overflowing" in page.get_data(as_text=True)
+
+
+def test_home_stats_are_cached_for_logged_in_renders_too(app, citizen, monkeypatch):
+    _report(citizen, 1, "Pothole near the bus stand")
+    reads = []
+    stats = shards.stats
+    monkeypatch.setattr(shards, "stats", lambda: reads.append(1) or stats())
+    citizen.get("/")
+    citizen.get("/")
+    assert len(reads) == 1
+
+    _report(citizen, 1, "Streetlight out")
+    assert app.test_client().get("/api/v1/stats").get_json()["data"]["issues"] == 2
+    assert len(reads) == 2
+
+
+# ---------------- NEW ROWS ----------------
+
+def test_shard_ids_start_at_their_offset(app, citizen, conn):
+    add_panchayath(conn, "Erattupetta")
+    _report(citizen, 2, "Broken culvert")
+    conns = _shard_conns(app)
+    try:
+        (shard, shard_conn), = conns.items()
+        issue_id = shard_conn.execute("SELECT id FROM issues").fetchone()[0]
+        assert issue_id >> shards.ID_BITS == shard
+        event_id = shard_conn.execute("SELECT MAX(id) FROM live_events").fetchone()[0]
+        assert event_id >> shards.ID_BITS == shard
+    finally:
+        for shard_conn in conns.values():
+            shard_conn.close()
+
+
+# ---------------- FAN-OUT ----------------
+
+def test_listings_merge_every_shard_newest_first(app, citizen, conn):
+    add_panchayath(conn, "Erattupetta")
+    for n in range(6):
+        _report(citizen, 1 + n % 2, f"Road damage {n}")
+    client = app.test_client()
+
+    descriptions, cursor = [], ""
+    while True:
+        body = client.get("/api/v1/issues", query_string={"limit": 4, "cursor": cursor}).get_json()
+        descriptions += [item["description"] for item in body["data"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    # Pages across shards add up to the one merged listing
+    everything = client.get("/api/v1/issues", query_string={"limit": 50}).get_json()["data"]
+    assert descriptions == [item["description"] for item in everything]
+    assert sorted(descriptions) == [f"Road damage {n}" for n in range(6)]
+
+    results = client.get("/api/search", query_string={"q": "damage", "limit": 50}).get_json()["results"]
+    assert len(results) == 6
+    only_second = client.get("/api/search", query_string={"q": "damage", "panchayath_id": 2}).get_json()
+    assert {result["panchayath"] for result in only_second["results"]} == {"Erattupetta"}
+
+
+def test_admins_see_their_own_shard(admin, citizen, conn):
+    add_panchayath(conn, "Erattupetta")
+    _report(citizen, 1, "Pothole", "Our ward")
+    _report(citizen, 2, "Pothole", "Their ward")
+    page = admin.get("/admin").get_data(as_text=True)
+    assert "Our ward" in page and "Their ward" not in page
+
+
+# ---------------- SPLITTING ----------------
+
+def test_split_moves_issues_with_their_history(app, conn):
+    second = add_panchayath(conn, "Erattupetta")
+    first_ids = add_issues(conn, 3, photo_path="uploads/ab/cd/photo.jpg")
+    second_ids = add_issues(conn, 2, panchayath_id=second)
+    conn.execute("INSERT INTO upload_refs (path, refcount, size) VALUES ('uploads/ab/cd/photo.jpg', 3, 10)")
+    conn.execute("UPDATE issues SET status = 'Completed' WHERE id = ?", (first_ids[0],))
+    conn.commit()
+    history = _history(conn, first_ids[0])
+    stats = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+
+    result = app.test_cli_runner().invoke(args=["shards", "split"])
+    assert result.exit_code == 0, result.output
+
+    conn.rollback()
+    assert conn.execute("SELECT COUNT(*) FROM issues").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM issue_events").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM upload_refs").fetchone()[0] == 0
+    conns = _shard_conns(app)
+    try:
+        assert len(conns) == 2
+        moved = {}
+        for shard_conn in conns.values():
+            for (issue_id,) in shard_conn.execute("SELECT id FROM issues"):
+                moved[issue_id] = shard_conn
+            # The copies are no news to live clients
+            assert shard_conn.execute("SELECT COUNT(*) FROM live_events").fetchone()[0] == 0
+        assert sorted(moved) == sorted(first_ids + second_ids)
+        assert moved[first_ids[0]] is not moved[second_ids[0]]
+        # Original ids, real history, references counted where the issues went
+        assert _history(moved[first_ids[0]], first_ids[0]) == history
+        assert moved[first_ids[0]].execute("SELECT refcount FROM upload_refs").fetchone()[0] == 3
+        with app.test_request_context():
+            totals = shards.stats()
+        assert totals["issues"] == stats["issues"] and totals["issues_completed"] == 1
+    finally:
+        for shard_conn in conns.values():
+            shard_conn.close()
+
+    # Running it again copies nothing twice
+    result = app.test_cli_runner().invoke(args=["shards", "split"])
+    assert result.exit_code == 0, result.output
+    assert "0 issue(s), 0 notice(s) copied" in result.output
+    with app.test_request_context():
+        assert shards.stats()["issues"] == 5
+
+
+def test_copy_into_is_one_transaction_and_repeatable(app, conn):
+    add_issues(conn, 2)
+    with app.app_context():
+        shard_map = shards.shard_map()
+        shard = shard_map.shard_of(1)
+        path = shard_map.current()[shard]
+    assert shards._copy_into(shard, path, app.config["DATABASE"]) == {"issues": 2, "notices": 0}
+    assert shards._copy_into(shard, path, app.config["DATABASE"]) == {"issues": 0, "notices": 0}
+    # Until the catalog is cleared both hold the issues
+    assert conn.execute("SELECT COUNT(*) FROM issues").fetchone()[0] == 2
+    assert shards._clear_catalog(conn) == 0
+    assert conn.execute("SELECT COUNT(*) FROM issue_events").fetchone()[0] == 0
+
+
+# ---------------- LIVE RESUME TOKENS ----------------
+
+def test_resume_tokens_name_the_shard(app):
+    first, third = 1 << shards.ID_BITS, 3 << shards.ID_BITS
+    # Offsets within each shard; a shard with no events yet is left out
+    token = live._encode({1: first + 41, 2: 2 << shards.ID_BITS, 3: third + 7})
+    assert token == "1:41.3:7"
+    with app.test_request_context(headers={"Last-Event-ID": token}):
+        assert live._resume_ids() == {1: first + 41, 3: third + 7}
+    with app.test_request_context("/?after=" + token):
+        assert live._resume_ids() == {1: first + 41, 3: third + 7}
+    # Unsharded ids are plain numbers
+    assert live._encode({0: 12}) == "12"
+    with app.test_request_context("/?after=12"):
+        assert live._resume_ids() == {0: 12}
+    with app.test_request_context("/?after=1:x"):
+        assert live._resume_ids() is None
+    with app.test_request_context("/"):
+        assert live._resume_ids() is None
@@ -0,0 +1,189 @@
+import io
+import os
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import images
+import uploads
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _huge_png(width, height):
+    """A PNG header claiming width x height pixels, with no pixels behind it."""
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", ihdr) + _png_chunk(b"IEND", b"")
+
+
+def _photo(fmt="JPEG", orientation=None):
+    exif = Image.Exif()
+    exif[0x010F] = "Camera Maker"
+    exif[0x8825] = {2: (9.0, 58.0, 12.0), 4: (76.0, 15.0, 3.0)}
+    if orientation:
+        exif[0x0112] = orientation
+    out = io.BytesIO()
+    Image.new("RGB", (40, 20), "orange").save(out, fmt, exif=exif.tobytes())
+    return out.getvalue()
+
+
+def _report(citizen, data, filename):
+    return citizen.post("/report", data={
+        "panchayath_id": "1",
+        "category": "Roads",
+        "description": "Pothole",
+        "location": "Ward 1",
+        "image": (io.BytesIO(data), filename),
+    }, content_type="multipart/form-data")
+
+
+def _stored(app, conn):
+    conn.rollback()
+    path = conn.execute("SELECT photo_path FROM issues").fetchone()[0]
+    return os.path.join(app.config["UPLOAD_FOLDER"], os.path.relpath(path, "uploads"))
+
+
+def _publish(admin, data, title="Water cut"):
+    return admin.post("/admin/notices", data={
+        "title": title,
+        "description": "No supply on Sunday",
+        "banner": (io.BytesIO(data), "banner.png"),
+    }, content_type="multipart/form-data")
+
+
+def _refs(conn):
+    conn.rollback()
+    return dict(conn.execute("SELECT path, refcount FROM upload_refs").fetchall())
+
+
+# ---------------- CONTENT-ADDRESSED STORE ----------------
+
+def test_identical_uploads_share_one_file(app, citizen, admin, conn):
+    photo = _photo("PNG")
+    _report(citizen, photo, "photo.png")
+    _publish(admin, photo)
+    conn.rollback()
+    paths = {row[0] for row in conn.execute("SELECT photo_path FROM issues UNION SELECT banner_path FROM notices")}
+    (path,) = paths
+    assert uploads.HASHED_PATH.match(path)
+    assert _refs(conn) == {path: 2}
+    files = [name for _, _, names in os.walk(app.config["UPLOAD_FOLDER"]) for name in names]
+    assert files == [os.path.basename(path)]
+
+
+def test_last_reference_deletes_the_file(app, admin, conn):
+    photo = _photo("PNG")
+    _publish(admin, photo, "First")
+    _publish(admin, photo, "Second")
+    first, second = [row[0] for row in conn.execute("SELECT id FROM notices ORDER BY id")]
+    (path,) = _refs(conn)
+    with app.app_context():
+        filename = uploads.file_path(path)
+
+    admin.get(f"/admin/notices/delete/{first}")
+    assert _refs(conn) == {path: 1}
+    assert os.path.exists(filename)
+    admin.get(f"/admin/notices/delete/{second}")
+    assert _refs(conn) == {}
+    assert not os.path.exists(filename)
+
+
+def test_a_rolled_back_release_keeps_the_file(app, conn):
+    with app.test_request_context():
+        path, created = uploads.store(conn, FileStorage(io.BytesIO(_photo("PNG")), "photo.png"))
+        conn.commit()
+        assert created
+        assert uploads.release(conn, path) == path
+        conn.rollback()
+        uploads.discard(conn, [])
+        assert os.path.exists(uploads.file_path(path))
+        assert _refs(conn) == {path: 1}
+
+
+@pytest.mark.parametrize("data, filename", [
+    (b"GIF89a but not really", "notes.txt"),
+    (b"plain text", "photo.jpg"),
+    (b"", "photo.jpg"),
+])
+def test_only_images_are_stored(app, citizen, conn, data, filename):
+    response = _report(citizen, data, filename)
+    assert response.headers["Location"].endswith("/report")
+    conn.rollback()
+    assert conn.execute("SELECT COUNT(*) FROM issues").fetchone()[0] == 0
+    assert _refs(conn) == {}
+    assert [name for _, _, names in os.walk(app.config["UPLOAD_FOLDER"]) for name in names] == []
+
+
+# ---------------- SANITISING ----------------
+
+def test_photo_metadata_is_stripped_but_orientation_kept(app, citizen, conn):
+    response = _report(citizen, _photo(orientation=6), "photo.jpg")
+    assert response.status_code == 302
+
+    filename = _stored(app, conn)
+    with Image.open(filename) as stored:
+        assert dict(stored.getexif()) == {0x0112: 6}
+        assert stored.size == (40, 20)
+    # The name is the hash of the bytes served, not of what was posted
+    digest, _ = uploads._digest(filename)
+    assert os.path.basename(filename) == f"{digest}.jpg"
+
+
+@pytest.mark.parametrize("fmt, ext", [("PNG", "png"), ("WEBP", "webp")])
+def test_png_and_webp_metadata_is_stripped(app, citizen, conn, fmt, ext):
+    _report(citizen, _photo(fmt), f"photo.{ext}")
+    with Image.open(_stored(app, conn)) as stored:
+        stored.load()
+        assert dict(stored.getexif()) == {}
+
+
+def test_stored_files_are_world_readable(app, citizen, conn):
+    out = io.BytesIO()
+    Image.new("P", (8, 8)).save(out, "GIF")
+    _report(citizen, out.getvalue(), "anim.gif")
+    assert os.stat(_stored(app, conn)).st_mode & 0o777 == 0o644
+
+
+@pytest.mark.parametrize("width, height, max_pixels", [
+    (30000, 30000, images.MAX_PIXELS),  # past Pillow's own bomb limit
+    (100, 100, 5000),                   # past ours
+])
+def test_oversized_images_are_refused(citizen, conn, monkeypatch, width, height, max_pixels):
+    monkeypatch.setattr(images, "MAX_PIXELS", max_pixels)
+    response = _report(citizen, _huge_png(width, height), "bomb.png")
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith("/report")
+    assert "too large" in citizen.get("/report").get_data(as_text=True)
+    conn.rollback()
+    assert conn.execute("SELECT COUNT(*) FROM issues").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM upload_refs").fetchone()[0] == 0
+
+
+# ---------------- VARIANTS ----------------
+
+class _Inline:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+def test_variants_live_in_the_upload_folder(app, citizen, conn, monkeypatch):
+    monkeypatch.setattr(images, "_get_executor", _Inline)
+    _report(citizen, _photo(), "photo.jpg")
+    conn.rollback()
+    path = conn.execute("SELECT photo_path FROM issues").fetchone()[0]
+    variants = [images.variant_path(path, size, ext) for size in images.VARIANTS for ext, _, _ in images.FORMATS]
+    with app.app_context():
+        assert all(os.path.exists(uploads.file_path(variant)) for variant in variants)
+    assert images.variant_path(path, "thumb", "webp") in citizen.get("/track").get_data(as_text=True)
+
+    with app.test_request_context():
+        conn.execute("DELETE FROM issues")
+        released = uploads.release(conn, path)
+        conn.commit()
+        uploads.discard(conn, [released])
+        assert not any(os.path.exists(uploads.file_path(name)) for name in [path] + variants)
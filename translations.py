@@ -1,260 +0,0 @@
-TRANSLATIONS = {
-    "en": {
-        "home": "Home",
-        "about_scheme": "About Scheme",
-        "report_issue": "Report Issue",
-        "my_issues": "My Issues",
-        "public_issues": "Public Issues",
-        "public_notices": "Public Notices",
-        "manage_issues": "Manage Issues",
-        "manage_notices": "Manage Notices",
-        "dashboard": "Dashboard",
-        "logout": "Logout",
-        "login": "Login",
-        "official_login": "Official Login",
-        "register": "Register",
-        "search_placeholder": "Search...",
-        "hi": "Hi",
-        "menu": "Menu",
-        
-        # Home Page
-        "hero_title": "Empowering Rural India",
-        "citizen_services": "Citizen Services",
-        "citizen_services_desc": "Direct access to essential panchayat services designed for efficiency and transparency.",
-        "track_status": "Track Status",
-        "track_status_desc": "Check the real-time status of your reported grievances and actions taken.",
-        "latest_notices": "Public Notices",
-        "latest_notices_desc": "View latest circulars, schemes, and announcements from the Gram Panchayat.",
-        "schemes": "Schemes",
-        "schemes_desc": "Explore government schemes available for rural welfare and development.",
-        "active_panchayats": "Active Panchayats",
-        "issues_reported": "Issues Reported",
-        "resolution_rate": "Resolution Rate",
-        "citizens_connected": "Citizens Connected",
-        "discover_vision": "Discover the Vision",
-        "mission_title": "Institutional Messaging System for Rural India",
-        "mission_desc": "Meri Panchayat is an integrated digital governance platform designed to bridge the gap between citizens and administration. Built by NIC, it brings transparency, real-time accountability, and streamlined service delivery to the very heart of rural governance.",
-        "explore_mission": "Explore Our Mission",
-        "lodge_complaint": "Lodge a complaint regarding water, roads, electricity, or other civic amenities.",
-
-        # Footer
-        "information": "Information",
-        "about_us": "About Us",
-        "terms_use": "Terms of Use",
-        "privacy_policy": "Privacy Policy",
-        "contact_us": "Contact Us",
-        "important_links": "Important Links",
-        "contact": "Contact",
-        "ministry_name": "Ministry of Panchayati Raj",
-        "govt_india": "Government of India",
-        "address_line": "Krishi Bhawan, Padubidri - 110001",
-        "official_admin_login": "Official / Admin Login",
-        "designed_by": "Designed & Developed by National Informatics Centre (NIC) | &copy; 2025 All Rights Reserved.",
-
-        # About Page
-        "about_mission_vision": "Our Mission & Vision",
-        "about_hero_desc": "Empowering rural communities through digital transparency, accountability, and unified governance.",
-        "who_we_are": "Who We Are",
-        "inst_rural_digitalization": "Institutionalizing Rural Digitalization",
-        "meri_panchayat_desc_1": "The <strong>Meri Panchayat</strong> initiative is a flagship program by the Ministry of Panchayati Raj, Government of India. It serves as the primary m-Governance platform, designed to bring institutional transparency and real-time efficiency to the very heart of rural administration.",
-        "meri_panchayat_desc_2": "Our mission is to bridge the gap between citizens and local administration. By providing a unified platform for reporting issues, tracking public works, and accessing critical notices, we ensure that every voice in the village is heard and every grievance is addressed through a streamlined, time-bound process.",
-        "the_vision": "The Vision",
-        "vision_desc": "To create a digitally empowered rural society where governance is not just a service, but a collaborative ecosystem accessible to every citizen, down to the last mile.",
-        "the_mission": "The Mission",
-        "mission_full_desc": "To implement state-of-the-art e-Governance solutions that simplify complex administrative processes, enhance citizen engagement, and foster a culture of data-driven local governance.",
-
-        # Report Issue Page
-        "lodge_grievance": "Lodge Public Grievance",
-        "report_form_desc": "Please provide accurate details to help us address your concern promptly.",
-        "select_panchayath": "Select Your Panchayath",
-        "issue_category": "Issue Category",
-        "select_option": "-- Select --",
-        "location_neighborhood": "Location / Neighborhood",
-        "location_placeholder": "Ex. Main Market, Near Primary School",
-        "detailed_description": "Detailed Description",
-        "description_placeholder": "Provide as much detail as possible...",
-        "attach_photo": "Attach Supporting Photo (Optional)",
-        "submit_complaint": "Submit Formal Complaint",
-        "cat_garbage": "Garbage Collection",
-        "cat_water": "Water Supply",
-        "cat_road": "Road Maintenance",
-        "cat_light": "Street Lights",
-        "cat_drainage": "Drainage/Sewerage",
-        "cat_others": "Others",
-
-        # Track Issue Page
-        "track_issue_status": "Track Issue Status",
-        "all_panchayat_issues": "All Panchayat Issues",
-        "my_reported_issues": "My Reported Issues",
-        "public_issues_desc": "Transparency and accountability for every reported concern.",
-        "my_issues_desc": "Track the progress of your submitted reports.",
-        "reported_by": "Reported by",
-        "location": "Location",
-        "date": "Date",
-        "panchayat": "Panchayat",
-        "no_issues_found": "No issues found",
-        "no_issues_desc": "There are no issues to display at the moment.",
-
-        # Notices Page
-        "public_notices_announcements": "Public Notices & Announcements",
-        "issued_by": "Issued by",
-        "no_notices": "No public notices available at the moment.",
-
-        # Profile Page
-        "citizen_profile": "Citizen Profile",
-        "verified_citizen": "Verified Citizen",
-        "email_address": "Email Address",
-        "mobile_number": "Mobile Number",
-        "member_since": "Member Since",
-        "return_to_home": "Return to Home",
-
-        # Auth Pages
-        "welcome_back": "Welcome Back",
-        "login_subtitle": "Login to your citizen account",
-        "email_placeholder": "name@example.com",
-        "password": "Password",
-        "enter_password": "Enter your password",
-        "sign_in": "Sign In",
-        "no_account": "Don't have an account?",
-        "register_here": "Register here",
-        "are_official": "Are you an official?",
-        "official_login_here": "Official Login here",
-        "create_account": "Create Citizen Account",
-        "register_subtitle": "Join Meri Panchayat to report and track issues",
-        "full_name": "Full Name",
-        "fullname_placeholder": "Enter your full name",
-        "mobile_placeholder": "Enter 10-digit mobile number",
-        "already_have_account": "Already have an account?",
-        "choose_password": "Choose a secure password",
-        "register_now": "Register Now"
-    },
-    "kn": {
-        "home": "ಮುಖಪುಟ",
-        "about_scheme": "ಯೋಜನೆ ಬಗ್ಗೆ",
-        "report_issue": "ದೂರು ನೀಡಿ",
-        "my_issues": "ನನ್ನ ದೂರುಗಳು",
-        "public_issues": "ಸಾರ್ವಜನಿಕ ದೂರುಗಳು",
-        "public_notices": "ಸಾರ್ವಜನಿಕ ಸೂಚನೆಗಳು",
-        "manage_issues": "ದೂರು ನಿರ್ವಹಣೆ",
-        "manage_notices": "ಸೂಚನೆ ನಿರ್ವಹಣೆ",
-        "dashboard": "ಡ್ಯಾಶ್‌ಬೋರ್ಡ್",
-        "logout": "ನಿರ್ಗಮಿಸಿ",
-        "login": "ಪ್ರವೇಶಿಸಿ",
-        "official_login": "ಅಧಿಕೃತ ಪ್ರವೇಶ",
-        "register": "ನೋಂದಣಿ ಮಾಡಿ",
-        "search_placeholder": "ಹುಡುಕಿ...",
-        "hi": "ನಮಸ್ಕಾರ",
-        "menu": "ಮೆನು",
-
-        # Home Page
-        "hero_title": "ಗ್ರಾಮೀಣ ಭಾರತದ ಸಬಲೀಕರಣ",
-        "citizen_services": "ನಾಗರಿಕ ಸೇವೆಗಳು",
-        "citizen_services_desc": "ದಕ್ಷತೆ ಮತ್ತು ಪಾರದರ್ಶಕತೆಗಾಗಿ ವಿನ್ಯಾಸಗೊಳಿಸಲಾದ ಪಂಚಾಯತ್ ಸೇವೆಗಳಿಗೆ ನೇರ ಪ್ರವೇಶ.",
-        "track_status": "ಸ್ಥಿತಿ ಪರಿಶೀಲಿಸಿ",
-        "track_status_desc": "ನಿಮ್ಮ ದೂರುಗಳ ಪ್ರಸ್ತುತ ಸ್ಥಿತಿ ಮತ್ತು ತೆಗೆದುಕೊಂಡ ಕ್ರಮಗಳನ್ನು ತಿಳಿಯಿರಿ.",
-        "latest_notices": "ಸಾರ್ವಜನಿಕ ಸೂಚನೆಗಳು",
-        "latest_notices_desc": "ಗ್ರಾಮ ಪಂಚಾಯತ್‌ನ ಇತ್ತೀಚಿನ ಸುತ್ತೋಲೆಗಳು, ಯೋಜನೆಗಳು ಮತ್ತು ಪ್ರಕಟಣೆಗಳನ್ನು ನೋಡಿ.",
-        "schemes": "ಸರ್ಕಾರಿ ಯೋಜನೆಗಳು",
-        "schemes_desc": "ಗ್ರಾಮೀಣ ಕಲ್ಯಾಣ ಮತ್ತು ಅಭಿವೃದ್ಧಿಗಾಗಿ ಲಭ್ಯವಿರುವ ಸರ್ಕಾರಿ ಯೋಜನೆಗಳನ್ನು ತಿಳಿಯಿರಿ.",
-        "active_panchayats": "ಸಕ್ರಿಯ ಪಂಚಾಯತ್‌ಗಳು",
-        "issues_reported": "ವರದಿಯಾದ ದೂರುಗಳು",
-        "resolution_rate": "ಪರಿಹಾರ ದರ",
-        "citizens_connected": "ನೋಂದಾಯಿತ ನಾಗರಿಕರು",
-        "discover_vision": "ನಮ್ಮ ದೃಷ್ಟಿಕೋನ",
-        "mission_title": "ಗ್ರಾಮೀಣ ಭಾರತಕ್ಕಾಗಿ ಡಿಜಿಟಲ್ ಆಡಳಿತ ವೇದಿಕೆ",
-        "mission_desc": "ಮೇರಿ ಪಂಚಾಯತ್ ನಾಗರಿಕರು ಮತ್ತು ಆಡಳಿತದ ನಡುವಿನ ಅಂತರವನ್ನು ಕಡಿಮೆ ಮಾಡಲು ವಿನ್ಯಾಸಗೊಳಿಸಲಾದ ಸಮಗ್ರ ಡಿಜಿಟಲ್ ಆಡಳಿತ ವೇದಿಕೆಯಾಗಿದೆ. ಎನ್‌ಐಸಿ ಅಭಿವೃದ್ಧಿಪಡಿಸಿರುವ ಈ ವೇದಿಕೆಯು ಗ್ರಾಮೀಣ ಆಡಳಿತಕ್ಕೆ ಪಾರದರ್ಶಕತೆ, ನೈಜ-ಸಮಯದ ಹೊಣೆಗಾರಿಕೆ ಮತ್ತು ಸುಗಮ ಸೇವಾ ವಿತರಣೆಯನ್ನು ತರುತ್ತದೆ.",
-        "explore_mission": "ಇನ್ನಷ್ಟು ತಿಳಿಯಿರಿ",
-        "lodge_complaint": "ನೀರು, ರಸ್ತೆಗಳು, ವಿದ್ಯುತ್ ಅಥವಾ ಇತರ ನಾಗರಿಕ ಸೌಲಭ್ಯಗಳ ಬಗ್ಗೆ ದೂರು ನೀಡಿ.",
-
-        # Footer
-        "information": "ಮಾಹಿತಿ",
-        "about_us": "ನಮ್ಮ ಬಗ್ಗೆ",
-        "terms_use": "ಬಳಕೆಯ ನಿಯಮಗಳು",
-        "privacy_policy": "ಗೌಪ್ಯತಾ ನೀತಿ",
-        "contact_us": "ನಮ್ಮನ್ನು ಸಂಪರ್ಕಿಸಿ",
-        "important_links": "ಪ್ರಮುಖ ಲಿಂಕ್‌ಗಳು",
-        "contact": "ಸಂಪರ್ಕ",
-        "ministry_name": "ಪಂಚಾಯತ್ ರಾಜ್ ಸಚಿವಾಲಯ",
-        "govt_india": "ಭಾರತ ಸರ್ಕಾರ",
-        "address_line": "ಕೃಷಿ ಭವನ, ಪಡುಬಿದ್ರಿ - 110001",
-        "official_admin_login": "ಅಧಿಕೃತ / ನಿರ್ವಾಹಕ ಪ್ರವೇಶ",
-        "designed_by": "ರಾಷ್ಟ್ರೀಯ ಮಾಹಿತಿ ವಿಜ್ಞಾನ ಕೇಂದ್ರ (ಎನ್‌ಐಸಿ) ವಿನ್ಯಾಸ ಮತ್ತು ಅಭಿವೃದ್ಧಿ | &copy; 2025 ಎಲ್ಲಾ ಹಕ್ಕುಗಳನ್ನು ಕಾಯ್ದಿರಿಸಲಾಗಿದೆ.",
-
-        # About Page
-        "about_mission_vision": "ನಮ್ಮ ಧ್ಯೇಯ ಮತ್ತು ದೃಷ್ಟಿ",
-        "about_hero_desc": "ಡಿಜಿಟಲ್ ಪಾರದರ್ಶಕತೆ, ಹೊಣೆಗಾರಿಕೆ ಮತ್ತು ಏಕೀಕೃತ ಆಡಳಿತದ ಮೂಲಕ ಗ್ರಾಮೀಣ ಸಮುದಾಯಗಳನ್ನು ಸಬಲೀಕರಣಗೊಳಿಸುವುದು.",
-        "who_we_are": "ನಾವು ಯಾರು",
-        "inst_rural_digitalization": "ಗ್ರಾಮೀಣ ಡಿಜಿಟಲೀಕರಣದ ಸಾಂಸ್ಥಿಕೀಕರಣ",
-        "meri_panchayat_desc_1": "<strong>ಮೇರಿ ಪಂಚಾಯತ್</strong> ಉಪಕ್ರಮವು ಭಾರತ ಸರ್ಕಾರದ ಪಂಚಾಯತ್ ರಾಜ್ ಸಚಿವಾಲಯದ ಪ್ರಮುಖ ಕಾರ್ಯಕ್ರಮವಾಗಿದೆ. ಇದು ಸಾಂಸ್ಥಿಕ ಪಾರದರ್ಶಕತೆ ಮತ್ತು ನೈಜ-ಸಮಯದ ದಕ್ಷತೆಯನ್ನು ಗ್ರಾಮೀಣ ಆಡಳಿತದ ಹೃದಯಭಾಗಕ್ಕೆ ತರಲು ವಿನ್ಯಾಸಗೊಳಿಸಲಾದ ಪ್ರಾಥಮಿಕ ಎಂ-ಗವರ್ನೆನ್ಸ್ ವೇದಿಕೆಯಾಗಿ ಕಾರ್ಯನಿರ್ವಹಿಸುತ್ತದೆ.",
-        "meri_panchayat_desc_2": "ನಾಗರಿಕರು ಮತ್ತು ಸ್ಥಳೀಯ ಆಡಳಿತದ ನಡುವಿನ ಅಂತರವನ್ನು ಕಡಿಮೆ ಮಾಡುವುದು ನಮ್ಮ ಉದ್ದೇಶವಾಗಿದೆ. ದೂರು ವರದಿ ಮಾಡಲು, ಸಾರ್ವಜನಿಕ ಕಾಮಗಾರಿಗಳ ಮೇಲೆ ನಿಗಾ ಇಡಲು ಮತ್ತು ಪ್ರಮುಖ ಸೂಚನೆಗಳನ್ನು ಪಡೆಯಲು ಏಕೀಕೃತ ವೇದಿಕೆಯನ್ನು ಒದಗಿಸುವ ಮೂಲಕ, ಗ್ರಾಮದ ಪ್ರತಿಯೊಬ್ಬರ ಧ್ವನಿಯನ್ನು ಆಲಿಸಲಾಗುತ್ತದೆ ಮತ್ತು ಪ್ರತಿಯೊಂದು ದೂರನ್ನು ಶೀಘ್ರವಾಗಿ ಪರಿಹರಿಸಲಾಗುತ್ತದೆ ಎಂಬ ಭರವಸೆ ನೀಡುತ್ತೇವೆ.",
-        "the_vision": "ದೂರದೃಷ್ಟಿ",
-        "vision_desc": "ಆಡಳಿತವು ಕೇವಲ ಸೇವೆಯಾಗಿರದೆ, ಪ್ರತಿಯೊಬ್ಬ ನಾಗರಿಕನಿಗೂ ತಲುಪುವ ಸಹಯೋಗದ ವ್ಯವಸ್ಥೆಯಾಗಿರುವ ಡಿಜಿಟಲ್ ಸಬಲೀಕೃತ ಗ್ರಾಮೀಣ ಸಮಾಜವನ್ನು ನಿರ್ಮಿಸುವುದು.",
-        "the_mission": "ಧ್ಯೇಯ",
-        "mission_full_desc": "ಸಂಕೀರ್ಣ ಆಡಳಿತಾತ್ಮಕ ಪ್ರಕ್ರಿಯೆಗಳನ್ನು ಸರಳಗೊಳಿಸುವ, ನಾಗರಿಕರ ಸಹಭಾಗಿತ್ವವನ್ನು ಹೆಚ್ಚಿಸುವ ಮತ್ತು ದತ್ತಾಂಶ ಆಧಾರಿತ ಸ್ಥಳೀಯ ಆಡಳಿತದ ಸಂಸ್ಕೃತಿಯನ್ನು ಬೆಳೆಸುವ ಅತ್ಯಾಧುನಿಕ ಇ-ಗವರ್ನೆನ್ಸ್ ಪರಿಹಾರಗಳನ್ನು ಜಾರಿಗೆ ತರುವುದು.",
-
-        # Report Issue Page
-        "lodge_grievance": "ಸಾರ್ವಜನಿಕ ದೂರು ನೀಡಿ",
-        "report_form_desc": "ನಿಮ್ಮ ದೂರನ್ನು ಶೀಘ್ರವಾಗಿ ಪರಿಹರಿಸಲು ದಯವಿಟ್ಟು ನಿಖರವಾದ ವಿವರಗಳನ್ನು ನೀಡಿ.",
-        "select_panchayath": "ನಿಮ್ಮ ಪಂಚಾಯತ್ ಆಯ್ಕೆಮಾಡಿ",
-        "issue_category": "ದೂರಿನ ವರ್ಗ",
-        "select_option": "-- ಆಯ್ಕೆಮಾಡಿ --",
-        "location_neighborhood": "ಸ್ಥಳ / ನೆರೆಹೊರೆ",
-        "location_placeholder": "ಉದಾಹರಣೆ: ಮುಖ್ಯ ಮಾರುಕಟ್ಟೆ, ಪ್ರಾಥಮಿಕ ಶಾಲೆಯ ಹತ್ತಿರ",
-        "detailed_description": "ವಿವರವಾದ ವಿವರಣೆ",
-        "description_placeholder": "ಸಾಧ್ಯವಾದಷ್ಟು ಹೆಚ್ಚಿನ ವಿವರಗಳನ್ನು ನೀಡಿ...",
-        "attach_photo": "ಪೂರಕ ಫೋಟೋ ಲಗತ್ತಿಸಿ (ಐಚ್ಛಿಕ)",
-        "submit_complaint": "ದೂರನ್ನು ಸಲ್ಲಿಸಿ",
-        "cat_garbage": "ಕಸ ಸಂಗ್ರಹಣೆ",
-        "cat_water": "ನೀರು ಸರಬರಾಜು",
-        "cat_road": "ರಸ್ತೆ ನಿರ್ವಹಣೆ",
-        "cat_light": "ಬೀದಿ ದೀಪಗಳು",
-        "cat_drainage": "ಚರಂಡಿ ವ್ಯವಸ್ಥೆ",
-        "cat_others": "ಇತರರು",
-
-        # Track Issue Page
-        "track_issue_status": "ದೂರಿನ ಸ್ಥಿತಿ ಪರಿಶೀಲಿಸಿ",
-        "all_panchayat_issues": "ಪಂಚಾಯತ್‌ನ ಎಲ್ಲಾ ದೂರುಗಳು",
-        "my_reported_issues": "ನನ್ನ ದೂರುಗಳು",
-        "public_issues_desc": "ವರದಿಯಾದ ಪ್ರತಿಯೊಂದು ದೂರಿನ ಬಗ್ಗೆ ಪಾರದರ್ಶಕತೆ ಮತ್ತು ಹೊಣೆಗಾರಿಕೆ.",
-        "my_issues_desc": "ನೀವು ಸಲ್ಲಿಸಿದ ದೂರುಗಳ ಪ್ರಗತಿಯನ್ನು ಪರಿಶೀಲಿಸಿ.",
-        "reported_by": "ವರದಿ ಮಾಡಿದವರು",
-        "location": "ಸ್ಥಳ",
-        "date": "ದಿನಾಂಕ",
-        "panchayat": "ಪಂಚಾಯತ್",
-        "no_issues_found": "ಯಾವುದೇ ದೂರುಗಳು ಕಂಡುಬಂದಿಲ್ಲ",
-        "no_issues_desc": "ಪ್ರಸ್ತುತ ಪ್ರದರ್ಶಿಸಲು ಯಾವುದೇ ದೂರುಗಳಿಲ್ಲ.",
-
-        # Notices Page
-        "public_notices_announcements": "ಸಾರ್ವಜನಿಕ ಸೂಚನೆಗಳು ಮತ್ತು ಪ್ರಕಟಣೆಗಳು",
-        "issued_by": "ನೀಡಿದವರು",
-        "no_notices": "ಪ್ರಸ್ತುತ ಯಾವುದೇ ಸಾರ್ವಜನಿಕ ಸೂಚನೆಗಳು ಲಭ್ಯವಿಲ್ಲ.",
-
-        # Profile Page
-        "citizen_profile": "ನಾಗರಿಕ ವಿವರ",
-        "verified_citizen": "ಪರಿಶೀಲಿಸಿದ ನಾಗರಿಕ",
-        "email_address": "ಇಮೇಲ್ ವಿಳಾಸ",
-        "mobile_number": "ಮೊಬೈಲ್ ಸಂಖ್ಯೆ",
-        "member_since": "ಸದಸ್ಯರಾದ ದಿನಾಂಕ",
-        "return_to_home": "ಮುಖಪುಟಕ್ಕೆ ಹಿಂತಿರುಗಿ",
-
-        # Auth Pages
-        "welcome_back": "ಮತ್ತೊಮ್ಮೆ ಸುಸ್ವಾಗತ",
-        "login_subtitle": "ನಿಮ್ಮ ನಾಗರಿಕ ಖಾತೆಗೆ ಪ್ರವೇಶಿಸಿ",
-        "email_placeholder": "name@example.com",
-        "password": "ಪಾಸ್‌ವರ್ಡ್",
-        "enter_password": "ನಿಮ್ಮ ಪಾಸ್‌ವರ್ಡ್ ನಮೂದಿಸಿ",
-        "sign_in": "ಪ್ರವೇಶಿಸಿ",
-        "no_account": "ಖಾತೆ ಹೊಂದಿಲ್ಲವೇ?",
-        "register_here": "ಇಲ್ಲಿ ನೋಂದಾಯಿಸಿ",
-        "are_official": "ನೀವು ಅಧಿಕಾರಿಯೇ?",
-        "official_login_here": "ಅಧಿಕೃತ ಪ್ರವೇಶ ಇಲ್ಲಿ",
-        "create_account": "ನಾಗರಿಕ ಖಾತೆ ರಚಿಸಿ",
-        "register_subtitle": "ದೂರು ನೀಡಲು ಮತ್ತು ಪ್ರಗತಿ ನೋಡಲು ಮೇರಿ ಪಂಚಾಯತ್ ಸೇರಿ",
-        "full_name": "ಪೂರ್ಣ ಹೆಸರು",
-        "fullname_placeholder": "ನಿಮ್ಮ ಪೂರ್ಣ ಹೆಸರನ್ನು ನಮೂದಿಸಿ",
-        "mobile_placeholder": "10-ಅಂಕಿಯ ಮೊಬೈಲ್ ಸಂಖ್ಯೆ ನಮೂದಿಸಿ",
-        "already_have_account": "ಈಗಾಗಲೇ ಖಾತೆ ಹೊಂದಿದ್ದೀರಾ?",
-        "choose_password": "ಸುರಕ್ಷಿತ ಪಾಸ್‌ವರ್ಡ್ ಆಯ್ಕೆಮಾಡಿ",
-        "register_now": "ಈಗಲೇ ನೋಂದಾಯಿಸಿ"
-    }
-}
@@ -0,0 +1,121 @@
+import importlib
+import pkgutil
+import threading
+
+from flask import current_app, g, has_request_context, session
+from flask import render_template as flask_render_template
+from jinja2.ext import Extension
+from jinja2.lexer import Token
+
+# ---------------- TRANSLATIONS ----------------
+#
+# One module per language (en.py, kn.py, ...) defining MESSAGES. A language
+# module is imported the first time someone uses that language and merged
+# over English once, so every lookup is a single dict.get with the fallback
+# already applied. Adding a language is adding a file.
+#
+# Templates are compiled once per language: TranslationExtension replaces
+# get_text('literal') with the translated text while the template compiles,
+# so a cached template renders without any lookups. get_text() stays
+# available as a global for keys that are only known at render time.
+
+DEFAULT_LANGUAGE = "en"
+LANGUAGES = tuple(sorted(name for _, name, is_pkg in pkgutil.iter_modules(__path__) if not is_pkg))
+
+_catalogs = {}
+_lock = threading.Lock()
+
+
+def catalog(lang):
+    """Flat key -> text dict for `lang`, English filled in where missing."""
+    messages = _catalogs.get(lang)
+    if messages is None:
+        with _lock:
+            messages = _catalogs.get(lang)
+            if messages is None:
+                messages = dict(importlib.import_module(f"{__name__}.{DEFAULT_LANGUAGE}").MESSAGES)
+                if lang != DEFAULT_LANGUAGE:
+                    messages.update(importlib.import_module(f"{__name__}.{lang}").MESSAGES)
+                _catalogs[lang] = messages
+    return messages
+
+
+def current_language():
+    """The session's language, resolved once per request."""
+    if not has_request_context():
+        return DEFAULT_LANGUAGE
+    lang = g.get("lang")
+    if lang is None:
+        lang = session.get("lang", DEFAULT_LANGUAGE)
+        if lang not in LANGUAGES:
+            lang = DEFAULT_LANGUAGE
+        g.lang = lang
+    return lang
+
+
+def get_text(key):
+    return catalog(current_language()).get(key, key)
+
+
+# ---------------- COMPILE-TIME LOOKUP ----------------
+
+# get_text ( 'key' )
+_CALL = (("name", "get_text"), ("lparen", None), ("string", None), ("rparen", None))
+
+
+def _matches(tokens):
+    return all(
+        token.type == kind and (value is None or token.value == value)
+        for token, (kind, value) in zip(tokens, _CALL)
+    )
+
+
+class TranslationExtension(Extension):
+    """Rewrite get_text('key') into the translated string literal for the
+    environment's language. Calls with non-literal arguments are left alone."""
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(language=DEFAULT_LANGUAGE)
+
+    def filter_stream(self, stream):
+        messages = catalog(self.environment.language)
+        pending = []
+        for token in stream:
+            pending.append(token)
+            while pending and not _matches(pending):
+                yield pending.pop(0)
+            if len(pending) == len(_CALL):
+                key = pending[2].value
+                yield Token(pending[0].lineno, "string", messages.get(key, key))
+                pending = []
+        yield from pending
+
+
+def environment(app, lang):
+    """Jinja environment whose compiled templates have `lang` baked in.
+
+    An overlay shares the loader, globals and filters of app.jinja_env but
+    keeps its own template cache, so each language compiles each template
+    once.
+    """
+    envs = app.extensions.setdefault("translation_environments", {})
+    env = envs.get(lang)
+    if env is None:
+        with _lock:
+            env = envs.get(lang)
+            if env is None:
+                env = app.jinja_env.overlay(extensions=[TranslationExtension])
+                env.language = lang
+                envs[lang] = env
+    return env
+
+
+def render_template(template_name_or_list, **context):
+    """flask.render_template using the current language's environment."""
+    env = environment(current_app._get_current_object(), current_language())
+    return flask_render_template(env.get_or_select_template(template_name_or_list), **context)
+
+
+def init_app(app):
+    app.add_template_global(get_text)
@@ -0,0 +1,143 @@
+# English: the reference catalog. Every key used by a template must be here.
+
+MESSAGES = {
+    "home": "Home",
+    "about_scheme": "About Scheme",
+    "report_issue": "Report Issue",
+    "my_issues": "My Issues",
+    "public_issues": "Public Issues",
+    "public_notices": "Public Notices",
+    "manage_issues": "Manage Issues",
+    "manage_notices": "Manage Notices",
+    "dashboard": "Dashboard",
+    "logout": "Logout",
+    "login": "Login",
+    "official_login": "Official Login",
+    "register": "Register",
+    "search_placeholder": "Search...",
+    "hi": "Hi",
+    "menu": "Menu",
+    
+    # Home Page
+    "hero_title": "Empowering Rural India",
+    "citizen_services": "Citizen Services",
+    "citizen_services_desc": "Direct access to essential panchayat services designed for efficiency and transparency.",
+    "track_status": "Track Status",
+    "track_status_desc": "Check the real-time status of your reported grievances and actions taken.",
+    "latest_notices": "Public Notices",
+    "latest_notices_desc": "View latest circulars, schemes, and announcements from the Gram Panchayat.",
+    "schemes": "Schemes",
+    "schemes_desc": "Explore government schemes available for rural welfare and development.",
+    "active_panchayats": "Active Panchayats",
+    "issues_reported": "Issues Reported",
+    "resolution_rate": "Resolution Rate",
+    "citizens_connected": "Citizens Connected",
+    "discover_vision": "Discover the Vision",
+    "mission_title": "Institutional Messaging System for Rural India",
+    "mission_desc": "Meri Panchayat is an integrated digital governance platform designed to bridge the gap between citizens and administration. Built by NIC, it brings transparency, real-time accountability, and streamlined service delivery to the very heart of rural governance.",
+    "explore_mission": "Explore Our Mission",
+    "lodge_complaint": "Lodge a complaint regarding water, roads, electricity, or other civic amenities.",
+
+    # Footer
+    "information": "Information",
+    "about_us": "About Us",
+    "terms_use": "Terms of Use",
+    "privacy_policy": "Privacy Policy",
+    "contact_us": "Contact Us",
+    "important_links": "Important Links",
+    "contact": "Contact",
+    "ministry_name": "Ministry of Panchayati Raj",
+    "govt_india": "Government of India",
+    "address_line": "Krishi Bhawan, Padubidri - 110001",
+    "official_admin_login": "Official / Admin Login",
+    "designed_by": "Designed & Developed by National Informatics Centre (NIC) | &copy; 2025 All Rights Reserved.",
+
+    # About Page
+    "about_mission_vision": "Our Mission & Vision",
+    "about_hero_desc": "Empowering rural communities through digital transparency, accountability, and unified governance.",
+    "who_we_are": "Who We Are",
+    "inst_rural_digitalization": "Institutionalizing Rural Digitalization",
+    "meri_panchayat_desc_1": "The <strong>Meri Panchayat</strong> initiative is a flagship program by the Ministry of Panchayati Raj, Government of India. It serves as the primary m-Governance platform, designed to bring institutional transparency and real-time efficiency to the very heart of rural administration.",
+    "meri_panchayat_desc_2": "Our mission is to bridge the gap between citizens and local administration. By providing a unified platform for reporting issues, tracking public works, and accessing critical notices, we ensure that every voice in the village is heard and every grievance is addressed through a streamlined, time-bound process.",
+    "the_vision": "The Vision",
+    "vision_desc": "To create a digitally empowered rural society where governance is not just a service, but a collaborative ecosystem accessible to every citizen, down to the last mile.",
+    "the_mission": "The Mission",
+    "mission_full_desc": "To implement state-of-the-art e-Governance solutions that simplify complex administrative processes, enhance citizen engagement, and foster a culture of data-driven local governance.",
+
+    # Report Issue Page
+    "lodge_grievance": "Lodge Public Grievance",
+    "report_form_desc": "Please provide accurate details to help us address your concern promptly.",
+    "select_panchayath": "Select Your Panchayath",
+    "issue_category": "Issue Category",
+    "select_option": "-- Select --",
+    "location_neighborhood": "Location / Neighborhood",
+    "location_placeholder": "Ex. Main Market, Near Primary School",
+    "detailed_description": "Detailed Description",
+    "description_placeholder": "Provide as much detail as possible...",
+    "attach_photo": "Attach Supporting Photo (Optional)",
+    "submit_complaint": "Submit Formal Complaint",
+    "cat_garbage": "Garbage Collection",
+    "cat_water": "Water Supply",
+    "cat_road": "Road Maintenance",
+    "cat_light": "Street Lights",
+    "cat_drainage": "Drainage/Sewerage",
+    "cat_others": "Others",
+
+    # Track Issue Page
+    "track_issue_status": "Track Issue Status",
+    "all_panchayat_issues": "All Panchayat Issues",
+    "my_reported_issues": "My Reported Issues",
+    "public_issues_desc": "Transparency and accountability for every reported concern.",
+    "my_issues_desc": "Track the progress of your submitted reports.",
+    "reported_by": "Reported by",
+    "location": "Location",
+    "date": "Date",
+    "panchayat": "Panchayat",
+    "no_issues_found": "No issues found",
+    "no_issues_desc": "There are no issues to display at the moment.",
+    "show_history": "Show archived issues",
+    "hide_history": "Hide archived issues",
+    "archived": "Archived",
+
+    # Notices Page
+    "public_notices_announcements": "Public Notices & Announcements",
+    "issued_by": "Issued by",
+    "no_notices": "No public notices available at the moment.",
+    "load_more": "Load More",
+
+    # Profile Page
+    "citizen_profile": "Citizen Profile",
+    "verified_citizen": "Verified Citizen",
+    "email_address": "Email Address",
+    "mobile_number": "Mobile Number",
+    "member_since": "Member Since",
+    "return_to_home": "Return to Home",
+
+    # Auth Pages
+    "welcome_back": "Welcome Back",
+    "login_subtitle": "Login to your citizen account",
+    "email_placeholder": "name@example.com",
+    "password": "Password",
+    "enter_password": "Enter your password",
+    "sign_in": "Sign In",
+    "no_account": "Don't have an account?",
+    "register_here": "Register here",
+    "are_official": "Are you an official?",
+    "official_login_here": "Official Login here",
+    "create_account": "Create Citizen Account",
+    "register_subtitle": "Join Meri Panchayat to report and track issues",
+    "full_name": "Full Name",
+    "fullname_placeholder": "Enter your full name",
+    "mobile_placeholder": "Enter 10-digit mobile number",
+    "already_have_account": "Already have an account?",
+    "choose_password": "Choose a secure password",
+    "register_now": "Register Now",
+
+    # Search
+    "search": "Search",
+    "search_results": "Search Results",
+    "search_hint": "Find issues and notices by any word in their title, description or location.",
+    "all_panchayaths": "All Panchayaths",
+    "all_statuses": "All Statuses",
+    "no_results": "No results found"
+}
@@ -0,0 +1,143 @@
+# Kannada. Missing keys fall back to English (see translations/__init__.py).
+
+MESSAGES = {
+    "home": "ಮುಖಪುಟ",
+    "about_scheme": "ಯೋಜನೆ ಬಗ್ಗೆ",
+    "report_issue": "ದೂರು ನೀಡಿ",
+    "my_issues": "ನನ್ನ ದೂರುಗಳು",
+    "public_issues": "ಸಾರ್ವಜನಿಕ ದೂರುಗಳು",
+    "public_notices": "ಸಾರ್ವಜನಿಕ ಸೂಚನೆಗಳು",
+    "manage_issues": "ದೂರು ನಿರ್ವಹಣೆ",
+    "manage_notices": "ಸೂಚನೆ ನಿರ್ವಹಣೆ",
+    "dashboard": "ಡ್ಯಾಶ್‌ಬೋರ್ಡ್",
+    "logout": "ನಿರ್ಗಮಿಸಿ",
+    "login": "ಪ್ರವೇಶಿಸಿ",
+    "official_login": "ಅಧಿಕೃತ ಪ್ರವೇಶ",
+    "register": "ನೋಂದಣಿ ಮಾಡಿ",
+    "search_placeholder": "ಹುಡುಕಿ...",
+    "hi": "ನಮಸ್ಕಾರ",
+    "menu": "ಮೆನು",
+
+    # Home Page
+    "hero_title": "ಗ್ರಾಮೀಣ ಭಾರತದ ಸಬಲೀಕರಣ",
+    "citizen_services": "ನಾಗರಿಕ ಸೇವೆಗಳು",
+    "citizen_services_desc": "ದಕ್ಷತೆ ಮತ್ತು ಪಾರದರ್ಶಕತೆಗಾಗಿ ವಿನ್ಯಾಸಗೊಳಿಸಲಾದ ಪಂಚಾಯತ್ ಸೇವೆಗಳಿಗೆ ನೇರ ಪ್ರವೇಶ.",
+    "track_status": "ಸ್ಥಿತಿ ಪರಿಶೀಲಿಸಿ",
+    "track_status_desc": "ನಿಮ್ಮ ದೂರುಗಳ ಪ್ರಸ್ತುತ ಸ್ಥಿತಿ ಮತ್ತು ತೆಗೆದುಕೊಂಡ ಕ್ರಮಗಳನ್ನು ತಿಳಿಯಿರಿ.",
+    "latest_notices": "ಸಾರ್ವಜನಿಕ ಸೂಚನೆಗಳು",
+    "latest_notices_desc": "ಗ್ರಾಮ ಪಂಚಾಯತ್‌ನ ಇತ್ತೀಚಿನ ಸುತ್ತೋಲೆಗಳು, ಯೋಜನೆಗಳು ಮತ್ತು ಪ್ರಕಟಣೆಗಳನ್ನು ನೋಡಿ.",
+    "schemes": "ಸರ್ಕಾರಿ ಯೋಜನೆಗಳು",
+    "schemes_desc": "ಗ್ರಾಮೀಣ ಕಲ್ಯಾಣ ಮತ್ತು ಅಭಿವೃದ್ಧಿಗಾಗಿ ಲಭ್ಯವಿರುವ ಸರ್ಕಾರಿ ಯೋಜನೆಗಳನ್ನು ತಿಳಿಯಿರಿ.",
+    "active_panchayats": "ಸಕ್ರಿಯ ಪಂಚಾಯತ್‌ಗಳು",
+    "issues_reported": "ವರದಿಯಾದ ದೂರುಗಳು",
+    "resolution_rate": "ಪರಿಹಾರ ದರ",
+    "citizens_connected": "ನೋಂದಾಯಿತ ನಾಗರಿಕರು",
+    "discover_vision": "ನಮ್ಮ ದೃಷ್ಟಿಕೋನ",
+    "mission_title": "ಗ್ರಾಮೀಣ ಭಾರತಕ್ಕಾಗಿ ಡಿಜಿಟಲ್ ಆಡಳಿತ ವೇದಿಕೆ",
+    "mission_desc": "ಮೇರಿ ಪಂಚಾಯತ್ ನಾಗರಿಕರು ಮತ್ತು ಆಡಳಿತದ ನಡುವಿನ ಅಂತರವನ್ನು ಕಡಿಮೆ ಮಾಡಲು ವಿನ್ಯಾಸಗೊಳಿಸಲಾದ ಸಮಗ್ರ ಡಿಜಿಟಲ್ ಆಡಳಿತ ವೇದಿಕೆಯಾಗಿದೆ. ಎನ್‌ಐಸಿ ಅಭಿವೃದ್ಧಿಪಡಿಸಿರುವ ಈ ವೇದಿಕೆಯು ಗ್ರಾಮೀಣ ಆಡಳಿತಕ್ಕೆ ಪಾರದರ್ಶಕತೆ, ನೈಜ-ಸಮಯದ ಹೊಣೆಗಾರಿಕೆ ಮತ್ತು ಸುಗಮ ಸೇವಾ ವಿತರಣೆಯನ್ನು ತರುತ್ತದೆ.",
+    "explore_mission": "ಇನ್ನಷ್ಟು ತಿಳಿಯಿರಿ",
+    "lodge_complaint": "ನೀರು, ರಸ್ತೆಗಳು, ವಿದ್ಯುತ್ ಅಥವಾ ಇತರ ನಾಗರಿಕ ಸೌಲಭ್ಯಗಳ ಬಗ್ಗೆ ದೂರು ನೀಡಿ.",
+
+    # Footer
+    "information": "ಮಾಹಿತಿ",
+    "about_us": "ನಮ್ಮ ಬಗ್ಗೆ",
+    "terms_use": "ಬಳಕೆಯ ನಿಯಮಗಳು",
+    "privacy_policy": "ಗೌಪ್ಯತಾ ನೀತಿ",
+    "contact_us": "ನಮ್ಮನ್ನು ಸಂಪರ್ಕಿಸಿ",
+    "important_links": "ಪ್ರಮುಖ ಲಿಂಕ್‌ಗಳು",
+    "contact": "ಸಂಪರ್ಕ",
+    "ministry_name": "ಪಂಚಾಯತ್ ರಾಜ್ ಸಚಿವಾಲಯ",
+    "govt_india": "ಭಾರತ ಸರ್ಕಾರ",
+    "address_line": "ಕೃಷಿ ಭವನ, ಪಡುಬಿದ್ರಿ - 110001",
+    "official_admin_login": "ಅಧಿಕೃತ / ನಿರ್ವಾಹಕ ಪ್ರವೇಶ",
+    "designed_by": "ರಾಷ್ಟ್ರೀಯ ಮಾಹಿತಿ ವಿಜ್ಞಾನ ಕೇಂದ್ರ (ಎನ್‌ಐಸಿ) ವಿನ್ಯಾಸ ಮತ್ತು ಅಭಿವೃದ್ಧಿ | &copy; 2025 ಎಲ್ಲಾ ಹಕ್ಕುಗಳನ್ನು ಕಾಯ್ದಿರಿಸಲಾಗಿದೆ.",
+
+    # About Page
+    "about_mission_vision": "ನಮ್ಮ ಧ್ಯೇಯ ಮತ್ತು ದೃಷ್ಟಿ",
+    "about_hero_desc": "ಡಿಜಿಟಲ್ ಪಾರದರ್ಶಕತೆ, ಹೊಣೆಗಾರಿಕೆ ಮತ್ತು ಏಕೀಕೃತ ಆಡಳಿತದ ಮೂಲಕ ಗ್ರಾಮೀಣ ಸಮುದಾಯಗಳನ್ನು ಸಬಲೀಕರಣಗೊಳಿಸುವುದು.",
+    "who_we_are": "ನಾವು ಯಾರು",
+    "inst_rural_digitalization": "ಗ್ರಾಮೀಣ ಡಿಜಿಟಲೀಕರಣದ ಸಾಂಸ್ಥಿಕೀಕರಣ",
+    "meri_panchayat_desc_1": "<strong>ಮೇರಿ ಪಂಚಾಯತ್</strong> ಉಪಕ್ರಮವು ಭಾರತ ಸರ್ಕಾರದ ಪಂಚಾಯತ್ ರಾಜ್ ಸಚಿವಾಲಯದ ಪ್ರಮುಖ ಕಾರ್ಯಕ್ರಮವಾಗಿದೆ. ಇದು ಸಾಂಸ್ಥಿಕ ಪಾರದರ್ಶಕತೆ ಮತ್ತು ನೈಜ-ಸಮಯದ ದಕ್ಷತೆಯನ್ನು ಗ್ರಾಮೀಣ ಆಡಳಿತದ ಹೃದಯಭಾಗಕ್ಕೆ ತರಲು ವಿನ್ಯಾಸಗೊಳಿಸಲಾದ ಪ್ರಾಥಮಿಕ ಎಂ-ಗವರ್ನೆನ್ಸ್ ವೇದಿಕೆಯಾಗಿ ಕಾರ್ಯನಿರ್ವಹಿಸುತ್ತದೆ.",
+    "meri_panchayat_desc_2": "ನಾಗರಿಕರು ಮತ್ತು ಸ್ಥಳೀಯ ಆಡಳಿತದ ನಡುವಿನ ಅಂತರವನ್ನು ಕಡಿಮೆ ಮಾಡುವುದು ನಮ್ಮ ಉದ್ದೇಶವಾಗಿದೆ. ದೂರು ವರದಿ ಮಾಡಲು, ಸಾರ್ವಜನಿಕ ಕಾಮಗಾರಿಗಳ ಮೇಲೆ ನಿಗಾ ಇಡಲು ಮತ್ತು ಪ್ರಮುಖ ಸೂಚನೆಗಳನ್ನು ಪಡೆಯಲು ಏಕೀಕೃತ ವೇದಿಕೆಯನ್ನು ಒದಗಿಸುವ ಮೂಲಕ, ಗ್ರಾಮದ ಪ್ರತಿಯೊಬ್ಬರ ಧ್ವನಿಯನ್ನು ಆಲಿಸಲಾಗುತ್ತದೆ ಮತ್ತು ಪ್ರತಿಯೊಂದು ದೂರನ್ನು ಶೀಘ್ರವಾಗಿ ಪರಿಹರಿಸಲಾಗುತ್ತದೆ ಎಂಬ ಭರವಸೆ ನೀಡುತ್ತೇವೆ.",
+    "the_vision": "ದೂರದೃಷ್ಟಿ",
+    "vision_desc": "ಆಡಳಿತವು ಕೇವಲ ಸೇವೆಯಾಗಿರದೆ, ಪ್ರತಿಯೊಬ್ಬ ನಾಗರಿಕನಿಗೂ ತಲುಪುವ ಸಹಯೋಗದ ವ್ಯವಸ್ಥೆಯಾಗಿರುವ ಡಿಜಿಟಲ್ ಸಬಲೀಕೃತ ಗ್ರಾಮೀಣ ಸಮಾಜವನ್ನು ನಿರ್ಮಿಸುವುದು.",
+    "the_mission": "ಧ್ಯೇಯ",
+    "mission_full_desc": "ಸಂಕೀರ್ಣ ಆಡಳಿತಾತ್ಮಕ ಪ್ರಕ್ರಿಯೆಗಳನ್ನು ಸರಳಗೊಳಿಸುವ, ನಾಗರಿಕರ ಸಹಭಾಗಿತ್ವವನ್ನು ಹೆಚ್ಚಿಸುವ ಮತ್ತು ದತ್ತಾಂಶ ಆಧಾರಿತ ಸ್ಥಳೀಯ ಆಡಳಿತದ ಸಂಸ್ಕೃತಿಯನ್ನು ಬೆಳೆಸುವ ಅತ್ಯಾಧುನಿಕ ಇ-ಗವರ್ನೆನ್ಸ್ ಪರಿಹಾರಗಳನ್ನು ಜಾರಿಗೆ ತರುವುದು.",
+
+    # Report Issue Page
+    "lodge_grievance": "ಸಾರ್ವಜನಿಕ ದೂರು ನೀಡಿ",
+    "report_form_desc": "ನಿಮ್ಮ ದೂರನ್ನು ಶೀಘ್ರವಾಗಿ ಪರಿಹರಿಸಲು ದಯವಿಟ್ಟು ನಿಖರವಾದ ವಿವರಗಳನ್ನು ನೀಡಿ.",
+    "select_panchayath": "ನಿಮ್ಮ ಪಂಚಾಯತ್ ಆಯ್ಕೆಮಾಡಿ",
+    "issue_category": "ದೂರಿನ ವರ್ಗ",
+    "select_option": "-- ಆಯ್ಕೆಮಾಡಿ --",
+    "location_neighborhood": "ಸ್ಥಳ / ನೆರೆಹೊರೆ",
+    "location_placeholder": "ಉದಾಹರಣೆ: ಮುಖ್ಯ ಮಾರುಕಟ್ಟೆ, ಪ್ರಾಥಮಿಕ ಶಾಲೆಯ ಹತ್ತಿರ",
+    "detailed_description": "ವಿವರವಾದ ವಿವರಣೆ",
+    "description_placeholder": "ಸಾಧ್ಯವಾದಷ್ಟು ಹೆಚ್ಚಿನ ವಿವರಗಳನ್ನು ನೀಡಿ...",
+    "attach_photo": "ಪೂರಕ ಫೋಟೋ ಲಗತ್ತಿಸಿ (ಐಚ್ಛಿಕ)",
+    "submit_complaint": "ದೂರನ್ನು ಸಲ್ಲಿಸಿ",
+    "cat_garbage": "ಕಸ ಸಂಗ್ರಹಣೆ",
+    "cat_water": "ನೀರು ಸರಬರಾಜು",
+    "cat_road": "ರಸ್ತೆ ನಿರ್ವಹಣೆ",
+    "cat_light": "ಬೀದಿ ದೀಪಗಳು",
+    "cat_drainage": "ಚರಂಡಿ ವ್ಯವಸ್ಥೆ",
+    "cat_others": "ಇತರರು",
+
+    # Track Issue Page
+    "track_issue_status": "ದೂರಿನ ಸ್ಥಿತಿ ಪರಿಶೀಲಿಸಿ",
+    "all_panchayat_issues": "ಪಂಚಾಯತ್‌ನ ಎಲ್ಲಾ ದೂರುಗಳು",
+    "my_reported_issues": "ನನ್ನ ದೂರುಗಳು",
+    "public_issues_desc": "ವರದಿಯಾದ ಪ್ರತಿಯೊಂದು ದೂರಿನ ಬಗ್ಗೆ ಪಾರದರ್ಶಕತೆ ಮತ್ತು ಹೊಣೆಗಾರಿಕೆ.",
+    "my_issues_desc": "ನೀವು ಸಲ್ಲಿಸಿದ ದೂರುಗಳ ಪ್ರಗತಿಯನ್ನು ಪರಿಶೀಲಿಸಿ.",
+    "reported_by": "ವರದಿ ಮಾಡಿದವರು",
+    "location": "ಸ್ಥಳ",
+    "date": "ದಿನಾಂಕ",
+    "panchayat": "ಪಂಚಾಯತ್",
+    "no_issues_found": "ಯಾವುದೇ ದೂರುಗಳು ಕಂಡುಬಂದಿಲ್ಲ",
+    "no_issues_desc": "ಪ್ರಸ್ತುತ ಪ್ರದರ್ಶಿಸಲು ಯಾವುದೇ ದೂರುಗಳಿಲ್ಲ.",
+    "show_history": "ಆರ್ಕೈವ್ ಮಾಡಿದ ದೂರುಗಳನ್ನು ತೋರಿಸಿ",
+    "hide_history": "ಆರ್ಕೈವ್ ಮಾಡಿದ ದೂರುಗಳನ್ನು ಮರೆಮಾಡಿ",
+    "archived": "ಆರ್ಕೈವ್ ಮಾಡಲಾಗಿದೆ",
+
+    # Notices Page
+    "public_notices_announcements": "ಸಾರ್ವಜನಿಕ ಸೂಚನೆಗಳು ಮತ್ತು ಪ್ರಕಟಣೆಗಳು",
+    "issued_by": "ನೀಡಿದವರು",
+    "no_notices": "ಪ್ರಸ್ತುತ ಯಾವುದೇ ಸಾರ್ವಜನಿಕ ಸೂಚನೆಗಳು ಲಭ್ಯವಿಲ್ಲ.",
+    "load_more": "ಇನ್ನಷ್ಟು ತೋರಿಸಿ",
+
+    # Profile Page
+    "citizen_profile": "ನಾಗರಿಕ ವಿವರ",
+    "verified_citizen": "ಪರಿಶೀಲಿಸಿದ ನಾಗರಿಕ",
+    "email_address": "ಇಮೇಲ್ ವಿಳಾಸ",
+    "mobile_number": "ಮೊಬೈಲ್ ಸಂಖ್ಯೆ",
+    "member_since": "ಸದಸ್ಯರಾದ ದಿನಾಂಕ",
+    "return_to_home": "ಮುಖಪುಟಕ್ಕೆ ಹಿಂತಿರುಗಿ",
+
+    # Auth Pages
+    "welcome_back": "ಮತ್ತೊಮ್ಮೆ ಸುಸ್ವಾಗತ",
+    "login_subtitle": "ನಿಮ್ಮ ನಾಗರಿಕ ಖಾತೆಗೆ ಪ್ರವೇಶಿಸಿ",
+    "email_placeholder": "name@example.com",
+    "password": "ಪಾಸ್‌ವರ್ಡ್",
+    "enter_password": "ನಿಮ್ಮ ಪಾಸ್‌ವರ್ಡ್ ನಮೂದಿಸಿ",
+    "sign_in": "ಪ್ರವೇಶಿಸಿ",
+    "no_account": "ಖಾತೆ ಹೊಂದಿಲ್ಲವೇ?",
+    "register_here": "ಇಲ್ಲಿ ನೋಂದಾಯಿಸಿ",
+    "are_official": "ನೀವು ಅಧಿಕಾರಿಯೇ?",
+    "official_login_here": "ಅಧಿಕೃತ ಪ್ರವೇಶ ಇಲ್ಲಿ",
+    "create_account": "ನಾಗರಿಕ ಖಾತೆ ರಚಿಸಿ",
+    "register_subtitle": "ದೂರು ನೀಡಲು ಮತ್ತು ಪ್ರಗತಿ ನೋಡಲು ಮೇರಿ ಪಂಚಾಯತ್ ಸೇರಿ",
+    "full_name": "ಪೂರ್ಣ ಹೆಸರು",
+    "fullname_placeholder": "ನಿಮ್ಮ ಪೂರ್ಣ ಹೆಸರನ್ನು ನಮೂದಿಸಿ",
+    "mobile_placeholder": "10-ಅಂಕಿಯ ಮೊಬೈಲ್ ಸಂಖ್ಯೆ ನಮೂದಿಸಿ",
+    "already_have_account": "ಈಗಾಗಲೇ ಖಾತೆ ಹೊಂದಿದ್ದೀರಾ?",
+    "choose_password": "ಸುರಕ್ಷಿತ ಪಾಸ್‌ವರ್ಡ್ ಆಯ್ಕೆಮಾಡಿ",
+    "register_now": "ಈಗಲೇ ನೋಂದಾಯಿಸಿ",
+
+    # Search
+    "search": "ಹುಡುಕಿ",
+    "search_results": "ಹುಡುಕಾಟ ಫಲಿತಾಂಶಗಳು",
+    "search_hint": "ಶೀರ್ಷಿಕೆ, ವಿವರಣೆ ಅಥವಾ ಸ್ಥಳದಲ್ಲಿರುವ ಯಾವುದೇ ಪದದಿಂದ ದೂರುಗಳು ಮತ್ತು ಸೂಚನೆಗಳನ್ನು ಹುಡುಕಿ.",
+    "all_panchayaths": "ಎಲ್ಲಾ ಪಂಚಾಯತಿಗಳು",
+    "all_statuses": "ಎಲ್ಲಾ ಸ್ಥಿತಿಗಳು",
+    "no_results": "ಯಾವುದೇ ಫಲಿತಾಂಶಗಳು ಕಂಡುಬಂದಿಲ್ಲ"
+}
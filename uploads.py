@@ -0,0 +1,246 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from flask import Request, current_app, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import images
+import metrics
+import storage
+
+# ---------------- CONTENT-ADDRESSED UPLOAD STORE ----------------
+#
+# Uploads are stored under the SHA-256 of their bytes:
+#
+#     static/uploads/3f/a2/3fa2...e9.jpg
+#
+# The multipart parser streams each file straight into a HashingFile in the
+# uploads folder, so the hash is computed while the body arrives and the
+# file is never copied again. store() strips the photo's metadata
+# (images.sanitize, which never decodes it) before it is named, so the name
+# covers exactly the bytes served, then renames it into place. Identical photos share one file,
+# counted in upload_refs, and once the last reference is gone and that has
+# been committed, discard() deletes the file. Names never change meaning, so
+# the files can be cached by browsers forever.
+
+UPLOAD_DIR = os.path.join("static", "uploads")
+CHUNK_SIZE = 64 * 1024
+CACHE_MAX_AGE = 365 * 24 * 3600
+FILE_MODE = 0o644
+
+# Accepted types: canonical extension -> magic-number check
+ALLOWED_TYPES = {
+    "jpg": lambda head: head.startswith(b"\xff\xd8\xff"),
+    "png": lambda head: head.startswith(b"\x89PNG\r\n\x1a\n"),
+    "gif": lambda head: head[:6] in (b"GIF87a", b"GIF89a"),
+    "webp": lambda head: head[:4] == b"RIFF" and head[8:12] == b"WEBP",
+}
+EXTENSION_ALIASES = {"jpeg": "jpg", "jpe": "jpg"}
+
+HASHED_PATH = re.compile(r"^uploads/[0-9a-f]{2}/[0-9a-f]{2}/(variants/)?[0-9a-f]{64}[.\w]*$")
+
+# Set by shards.py when sharded: referenced_elsewhere(conn, path) says
+# whether a database other than conn's still uses the file, since each
+# shard's upload_refs only counts its own rows
+referenced_elsewhere = None
+
+
+class UploadError(ValueError):
+    """Rejected upload; the message is safe to show to the user."""
+
+
+class HashingFile:
+    """Temp file in the upload folder that hashes and size-checks every
+    chunk written to it."""
+
+    def __init__(self, folder, limit=None):
+        os.makedirs(folder, exist_ok=True)
+        fd, self.name = tempfile.mkstemp(dir=folder, prefix=".upload-", suffix=".part")
+        self._file = os.fdopen(fd, "w+b")
+        self.limit = limit
+        self.size = 0
+        self.head = b""
+        self.sha256 = hashlib.sha256()
+        self.kept = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.limit is not None and self.size > self.limit:
+            raise RequestEntityTooLarge()
+        if len(self.head) < 16:
+            self.head += data[:16 - len(self.head)]
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def close(self):
+        self._file.close()
+        # Anything not claimed by store() is garbage by the end of the request
+        if not self.kept and os.path.exists(self.name):
+            os.unlink(self.name)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(upload_folder(), current_app.config.get("MAX_CONTENT_LENGTH"))
+
+
+def upload_folder():
+    return current_app.config.get("UPLOAD_FOLDER", UPLOAD_DIR)
+
+
+def file_path(path, folder=None):
+    """Where a stored path ('uploads/3f/a2/....jpg', or one of its variants)
+    is on disk: the same place under UPLOAD_FOLDER, wherever that is."""
+    return os.path.join(folder or upload_folder(), *path.split("/")[1:])
+
+
+def _as_hashing_file(file_storage):
+    stream = file_storage.stream
+    if isinstance(stream, HashingFile):
+        return stream
+    # Not parsed by UploadRequest (e.g. built by hand): copy it through one
+    copy = HashingFile(upload_folder(), current_app.config.get("MAX_CONTENT_LENGTH"))
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        copy.write(chunk)
+    return copy
+
+
+def _digest(filename):
+    """(sha256 hex digest, size) of a file on disk."""
+    sha256, size = hashlib.sha256(), 0
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+def store(conn, file_storage):
+    """Move an uploaded file into the store and take a reference to it.
+
+    Returns (path, created): path relative to static/ as saved in the
+    database, and whether this content was new. Runs inside the caller's
+    transaction, which must be committed for the reference to stick.
+    """
+    started = time.perf_counter()
+    ext = os.path.splitext(file_storage.filename or "")[1].lower().lstrip(".")
+    ext = EXTENSION_ALIASES.get(ext, ext)
+    if ext not in ALLOWED_TYPES:
+        raise UploadError("Only JPEG, PNG, GIF or WebP images can be uploaded.")
+
+    temp = _as_hashing_file(file_storage)
+    if temp.size == 0:
+        raise UploadError("The uploaded file is empty.")
+    sniffed = next((name for name, check in ALLOWED_TYPES.items() if check(temp.head)), None)
+    if sniffed is None:
+        raise UploadError("The uploaded file is not a supported image.")
+    temp.flush()
+
+    # Hash what will be served: stripping metadata changes the bytes, and a
+    # hashed file is immutable from its first response on
+    try:
+        stripped = images.sanitize(temp.name)
+    except images.ImageRejected as e:
+        raise UploadError(str(e))
+    if stripped:
+        digest, size = _digest(temp.name)
+    else:
+        digest, size = temp.sha256.hexdigest(), temp.size
+    # mkstemp makes the file private to us; the web server must read it
+    os.chmod(temp.name, FILE_MODE)
+    path = f"uploads/{digest[:2]}/{digest[2:4]}/{digest}.{sniffed}"
+    target = os.path.join(upload_folder(), digest[:2], digest[2:4], f"{digest}.{sniffed}")
+
+    # Take the reference first: this grabs the write lock, so a concurrent
+    # discard() of the same content can't delete the file under us.
+    conn.execute("""
+        INSERT INTO upload_refs (path, refcount, size) VALUES (?, 1, ?)
+        ON CONFLICT(path) DO UPDATE SET refcount = refcount + 1
+    """, (path, size))
+
+    created = not os.path.exists(target)
+    if created:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp.name, target)
+        temp.kept = True
+    metrics.observe("upload_store_duration_seconds", time.perf_counter() - started)
+    metrics.inc("uploads_total", result="new" if created else "duplicate")
+    metrics.inc("upload_bytes_total", size)
+    return path, created
+
+
+def release(conn, path):
+    """Drop one reference to `path`. Call inside the transaction that
+    removes the referencing row. Returns `path` if that was the last
+    reference, for discard() once the transaction has committed; None
+    otherwise, and for untracked (pre-hash) uploads, which are left alone."""
+    if not path:
+        return None
+    row = conn.execute("SELECT refcount FROM upload_refs WHERE path = ?", (path,)).fetchone()
+    if row is None:
+        return None
+    if row["refcount"] > 1:
+        conn.execute("UPDATE upload_refs SET refcount = refcount - 1 WHERE path = ?", (path,))
+        return None
+
+    conn.execute("DELETE FROM upload_refs WHERE path = ?", (path,))
+    if referenced_elsewhere is not None and referenced_elsewhere(conn, path):
+        return None
+    return path
+
+
+def discard(conn, paths):
+    """Delete the files (and their variants) release() gave up, after its
+    transaction committed: a rollback or crash before that keeps the row
+    and so must keep the photo. Files a store() has re-referenced since
+    are kept. A crash in between leaves an unreferenced file behind,
+    never a row without its file."""
+    paths = [path for path in paths if path]
+    if not paths:
+        return
+    storage.begin_write(conn)
+    try:
+        for path in paths:
+            # Holding the write lock, so no store() can re-reference it now.
+            # (Only this database's lock: a shard storing the same photo at
+            # this very moment can still lose it.)
+            if conn.execute("SELECT 1 FROM upload_refs WHERE path = ?", (path,)).fetchone():
+                continue
+            files = [path] + [
+                images.variant_path(path, size, ext)
+                for size in images.VARIANTS
+                for ext, _, _ in images.FORMATS
+            ]
+            for name in files:
+                try:
+                    os.unlink(file_path(name))
+                except FileNotFoundError:
+                    pass
+    finally:
+        conn.commit()
+
+
+def _cache_forever(response):
+    if (request.endpoint == "static" and response.status_code == 200
+            and HASHED_PATH.match(request.view_args.get("filename", ""))):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = CACHE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    app.request_class = UploadRequest
+    app.config.setdefault("MAX_CONTENT_LENGTH", int(os.environ.get("MAX_UPLOAD_MB", "10")) * 1024 * 1024)
+    app.config.setdefault("UPLOAD_FOLDER", UPLOAD_DIR)
+    app.after_request(_cache_forever)